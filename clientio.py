@@ -1,863 +1,2827 @@
-"""
-ClientIO module deals with connecting to a server as a client, sending commands
-and returning responses.
-
-Usage:
-    - Connect to server using connect(address)
-    - Disconnect using disconnect()
-    - Transfer files using FileTransfer class
-    - Make requests to server using other functions:
-        listDir()
-        chDir(path)
-        makeDir(path)
-        getDir(filename)
-        getFileProperties(filename)
-        getFileText(filename)
-    - Do not use functions labelled as "For internal use"
-
-Exceptions:
-    IOError - Thrown by functions when there is a connection/network problem
-    OSError - If the server cannot/will not return data, or a file operation
-              has failed.
-    ValueError - If bad data has been returned by the server (if the server is
-                 functioning properly, this should not occur)
-    AttributeError - If the socket = None, i.e. if it has not been created
-                     using connect(), or has been disconnected with
-                     disconnect()
-                   - If a file opened in the wrong mode is given as a parameter
-                     to a function.
-"""
-__author__ = "Sean O'Kelly <so227@st-andrews.ac.uk>"
-__date__ = "2010-11-13  23:18"
-
-import socket
-import string
-import threading
-import Queue
-import time
-
-
-
-
-
-###############################################################################
-# Globals and initialisation
-###############################################################################
-
-#Constants - same across client and server
-PORT_NUM = 56740 #unique port number based on my unix user id
-TRANSFER_PORT_NUM = 56744 #other group member's port number
-BUFFER_SIZE = 8192 #8kB - enough for anything like directory listing etc.
-TIMEOUT = 30 #30 seconds
-DIVIDER = "|" #To divide sections of transmissions (e.g. cmd and params)
-LISTDIR_CMD = "LS"
-CHDIR_CMD = "CD"
-GETDIR_CMD = "GETCWD"
-GETINFO_CMD = "INFO"
-MKDIR_CMD = "MKDIR"
-DOWNLOAD_CMD = "DOWN"
-UPLOAD_CMD = "UP"
-GETTEXT_CMD = "GETTEXT"
-CONTINUE_CMD = "CONTINUE"
-CANCEL_CMD = "CANCEL"
-DISCONNECT_CMD = "DISCONNECT"
-FAILURE_MSG = "FAIL" #just kidding
-SUCCESS_MSG = "WIN"
-
-#Variables
-address = ""
-client_socket = None
-
-###############################################################################
-# End of globals/initialisation
-###############################################################################
-
-
-
-
-
-###############################################################################
-# Connect/Disconnect functions
-###############################################################################
-
-#connect function: to connect client_socket to the server
-def connect(input_address=socket.gethostname()):
-    """
-    Usage:
-        Connects to a server at address, initialises the module so that other
-        functions in the module may be used.
-    
-    Takes in:
-        address - address of server to connect to, current computer by default.
-    
-    Exceptions:
-        IOError - if connection fails.
-    """
-    try:
-        global address
-        address = input_address
-        global client_socket
-        if client_socket != None:
-            #Socket already exists, disconnect it so new connection can be made
-            disconnect()
-        #next: create socket object
-        #AF_INET and SOCK_STREAM - constants defining type of socket
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.connect((address, PORT_NUM))
-        #client_socket.settimeout(30) #30 seconds for timeout
-    
-    except socket.herror:
-        #socket has failed to connect because of address lookup error
-        client_socket = None
-        raise IOError("Address lookup failed.")
-    except socket.gaierror:
-        #socket has failed to connect because of invalid address
-        client_socket = None
-        raise IOError("Invalid address.")
-    except socket.error:
-        #socket has failed to connect due to network issue/refused connection
-        client_socket = None
-        raise IOError("Connection failed.")
-#end of connect function
-
-
-#disconnect function: to disconnect the socket
-def disconnect(notify_server=True):
-    """
-    Usage:
-        Disconnects from the server. Use after program is finished using the
-        server. Will attempt to notify server of disconnect.
-    """
-    global client_socket
-    #only perform actions if the socket exists.
-    if client_socket != None:
-        if notify_server:
-            try:
-                # Send DISCONNECT_CMD to let server know of disconnect.
-                # ensures server can quit gracefully.
-                sendMsg(DISCONNECT_CMD)
-            except (IOError, AttributeError):
-                # if there's an error, we tried to notify server but failed,
-                # server has to deal with it, so we'll ignore.
-                pass
-        try:
-            client_socket.close()
-        except AttributeError:
-            pass
-        #Remove reference to old socket object
-        client_socket = None
-#end of disconnect function
-
-###############################################################################
-# End of connect/disconnect functions
-###############################################################################
-
-
-
-
-
-###############################################################################
-# Functions for sending commands to server
-###############################################################################
-
-#listDir function: to get a list of directories from the server and return it
-def listDir():
-    """
-    Usage:
-        Requests a list of files/directories from the server.
-    
-    Returns:
-        List of tuples in the form (file_name, file_size), one tuple for each
-        file or directory - file_size is -1 for directories.
-    
-    Exceptions:
-        IOError - If network IO (request for or receipt of data) fails.
-                - If this is raised, the socket is probably not connected.
-        OSError - If the server fails to retrieve directory info
-                - Possibly if the directory has been deleted or similar?
-        ValueError - If it receives badly formatted data from the server.
-                   - This should never happen if server is working properly.
-        AttributeError - If the socket = None, i.e. if it has not been created
-                         using connect(), or has been disconnected with
-                         disconnect()
-    """
-    try:
-        data = sendCmdReceiveReply(LISTDIR_CMD)
-    except (IOError, AttributeError): raise
-
-    # If the server sends a failure message - cannot retrieve data
-    if checkForFailure(data): 
-        message = "Server: Could not return directory data."
-        if len(data) >= 2:
-            message = "Server: " + data[1]
-        raise OSError(message)
-
-    #Re-format data back into original form
-    #  sendCmdReceiveReply automatically splits data into list
-    #  this is incompatible with this function which receives complex data.
-    data_str = ""
-    for element in data:
-        data_str += element + DIVIDER
-    #remove last and first dividers:
-    data = data_str[1:len(data_str) - 1]
-    
-    try:
-        if data == "":
-            data_list = []
-        else:
-            #Remove any random whitespace
-            data = data.strip()
-            #Split into a list of "name|size" strings
-            data_list = data.split("\n")
-            #For each array index in the list
-            for i in xrange(0, len(data_list)):
-                #split into [name, size]
-                elem_list = data_list[i].split(DIVIDER)
-                #change to tuple
-                data_list[i] = (elem_list[0], int(elem_list[1]))
-    except (IndexError, ValueError):
-        #Something went wrong in the analysis of data from server, so it's
-        #probably badly formatted data from server.
-        raise ValueError("Bad data from server.")
-    
-    return data_list
-#end of listDir function
-
-
-#chDir function: to change the current directory of the server's filestore
-def chDir(path):
-    """
-    Usage:
-        Used to request to change the current directory of the filestore on the
-        server.
-
-    Takes in:
-        path - path to change to.
-    
-    Exceptions:
-        IOError - If network IO (request for or receipt of data) fails.
-                - If this is raised, the socket is probably not connected.
-        OSError - If the server cannot/will not change directory (i.e. because
-                  of restrictions.)
-        AttributeError - If the socket = None, i.e. if it has not been created
-                         using connect(), or has been disconnected with
-                         disconnect()
-    """
-    try:
-        # "CD|dir_name" - recognised by server
-        command = CHDIR_CMD + DIVIDER + path 
-        data = sendCmdReceiveReply(command)
-    except (IOError, AttributeError): raise
-    
-    if checkForFailure(data): #Server couldn't/wouldn't change directory
-        message = "Server: Could not change directory."
-        if len(data) >= 2:
-            message = "Server: " + data[1]
-        raise OSError(message)
-#end of chDir function
-
-
-#makeDir function: to change the current directory of the server's filestore
-def makeDir(path):
-    """
-    Usage:
-        Used to request to create a new directory on the server.
-
-    Takes in:
-        path - directory to create.
-    
-    Exceptions:
-        IOError - If network IO (request for or receipt of data) fails.
-                - If this is raised, the socket is probably not connected.
-        OSError - If the server cannot/will not create directory (i.e. because
-                  of restrictions.)
-        AttributeError - If the socket = None, i.e. if it has not been created
-                         using connect(), or has been disconnected with
-                         disconnect()
-    """
-    try:
-        # "MKDIR|dir_name" - recognised by server
-        command = MKDIR_CMD + DIVIDER + path 
-        data = sendCmdReceiveReply(command)
-    except (IOError, AttributeError): raise
-    
-    if checkForFailure(data): #Server couldn't/wouldn't make dir
-        message = "Server: Could not create directory."
-        if len(data) >= 2:
-            message = "Server: " + data[1]
-        raise OSError(message)
-#end of makeDir function
-
-
-#getDir function: to get the current path from the server
-def getDir():
-    """
-    Usage:
-        Request that the server send the path of the current directory.
-
-    Returns:
-        The path of the current directory of the filestore on the server.
-    
-    Exceptions:
-        IOError - If network IO (request for or receipt of data) fails.
-                - If this is raised, the socket is probably not connected.
-        OSError - If the server fails to retrieve directory info
-                - Possibly if the directory has been deleted or similar?
-        AttributeError - If the socket = None, i.e. if it has not been created
-                         using connect(), or has been disconnected with
-                         disconnect()
-    """
-    try:
-        #Request to be sent current location in server's filesystem
-        data = sendCmdReceiveReply(GETDIR_CMD)
-    except (IOError, AttributeError): raise
-    
-    if checkForFailure(data): #The server cannot retrieve the data
-        message = "Server: Could not return directory path."
-        if len(data) >= 2:
-            message = "Server: " + data[1]
-        raise OSError(message)
-    
-    return data[0]
-#end of getDir function
-
-
-#getFileProperties function: to get details on a specified file from the server
-def getFileProperties(filename):
-    """
-    Usage:
-        Requests that the server send details for a file.
-    
-    Takes in:
-        filename - The file name of the file whose details are being requested.
-    
-    Returns:
-        Tuple of (full_path_name, file_size (bytes), last_access_time,
-                  last_modification_time)
-    
-    Exceptions:
-        IOError - If network IO (request for or receipt of data) fails.
-                - If this is raised, the socket is probably not connected.
-        OSError - If the server has failed to get data on the file.
-                - e.g. if the file does not exist.
-        ValueError - If it receives badly formatted data from the server.
-                   - This should never happen if server is working properly.
-        AttributeError - If the socket = None, i.e. if it has not been created
-                         using connect(), or has been disconnected with
-                         disconnect()
-    """
-    try:
-        #"INFO|filename"-recognised by server
-        command = GETINFO_CMD + "|" + filename
-        data = sendCmdReceiveReply(command)
-    except (IOError, AttributeError): raise
-
-    #Server couldn't/wouldn't get file data.
-    if checkForFailure(data):
-        message = "Server: Could not get file data."
-        if len(data) >= 2:
-            message = "Server: " + data[1]
-        raise OSError(message)
-    
-    try:
-        # data is in form "a|b|c|d" for transit
-        data = (data[0], int(data[1]), data[2], data[3])
-        return data
-    except (IndexError, ValueError):
-        #Server transferred badly formatted data.
-        raise ValueError("Bad data from server.")
-#end of getFileProperties function
-
-###############################################################################
-# End of server command functions
-###############################################################################
-
-
-
-
-###############################################################################
-# Code for file transfer
-###############################################################################
-
-#FileTransfer class - allows concurrent, queued (one at a time) file transfer
-class FileTransfer(threading.Thread):
-    """
-    Usage:
-        Create an object of this class to execute a file transfer (upload
-        or download).
-        File transfers will be made to run concurrently, so will not block the
-        rest of the program, but will be queued to run one at a time, so that
-        we don't have multiple transfers on the same port at the same time.
-        To get the transfer's status, use getStatus() to get a tuple of
-        information.
-        Do not call any other methods in this class directly, simply create the
-        object. Calling any other method will mess up the program's operation.
-        Note - if it fails during transfer (not during negotiation/
-        initialisation), no exception will be raised, failure can be detected
-        through getStatus()
-        File being read from/written to will automatically be closed at the
-        completion of the transfer - file should not be closed externally due
-        to the concurrent nature of this class.
-    """
-    
-    #Constructor
-    def __init__(self, filename, file_object, file_size=-1, download=True):
-        """
-        Constructor
-
-        Usage:
-            For an upload:
-                my_transfer = Transfer(filename_to_save_as,
-                                       file_object_to_read_from,
-                                       file_size=exact_size_in_bytes
-                                       download=False)
-            For a download:
-                my_transfer = Transfer(filename_of_file_to_download,
-                                       file_object_to_write_to)
-        
-        Takes in:
-            filename - If this transfer is an upload, the filename is the name
-                       to save the uploaded file to on the server.
-                       If this is a download, it is the name of the file to
-                       download from server.
-            file_object - If this is an upload, the file_object is the file to
-                          read data from, and upload. Must be in "rb" mode.
-                          If this is a download, the file_object is the file to
-                          write downloaded data to. Must be in "wb" mode.
-            file_size - If this is an upload, this is required, and must be the
-                        exact size of the file in bytes.
-                        If this is a download, this is not required and will be
-                        ignored.
-            download - Boolean for whether this is a download or an upload.
-                       should be True (default) if this is a download,
-                       False for an upload.
-
-        Exceptions:
-            AttributeError - If the file is open in the wrong mode.
-                           - If the socket = None, i.e. if it has not been
-                             created using connect(), or has been disconnected
-                             with disconnect()
-            IOError - If network IO (request for or receipt of data) fails.
-                    - If this is raised, the socket is probably not connected.
-            OSError - If the server fails to retreive the file, or will not/
-                      cannot receive it.
-                    - e.g. if the file does not exist.
-            ValueError - If it receives badly formatted data from the server.
-                       - Should never happen if server is working properly.
-        """
-        #Thread requires a call to its constructor
-        threading.Thread.__init__(self)
-        
-        self.download = download
-        self.filename = filename
-        self.file_object = file_object
-        
-        self.file_size = file_size
-        self.bytes_transferred = 0
-        #transfer_going - whether or not the transfer is in progress
-        #false if finished, failed, or waiting in the queue
-        self.transfer_going = False
-        #has_failed indicates if the transfer has failed.
-        self.has_failed = False
-        self.is_complete = False
-        self.has_started = False
-
-        #for downloading, file needs to be written to in binary mode.
-        if download and file_object.mode != "wb":
-            raise AttributeError("File must be opened in wb mode for download")
-        #for uploading, file needs to be read from in binary mode.
-        elif not download and file_object.mode != "rb":
-            raise AttributeError("File must be opened in rb mode for upload")
-        
-        if download:
-            self.initialiseDownload()
-        else:
-            self.initialiseUpload()
-
-        #If there is not currently a transfer in progress
-        if not FileTransfer.transfer_in_progress:
-            #There is a transfer in progress now
-            FileTransfer.transfer_in_progress = True
-            #Start the thread - thread handles actual data transfer.
-            self.start()
-        else:
-            #there is a transfer already in progress, so add this one to the
-            #queue
-            FileTransfer.transfer_queue.put(self)
-    #End of Constructor
-    
-
-    #getStatus method - to get a tuple of the transfer status
-    def getStatus(self):
-        """
-        Usage:
-            Use to keep track of the file transfer's status
-
-        Returns:
-            tuple of file transfer status:
-                (bytes_transferred, file_size, transfer_going, has_failed,
-                 is_complete, has_started)
-        """
-        status = (self.bytes_transferred, self.file_size, self.transfer_going,
-                  self.has_failed, self.is_complete, self.has_started)
-        return status
-    #End of getStatus method
-
-
-    #initialiseDownload method - to initialise for download (not upload)
-    #This gets file size data from the server, and lets the server know to add
-    #  this transfer to its queue.
-    def initialiseDownload(self):
-        """
-        Usage:
-            For internal use only.
-            Used to initialise the FileTransfer object for a download.
-            Communicates with server, gets file size data, lets server know to
-            add this to its queue of transfers.
-
-        Exceptions:
-            AttributeError - If the socket = None, i.e. if it has not been
-                             created using connect(), or has been disconnected
-                             with disconnect()
-            IOError - If network IO (request for or receipt of data) fails.
-                    - If this is raised, the socket is probably not connected.
-            OSError - If the server fails to retreive the file
-                    - e.g. if the file does not exist.
-            ValueError - If it receives badly formatted data from the server.
-                       - Should never happen if server is working properly.
-        """
-        # command should be "DOWN|filename"
-        command = DOWNLOAD_CMD + DIVIDER + self.filename
-        data = sendCmdReceiveReply(command)
-        #If server failed to get file.
-        if checkForFailure(data):
-            raise OSError("Server: Could not send file.")
-        try:
-            self.file_size = int(data[0])
-        except ValueError:
-            #Server has sent bad data. (data[0] should be data length integer)
-            #Tell server to cancel transfer.
-            sendMsg(CANCEL_CMD)
-            raise ValueError("Bad data from server.")
-        sendMsg(SUCCESS_MSG)
-    #End of initialiseDownload method
-    
-
-    #initialiseUpload method - to initialise for upload (not download)
-    #Tells server the filename and filesize, and lets it know to add this
-    #transfer to its queue
-    def initialiseUpload(self):
-        """
-        Usage:
-            For internal use only.
-            Used to initialise the FileTransfer object for an upload.
-            Communicates with server, sends server data on the file being
-            uploaded, lets server know to add this to its transfer queue.
-
-        Exceptions:
-            AttributeError - If the socket = None, i.e. if it has not been
-                             created using connect(), or has been disconnected
-                             with disconnect()
-            IOError - If network IO (request for or receipt of data) fails.
-                    - If this is raised, the socket is probably not connected.
-            OSError - If the server will not/cannot receive file.
-                    - e.g. if there is already a file with specified name.
-            ValueError - If it receives badly formatted data from the server.
-                       - Should never happen if server is working properly.
-        """
-        # command should be "UP|filename|file_size"
-        # changing name from path/name to name:
-        command = UPLOAD_CMD + DIVIDER + self.filename + DIVIDER \
-                + str(self.file_size)
-        message = sendCmdReceiveReply(command)
-        #If server will not accept file upload.
-        if checkForFailure(message):
-            raise OSError("Server would not accept file.")
-    #End of initialiseUpload method
-
-
-    #transfer method - to carry out the file transfer (only call from run)
-    def transfer(self):
-        """
-        Usage:
-            For internal use only.
-            Used to perform the actual transfer/read/write of data.
-
-        Exceptions:
-            AttributeError - If the transfer socket has not been created.
-            IOError - If network IO (request for or receipt of data) fails.
-                    - If this is raised, connection is dead.
-        """
-        try:
-            #Loop until all data is transferred.
-            while self.bytes_transferred < self.file_size:
-                #if it's a download, receive data.
-                if self.download:
-                    #receive data through socket.
-                    data = self.transfer_socket.recv(BUFFER_SIZE)
-                    #if data == "", the transfer has failed.
-                    if data == "" or data == None:
-                        raise socket.error
-                    self.bytes_transferred += len(data)
-                    #write binary data to file
-                    self.file_object.write(data)
-                    self.file_object.flush()
-                #If it's an upload, send data.
-                else:
-                    #read data from file, and send it through the socket
-                    data = self.file_object.read(BUFFER_SIZE)
-                    self.transfer_socket.send(data)
-                    self.bytes_transferred += len(data)
-        except (socket.error, socket.timeout):
-            raise IOError("Transfer failed.")
-    #End of transfer method
-
-
-    #run method - required by thread class - code to be concurrently executed
-    def run(self):
-        """
-        Usage:
-            For internal use only.
-            Required by thread class, code here is executed concurrently.
-            This performs initialisation of the connection used for file
-            transfer, and will automatically start the next transfer in the
-            queue upon completion.
-        """
-        self.has_started = True
-        try:
-            #Create a socket and connect it using the file transfer port
-            self.transfer_socket = socket.socket(socket.AF_INET,
-                                                 socket.SOCK_STREAM)
-            #Sleep for a short time to give server time to set up:
-            time.sleep(0.2)
-            self.transfer_socket.connect((address, TRANSFER_PORT_NUM))
-            #Call actual transfer code
-            self.transfer()
-        except (IOError, socket.error, socket.herror, socket.gaierror,
-                socket.timeout):
-            #Some exception has been thrown, this transfer has failed.
-            self.transfer_going = False
-            self.has_failed = True
-        else:
-            #The transfer has completed without any issues.
-            self.is_complete = True
-        finally:
-            #Tidying up - close file and socket once operations are done
-            self.transfer_socket.close()
-            self.file_object.close()
-        
-        try:
-            #Get the next transfer in the queue
-            next_transfer = FileTransfer.transfer_queue.get_nowait()
-        except Queue.Empty:
-            #if Queue.Empty is caught, it means there is nothing in the queue
-            #because queue is empty, transfers are finished for now.
-            FileTransfer.transfer_in_progress = False
-        else:
-            #start the next transfer in the queue
-            next_transfer.start()
-    #End of run method
-    
-#End of FileTransfer class
-
-
-#Static fields for FileTransfer class
-FileTransfer.transfer_queue = Queue.Queue()
-FileTransfer.transfer_in_progress = False
-
-
-#getFileText function - to get from the server the contents of a text file.
-def getFileText(filename):
-    """
-    Usage:
-        Requests that the server send text content for a file.
-    
-    Takes in:
-        filename - The file name of the file whose contents are being
-                   requested.
-    
-    Returns:
-        String of text from the file.
-    
-    Exceptions:
-        IOError - If network IO (request for or receipt of data) fails.
-                - If this is raised, the socket is probably not connected.
-        OSError - If the server has failed to get the file.
-                - e.g. if the file does not exist.
-        ValueError - If it receives badly formatted data from the server.
-                   - This should never happen if server is working properly.
-        AttributeError - If the socket = None, i.e. if it has not been created
-                         using connect(), or has been disconnected with
-                         disconnect()
-    """
-    try:
-        #"GETTEXT|filename"-recognised by server
-        command = GETTEXT_CMD + DIVIDER + filename
-        data = sendCmdReceiveReply(command)
-    except (IOError, AttributeError): raise
-    
-    #Server couldn't/wouldn't get file data.
-    if checkForFailure(data):
-        message = "Server: Could not get file."
-        if len(data) >= 2:
-            message = "Server: " + data[1]
-        raise OSError(message)
-    else:
-        try:
-            filesize = int(data[0])
-        except ValueError:
-            raise ValueError("Server sent bad filesize data.")
-    
-    sendMsg(CONTINUE_CMD)
-    data_transferred = 0
-    file_text = ""
-    while data_transferred < filesize:
-        try:
-            data = receiveData()
-            data_transferred += len(data)
-            file_text += data
-        except (IOError, AttributeError): raise
-    return file_text
-#End of getFileText function
-
-###############################################################################
-# End of file transfer code
-###############################################################################
-
-
-
-
-###############################################################################
-# Internally used convenience/abstraction functions
-###############################################################################
-
-#sendCmdReceiveReply function - to send cmd to server and return response
-def sendCmdReceiveReply(command, params=[]):
-    """
-    Usage:
-        For internal use only.
-        sends a command, with optional parameters, to the server and returns
-        the server's response in a list, split by DIVIDER.
-    
-    Takes in:
-        command - The command to send to the server.
-        params - optional parameters to go with the command.
-
-    Returns:
-        Data from the server, separated into a list using DIVIDER to separate
-        elements.
-
-    Exceptions:
-        IOError - If network IO (request for or receipt of data) fails.
-                - If this is raised, the socket is probably not connected.
-        AttributeError - If the socket = None, i.e. if it has not been created
-                         using connect(), or has been disconnected with
-                         disconnect()
-    """
-    for param in params:
-        command += DIVIDER + param
-    
-    try:
-        sendMsg(command, params)
-    except (IOError, AttributeError): raise
-    
-    try:
-        reply = receiveData()
-    except (IOError, AttributeError): raise
-    
-    reply_list = reply.split(DIVIDER)
-    return reply_list
-#end of sendCmdReceiveReply function
-
-
-#sendCmd function - to send cmd to server where no reply is expected
-def sendMsg(command, params=[]):
-    """
-    Usage:
-        For internal use only.
-        sends a command, with optional parameters, to the server, does not wait
-        for a response.
-    
-    Takes in:
-        command - The command to send to the server.
-        params - optional parameters to go with the command.
-    
-    Exceptions:
-        IOError - If network IO (request for or receipt of data) fails.
-                - If this is raised, the socket is probably not connected.
-        AttributeError - If the socket = None, i.e. if it has not been created
-                         using connect(), or has been disconnected with
-                         disconnect()
-    """
-    #Compile command and params into one string:
-    for param in params:
-        #Remove all dividers from param - these will screw up parsing of data
-        command = string.replace(command, DIVIDER, "")
-        command += DIVIDER + param
-    
-    try:
-        client_socket.send(command)
-    except socket.error:
-        #if connection error is detected, connection is broken so tidy up.
-        disconnect(notify_server=False)
-        raise IOError("Network IO failed.")
-    except AttributeError:
-        raise AttributeError("Socket has not been created.")
-#end of sendCmd function
-
-
-#receiveData function - to wait for data receipt without sending cmd
-def receiveData():
-    """
-    Usage:
-        For internal use only.
-        Waits for server to send data, then returns data.
-    
-    Returns:
-        Data from the server as a raw string.
-    
-    Exceptions:
-        IOError - If network IO (request for or receipt of data) fails.
-                - If this is raised, the socket is probably not connected.
-        AttributeError - If the socket = None, i.e. if it has not been created
-                         using connect(), or has been disconnected with
-                         disconnect()
-    """
-    try:
-        data = client_socket.recv(BUFFER_SIZE) #recieve bytes
-        if data == "":
-            raise socket.error
-    except (socket.error, socket.timeout):
-        #if connection error is detected, connection is broken so tidy up.
-        disconnect()
-        raise IOError("Network IO failed.")
-    except AttributeError:
-        raise AttributeError("Socket has not been created.")
-    return data
-#end of receiveData function
-
-
-#checkForFailure function - to check if the server has sent failure message
-def checkForFailure(data):
-    """
-    Usage:
-        For internal use - Nothing will break if this is used, but there's no
-        reason to use this externally.
-        Checks if data from server contains failure message.
-    
-    Takes in:
-        data - list of data from server.
-    
-    Returns:
-        True - if the data is a failure message or is otherwise invalid.
-        False - if the data is not a failure message
-    """
-    if (len(data) == 0) or (data[0] == FAILURE_MSG) or (data[0] == CANCEL_CMD):
-        return True
-    else:
-        return False
-#end of checkForFailure function
-
-###############################################################################
-# End of internal functions
-###############################################################################
+"""
+ClientIO module deals with connecting to a server as a client, sending commands
+and returning responses.
+
+Usage:
+    - Connect to server using connect(address)
+    - Disconnect using disconnect()
+    - Transfer files using FileTransfer class
+        - Transfer whole directories using TreeTransfer class
+        - Set how many transfers run at once using setMaxTransfers(limit)
+        - Queued transfers start in order of priority, then oldest (or
+          smallest, see setSchedulingPolicy(policy)) first
+        - Cap the data rate of all transfers using setRateLimit(rate), or of
+          one using its setRateLimit(rate) method
+        - Cap the server's data rate using setServerRateLimit(rate, scope)
+    - Make requests to server using other functions:
+        listDir()
+        listDirPages()
+        chDir(path)
+        makeDir(path)
+        getDir(filename)
+        getDirAndList()
+        getSnapshot()
+        getFileProperties(filename)
+        getFileText(filename)
+        getFileTextRange(filename, offset, length)
+        readFileRange(filename, offset, length)
+        searchFiles(pattern)
+        findFiles(name, min_size, max_size, min_mtime, max_mtime, order)
+    - Read parts of a file on the server, as if it were a local file, using
+      RemoteFile class
+    - Requests are tagged with an ID, so several may be sent before any reply
+      is received. getDirAndList() sends both of its requests at once, so
+      costs only one round trip.
+    - Listings are kept, and the server only sends a directory's listing
+      again if it has changed since it was kept.
+    - Do not use functions labelled as "For internal use"
+
+Exceptions:
+    IOError - Thrown by functions when there is a connection/network problem
+    OSError - If the server cannot/will not return data, or a file operation
+              has failed.
+    ValueError - If bad data has been returned by the server (if the server is
+                 functioning properly, this should not occur)
+    AttributeError - If the socket = None, i.e. if it has not been created
+                     using connect(), or has been disconnected with
+                     disconnect()
+                   - If a file opened in the wrong mode is given as a parameter
+                     to a function.
+"""
+__author__ = "Sean O'Kelly <so227@st-andrews.ac.uk>"
+__date__ = "2010-11-13  23:18"
+
+import os
+import socket
+import string
+import threading
+import Queue
+import collections
+import time
+import zlib
+
+import compression
+import delta
+import hashindex
+import protocol
+import transferengine
+import transfertuner
+import treestream
+
+
+
+
+
+###############################################################################
+# Globals and initialisation
+###############################################################################
+
+#Constants - same across client and server
+PORT_NUM = 56740 #unique port number based on my unix user id
+TIMEOUT = 30 #30 seconds
+PAGE_SIZE = 500 #Directory entries in each page of a paged listing
+SEARCH_HITS = 1000 #Default most matching lines found by a search
+SEARCH_TIME = 30 #Default most seconds a search runs for
+FIND_RESULTS = 1000 #Default most files given by a find
+LISTDIR_CMD = "LS"
+LISTPAGES_CMD = "LSPAGES"
+CHDIR_CMD = "CD"
+GETDIR_CMD = "GETCWD"
+GETINFO_CMD = "INFO"
+SNAPSHOT_CMD = "SNAPSHOT"
+MKDIR_CMD = "MKDIR"
+DOWNLOAD_CMD = "DOWN"
+UPLOAD_CMD = "UP"
+DOWNTREE_CMD = "DOWNTREE"
+UPTREE_CMD = "UPTREE"
+GETTEXT_CMD = "GETTEXT"
+TEXTRANGE_CMD = "TEXTRANGE"
+READRANGE_CMD = "READRANGE"
+CANCEL_CMD = "CANCEL"
+PAUSE_CMD = "PAUSE"
+RATELIMIT_CMD = "RATELIMIT"
+PRIORITY_CMD = "PRIORITY"
+SEARCH_CMD = "SEARCH"
+FIND_CMD = "FIND"
+DATA_MSG = "DATA"
+WINDOW_MSG = "WINDOW"
+COPY_MSG = "COPY"
+SIGNATURES_MSG = "SIGS"
+DISCONNECT_CMD = "DISCONNECT"
+FAILURE_MSG = "FAIL" #just kidding
+SUCCESS_MSG = "WIN"
+NOT_MODIFIED_MSG = "NOTMODIFIED" #listing is the same as the one already held
+SERVER_SCOPE = "server" #rate limit scopes - all transfers on the server,
+SESSION_SCOPE = "session" #  this client's transfers,
+TRANSFER_SCOPE = "transfer" #  or one transfer
+LARGEST = "largest" #orders of found files - largest first,
+NEWEST = "newest" #  or most recently modified first
+
+MAX_TRANSFERS = 4 #Default number of file transfers which may run at once
+LOW_PRIORITY = transferengine.LOW_PRIORITY #transfer priorities
+NORMAL_PRIORITY = transferengine.NORMAL_PRIORITY
+HIGH_PRIORITY = transferengine.HIGH_PRIORITY
+FIFO = transferengine.FIFO #scheduling policies - oldest first,
+SHORTEST_FIRST = transferengine.SHORTEST_FIRST #  or smallest first
+STREAM_WINDOW = 262144 #256kB - data the server may send before it waits
+STREAM_CHUNK_SIZE = 32768 #32kB - most data sent in one message on a stream
+COPY_COST = 16 #window used up by a delta copy message
+DEDUPE_MIN_SIZE = 65536 #64kB - smallest upload worth hashing first
+MULTIPLEX_LIMIT = 1048576 #1MB - files smaller than this are multiplexed
+RECEIVE_BUFFER_SIZE = 262144 #256kB - data received before writing to file
+RESUME_MODES = ("r+b", "rb+", "ab", "a+b", "ab+") #to add to a partial file
+SEGMENTS = 4 #Default number of segments in a segmented download
+SEGMENT_MIN_SIZE = 4194304 #4MB - smallest segment worth its own connection
+REMOTE_BLOCK_SIZE = 65536 #64kB - data a RemoteFile fetches and caches at once
+REMOTE_CACHE_BLOCKS = 64 #Blocks a RemoteFile keeps (4MB)
+REMOTE_READAHEAD = 16 #Most blocks a RemoteFile reads ahead (1MB)
+LISTING_CACHE_SIZE = 64 #Listings kept to be checked with the server, rather
+                        #than fetched again
+MAX_CACHED_ENTRIES = 100000 #Most entries in a listing kept by the cache
+LISTING_CACHE_ENTRIES = 200000 #Most entries in all listings kept together
+
+#Variables
+transfer_engine = transferengine.TransferEngine(MAX_TRANSFERS)
+address = ""
+client_socket = None
+receiver = None #ReplyReceiver for client_socket
+send_lock = threading.Lock() #Only one thread may send a message at once
+#(address, path, command) -> (validator, listing, entries), least recently
+#used first
+listing_cache = collections.OrderedDict()
+listing_entries = 0 #entries in all of the listings in listing_cache
+listing_lock = threading.Lock()
+remote_path = None #server's current directory, as of the last reply giving it
+
+###############################################################################
+# End of globals/initialisation
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Connect/Disconnect functions
+###############################################################################
+
+#connect function: to connect client_socket to the server
+def connect(input_address=socket.gethostname()):
+    """
+    Usage:
+        Connects to a server at address, initialises the module so that other
+        functions in the module may be used.
+    
+    Takes in:
+        address - address of server to connect to, current computer by default.
+    
+    Exceptions:
+        IOError - if connection fails.
+    """
+    try:
+        global address, remote_path
+        address = input_address
+        remote_path = None
+        global client_socket, receiver
+        if client_socket != None:
+            #Socket already exists, disconnect it so new connection can be made
+            disconnect()
+        #next: create socket object
+        #AF_INET and SOCK_STREAM - constants defining type of socket
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client_socket.connect((address, PORT_NUM))
+        transfertuner.tuneControlSocket(client_socket)
+        #client_socket.settimeout(30) #30 seconds for timeout
+        #Replies are received in the background and matched to requests
+        receiver = ReplyReceiver(client_socket)
+    
+    except socket.herror:
+        #socket has failed to connect because of address lookup error
+        client_socket = None
+        raise IOError("Address lookup failed.")
+    except socket.gaierror:
+        #socket has failed to connect because of invalid address
+        client_socket = None
+        raise IOError("Invalid address.")
+    except socket.error:
+        #socket has failed to connect due to network issue/refused connection
+        client_socket = None
+        raise IOError("Connection failed.")
+#end of connect function
+
+
+#disconnect function: to disconnect the socket
+def disconnect(notify_server=True):
+    """
+    Usage:
+        Disconnects from the server. Use after program is finished using the
+        server. Will attempt to notify server of disconnect.
+    """
+    global client_socket, receiver
+    #only perform actions if the socket exists.
+    if client_socket != None:
+        if notify_server:
+            try:
+                # Send DISCONNECT_CMD to let server know of disconnect.
+                # ensures server can quit gracefully.
+                sendMsg(DISCONNECT_CMD)
+            except (IOError, AttributeError):
+                # if there's an error, we tried to notify server but failed,
+                # server has to deal with it, so we'll ignore.
+                pass
+        try:
+            #shutdown wakes the receiver, which is blocked receiving
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except (socket.error, AttributeError):
+            pass
+        try:
+            client_socket.close()
+        except AttributeError:
+            pass
+        #Wait for the receiver to wake any requests still waiting on replies
+        if receiver != None:
+            receiver.join(TIMEOUT)
+        #Remove reference to old socket object
+        client_socket = None
+        receiver = None
+#end of disconnect function
+
+###############################################################################
+# End of connect/disconnect functions
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Functions for sending commands to server
+###############################################################################
+
+#listDir function: to get a list of directories from the server and return it
+def listDir():
+    """
+    Usage:
+        Requests a list of files/directories from the server.
+    
+    Returns:
+        List of tuples in the form (file_name, file_size), one tuple for each
+        file or directory - file_size is -1 for directories.
+    
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+                - If this is raised, the socket is probably not connected.
+        OSError - If the server fails to retrieve directory info
+                - Possibly if the directory has been deleted or similar?
+        ValueError - If it receives badly formatted data from the server.
+                   - This should never happen if server is working properly.
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    try:
+        #[LS, validator] - recognised by server
+        data = sendCmdReceiveReply(LISTDIR_CMD, [getValidator(LISTDIR_CMD)])
+    except (IOError, AttributeError): raise
+
+    return readDirList(data)
+#end of listDir function
+
+
+#listDirPages function: to get the directory listing a page at a time
+def listDirPages(cursor=None, page_size=PAGE_SIZE):
+    """
+    Usage:
+        Requests the list of files/directories from the server, to be sent a
+        page at a time. This is a generator - each page can be used as soon as
+        it arrives, while the server is still producing the rest, so huge
+        directories can be shown straight away.
+        Entries are sorted by name. If the listing is interrupted, it can be
+        carried on by passing the cursor of the last page received - the
+        name of its last entry - so entries added or removed in between are
+        neither missed nor given twice.
+        A whole listing (from the start) is kept, so if the directory has not
+        changed the next time it is listed, the server need only say so, and
+        the listing kept is given as one page.
+
+    Takes in:
+        cursor - Where to start listing from, None (default) for the start.
+        page_size - Number of entries in each page.
+
+    Yields:
+        Tuples of (path, entries, cursor) - path of the directory, a list of
+        entries in the form used by getSnapshot(), and the cursor to carry on
+        after this page.
+
+    Exceptions:
+        As for getSnapshot().
+    """
+    validator = None
+    #Entries so far, to keep once the listing is complete
+    listing = None
+    if cursor in (None, 0):
+        validator = getValidator(LISTPAGES_CMD)
+        listing = []
+    try:
+        #[LSPAGES, cursor, page_size, validator] - recognised by server
+        request = sendRequest(LISTPAGES_CMD, [cursor, page_size, validator])
+    except (IOError, AttributeError): raise
+
+    try:
+        done = False
+        while not done:
+            data = request.getReply()
+            if checkForFailure(data):
+                message = "Server: Could not return directory data."
+                if len(data) >= 2:
+                    message = "Server: " + data[1]
+                raise OSError(message)
+            if data[0] == NOT_MODIFIED_MSG:
+                # data = [NOT_MODIFIED_MSG, path, validator]
+                kept = readNotModified(LISTPAGES_CMD, data)
+                if kept == None:
+                    #The listing was dropped from the cache since the request
+                    #was sent, so it is asked for again without a validator
+                    request.finish()
+                    try:
+                        request = sendRequest(LISTPAGES_CMD,
+                                              [cursor, page_size, None])
+                    except (IOError, AttributeError): raise
+                    continue
+                (path, (entries, cursor)) = kept
+                done = True
+                yield (path, list(entries), cursor)
+                continue
+            try:
+                # data = [SUCCESS_MSG, path, cursor, entries, done, validator]
+                (path, cursor, entries, done) = data[1:5]
+                entries = [(name, int(size), last_access, last_mod, file_type)
+                           for (name, size, last_access, last_mod, file_type)
+                           in entries]
+            except (ValueError, TypeError):
+                raise ValueError("Bad data from server.")
+            if listing != None:
+                listing.extend(entries)
+                if len(listing) > MAX_CACHED_ENTRIES:
+                    listing = None
+            if done and listing != None and len(data) >= 6:
+                cacheListing(LISTPAGES_CMD, path, data[5], (listing, cursor),
+                             len(listing))
+            yield (path, entries, cursor)
+    finally:
+        #If the generator is abandoned, remaining pages are ignored.
+        request.finish()
+#end of listDirPages function
+
+
+#searchFiles function: to search the contents of files on the server
+def searchFiles(pattern, regex=False, ignore_case=False, max_hits=SEARCH_HITS,
+                time_limit=SEARCH_TIME):
+    """
+    Usage:
+        Asks the server to search every text file under the current directory
+        (and its subdirectories) for lines matching pattern. The files are
+        searched on the server, so only the matching lines are sent over the
+        network. This is a generator - hits are given as soon as the server
+        finds them, while it carries on searching. If the generator is
+        abandoned, the server is told to stop searching.
+
+    Takes in:
+        pattern - string to look for.
+        regex - True if pattern is a regular expression, False (default) for
+                a literal string. The server limits how long it may be, and
+                tries it on long lines a piece at a time (see contentsearch).
+        ignore_case - True to match whatever the case of letters.
+        max_hits - Most matching lines to find (the server may cap it).
+        time_limit - Most seconds to search for (the server may cap it).
+
+    Yields:
+        Tuples of (hits, truncated) - a list of (path, line_number, text)
+        tuples, path being relative to the current directory with "/" between
+        names, and truncated, which is True only with the last hits if the
+        search stopped at a limit before every file was searched.
+
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+        ValueError - If the server sends back badly formatted data.
+        OSError - If the server could not search, e.g. for a bad regular
+                  expression.
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    try:
+        # [SEARCH, pattern, regex, ignore_case, max_hits, time_limit]
+        #                                               - recognised by server
+        request = sendRequest(SEARCH_CMD, [pattern, int(bool(regex)),
+                                           int(bool(ignore_case)), max_hits,
+                                           time_limit])
+    except (IOError, AttributeError): raise
+
+    done = False
+    try:
+        while not done:
+            data = request.getReply()
+            if checkForFailure(data):
+                message = "Server: Could not search files."
+                if len(data) >= 2:
+                    message = "Server: " + data[1]
+                done = True
+                raise OSError(message)
+            try:
+                # data = [SUCCESS_MSG, hits, done, truncated]
+                (hits, done, truncated) = data[1:4]
+                hits = [(path, int(line_number), text)
+                        for (path, line_number, text) in hits]
+            except (ValueError, TypeError):
+                raise ValueError("Bad data from server.")
+            yield (hits, bool(truncated))
+    finally:
+        #If the generator is abandoned, the server stops searching.
+        if not done:
+            try:
+                sendStreamMsg(request, CANCEL_CMD)
+            except (IOError, AttributeError):
+                pass
+        request.finish()
+#end of searchFiles function
+
+
+#chDir function: to change the current directory of the server's filestore
+def chDir(path):
+    """
+    Usage:
+        Used to request to change the current directory of the filestore on the
+        server.
+
+    Takes in:
+        path - path to change to.
+    
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+                - If this is raised, the socket is probably not connected.
+        OSError - If the server cannot/will not change directory (i.e. because
+                  of restrictions.)
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    global remote_path
+    #Not known again until the server gives it
+    remote_path = None
+    try:
+        # [CD, dir_name] - recognised by server
+        data = sendCmdReceiveReply(CHDIR_CMD, [path])
+    except (IOError, AttributeError): raise
+    
+    if checkForFailure(data): #Server couldn't/wouldn't change directory
+        message = "Server: Could not change directory."
+        if len(data) >= 2:
+            message = "Server: " + data[1]
+        raise OSError(message)
+    # data = [SUCCESS_MSG, path] - older servers leave out the path
+    if len(data) >= 2:
+        remote_path = data[1]
+#end of chDir function
+
+
+#makeDir function: to change the current directory of the server's filestore
+def makeDir(path):
+    """
+    Usage:
+        Used to request to create a new directory on the server.
+
+    Takes in:
+        path - directory to create.
+    
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+                - If this is raised, the socket is probably not connected.
+        OSError - If the server cannot/will not create directory (i.e. because
+                  of restrictions.)
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    try:
+        # [MKDIR, dir_name] - recognised by server
+        data = sendCmdReceiveReply(MKDIR_CMD, [path])
+    except (IOError, AttributeError): raise
+    
+    if checkForFailure(data): #Server couldn't/wouldn't make dir
+        message = "Server: Could not create directory."
+        if len(data) >= 2:
+            message = "Server: " + data[1]
+        raise OSError(message)
+#end of makeDir function
+
+
+#getDir function: to get the current path from the server
+def getDir():
+    """
+    Usage:
+        Request that the server send the path of the current directory.
+
+    Returns:
+        The path of the current directory of the filestore on the server.
+    
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+                - If this is raised, the socket is probably not connected.
+        OSError - If the server fails to retrieve directory info
+                - Possibly if the directory has been deleted or similar?
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    try:
+        #Request to be sent current location in server's filesystem
+        data = sendCmdReceiveReply(GETDIR_CMD)
+    except (IOError, AttributeError): raise
+    
+    return readDir(data)
+#end of getDir function
+
+
+#getDirAndList function: to get the current path and its listing at once
+def getDirAndList():
+    """
+    Usage:
+        Requests both the path of the current directory and the list of
+        files/directories in it. Both requests are sent before waiting for
+        either reply, so this costs one round trip instead of two.
+
+    Returns:
+        Tuple of (path, listing) - as returned by getDir() and listDir().
+
+    Exceptions:
+        As for getDir() and listDir().
+    """
+    try:
+        validator = getValidator(LISTDIR_CMD)
+        (dir_data, list_data) = sendCmdsReceiveReplies([(GETDIR_CMD, []),
+                                                        (LISTDIR_CMD,
+                                                         [validator])])
+    except (IOError, AttributeError): raise
+
+    return (readDir(dir_data), readDirList(list_data))
+#end of getDirAndList function
+
+
+#getSnapshot function: to get the current path, listing and entry details
+def getSnapshot():
+    """
+    Usage:
+        Requests the path of the current directory, the list of files/
+        directories in it, and the details of each, all in one request. The
+        server only scans the directory once to answer.
+
+    Returns:
+        Tuple of (path, entries) where entries is a list of tuples in the form
+        (file_name, file_size, last_access_time, last_modification_time,
+         type) - file_size is -1 for directories, type is "dir", "file" or
+        "other".
+
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+                - If this is raised, the socket is probably not connected.
+        OSError - If the server fails to retrieve directory info
+        ValueError - If it receives badly formatted data from the server.
+                   - This should never happen if server is working properly.
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    try:
+        data = sendCmdReceiveReply(SNAPSHOT_CMD)
+    except (IOError, AttributeError): raise
+
+    if checkForFailure(data): #The server cannot retrieve the data
+        message = "Server: Could not return directory data."
+        if len(data) >= 2:
+            message = "Server: " + data[1]
+        raise OSError(message)
+
+    try:
+        # data = [SUCCESS_MSG, path, [[name, size, atime, mtime, type], ...]]
+        entries = [(name, int(size), last_access, last_mod, file_type)
+                   for (name, size, last_access, last_mod, file_type)
+                   in data[2]]
+        return (data[1], entries)
+    except (IndexError, ValueError, TypeError):
+        raise ValueError("Bad data from server.")
+#end of getSnapshot function
+
+
+#getFileProperties function: to get details on a specified file from the server
+def getFileProperties(filename):
+    """
+    Usage:
+        Requests that the server send details for a file.
+    
+    Takes in:
+        filename - The file name of the file whose details are being requested.
+    
+    Returns:
+        Tuple of (full_path_name, file_size (bytes), last_access_time,
+                  last_modification_time)
+    
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+                - If this is raised, the socket is probably not connected.
+        OSError - If the server has failed to get data on the file.
+                - e.g. if the file does not exist.
+        ValueError - If it receives badly formatted data from the server.
+                   - This should never happen if server is working properly.
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    try:
+        #[INFO, filename]-recognised by server
+        data = sendCmdReceiveReply(GETINFO_CMD, [filename])
+    except (IOError, AttributeError): raise
+
+    #Server couldn't/wouldn't get file data.
+    if checkForFailure(data):
+        message = "Server: Could not get file data."
+        if len(data) >= 2:
+            message = "Server: " + data[1]
+        raise OSError(message)
+    
+    try:
+        # data is in form [SUCCESS_MSG, a, b, c, d] for transit
+        data = (data[1], int(data[2]), data[3], data[4])
+        return data
+    except (IndexError, ValueError):
+        #Server transferred badly formatted data.
+        raise ValueError("Bad data from server.")
+#end of getFileProperties function
+
+
+#findFiles function: to find files on the server by name, size or age
+def findFiles(name=None, min_size=None, max_size=None, min_mtime=None,
+              max_mtime=None, order=None, limit=FIND_RESULTS):
+    """
+    Usage:
+        Requests the files under the current directory (and its
+        subdirectories) which meet every condition given. The server looks
+        them up in an index of its files rather than going through them, so
+        this is quick however many files there are, but changes made since
+        the index was last brought up to date may be missed.
+        e.g. findFiles(order=LARGEST, limit=10) finds the 10 largest files,
+        findFiles("*.log", min_mtime=time.time() - 86400) finds logs changed
+        in the last day.
+
+    Takes in:
+        name - glob which file names must match, e.g. "*.log".
+        min_size/max_size - range of sizes in bytes, inclusive.
+        min_mtime/max_mtime - range of modification times, in seconds since
+                              the epoch, inclusive.
+        order - None to sort by path, LARGEST for the largest first, or
+                NEWEST for the most recently modified first.
+        limit - Most files to find (the server may cap it).
+
+    Returns:
+        Tuple of (files, updated) - a list of (path, file_size,
+        last_modification_time) tuples, path being relative to the current
+        directory with "/" between names, and the time the index was last
+        brought up to date, or None if it is still being built.
+
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+        OSError - If the server has no index, or could not find files.
+        ValueError - If it receives badly formatted data from the server.
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    try:
+        #[FIND, name, min_size, max_size, min_mtime, max_mtime, order, limit]
+        #                                               - recognised by server
+        data = sendCmdReceiveReply(FIND_CMD, [name, min_size, max_size,
+                                              min_mtime, max_mtime, order,
+                                              limit])
+    except (IOError, AttributeError): raise
+
+    if checkForFailure(data):
+        message = "Server: Could not find files."
+        if len(data) >= 2:
+            message = "Server: " + data[1]
+        raise OSError(message)
+
+    try:
+        # data = [SUCCESS_MSG, files, updated]
+        files = [(path, int(size), last_mod)
+                 for (path, size, last_mod) in data[1]]
+        return (files, data[2])
+    except (IndexError, ValueError, TypeError):
+        raise ValueError("Bad data from server.")
+#end of findFiles function
+
+###############################################################################
+# End of server command functions
+###############################################################################
+
+
+
+
+###############################################################################
+# Code for file transfer
+###############################################################################
+
+#FileTransfer class - allows concurrent, queued file transfer
+class FileTransfer(threading.Thread):
+    """
+    Usage:
+        Create an object of this class to execute a file transfer (upload
+        or download).
+        File transfers will be made to run concurrently, so will not block the
+        rest of the program. Large files have their own data connection,
+        small ones are multiplexed over the control connection, which saves
+        setting up a new connection. Up to MAX_TRANSFERS run at once (see
+        setMaxTransfers()), the rest are queued, and start in order of
+        priority. The server is only asked for a transfer once it starts, so
+        the order is decided here alone - the server runs each transfer as
+        soon as it is asked, unless it is busy with other clients'.
+        A transfer may be paused, unpaused or cancelled at any time, including
+        while it is running, using pause(), unpause() and cancel(). Its
+        priority may be changed while it is queued using setPriority() or
+        moveToFront().
+        To get the transfer's status, use getStatus() to get a tuple of
+        information.
+        Do not call any other methods in this class directly, simply create the
+        object. Calling any other method will mess up the program's operation.
+        Note - as the server is only asked for the transfer once it starts,
+        no exception will be raised if it fails, even if the server will not
+        send or take the file. Failure can be detected through getStatus()
+        File being read from/written to will automatically be closed at the
+        completion of the transfer - file should not be closed externally due
+        to the concurrent nature of this class.
+    """
+    
+    #Constructor
+    def __init__(self, filename, file_object, file_size=-1, download=True,
+                 multiplexed=None, resume=False, segment=None, compress=True,
+                 use_delta=False, dedupe=True, rate_limit=None,
+                 priority=NORMAL_PRIORITY, validator=None):
+        """
+        Constructor
+
+        Usage:
+            For an upload:
+                my_transfer = Transfer(filename_to_save_as,
+                                       file_object_to_read_from,
+                                       file_size=exact_size_in_bytes
+                                       download=False)
+            For a download:
+                my_transfer = Transfer(filename_of_file_to_download,
+                                       file_object_to_write_to)
+        
+        Takes in:
+            filename - If this transfer is an upload, the filename is the name
+                       to save the uploaded file to on the server.
+                       If this is a download, it is the name of the file to
+                       download from server.
+            file_object - If this is an upload, the file_object is the file to
+                          read data from, and upload. Must be in "rb" mode.
+                          If this is a download, the file_object is the file to
+                          write downloaded data to. Must be in "wb" mode, or
+                          if resuming, "r+b" or "ab" mode.
+            file_size - If this is an upload, this is required, and must be the
+                        exact size of the file in bytes.
+                        If this is a download, this is not required and will be
+                        ignored.
+            download - Boolean for whether this is a download or an upload.
+                       should be True (default) if this is a download,
+                       False for an upload.
+            multiplexed - True to send the data over the control connection,
+                          False for a separate data connection, None
+                          (default) to multiplex uploads smaller than
+                          MULTIPLEX_LIMIT. Downloads are only multiplexed if
+                          True, as the size is not known until the server
+                          replies.
+            resume - True to carry on from a transfer which was cut short.
+                     For a download, everything already in file_object is
+                     kept, and the server sends the rest - give validator,
+                     so this fails if the file has changed since. For an
+                     upload, the server carries on from the end of its
+                     partial file of the same name, if it was made from a
+                     file of the same size and modification time as this
+                     one, and starts again otherwise.
+            segment - For a download, optional tuple of (offset, length) to
+                      only download length bytes from offset, writing them in
+                      the same place in file_object, which must be in "r+b"
+                      mode. Used by SegmentedDownload.
+            compress - True (default) to compress the data on the way, if it
+                       is worth it (see compression.worthCompressing()),
+                       False to never compress it.
+            use_delta - For an upload, True to replace the file on the server
+                        if it already exists, sending only the parts which
+                        have changed (see delta module). If the server has
+                        the file, and both are big enough for a delta to be
+                        worth it (the server decides), the delta is always
+                        multiplexed, otherwise the whole file is sent as
+                        multiplexed says, and still replaces the server's.
+            dedupe - For an upload, True (default) to send the file's hash
+                     first, so that if the server already has a file with the
+                     same contents it copies that one instead, and nothing is
+                     sent. Files smaller than DEDUPE_MIN_SIZE are just sent.
+                     The file is hashed once the transfer starts, so as not
+                     to hold up the caller.
+            rate_limit - cap on this transfer's data rate in bytes per
+                         second, or None (default) for no cap. May be changed
+                         later using setRateLimit().
+            priority - LOW_PRIORITY, NORMAL_PRIORITY (default) or
+                       HIGH_PRIORITY. Queued transfers with a higher
+                       priority start first, here and on the server.
+            validator - For a download, [size, modification time] the file
+                        on the server had when what is already in
+                        file_object was downloaded (see getFileProperties()),
+                        or None (default). The server refuses to resume if
+                        the file has changed since.
+
+        Exceptions:
+            AttributeError - If the file is open in the wrong mode.
+                           - If the socket = None, i.e. if it has not been
+                             created using connect(), or has been disconnected
+                             with disconnect()
+            IOError - If network IO fails while getting the server's current
+                      directory (see getDir()).
+            OSError - If the server cannot give its current directory.
+            ValueError - If it receives badly formatted data from the server.
+                       - Should never happen if server is working properly.
+        """
+        #Thread requires a call to its constructor
+        threading.Thread.__init__(self)
+        
+        self.download = download
+        self.address = address
+        self.port = None
+        self.multiplexed = multiplexed
+        if multiplexed == None:
+            self.multiplexed = (not download and
+                                0 <= file_size < MULTIPLEX_LIMIT)
+        self.request = None
+        self.transfer_socket = None
+        self.tuner = None
+        self.rtt = None
+        self.request_id = None
+        self.rate_limit = transferengine.TokenBucket(rate_limit)
+        #Pauses or cancels the transfer between pieces of data
+        self.control = transferengine.TransferControl(self.keepAlive)
+        #Every cap which applies to this transfer
+        self.limits = (self.control, self.rate_limit,
+                       transfer_engine.rate_limit)
+        self.priority = priority
+        self.resume = resume
+        self.segment = segment
+        self.compress = compress
+        self.use_delta = use_delta
+        self.dedupe = dedupe
+        #Whether the upload is only asked for once the file is hashed
+        self.hash_first = (not download and dedupe and
+                           file_size >= DEDUPE_MIN_SIZE)
+        self.validator = validator
+        self.block_size = None
+        self.filename = filename
+        self.file_object = file_object
+        
+        self.file_size = file_size
+        self.bytes_transferred = 0
+        #transfer_going - whether or not the transfer is in progress
+        #false if finished, failed, or waiting in the queue
+        self.transfer_going = False
+        #has_failed indicates if the transfer has failed.
+        self.has_failed = False
+        self.is_complete = False
+        self.has_started = False
+
+        #for downloading, file needs to be written to in binary mode.
+        if download and segment != None:
+            if file_object.mode not in ("r+b", "rb+"):
+                raise AttributeError("File must be opened in r+b mode to " +
+                                     "download a segment")
+        elif download and resume and file_object.mode not in RESUME_MODES:
+            raise AttributeError("File must be opened in r+b or ab mode " +
+                                 "to resume download")
+        elif download and not resume and file_object.mode != "wb":
+            raise AttributeError("File must be opened in wb mode for download")
+        #for uploading, file needs to be read from in binary mode.
+        elif not download and file_object.mode != "rb":
+            raise AttributeError("File must be opened in rb mode for upload")
+
+        #The server is only asked for the transfer once it starts, by which
+        #time its current directory may have changed
+        self.directory = remote_path
+        if self.directory == None:
+            self.directory = getDir()
+        #Start the thread once there is room for it - the thread asks the
+        #server for the transfer, and handles actual data transfer.
+        transfer_engine.add(self, priority)
+    #End of Constructor
+    
+
+    #getStatus method - to get a tuple of the transfer status
+    def getStatus(self):
+        """
+        Usage:
+            Use to keep track of the file transfer's status
+
+        Returns:
+            tuple of file transfer status:
+                (bytes_transferred, file_size, transfer_going, has_failed,
+                 is_complete, has_started)
+        """
+        status = (self.bytes_transferred, self.file_size, self.transfer_going,
+                  self.has_failed, self.is_complete, self.has_started)
+        return status
+    #End of getStatus method
+
+
+    #setRateLimit method - to change the cap on this transfer's data rate
+    def setRateLimit(self, rate):
+        """
+        Usage:
+            Applies straight away. The server is asked to cap the transfer
+            too, if it is still going, so it doesn't send more than will be
+            taken.
+
+        Takes in:
+            rate - bytes per second, or None/0 for no cap.
+
+        Exceptions:
+            ValueError - If rate is not a number, or is negative.
+            IOError - If network IO fails.
+        """
+        self.rate_limit.setRate(rate)
+        if self.request_id != None and not (self.is_complete or
+                                            self.has_failed):
+            try:
+                setServerRateLimit(rate, TRANSFER_SCOPE, self.request_id)
+            except OSError:
+                #The transfer finished in the meantime
+                pass
+    #End of setRateLimit method
+
+
+    #pause method - to stop the transfer until it is unpaused
+    def pause(self):
+        """
+        Usage:
+            A running transfer stops after the piece of data it is on, and
+            another transfer may start in its place. A queued transfer is not
+            started until it is unpaused.
+        """
+        self.control.pause()
+        transfer_engine.pause(self)
+        self.sendPaused(True)
+    #End of pause method
+
+
+    #unpause method - to carry on with a paused transfer
+    def unpause(self):
+        """
+        Usage:
+            Not called resume(), as resume is whether the transfer carries on
+            from a partial file (see Constructor).
+        """
+        self.control.resume()
+        transfer_engine.resume(self)
+        self.sendPaused(False)
+    #End of unpause method
+
+
+    #isPaused method - to check whether the transfer is paused
+    def isPaused(self):
+        return self.control.isPaused()
+    #End of isPaused method
+
+
+    #cancel method - to stop the transfer for good
+    def cancel(self):
+        """
+        Usage:
+            A running transfer fails after the piece of data it is on. A
+            queued transfer fails straight away, and is never started. If the
+            server has been asked for the transfer, it is told to give up on
+            it, which also fails one still waiting its turn there.
+        """
+        self.control.cancel()
+        if transfer_engine.remove(self):
+            #The server has not been asked for it yet
+            self.has_failed = True
+            self.file_object.close()
+        elif self.request_id != None and not (self.is_complete or
+                                              self.has_failed):
+            try:
+                sendFrame([self.request_id, CANCEL_CMD])
+            except (IOError, AttributeError):
+                pass
+    #End of cancel method
+
+
+    #setPriority method - to change the priority of a queued transfer
+    def setPriority(self, priority):
+        """
+        Usage:
+            Changes the order queued transfers start in, here and on the
+            server. Has no effect once the transfer has started.
+
+        Takes in:
+            priority - LOW_PRIORITY, NORMAL_PRIORITY or HIGH_PRIORITY.
+        """
+        self.priority = priority
+        transfer_engine.setPriority(self, priority)
+        self.sendPriority()
+    #End of setPriority method
+
+
+    #moveToFront method - to start this before other queued transfers
+    def moveToFront(self):
+        """
+        Usage:
+            Starts this before any other queued transfer of the same
+            priority.
+        """
+        transfer_engine.moveToFront(self)
+    #End of moveToFront method
+
+
+    #sendPriority method - to tell the server the transfer's priority
+    def sendPriority(self):
+        """
+        Usage:
+            For internal use only.
+            The server is given the priority when it is asked for the
+            transfer, and told of any change while it is still waiting its
+            turn there. Nothing is lost if it cannot be told, e.g. the server
+            has not been asked for the transfer yet, or has already started
+            or finished it.
+        """
+        if self.request_id == None:
+            return
+        try:
+            # [PRIORITY, transfer_request_id, priority] - recognised by server
+            sendCmdReceiveReply(PRIORITY_CMD, [self.request_id, self.priority])
+        except (IOError, AttributeError):
+            pass
+    #End of sendPriority method
+
+
+    #sendPaused method - to tell the server the transfer is paused or not
+    def sendPaused(self, paused):
+        """
+        Usage:
+            For internal use only.
+            The server gives the place of a paused transfer to another, as
+            is done here, so the transfer started here in its place is not
+            held back there. Nothing is lost if it cannot be told, e.g. the
+            server has not been asked for the transfer yet.
+        """
+        if self.request_id == None:
+            return
+        try:
+            # [transfer_request_id, PAUSE, paused] - recognised by server
+            sendFrame([self.request_id, PAUSE_CMD, int(paused)])
+        except (IOError, AttributeError):
+            pass
+    #End of sendPaused method
+
+
+    #keepAlive method - to keep the server waiting while paused
+    def keepAlive(self):
+        """
+        Usage:
+            For internal use only, called by the TransferControl while the
+            transfer is paused, and by transfer_engine while it is queued.
+            The server gives up on a multiplexed transfer which goes quiet for
+            TIMEOUT seconds, so an empty window message is sent to show the
+            transfer is still wanted. The server does the same while the
+            transfer is paused there.
+        """
+        request = self.request
+        if self.multiplexed and request != None:
+            try:
+                sendStreamMsg(request, WINDOW_MSG, [0])
+            except (IOError, AttributeError):
+                pass
+    #End of keepAlive method
+
+
+    #initialiseDownload method - to initialise for download (not upload)
+    #This gets file size data from the server, and lets the server know to add
+    #  this transfer to its queue.
+    def initialiseDownload(self):
+        """
+        Usage:
+            For internal use only.
+            Used to initialise the FileTransfer object for a download.
+            Communicates with server, gets file size data, lets server know to
+            add this to its queue of transfers.
+
+        Exceptions:
+            AttributeError - If the socket = None, i.e. if it has not been
+                             created using connect(), or has been disconnected
+                             with disconnect()
+            IOError - If network IO (request for or receipt of data) fails.
+                    - If this is raised, the socket is probably not connected.
+            OSError - If the server fails to retreive the file
+                    - e.g. if the file does not exist.
+            ValueError - If it receives badly formatted data from the server.
+                       - Should never happen if server is working properly.
+        """
+        length = None
+        if self.segment != None:
+            #Write the segment in its own place in the file
+            (offset, length) = self.segment
+            self.file_object.seek(offset)
+            self.bytes_transferred = offset
+        elif self.resume:
+            #Carry on after what we already have
+            self.file_object.seek(0, os.SEEK_END)
+            self.bytes_transferred = self.file_object.tell()
+        # command should be
+        #   [DOWN, filename, multiplexed, offset, length, compress, validator,
+        #    directory, priority]
+        data = self.sendTransferRequest(DOWNLOAD_CMD,
+                                        [self.filename, int(self.multiplexed),
+                                         self.bytes_transferred, length,
+                                         int(self.compress), self.validator,
+                                         self.directory, self.priority])
+        #If server failed to get file.
+        if checkForFailure(data):
+            raise OSError("Server: Could not send file.")
+        try:
+            #data = [SUCCESS_MSG, file_size, port]
+            self.file_size = int(data[1])
+            if not self.multiplexed:
+                self.port = int(data[2])
+            if self.segment != None:
+                #Stop at the end of the segment
+                self.file_size = self.segment[0] + self.segment[1]
+            #The server decides whether to compress
+            self.compress = len(data) >= 4 and bool(data[3])
+        except (IndexError, ValueError, TypeError):
+            #Server has sent bad data. (data[1] should be data length integer)
+            #The server gives up on the transfer if we never connect.
+            self.finishRequest()
+            raise ValueError("Bad data from server.")
+    #End of initialiseDownload method
+    
+
+    #initialiseUpload method - to initialise for upload (not download)
+    #Tells server the filename and filesize, and lets it know to add this
+    #transfer to its queue
+    def initialiseUpload(self):
+        """
+        Usage:
+            For internal use only.
+            Used to initialise the FileTransfer object for an upload.
+            Communicates with server, sends server data on the file being
+            uploaded, lets server know to add this to its transfer queue.
+
+        Exceptions:
+            AttributeError - If the socket = None, i.e. if it has not been
+                             created using connect(), or has been disconnected
+                             with disconnect()
+            IOError - If network IO (request for or receipt of data) fails.
+                    - If this is raised, the socket is probably not connected.
+            OSError - If the server will not/cannot receive file.
+                    - e.g. if there is already a file with specified name.
+            ValueError - If it receives badly formatted data from the server.
+                       - Should never happen if server is working properly.
+        """
+        if self.compress:
+            #Only compress if it is worth it
+            position = self.file_object.tell()
+            self.compress = compression.worthCompressing(
+                    self.file_object.read(compression.SAMPLE_SIZE))
+            self.file_object.seek(position)
+        content_hash = None
+        if self.hash_first:
+            content_hash = hashindex.hashFile(self.file_object)
+        resume = None
+        if self.resume:
+            #The server only carries on from a partial file made from a
+            #file the same as this one
+            resume = [self.file_size,
+                      os.fstat(self.file_object.fileno()).st_mtime]
+        # command should be
+        #   [UP, filename, file_size, multiplexed, resume, compress, delta,
+        #    content_hash, directory, priority]
+        message = self.sendTransferRequest(UPLOAD_CMD,
+                                           [self.filename, self.file_size,
+                                            int(self.multiplexed),
+                                            resume,
+                                            int(self.compress),
+                                            int(self.use_delta),
+                                            content_hash, self.directory,
+                                            self.priority])
+        #If server will not accept file upload.
+        if checkForFailure(message):
+            raise OSError("Server would not accept file.")
+        try:
+            #message = [SUCCESS_MSG, port, bytes_server_already_has,
+            #           delta_block_size, deduplicated]
+            if len(message) >= 5 and message[4]:
+                #The server copied a file it already had
+                self.finishRequest()
+                self.bytes_transferred = self.file_size
+                self.has_started = True
+                self.is_complete = True
+                return
+            if len(message) >= 4 and message[3] != None:
+                #The server has the file, so only the delta is sent, over
+                #the control connection
+                self.block_size = int(message[3])
+                self.compress = False
+                self.multiplexed = True
+            elif not self.multiplexed:
+                #Nothing more comes in reply to the request
+                self.finishRequest()
+            if not self.multiplexed:
+                self.port = int(message[1])
+            if self.block_size == None and self.resume:
+                self.bytes_transferred = int(message[2])
+                self.file_object.seek(self.bytes_transferred)
+        except (IndexError, ValueError, TypeError):
+            self.finishRequest()
+            raise ValueError("Bad data from server.")
+    #End of initialiseUpload method
+
+
+    #initialise method - to ask the server for the transfer
+    def initialise(self):
+        """
+        Usage:
+            For internal use only, by run().
+            The server is only asked for the transfer once it starts here, so
+            the server starts it straight away, rather than queueing it in an
+            order of its own. An upload which is hashed first is hashed here
+            too, in this transfer's own thread, as hashing a big file takes a
+            while.
+
+        Exceptions:
+            As for initialiseDownload()/initialiseUpload(), except IOError if
+            not connected.
+        """
+        try:
+            if self.download:
+                self.initialiseDownload()
+            else:
+                self.initialiseUpload()
+        except AttributeError:
+            raise IOError("Not connected.")
+    #End of initialise method
+
+
+    #sendTransferRequest method - to ask the server to start the transfer
+    def sendTransferRequest(self, command, params):
+        """
+        Usage:
+            For internal use only.
+            Sends the download/upload request and returns the server's first
+            reply, which only comes once the server has started the transfer,
+            so there is no time limit on it. If multiplexed, the request is kept in self.request, as the
+            data (and flow control messages) come in reply to it, otherwise
+            it is finished - except for a delta upload, which is only
+            multiplexed if the server has the file, so initialiseUpload()
+            finishes it once the reply says whether it does.
+        """
+        start = time.time()
+        self.request = sendRequest(command, params)
+        #The server knows the transfer by this, e.g. to cap its rate
+        self.request_id = self.request.request_id
+        if self.control.isPaused():
+            #Paused since it started
+            self.sendPaused(True)
+        try:
+            reply = self.request.getReply()
+        except IOError:
+            self.finishRequest()
+            raise
+        #At most the round trip time, as it includes the server's work
+        self.rtt = time.time() - start
+        delta_upload = self.use_delta and not self.download
+        if checkForFailure(reply) or not (self.multiplexed or delta_upload):
+            self.finishRequest()
+        return reply
+    #End of sendTransferRequest method
+
+
+    #finishRequest method - to stop receiving replies to the transfer request
+    def finishRequest(self):
+        if self.request != None:
+            self.request.finish()
+            self.request = None
+    #End of finishRequest method
+
+
+    #transferMultiplexed method - to transfer over the control connection
+    def transferMultiplexed(self):
+        """
+        Usage:
+            For internal use only.
+            Used instead of transfer() to send or receive the data as messages
+            on the control connection, tagged with this transfer's request ID.
+            Each side may only send a window (STREAM_WINDOW) of data before
+            the other side grants it more, so a transfer never fills up the
+            connection and other requests are still answered meanwhile.
+
+        Exceptions:
+            IOError - If network IO fails, or the server gives up on the
+                      transfer.
+            ValueError - If the server sends bad data.
+        """
+        if self.download:
+            decoder = compression.Decoder(self.compress)
+            consumed = 0
+            while self.bytes_transferred < self.file_size:
+                message = self.request.getReply(TIMEOUT)
+                if checkForFailure(message):
+                    raise IOError("Server: transfer failed.")
+                elif message[0] == WINDOW_MSG:
+                    #The transfer is waiting its turn on the server
+                    continue
+                elif message[0] != DATA_MSG or len(message) < 2:
+                    raise ValueError("Bad data from server.")
+                #window is used up by the data as it was sent
+                consumed += len(message[1])
+                #Holding back window holds the server back
+                transferengine.throttle(self.limits, len(message[1]))
+                data = decoder.decode(message[1])
+                self.file_object.write(data)
+                self.bytes_transferred += len(data)
+                #Let the server send more once half the window is used up
+                if consumed >= STREAM_WINDOW / 2:
+                    sendStreamMsg(self.request, WINDOW_MSG, [consumed])
+                    consumed = 0
+            return
+        if self.block_size != None:
+            self.sendDelta()
+            return
+        window = STREAM_WINDOW
+        encoder = compression.Encoder(self.compress)
+        while self.bytes_transferred < self.file_size:
+            window = self.takeWindow(window)
+            data = self.file_object.read(min(window, STREAM_CHUNK_SIZE,
+                                             self.file_size -
+                                             self.bytes_transferred))
+            if data == "":
+                raise IOError("File ended early.")
+            self.bytes_transferred += len(data)
+            data = encoder.encode(data)
+            if self.bytes_transferred == self.file_size:
+                data += encoder.finish()
+            #The compressor may hold on to small pieces for now
+            if data != "":
+                transferengine.throttle(self.limits, len(data))
+                sendStreamMsg(self.request, DATA_MSG, [data])
+                window -= len(data)
+        self.waitForServer()
+    #End of transferMultiplexed method
+
+
+    #sendDelta method - to upload only what the server does not have
+    def sendDelta(self):
+        """
+        Usage:
+            For internal use only, by transferMultiplexed().
+            Gets the signatures of the server's copy of the file, then sends
+            the differences, as literal data (DATA_MSG) and references to
+            blocks of the server's copy (COPY_MSG).
+
+        Exceptions:
+            IOError - If network IO fails, or the server gives up on the
+                      transfer.
+            ValueError - If the server sends bad data.
+        """
+        #The server reads its whole copy first, which may take a while, and
+        #the transfer may be paused there meanwhile. The signatures come a
+        #few at a time, as
+        #   [SIGNATURES_MSG, signatures, done]
+        signatures = []
+        done = False
+        while not done:
+            message = self.request.getReply()
+            if message[0] == WINDOW_MSG:
+                continue
+            if checkForFailure(message):
+                raise IOError("Server: transfer failed.")
+            elif message[0] != SIGNATURES_MSG or len(message) < 2 or \
+                 not isinstance(message[1], list):
+                raise ValueError("Bad data from server.")
+            signatures.extend(message[1])
+            #Older servers send them all in one message
+            done = len(message) < 3 or bool(message[2])
+        self.file_object.seek(0)
+        self.bytes_transferred = 0
+        window = STREAM_WINDOW
+        for operation in delta.computeDelta(self.file_object, signatures,
+                                            self.block_size):
+            window = self.takeWindow(window)
+            if operation[0] == delta.LITERAL:
+                transferengine.throttle(self.limits, len(operation[1]))
+                sendStreamMsg(self.request, DATA_MSG, [operation[1]])
+                self.bytes_transferred += len(operation[1])
+                window -= len(operation[1])
+            else:
+                sendStreamMsg(self.request, COPY_MSG, list(operation[1:3]))
+                self.bytes_transferred += operation[3]
+                window -= COPY_COST
+        if self.bytes_transferred != self.file_size:
+            raise IOError("File is not the size given.")
+        self.waitForServer()
+    #End of sendDelta method
+
+
+    #takeWindow method - to take any window the server has granted
+    def takeWindow(self, window):
+        """
+        Usage:
+            For internal use only, when sending multiplexed data.
+            Only waits for the server if there is no window left.
+
+        Takes in:
+            window - bytes which may be sent before more window is needed.
+
+        Returns:
+            New window, with any the server has granted added on.
+
+        Exceptions:
+            IOError - If the server gives up on the transfer, or grants no
+                      window for TIMEOUT seconds.
+        """
+        while True:
+            try:
+                if window > 0:
+                    message = self.request.replies.get_nowait()
+                else:
+                    message = self.request.getReply(TIMEOUT)
+            except Queue.Empty:
+                return window
+            if message == None or checkForFailure(message):
+                raise IOError("Server: transfer failed.")
+            elif message[0] == WINDOW_MSG and len(message) >= 2:
+                window += int(message[1])
+    #End of takeWindow method
+
+
+    #waitForServer method - to wait until the server has the whole file
+    def waitForServer(self):
+        while True:
+            message = self.request.getReply(TIMEOUT)
+            if checkForFailure(message):
+                raise IOError("Server: transfer failed.")
+            elif message[0] == SUCCESS_MSG:
+                return
+    #End of waitForServer method
+
+
+    #transfer method - to carry out the file transfer (only call from run)
+    def transfer(self):
+        """
+        Usage:
+            For internal use only.
+            Used to perform the actual transfer/read/write of data.
+
+        Exceptions:
+            AttributeError - If the transfer socket has not been created.
+            IOError - If network IO (request for or receipt of data) fails.
+                    - If this is raised, connection is dead.
+        """
+        try:
+            encoder = compression.Encoder(self.compress)
+            #Chunk and socket buffer sizes follow the speed of the connection
+            self.tuner = transfertuner.TransferTuner(self.transfer_socket,
+                                                     not self.download,
+                                                     self.rtt)
+            #Loop until all data is transferred.
+            while self.bytes_transferred < self.file_size:
+                #if it's a download, receive data.
+                if self.download and self.compress:
+                    self.receiveCompressed()
+                elif self.download:
+                    self.receiveData()
+                #If it's an upload, send data.
+                else:
+                    #read data from file, and send it through the socket
+                    data = self.file_object.read(self.tuner.chunkSize())
+                    if data == "":
+                        raise IOError("File ended early.")
+                    transferengine.throttle(self.limits, len(data))
+                    self.transfer_socket.sendall(encoder.encode(data))
+                    self.bytes_transferred += len(data)
+                    self.tuner.update(len(data))
+            if not self.download:
+                self.transfer_socket.sendall(encoder.finish())
+        except (socket.error, socket.timeout, zlib.error):
+            raise IOError("Transfer failed.")
+    #End of transfer method
+
+
+    #receiveData method - to receive the rest of the file into the file
+    def receiveData(self):
+        """
+        Usage:
+            For internal use only, by transfer().
+            Receives straight into one buffer, which is reused for the whole
+            transfer, and only writes to the file once the buffer is full (or
+            the file is complete), so few large writes are made.
+
+        Exceptions:
+            socket.error - If receiving fails or the connection closes.
+        """
+        buffer = bytearray(RECEIVE_BUFFER_SIZE)
+        view = memoryview(buffer)
+        filled = 0
+        while self.bytes_transferred < self.file_size:
+            wanted = min(RECEIVE_BUFFER_SIZE - filled,
+                         self.file_size - self.bytes_transferred)
+            received = self.transfer_socket.recv_into(view[filled:], wanted)
+            #if nothing is received, the transfer has failed.
+            if received == 0:
+                raise socket.error("Connection closed.")
+            filled += received
+            self.bytes_transferred += received
+            self.tuner.update(received)
+            #Not reading holds the server back, once the socket fills up
+            transferengine.throttle(self.limits, received)
+            if filled == RECEIVE_BUFFER_SIZE or \
+               self.bytes_transferred == self.file_size:
+                #write binary data to file
+                self.file_object.write(view[:filled])
+                filled = 0
+        self.file_object.flush()
+    #End of receiveData method
+
+
+    #receiveCompressed method - to receive the rest of a compressed file
+    def receiveCompressed(self):
+        """
+        Usage:
+            For internal use only, by transfer().
+            Used instead of receiveData() if the server is compressing, as the
+            amount of data to receive is not known - it stops once the file
+            is complete.
+
+        Exceptions:
+            socket.error - If receiving fails or the connection closes.
+            zlib.error - If the data is not valid compressed data.
+        """
+        decoder = compression.Decoder(True)
+        while self.bytes_transferred < self.file_size:
+            data = self.transfer_socket.recv(RECEIVE_BUFFER_SIZE)
+            #if data == "", the transfer has failed.
+            if data == "":
+                raise socket.error("Connection closed.")
+            self.tuner.update(len(data))
+            transferengine.throttle(self.limits, len(data))
+            data = decoder.decode(data)
+            self.file_object.write(data)
+            self.bytes_transferred += len(data)
+        self.file_object.flush()
+    #End of receiveCompressed method
+
+
+    #run method - required by thread class - code to be concurrently executed
+    def run(self):
+        """
+        Usage:
+            For internal use only.
+            Required by thread class, code here is executed concurrently.
+            This performs initialisation of the connection used for file
+            transfer, and will automatically let the next transfer in the
+            queue start upon completion.
+        """
+        self.has_started = True
+        self.transfer_going = True
+        try:
+            self.initialise()
+            if self.is_complete:
+                #The server copied a file it already had
+                self.transfer_going = False
+                return
+            if self.multiplexed:
+                self.transferMultiplexed()
+            else:
+                #Create a socket and connect it to this transfer's port. The
+                #server was already listening before it told us the port.
+                self.transfer_socket = socket.socket(socket.AF_INET,
+                                                     socket.SOCK_STREAM)
+                self.transfer_socket.connect((self.address, self.port))
+                #Call actual transfer code
+                self.transfer()
+        except (IOError, OSError, ValueError, socket.error, socket.herror,
+                socket.gaierror, socket.timeout, zlib.error):
+            #Some exception has been thrown, this transfer has failed.
+            self.transfer_going = False
+            self.has_failed = True
+            if self.multiplexed:
+                try:
+                    #Let the server know to stop sending/waiting for data
+                    sendStreamMsg(self.request, CANCEL_CMD)
+                except (IOError, AttributeError):
+                    pass
+        else:
+            #The transfer has completed without any issues. The file is
+            #closed first, so it is all there once it is seen to be complete.
+            self.file_object.close()
+            self.transfer_going = False
+            self.is_complete = True
+        finally:
+            #Tidying up - close file and socket once operations are done
+            if self.transfer_socket != None:
+                self.transfer_socket.close()
+            self.file_object.close()
+            self.finishRequest()
+            #Let the next transfer in the queue start
+            transfer_engine.finished(self)
+    #End of run method
+    
+#End of FileTransfer class
+
+
+#TreeTransfer class - transfers a directory and everything in it
+class TreeTransfer(FileTransfer):
+    """
+    Usage:
+        Create an object of this class to download or upload a directory,
+        with everything in it, as one transfer. The files are sent one after
+        the other in a single stream (see treestream module), so there is no
+        request and reply for each file, and small files don't each wait for
+        a round trip.
+        Works as a FileTransfer otherwise - getStatus() gives the bytes of
+        the whole tree transferred so far.
+        Files which already exist are not overwritten - the transfer fails
+        when it reaches one.
+    """
+
+    #Constructor
+    def __init__(self, dirname, local_directory, download=True,
+                 multiplexed=None, compress=True):
+        """
+        Constructor
+
+        Usage:
+            For a download:
+                my_transfer = TreeTransfer(name_of_directory_on_server,
+                                           full_path_to_save_it_to)
+            For an upload:
+                my_transfer = TreeTransfer(name_to_save_directory_as,
+                                           full_path_of_directory_to_upload,
+                                           download=False)
+
+        Takes in:
+            dirname - the name of the directory on the server.
+            local_directory - full path of the directory on this machine. For
+                              a download it is made if it does not exist.
+            download - True (default) for a download, False for an upload.
+            multiplexed - as for FileTransfer.
+            compress - as for FileTransfer.
+
+        Exceptions:
+            As for FileTransfer.
+            OSError - also if the local directory cannot be read or made.
+        """
+        self.manifest = None
+        if download:
+            file_object = treestream.TreeWriter(local_directory)
+            file_size = -1
+        else:
+            self.manifest = treestream.makeManifest(local_directory)
+            file_object = treestream.TreeReader(local_directory,
+                                                self.manifest)
+            file_size = file_object.size
+        FileTransfer.__init__(self, dirname, file_object, file_size,
+                              download=download, multiplexed=multiplexed,
+                              compress=compress, dedupe=False)
+    #End of Constructor
+
+
+    #initialiseDownload method - to initialise for download (not upload)
+    def initialiseDownload(self):
+        """
+        Usage:
+            For internal use only.
+            Gets the size and manifest of the tree from the server, and
+            readies the local directory for it.
+
+        Exceptions:
+            As for FileTransfer.initialiseDownload()
+        """
+        # command should be
+        #   [DOWNTREE, dirname, multiplexed, compress, directory, priority]
+        data = self.sendTransferRequest(DOWNTREE_CMD,
+                                        [self.filename, int(self.multiplexed),
+                                         int(self.compress), self.directory,
+                                         self.priority])
+        if checkForFailure(data):
+            raise OSError("Server: Could not send directory.")
+        try:
+            #data = [SUCCESS_MSG, total_size, port, compressed, manifest]
+            self.file_size = int(data[1])
+            if not self.multiplexed:
+                self.port = int(data[2])
+            self.compress = bool(data[3])
+            self.file_object.setManifest(data[4])
+            if self.file_object.size != self.file_size:
+                raise ValueError("Manifest does not match size.")
+        except (IndexError, ValueError, TypeError, OSError, IOError) as e:
+            #The server gives up on the transfer if we never connect, or
+            #cancel.
+            if self.multiplexed:
+                sendStreamMsg(self.request, CANCEL_CMD)
+            self.finishRequest()
+            if isinstance(e, (OSError, IOError)):
+                raise OSError("Could not save directory: " + str(e))
+            raise ValueError("Bad data from server.")
+    #End of initialiseDownload method
+
+
+    #initialiseUpload method - to initialise for upload (not download)
+    def initialiseUpload(self):
+        """
+        Usage:
+            For internal use only.
+            Sends the size and manifest of the tree to the server.
+
+        Exceptions:
+            As for FileTransfer.initialiseUpload()
+        """
+        if self.compress:
+            #Only compress if it is worth it
+            self.compress = compression.worthCompressing(
+                    self.file_object.read(compression.SAMPLE_SIZE))
+            self.file_object.seek(0)
+        # command should be
+        #   [UPTREE, dirname, total_size, manifest, multiplexed, compress,
+        #    directory, priority]
+        message = self.sendTransferRequest(UPTREE_CMD,
+                                           [self.filename, self.file_size,
+                                            self.manifest,
+                                            int(self.multiplexed),
+                                            int(self.compress),
+                                            self.directory, self.priority])
+        if checkForFailure(message):
+            raise OSError("Server would not accept directory.")
+        try:
+            #message = [SUCCESS_MSG, port, 0, None]
+            if not self.multiplexed:
+                self.port = int(message[1])
+        except (IndexError, ValueError, TypeError):
+            self.finishRequest()
+            raise ValueError("Bad data from server.")
+    #End of initialiseUpload method
+
+#End of TreeTransfer class
+
+
+#SegmentedDownload class - downloads one file over several connections
+class SegmentedDownload(object):
+    """
+    Usage:
+        Create an object of this class to download a large file as several
+        segments (byte ranges) at once, each over its own data connection,
+        which is faster than one connection on links with a lot of latency.
+        Each segment is written straight to its place in the file, through
+        its own file object.
+        Segments are FileTransfers, so they share the limit on transfers
+        running at once (see setMaxTransfers()).
+        getStatus() gives the status of the whole download, in the same form
+        as FileTransfer.getStatus().
+    """
+
+    #Constructor
+    def __init__(self, filename, file_object, segments=SEGMENTS):
+        """
+        Constructor
+
+        Usage:
+            my_download = SegmentedDownload(filename_of_file_to_download,
+                                            file_object_to_write_to)
+
+        Takes in:
+            filename - the name of the file to download from the server.
+            file_object - the file to write downloaded data to. Must be in
+                          "wb" mode, and is closed straight away, as each
+                          segment opens the file for itself.
+            segments - most segments to split the download into. No segment
+                       is made smaller than SEGMENT_MIN_SIZE.
+
+        Exceptions:
+            AttributeError - If the file is open in the wrong mode.
+                           - If the socket = None.
+            IOError - If network IO fails.
+            OSError - If the server fails to retreive the file.
+            ValueError - If it receives badly formatted data from the server.
+        """
+        if file_object.mode != "wb":
+            raise AttributeError("File must be opened in wb mode for download")
+        self.filename = filename
+        self.file_size = getFileProperties(filename)[1]
+        #Make the file full size, so each segment can write in place
+        file_object.truncate(self.file_size)
+        file_object.close()
+
+        count = max(min(segments, self.file_size // SEGMENT_MIN_SIZE), 1)
+        segment_size = max(-(-self.file_size // count), 1)
+        self.transfers = []
+        for offset in xrange(0, max(self.file_size, 1), segment_size):
+            length = min(segment_size, self.file_size - offset)
+            self.transfers.append(FileTransfer(filename,
+                                               open(file_object.name, "r+b"),
+                                               multiplexed=False,
+                                               segment=(offset, length)))
+    #End of Constructor
+
+
+    #getStatus method - to get a tuple of the download status
+    def getStatus(self):
+        """
+        Usage:
+            Use to keep track of the download's status
+
+        Returns:
+            tuple of download status:
+                (bytes_transferred, file_size, transfer_going, has_failed,
+                 is_complete, has_started)
+        """
+        bytes_transferred = 0
+        statuses = []
+        for transfer in self.transfers:
+            status = transfer.getStatus()
+            bytes_transferred += status[0] - transfer.segment[0]
+            statuses.append(status)
+        has_failed = any(status[3] for status in statuses)
+        status = (bytes_transferred, self.file_size,
+                  any(status[2] for status in statuses), has_failed,
+                  not has_failed and all(status[4] for status in statuses),
+                  any(status[5] for status in statuses))
+        return status
+    #End of getStatus method
+
+#End of SegmentedDownload class
+
+
+#RemoteFile class - reads a file on the server as if it were local
+class RemoteFile(object):
+    """
+    Usage:
+        Create an object of this class to read parts of a file on the server
+        without downloading all of it, e.g. the footer of a big file, or a
+        few records from the middle.
+        Has the read(), readinto(), seek(), tell() and close() methods of a
+        file opened in "rb" mode.
+        Data is fetched in blocks of REMOTE_BLOCK_SIZE, and the last
+        REMOTE_CACHE_BLOCKS blocks used are kept, so reading the same part
+        again costs nothing. Reading straight through the file fetches more
+        blocks ahead of time each time, up to REMOTE_READAHEAD, so there are
+        few round trips. Several blocks which are needed at once are fetched
+        in one request.
+        Not safe to use from several threads at once, as with a file.
+    """
+    mode = "rb"
+
+    #Constructor
+    def __init__(self, filename, block_size=REMOTE_BLOCK_SIZE,
+                 cache_blocks=REMOTE_CACHE_BLOCKS, readahead=REMOTE_READAHEAD):
+        """
+        Constructor
+
+        Usage:
+            my_file = RemoteFile(filename_on_server)
+
+        Takes in:
+            filename - the name of the file on the server.
+            block_size - bytes fetched and cached at once.
+            cache_blocks - most blocks kept at once.
+            readahead - most blocks fetched ahead when reading straight
+                        through the file.
+
+        Exceptions:
+            As for getFileProperties() - e.g. OSError if the file does not
+            exist.
+        """
+        self.name = filename
+        self.size = getFileProperties(filename)[1]
+        self.block_size = block_size
+        self.cache_blocks = max(cache_blocks, readahead + 1)
+        self.max_readahead = readahead
+        self.readahead = 0
+        #block number -> data, least recently used first
+        self.cache = collections.OrderedDict()
+        self.position = 0
+        #where the last read ended, to spot reading straight through
+        self.read_end = 0
+        self.closed = False
+    #End of Constructor
+
+
+    #read method - to read up to size bytes from the current position
+    def read(self, size=-1):
+        """
+        Returns:
+            String of data - shorter than size only at the end of the file.
+
+        Exceptions:
+            ValueError - If the file has been closed.
+            IOError/OSError - If the data cannot be fetched from the server.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        end = self.size
+        if size >= 0:
+            end = min(self.position + size, self.size)
+        if end <= self.position:
+            return ""
+        first = self.position // self.block_size
+        last = (end - 1) // self.block_size
+        blocks = self.getBlocks(first, last, self.position == self.read_end)
+        data = "".join(blocks)
+        start = self.position - first * self.block_size
+        data = data[start:start + end - self.position]
+        self.position += len(data)
+        self.read_end = self.position
+        return data
+    #End of read method
+
+
+    #readinto method - to read into an existing buffer
+    def readinto(self, buffer):
+        """
+        Takes in:
+            buffer - bytearray (or other writable buffer) to fill.
+
+        Returns:
+            Number of bytes read into buffer - 0 at the end of the file.
+        """
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+    #End of readinto method
+
+
+    #seek method - to move to a position in the file
+    def seek(self, offset, whence=os.SEEK_SET):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise IOError("Invalid argument")
+        self.position = offset
+    #End of seek method
+
+
+    #tell method - to get the position in the file
+    def tell(self):
+        return self.position
+    #End of tell method
+
+
+    #close method - to let go of the cached data
+    def close(self):
+        self.cache.clear()
+        self.closed = True
+    #End of close method
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    #getBlocks method - to get blocks from the cache, or the server
+    def getBlocks(self, first, last, sequential):
+        """
+        Usage:
+            For internal use only.
+            Blocks not in the cache are fetched, along with any readahead,
+            in as few requests as possible. The blocks wanted are given from
+            what was found or fetched, so a read of more blocks than the
+            cache keeps never fetches any block twice.
+
+        Takes in:
+            first, last - numbers of the first and last blocks wanted.
+            sequential - True if the read carries on from the last one.
+
+        Returns:
+            List of the data of blocks first to last.
+        """
+        #block number -> data, of the blocks wanted
+        blocks = {}
+        for number in xrange(first, last + 1):
+            data = self.cache.pop(number, None)
+            if data != None:
+                #Most recently used goes to the end
+                self.cache[number] = data
+                blocks[number] = data
+
+        if len(blocks) < last - first + 1:
+            #Read further ahead each time the file is read straight through
+            #to a block which isn't here yet
+            if sequential:
+                self.readahead = min(max(self.readahead * 2, 1),
+                                     self.max_readahead)
+            else:
+                self.readahead = 0
+            last_block = max((self.size - 1) // self.block_size, 0)
+            wanted_last = max(min(last + self.readahead, last_block), last)
+
+            #Fetch each run of missing blocks with one request
+            run_start = None
+            for number in xrange(first, wanted_last + 2):
+                missing = number <= wanted_last and number not in blocks and \
+                          number not in self.cache
+                if missing and run_start == None:
+                    run_start = number
+                elif not missing and run_start != None:
+                    for (fetched, data) in self.fetchBlocks(run_start,
+                                                            number - 1):
+                        if fetched <= last:
+                            blocks[fetched] = data
+                    run_start = None
+
+        return [blocks[number] for number in xrange(first, last + 1)]
+    #End of getBlocks method
+
+
+    #fetchBlocks method - to fetch blocks from the server into the cache
+    def fetchBlocks(self, first, last):
+        """
+        Usage:
+            For internal use only.
+            The blocks are added to the cache as the most recently used,
+            dropping the least recently used to make room.
+
+        Returns:
+            List of (block number, data) tuples, for blocks first to last.
+        """
+        offset = first * self.block_size
+        (data, self.size) = readFileRange(self.name, offset,
+                                          (last - first + 1) *
+                                          self.block_size)
+        blocks = []
+        for number in xrange(first, last + 1):
+            start = (number - first) * self.block_size
+            blocks.append((number, data[start:start + self.block_size]))
+            self.cache.pop(number, None)
+            self.cache[number] = blocks[-1][1]
+        while len(self.cache) > self.cache_blocks:
+            self.cache.popitem(last=False)
+        return blocks
+    #End of fetchBlocks method
+
+#End of RemoteFile class
+
+
+#setMaxTransfers function - to change how many transfers run at once
+def setMaxTransfers(limit):
+    """
+    Usage:
+        Sets how many file transfers may run at the same time. Transfers
+        beyond the limit wait in a queue. MAX_TRANSFERS by default.
+
+        This client's queue decides the order transfers run in; the server
+        only asks for a transfer once it is started here. The server may
+        also cap how many of one client's transfers it runs at once, and
+        transfers started beyond its cap wait there in the order they were
+        started, so a limit above the server's lets queued transfers be
+        requested early.
+
+    Takes in:
+        limit - number of transfers to run at once, at least 1.
+    """
+    transfer_engine.setMaxTransfers(limit)
+#end of setMaxTransfers function
+
+
+#setRateLimit function - to cap the data rate of all transfers together
+def setRateLimit(rate):
+    """
+    Usage:
+        Caps the data rate of this client's transfers, taken together. Each
+        transfer may have its own cap as well (see FileTransfer). There is
+        no cap by default.
+
+    Takes in:
+        rate - bytes per second, or None/0 for no cap.
+
+    Exceptions:
+        ValueError - If rate is not a number, or is negative.
+    """
+    transfer_engine.setRateLimit(rate)
+#end of setRateLimit function
+
+
+#setSchedulingPolicy function - to choose the order queued transfers start in
+def setSchedulingPolicy(policy):
+    """
+    Usage:
+        Queued transfers always start in order of priority. Among those of
+        the same priority, FIFO (default) starts the oldest first, and
+        SHORTEST_FIRST starts the smallest first, so that small files are
+        not held up behind huge ones.
+
+    Takes in:
+        policy - FIFO or SHORTEST_FIRST.
+    """
+    transfer_engine.setPolicy(policy)
+#end of setSchedulingPolicy function
+
+
+#setServerRateLimit function - to cap the data rate of transfers on the server
+def setServerRateLimit(rate, scope=SESSION_SCOPE, request_id=None):
+    """
+    Usage:
+        Asks the server to cap the data rate of its transfers. Caps apply
+        straight away, including to transfers already running.
+
+    Takes in:
+        rate - bytes per second, or None/0 for no cap.
+        scope - SESSION_SCOPE (default) for this client's transfers taken
+                together, SERVER_SCOPE for every client's transfers taken
+                together, or TRANSFER_SCOPE for one transfer.
+        request_id - for TRANSFER_SCOPE, the ID of the request which started
+                     the transfer (FileTransfer.request_id).
+
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+        OSError - If the server will not set the cap, e.g. the transfer has
+                  finished.
+        AttributeError - If the socket = None.
+    """
+    try:
+        #[RATELIMIT, scope, rate, request_id] - recognised by server
+        data = sendCmdReceiveReply(RATELIMIT_CMD, [scope, rate, request_id])
+    except (IOError, AttributeError): raise
+
+    if checkForFailure(data):
+        message = "Server: Could not set rate limit."
+        if len(data) >= 2:
+            message = "Server: " + data[1]
+        raise OSError(message)
+#end of setServerRateLimit function
+
+
+#getFileText function - to get from the server the contents of a text file.
+def getFileText(filename):
+    """
+    Usage:
+        Requests that the server send text content for a file.
+    
+    Takes in:
+        filename - The file name of the file whose contents are being
+                   requested.
+    
+    Returns:
+        String of text from the file.
+    
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+                - If this is raised, the socket is probably not connected.
+        OSError - If the server has failed to get the file.
+                - e.g. if the file does not exist.
+        ValueError - If it receives badly formatted data from the server.
+                   - This should never happen if server is working properly.
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    try:
+        #[GETTEXT, filename, compress]-recognised by server
+        request = sendRequest(GETTEXT_CMD, [filename, 1])
+    except (IOError, AttributeError): raise
+    
+    return receiveText(request)[0]
+#End of getFileText function
+
+
+#getFileTextRange function - to get part of the text of a file from the server
+def getFileTextRange(filename, offset, length):
+    """
+    Usage:
+        Requests that the server send only some of the text of a file, so
+        that a big file can be looked at a piece at a time, without waiting
+        for, or keeping, all of it.
+
+    Takes in:
+        filename - The file name of the file whose contents are being
+                   requested.
+        offset - where in the file the text starts, in bytes.
+        length - most bytes of text to get. Less is returned at the end of
+                 the file.
+
+    Returns:
+        Tuple of (text, file_size) - file_size is the size of the whole file.
+
+    Exceptions:
+        As for getFileText().
+    """
+    try:
+        #[TEXTRANGE, filename, offset, length, compress]-recognised by server
+        request = sendRequest(TEXTRANGE_CMD, [filename, offset, length, 1])
+    except (IOError, AttributeError): raise
+
+    return receiveText(request)
+#end of getFileTextRange function
+
+
+#readFileRange function - to get a range of bytes of a file from the server
+def readFileRange(filename, offset, length):
+    """
+    Usage:
+        Requests that the server send length bytes of a file from offset.
+        Unlike a FileTransfer, only the range asked for is sent, over the
+        control connection, so it is cheap for small parts of big files.
+        See RemoteFile for reading a file a bit at a time.
+
+    Takes in:
+        filename - The file name of the file on the server.
+        offset - where in the file the range starts, in bytes.
+        length - most bytes to get. Less is returned at the end of the file.
+
+    Returns:
+        Tuple of (data, file_size) - file_size is the size of the whole file.
+
+    Exceptions:
+        As for getFileText().
+    """
+    try:
+        #[READRANGE, filename, offset, length, compress]-recognised by server
+        request = sendRequest(READRANGE_CMD, [filename, offset, length, 1])
+    except (IOError, AttributeError): raise
+
+    return receiveText(request)
+#end of readFileRange function
+
+
+#receiveText function - to receive text streamed in reply to a request
+def receiveText(request):
+    """
+    Usage:
+        For internal use only, by getFileText() and getFileTextRange().
+
+    Returns:
+        Tuple of (text, file_size) - file_size is the size of the whole file.
+
+    Exceptions:
+        As for getFileText().
+    """
+    try:
+        data = request.getReply()
+        #Server couldn't/wouldn't get file data.
+        if checkForFailure(data):
+            message = "Server: Could not get file."
+            if len(data) >= 2:
+                message = "Server: " + data[1]
+            raise OSError(message)
+        else:
+            try:
+                #data = [SUCCESS_MSG, size, compressed, file_size]
+                size = int(data[1])
+                file_size = size
+                if len(data) >= 4:
+                    file_size = int(data[3])
+            except (IndexError, ValueError):
+                raise ValueError("Server sent bad filesize data.")
+            #The server decides whether to compress
+            decoder = compression.Decoder(len(data) >= 3 and bool(data[2]))
+        
+        #The server streams the text straight after the size
+        data_transferred = 0
+        consumed = 0
+        file_text = []
+        while data_transferred < size:
+            # each message is [DATA_MSG, data]
+            data = request.getReply(TIMEOUT)
+            if checkForFailure(data):
+                #The file could not be read to the end
+                raise OSError("Server: Could not get file.")
+            elif len(data) < 2 or data[0] != DATA_MSG:
+                raise ValueError("Bad data from server.")
+            consumed += len(data[1])
+            try:
+                data = decoder.decode(data[1])
+            except zlib.error:
+                raise ValueError("Bad data from server.")
+            data_transferred += len(data)
+            file_text.append(data)
+            #Let the server send more once half the window is used up
+            if consumed >= STREAM_WINDOW / 2 and data_transferred < size:
+                sendStreamMsg(request, WINDOW_MSG, [consumed])
+                consumed = 0
+    finally:
+        request.finish()
+    return ("".join(file_text), file_size)
+#end of receiveText function
+
+###############################################################################
+# End of file transfer code
+###############################################################################
+
+
+
+
+###############################################################################
+# Internally used convenience/abstraction functions
+###############################################################################
+
+#ReplyReceiver class - receives replies and passes them to their requests
+class ReplyReceiver(threading.Thread):
+    """
+    Usage:
+        For internal use only.
+        Created by connect(). Receives every message from the server in the
+        background, and passes each one to the request with the matching
+        request ID, so that replies may arrive in any order and many requests
+        may be waiting at once.
+        If the connection fails, every waiting request is woken with None.
+    """
+
+    #Constructor
+    def __init__(self, sock):
+        threading.Thread.__init__(self)
+        #Don't keep the program running just to receive replies.
+        self.daemon = True
+        self.sock = sock
+        self.running = True
+        #request ID -> Queue of messages for that request
+        self.pending = {}
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.start()
+    #End of Constructor
+
+
+    #register method - to get a new request ID, to wait for replies to
+    def register(self):
+        """
+        Returns:
+            A new PendingRequest.
+
+        Exceptions:
+            IOError - If the connection has already failed.
+        """
+        with self.lock:
+            if not self.running:
+                raise IOError("Network IO failed.")
+            self.next_id += 1
+            replies = Queue.Queue()
+            self.pending[self.next_id] = replies
+            return PendingRequest(self, self.next_id, replies)
+    #End of register method
+
+
+    #forget method - to stop waiting for replies to a request
+    def forget(self, request_id):
+        with self.lock:
+            self.pending.pop(request_id, None)
+    #End of forget method
+
+
+    #run method - required by thread class - receives every message
+    def run(self):
+        try:
+            while True:
+                # message = [request_id, fields...]
+                message = protocol.receiveFrame(self.sock)
+                with self.lock:
+                    replies = self.pending.get(message[0])
+                #Replies to forgotten requests are ignored.
+                if replies != None:
+                    replies.put(message[1:])
+        except (socket.error, socket.timeout, ValueError, IndexError):
+            #Connection is dead or its data can't be trusted.
+            pass
+        with self.lock:
+            self.running = False
+            for replies in self.pending.values():
+                replies.put(None)
+            self.pending = {}
+    #End of run method
+
+#End of ReplyReceiver class
+
+
+#PendingRequest class - a request which has been sent, awaiting its replies
+class PendingRequest(object):
+    """
+    Usage:
+        For internal use only.
+        Returned by sendRequest(). Use getReply() for each message the server
+        sends in reply to the request, and finish() once no more are expected.
+    """
+
+    #Constructor
+    def __init__(self, receiver, request_id, replies):
+        self.receiver = receiver
+        self.request_id = request_id
+        self.replies = replies
+    #End of Constructor
+
+
+    #getReply method - to wait for the next message in reply to this request
+    def getReply(self, timeout=None):
+        """
+        Takes in:
+            timeout - optional number of seconds to wait for, forever if None.
+
+        Returns:
+            Message from the server as a list of fields.
+
+        Exceptions:
+            IOError - If the connection fails, or the timeout passes, before
+                      the reply arrives.
+        """
+        try:
+            reply = self.replies.get(True, timeout)
+        except Queue.Empty:
+            raise IOError("Timed out waiting for server.")
+        if reply == None:
+            raise IOError("Network IO failed.")
+        return reply
+    #End of getReply method
+
+
+    #finish method - to stop receiving replies to this request
+    def finish(self):
+        self.receiver.forget(self.request_id)
+    #End of finish method
+
+#End of PendingRequest class
+
+
+#sendCmdReceiveReply function - to send cmd to server and return response
+def sendCmdReceiveReply(command, params=[]):
+    """
+    Usage:
+        For internal use only.
+        sends a command, with optional parameters, to the server and returns
+        the server's response as a list of fields.
+    
+    Takes in:
+        command - The command to send to the server.
+        params - optional parameters to go with the command.
+
+    Returns:
+        Data from the server, as a list of fields.
+
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+                - If this is raised, the socket is probably not connected.
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    try:
+        reply_list = sendCmdsReceiveReplies([(command, params)])[0]
+    except (IOError, AttributeError): raise
+    
+    return reply_list
+#end of sendCmdReceiveReply function
+
+
+#sendCmdsReceiveReplies function - to send many cmds before any replies
+def sendCmdsReceiveReplies(commands):
+    """
+    Usage:
+        For internal use only.
+        Sends every command to the server, then waits for all of the replies,
+        so that the commands cost one round trip in total.
+
+    Takes in:
+        commands - list of (command, params) tuples.
+
+    Returns:
+        List of replies, in the same order as the commands, each a list of
+        fields.
+
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+                - If this is raised, the socket is probably not connected.
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    requests = []
+    try:
+        for (command, params) in commands:
+            requests.append(sendRequest(command, params))
+        replies = []
+        for request in requests:
+            replies.append(request.getReply())
+    except (IOError, AttributeError): raise
+    finally:
+        for request in requests:
+            request.finish()
+    return replies
+#end of sendCmdsReceiveReplies function
+
+
+#sendRequest function - to send a cmd to server, without waiting for reply
+def sendRequest(command, params=[]):
+    """
+    Usage:
+        For internal use only.
+        sends a command, with optional parameters, to the server, tagged with
+        a new request ID. Does not wait for a response.
+
+    Takes in:
+        command - The command to send to the server.
+        params - optional parameters to go with the command.
+
+    Returns:
+        A PendingRequest, to get the replies to the command from. Its
+        finish() method must be called once all replies are received.
+
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+                - If this is raised, the socket is probably not connected.
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    if receiver == None:
+        raise AttributeError("Socket has not been created.")
+    request = receiver.register()
+    try:
+        sendFrame([request.request_id, command] + list(params))
+    except (IOError, AttributeError):
+        request.finish()
+        raise
+    return request
+#end of sendRequest function
+
+
+#sendCmd function - to send cmd to server where no reply is expected
+def sendMsg(command, params=[]):
+    """
+    Usage:
+        For internal use only.
+        sends a command, with optional parameters, to the server, does not wait
+        for a response.
+    
+    Takes in:
+        command - The command to send to the server.
+        params - optional parameters to go with the command.
+    
+    Exceptions:
+        IOError - If network IO (request for or receipt of data) fails.
+                - If this is raised, the socket is probably not connected.
+        AttributeError - If the socket = None, i.e. if it has not been created
+                         using connect(), or has been disconnected with
+                         disconnect()
+    """
+    #No reply is expected, so the request ID is never used.
+    sendFrame([0, command] + list(params))
+#end of sendCmd function
+
+
+#sendStreamMsg function - to send a message within a request in progress
+def sendStreamMsg(request, command, params=[]):
+    """
+    Usage:
+        For internal use only.
+        Sends a data/window/cancel message to the server, tagged with the ID
+        of the request it belongs to, rather than a new one.
+
+    Takes in:
+        request - PendingRequest the message belongs to.
+        command - The message type, e.g. DATA_MSG.
+        params - optional parameters to go with it.
+
+    Exceptions:
+        IOError - If network IO fails.
+        AttributeError - If the socket = None.
+    """
+    sendFrame([request.request_id, command] + list(params))
+#end of sendStreamMsg function
+
+
+#sendFrame function - to send a whole message to the server
+def sendFrame(message):
+    """
+    Usage:
+        For internal use only.
+        Sends a list of fields to the server as one frame.
+
+    Exceptions:
+        IOError - If network IO fails.
+        AttributeError - If the socket = None.
+    """
+    try:
+        with send_lock:
+            protocol.sendFrame(client_socket, message)
+    except socket.error:
+        #if connection error is detected, connection is broken so tidy up.
+        disconnect(notify_server=False)
+        raise IOError("Network IO failed.")
+    except AttributeError:
+        raise AttributeError("Socket has not been created.")
+#end of sendFrame function
+
+
+#readDirList function - to read a directory listing reply from the server
+def readDirList(data):
+    """
+    Usage:
+        For internal use only.
+        Turns the server's reply to LISTDIR_CMD into a list of tuples.
+
+    Returns:
+        List of tuples in the form (file_name, file_size).
+
+    Exceptions:
+        OSError - If the server failed to retrieve directory info
+        ValueError - If the data is badly formatted.
+    """
+    # If the server sends a failure message - cannot retrieve data
+    if checkForFailure(data): 
+        message = "Server: Could not return directory data."
+        if len(data) >= 2:
+            message = "Server: " + data[1]
+        raise OSError(message)
+
+    # data = [NOT_MODIFIED_MSG, path, validator]
+    if data[0] == NOT_MODIFIED_MSG:
+        kept = readNotModified(LISTDIR_CMD, data)
+        if kept != None:
+            return list(kept[1])
+        #The listing was dropped from the cache since the request was sent,
+        #so it is asked for again without a validator
+        try:
+            data = sendCmdReceiveReply(LISTDIR_CMD, [None])
+        except (IOError, AttributeError): raise
+        return readDirList(data)
+
+    try:
+        # data = [SUCCESS_MSG, [[name, size], [name, size], ...], path,
+        #         validator]
+        data_list = [(name, int(size)) for (name, size) in data[1]]
+    except (IndexError, ValueError, TypeError):
+        #Something went wrong in the analysis of data from server, so it's
+        #probably badly formatted data from server.
+        raise ValueError("Bad data from server.")
+
+    if len(data) >= 4:
+        cacheListing(LISTDIR_CMD, data[2], data[3], data_list,
+                     len(data_list))
+    
+    return data_list
+#end of readDirList function
+
+
+#getValidator function - to get what to send to only list a changed directory
+def getValidator(command):
+    """
+    Usage:
+        For internal use only.
+
+    Takes in:
+        command - LISTDIR_CMD or LISTPAGES_CMD, the kind of listing wanted.
+
+    Returns:
+        Validator of the listing kept for the server's current directory,
+        which the server answers with NOT_MODIFIED_MSG if its listing is still
+        the same, or None if there is none.
+    """
+    path = remote_path
+    if path == None:
+        return None
+    with listing_lock:
+        entry = listing_cache.get((address, path, command))
+    if entry == None:
+        return None
+    return entry[0]
+#end of getValidator function
+
+
+#cacheListing function - to keep a listing to check with the server later
+def cacheListing(command, path, validator, listing, entries):
+    """
+    Usage:
+        For internal use only.
+        Also records path as the server's current directory.
+        The least recently used listings are dropped to keep at most
+        LISTING_CACHE_SIZE listings, of LISTING_CACHE_ENTRIES entries in
+        all. Listings of more than MAX_CACHED_ENTRIES entries are not kept.
+
+    Takes in:
+        command - LISTDIR_CMD or LISTPAGES_CMD, the kind of listing.
+        path - path of the directory listed.
+        validator - validator the server sent with the listing.
+        listing - the listing, as given by the function for command.
+        entries - number of entries in the listing.
+    """
+    global remote_path, listing_entries
+    remote_path = path
+    if validator == None or entries > MAX_CACHED_ENTRIES:
+        return
+    with listing_lock:
+        key = (address, path, command)
+        old = listing_cache.pop(key, None)
+        if old != None:
+            listing_entries -= old[2]
+        listing_cache[key] = (validator, listing, entries)
+        listing_entries += entries
+        while len(listing_cache) > LISTING_CACHE_SIZE or \
+              listing_entries > LISTING_CACHE_ENTRIES:
+            listing_entries -= listing_cache.popitem(last=False)[1][2]
+#end of cacheListing function
+
+
+#readNotModified function - to get the kept listing the server says is current
+def readNotModified(command, data):
+    """
+    Usage:
+        For internal use only.
+
+    Takes in:
+        command - LISTDIR_CMD or LISTPAGES_CMD, the kind of listing.
+        data - the server's reply, [NOT_MODIFIED_MSG, path, validator].
+
+    Returns:
+        Tuple of (path, listing) - the listing as given to cacheListing(), or
+        None if no listing with that validator is kept any more (it may have
+        been dropped from the cache while the request was sent), in which
+        case the listing should be asked for again without a validator.
+
+    Exceptions:
+        ValueError - If the data is badly formatted.
+    """
+    global remote_path
+    try:
+        (path, validator) = data[1:3]
+    except ValueError:
+        raise ValueError("Bad data from server.")
+    with listing_lock:
+        key = (address, path, command)
+        entry = listing_cache.get(key)
+        if entry == None or entry[0] != validator:
+            return None
+        #Now the most recently used
+        del listing_cache[key]
+        listing_cache[key] = entry
+    remote_path = path
+    return (path, entry[1])
+#end of readNotModified function
+
+
+#readDir function - to read a current directory reply from the server
+def readDir(data):
+    """
+    Usage:
+        For internal use only.
+        Gets the path from the server's reply to GETDIR_CMD.
+
+    Exceptions:
+        OSError - If the server failed to retrieve the path
+        ValueError - If the data is badly formatted.
+    """
+    if checkForFailure(data): #The server cannot retrieve the data
+        message = "Server: Could not return directory path."
+        if len(data) >= 2:
+            message = "Server: " + data[1]
+        raise OSError(message)
+    
+    global remote_path
+    try:
+        remote_path = data[1]
+    except IndexError:
+        raise ValueError("Bad data from server.")
+    return remote_path
+#end of readDir function
+
+
+#checkForFailure function - to check if the server has sent failure message
+def checkForFailure(data):
+    """
+    Usage:
+        For internal use - Nothing will break if this is used, but there's no
+        reason to use this externally.
+        Checks if data from server contains failure message.
+    
+    Takes in:
+        data - list of data from server.
+    
+    Returns:
+        True - if the data is a failure message or is otherwise invalid.
+        False - if the data is not a failure message
+    """
+    if (len(data) == 0) or (data[0] == FAILURE_MSG) or (data[0] == CANCEL_CMD):
+        return True
+    else:
+        return False
+#end of checkForFailure function
+
+###############################################################################
+# End of internal functions
+###############################################################################
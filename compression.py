@@ -0,0 +1,164 @@
+"""
+Compression module compresses file and text data sent between the client and
+the server, where it is worth doing.
+
+Usage:
+    Decide whether to compress using worthCompressing(sample)
+        - sample should be the first SAMPLE_SIZE bytes of the data.
+    The sender passes each piece of data through Encoder.encode(), and sends
+    whatever comes out of Encoder.finish() after the last piece.
+    The receiver passes each piece received through Decoder.decode(), until
+    it has the number of (uncompressed) bytes it was expecting.
+    Both take compress=False, in which case data is passed through unchanged,
+    so the same transfer code works either way.
+
+Exceptions:
+    zlib.error - If the data received is not valid compressed data.
+"""
+import zlib
+
+import filetypechecker
+
+
+
+
+###############################################################################
+# Globals
+###############################################################################
+
+COMPRESS_LEVEL = 6 #zlib compression level, 1 (fastest) to 9 (smallest)
+PROBE_LEVEL = 1 #zlib compression level used to test a sample
+SAMPLE_SIZE = 65536 #64kB - data looked at to decide whether to compress
+MAX_RATIO = 0.9 #Only compress if the sample shrinks to this fraction of it
+
+###############################################################################
+# End of globals
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Deciding whether to compress
+###############################################################################
+
+#worthCompressing function - to check a sample of the data
+def worthCompressing(sample):
+    """
+    Usage:
+        Text is always worth compressing. Anything else is test compressed
+        (quickly), and is only worth compressing if it shrinks enough, so that
+        no time is wasted on data which is already compressed, e.g. images
+        and archives.
+
+    Takes in:
+        sample - string from the start of the data to send.
+
+    Returns:
+        True if the data should be compressed, otherwise False.
+    """
+    if len(sample) == 0:
+        return False
+    if filetypechecker.istext(sample[:512]):
+        return True
+    probe = zlib.compress(sample, PROBE_LEVEL)
+    return len(probe) <= len(sample) * MAX_RATIO
+#end of worthCompressing function
+
+###############################################################################
+# End of deciding whether to compress
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Encoder/Decoder classes
+###############################################################################
+
+#Encoder class - to compress data as it is sent
+class Encoder(object):
+    """
+    Usage:
+        See module docstring.
+    """
+
+    #Constructor
+    def __init__(self, compress):
+        """
+        Takes in:
+            compress - True to compress, False to pass data through unchanged.
+        """
+        self.compressor = None
+        if compress:
+            self.compressor = zlib.compressobj(COMPRESS_LEVEL)
+    #End of Constructor
+
+
+    #encode method - to get the data to send for a piece of data
+    def encode(self, data):
+        """
+        Returns:
+            String to send - may be empty if the compressor is holding on to
+            the data for now.
+        """
+        if self.compressor == None:
+            return data
+        return self.compressor.compress(data)
+    #End of encode method
+
+
+    #finish method - to get the last of the data to send
+    def finish(self):
+        """
+        Returns:
+            String to send after the last piece of data - may be empty.
+        """
+        if self.compressor == None:
+            return ""
+        return self.compressor.flush()
+    #End of finish method
+
+#End of Encoder class
+
+
+#Decoder class - to decompress data as it is received
+class Decoder(object):
+    """
+    Usage:
+        See module docstring.
+    """
+
+    #Constructor
+    def __init__(self, compress):
+        """
+        Takes in:
+            compress - True if the data is compressed, False if it is not.
+        """
+        self.decompressor = None
+        if compress:
+            self.decompressor = zlib.decompressobj()
+    #End of Constructor
+
+
+    #decode method - to get the data back from a piece which was received
+    def decode(self, data):
+        """
+        Returns:
+            String of uncompressed data - may be empty.
+
+        Exceptions:
+            zlib.error - If the data is not valid compressed data.
+        """
+        if self.decompressor == None:
+            return data
+        return self.decompressor.decompress(data)
+    #End of decode method
+
+#End of Decoder class
+
+###############################################################################
+# End of Encoder/Decoder classes
+###############################################################################
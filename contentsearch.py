@@ -0,0 +1,298 @@
+"""
+ContentSearch module searches the contents of every text file in a directory
+tree for a literal string or regular expression, on the machine the files
+are on, so nothing but the matching lines need be sent anywhere.
+
+Usage:
+    Make a matcher using makeMatcher(pattern, regex, ignore_case)
+    Create a ContentSearch(directory, matcher, max_hits, time_limit)
+    Go through the hits using results()
+        - A generator, giving (path, line_number, text) for each matching
+          line as soon as it is found, where path is relative to directory,
+          with "/" between names. Gives None every POLL_TIME when no hit has
+          been found, so the caller can do other things meanwhile.
+        - Files are found by one thread and searched by a pool of WORKERS
+          threads, so reading one file overlaps with searching others.
+        - Stops after max_hits hits or time_limit seconds, in which case
+          truncated is True afterwards.
+    Stop a search early using stop()
+
+Regular expressions:
+    The re module backtracks, so some patterns (e.g. "(a+)+b") take time
+    exponential in the length of the line they are tried on. To keep this
+    down, a regular expression may be at most MAX_PATTERN_LENGTH characters,
+    and should be searched for with a line_limit of REGEX_LINE_LIMIT, so it
+    is never tried on more than that much of a line at once. This is not a
+    guarantee: a stopped search (or one past its time limit) gives no more
+    hits, but a worker part way through such a match carries on using CPU
+    until that one match ends, as re cannot be interrupted.
+
+Exceptions:
+    ValueError - If a regular expression is not valid, or is too long.
+"""
+import os
+import Queue
+import re
+import threading
+import time
+
+import filetypechecker
+
+
+
+
+###############################################################################
+# Globals
+###############################################################################
+
+WORKERS = 4 #threads searching files in each search
+MAX_HITS = 1000 #default most hits in a search
+TIME_LIMIT = 30 #default most seconds a search runs for
+POLL_TIME = 0.2 #seconds results() waits for a hit before giving None
+SAMPLE_SIZE = 512 #bytes looked at to tell if a file is text
+LINE_LIMIT = 65536 #64kB - longer lines are searched in pieces of this size
+REGEX_LINE_LIMIT = 4096 #4kB - LINE_LIMIT for regular expressions, which may
+                        #take time exponential in the length of a piece
+MAX_PATTERN_LENGTH = 256 #most characters in a regular expression
+MAX_LINE_LENGTH = 500 #most characters of a matching line given in a hit
+SEPARATOR = "/" #between names in a path given in a hit
+
+###############################################################################
+# End of globals
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Matching
+###############################################################################
+
+#makeMatcher function - to make a function which checks a line
+def makeMatcher(pattern, regex=False, ignore_case=False):
+    """
+    Takes in:
+        pattern - string to look for.
+        regex - True if pattern is a regular expression, False (default) if
+                it is a literal string.
+        ignore_case - True to match whatever the case of letters.
+
+    Returns:
+        Function which takes a line, and returns True if it matches.
+
+    Exceptions:
+        ValueError - If pattern is not a valid regular expression, or is a
+                     regular expression longer than MAX_PATTERN_LENGTH.
+    """
+    pattern = str(pattern)
+    if not regex and not ignore_case:
+        return lambda line: pattern in line
+    if not regex:
+        pattern = re.escape(pattern)
+    elif len(pattern) > MAX_PATTERN_LENGTH:
+        raise ValueError("Regular expression is longer than " +
+                         str(MAX_PATTERN_LENGTH) + " characters.")
+    try:
+        search = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+    except re.error as e:
+        raise ValueError("Invalid regular expression: " + str(e))
+    return lambda line: search.search(line) != None
+#end of makeMatcher function
+
+###############################################################################
+# End of matching
+###############################################################################
+
+
+
+
+
+###############################################################################
+# ContentSearch class
+###############################################################################
+
+#ContentSearch class - searches a tree of files with a pool of threads
+class ContentSearch(object):
+    """
+    Usage:
+        See module docstring.
+        Links to directories are not followed, so a link back up the tree
+        cannot make a search go round forever.
+    """
+
+    #Constructor
+    def __init__(self, directory, matcher, max_hits=MAX_HITS,
+                 time_limit=TIME_LIMIT, workers=WORKERS,
+                 line_limit=LINE_LIMIT):
+        """
+        Takes in:
+            directory - full path of the top of the tree to search.
+            matcher - function from makeMatcher().
+            max_hits - most hits to give.
+            time_limit - most seconds to search for.
+            workers - number of threads searching files.
+            line_limit - longer lines are searched in pieces of this size -
+                         REGEX_LINE_LIMIT for a regular expression (see
+                         module docstring).
+        """
+        self.directory = directory
+        self.matcher = matcher
+        self.max_hits = max_hits
+        self.time_limit = time_limit
+        self.workers = workers
+        self.line_limit = line_limit
+        #Bounded, so finding files doesn't get far ahead of searching them
+        self.files = Queue.Queue(workers * 16)
+        self.hits = Queue.Queue()
+        self.stopped = threading.Event()
+        self.truncated = False
+    #End of Constructor
+
+
+    #results method - to run the search, giving hits as they are found
+    def results(self):
+        """
+        Usage:
+            A generator - see module docstring.
+            The search stops when the generator is finished with, even if it
+            is abandoned part way.
+        """
+        threads = [threading.Thread(target=self.findFiles)]
+        threads += [threading.Thread(target=self.searchFiles)
+                    for i in xrange(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        deadline = time.time() + self.time_limit
+        hits = 0
+        finished = 0 #workers which have run out of files
+        try:
+            while finished < self.workers:
+                if time.time() >= deadline:
+                    self.truncated = True
+                    break
+                try:
+                    hit = self.hits.get(True, POLL_TIME)
+                except Queue.Empty:
+                    yield None
+                    continue
+                if hit == None:
+                    finished += 1
+                    continue
+                yield hit
+                hits += 1
+                if hits >= self.max_hits:
+                    self.truncated = True
+                    break
+        finally:
+            self.stop()
+    #End of results method
+
+
+    #stop method - to stop the search
+    def stop(self):
+        self.stopped.set()
+    #End of stop method
+
+
+    #findFiles method - to find every file in the tree
+    def findFiles(self):
+        """
+        Usage:
+            For internal use only, run in its own thread.
+            Ends with a None for each worker, so they know to finish.
+        """
+        try:
+            for (path, dirs, files) in os.walk(self.directory):
+                dirs.sort()
+                for name in sorted(files):
+                    if not self.put(self.files, os.path.join(path, name)):
+                        return
+        finally:
+            for i in xrange(self.workers):
+                if not self.put(self.files, None):
+                    return
+    #End of findFiles method
+
+
+    #put method - to put an item in a queue, unless the search is stopped
+    def put(self, queue, item):
+        """
+        Usage:
+            For internal use only.
+
+        Returns:
+            False if the search was stopped while waiting for room.
+        """
+        while not self.stopped.is_set():
+            try:
+                queue.put(item, True, POLL_TIME)
+                return True
+            except Queue.Full:
+                pass
+        return False
+    #End of put method
+
+
+    #searchFiles method - to search files until there are none left
+    def searchFiles(self):
+        """
+        Usage:
+            For internal use only, run in a thread for each worker.
+            Ends with a None in the hits, so results() knows it is done.
+        """
+        try:
+            while not self.stopped.is_set():
+                try:
+                    path = self.files.get(True, POLL_TIME)
+                except Queue.Empty:
+                    continue
+                if path == None:
+                    break
+                try:
+                    self.searchFile(path)
+                except (IOError, OSError):
+                    #Files which can't be read are skipped
+                    pass
+        finally:
+            self.hits.put(None)
+    #End of searchFiles method
+
+
+    #searchFile method - to search one file
+    def searchFile(self, path):
+        """
+        Usage:
+            For internal use only.
+            Files which are not text (see filetypechecker) are skipped. The
+            file is read a line at a time, so big files take little memory.
+
+        Exceptions:
+            IOError/OSError - If the file cannot be read.
+        """
+        relative = os.path.relpath(path, self.directory)
+        relative = relative.replace(os.sep, SEPARATOR)
+        with open(path, "rb") as file_object:
+            if not filetypechecker.istext(file_object.read(SAMPLE_SIZE)):
+                return
+            file_object.seek(0)
+            number = 0
+            partial = False #whether the last piece read was part of a line
+            line = file_object.readline(self.line_limit)
+            while line != "" and not self.stopped.is_set():
+                #pieces of a long line all have the line's number
+                if not partial:
+                    number += 1
+                partial = not line.endswith("\n")
+                if self.matcher(line):
+                    self.hits.put((relative, number,
+                                   line.rstrip("\r\n")[:MAX_LINE_LENGTH]))
+                line = file_object.readline(self.line_limit)
+    #End of searchFile method
+
+#End of ContentSearch class
+
+###############################################################################
+# End of ContentSearch class
+###############################################################################
@@ -0,0 +1,281 @@
+"""
+Delta module finds the differences between a new file and an old copy of it
+which is somewhere else, so that only the differences need to be sent, in the
+manner of rsync.
+
+Usage:
+    The side with the old copy (the basis) sends getSignatures(basis,
+    block_size) - a weak and strong checksum for each block of the basis.
+        - Use blockSize(basis_size) to choose the block size.
+        - iterSignatures(basis, block_size) gives them one at a time, so
+          they can be sent a few at a time.
+    The side with the new file goes through the operations from
+    computeDelta(new_file, signatures, block_size), sending each one:
+        - (LITERAL, data) - data which is not in the basis.
+        - (COPY, first, count, covered) - count blocks of the basis, from
+          block first, which are the next covered bytes of the new file.
+    The side with the basis rebuilds the new file by writing literal data to
+    it, and using copyBlocks(basis, output, first, count, block_size) for
+    each copy.
+
+Exceptions:
+    IOError - If reading or writing a file fails.
+"""
+import hashlib
+import math
+import zlib
+
+
+
+
+###############################################################################
+# Globals
+###############################################################################
+
+MIN_BLOCK_SIZE = 2048 #2kB - smallest block size chosen by blockSize()
+MAX_BLOCK_SIZE = 131072 #128kB - biggest block size chosen by blockSize()
+READ_SIZE = 1048576 #1MB - data read from the new file at once
+LITERAL_SIZE = 32768 #32kB - most literal data in one operation
+ROLL_LIMIT = 262144 #256kB - literal data after which blocks are mostly looked for a block apart
+SKIP_BLOCKS = 8 #blocks skipped then, between each block rolled through
+ADLER_MOD = 65521 #modulus used by the adler32 checksum
+
+LITERAL = "literal"
+COPY = "copy"
+
+###############################################################################
+# End of globals
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Signatures
+###############################################################################
+
+#blockSize function - to choose the block size for a basis file
+def blockSize(basis_size):
+    """
+    Usage:
+        Bigger blocks mean fewer signatures to send, smaller blocks mean less
+        literal data is sent around each change. The square root of the file
+        size balances the two.
+
+    Returns:
+        Block size in bytes, between MIN_BLOCK_SIZE and MAX_BLOCK_SIZE.
+    """
+    return max(MIN_BLOCK_SIZE,
+               min(MAX_BLOCK_SIZE, int(math.sqrt(basis_size))))
+#end of blockSize function
+
+
+#getSignatures function - to get the checksums of each block of a file
+def getSignatures(basis, block_size):
+    """
+    Takes in:
+        basis - file object of the old copy of the file, in "rb" mode.
+        block_size - size of each block, from blockSize().
+
+    Returns:
+        List of [weak_checksum, strong_checksum] for each block, in order.
+        The last block may be shorter than block_size.
+    """
+    return list(iterSignatures(basis, block_size))
+#end of getSignatures function
+
+
+#iterSignatures function - to get the checksums of each block one at a time
+def iterSignatures(basis, block_size):
+    """
+    Usage:
+        A generator, giving what getSignatures() returns one block at a time.
+    """
+    basis.seek(0)
+    block = basis.read(block_size)
+    while block != "":
+        yield [weakChecksum(block), strongChecksum(block)]
+        block = basis.read(block_size)
+#end of iterSignatures function
+
+
+#weakChecksum function - quick checksum which can be rolled along data
+def weakChecksum(data):
+    return zlib.adler32(data) & 0xffffffff
+#end of weakChecksum function
+
+
+#strongChecksum function - to check blocks whose weak checksums match
+def strongChecksum(data):
+    return hashlib.md5(data).digest()
+#end of strongChecksum function
+
+###############################################################################
+# End of signatures
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Finding/applying differences
+###############################################################################
+
+#computeDelta function - to find the operations which make the new file
+def computeDelta(source, signatures, block_size):
+    """
+    Usage:
+        A generator - see module docstring for the operations it gives.
+        Looks for a block of the basis at every position of the new file,
+        using the weak checksum, which is rolled along one byte at a time,
+        and only checking the strong checksum if the weak one matches. So the
+        time taken depends on how much of the file has changed.
+        Rolling is slow, so after ROLL_LIMIT bytes without finding a block,
+        blocks are looked for a whole block apart, rolling through only one
+        block in every SKIP_BLOCKS + 1, until one is found and rolling starts
+        again. So a file with little in common with the basis costs little
+        more than sending it whole, and where the new file has the basis's
+        data again, at whatever offset, it is found within a few blocks.
+
+    Takes in:
+        source - file object of the new file, in "rb" mode, at its start.
+        signatures - list from getSignatures() for the basis.
+        block_size - block size used for the signatures.
+
+    Exceptions:
+        IOError - If reading the new file fails.
+    """
+    #weak checksum -> {strong checksum: block number}
+    blocks = {}
+    for (index, (weak, strong)) in enumerate(signatures):
+        blocks.setdefault(weak, {}).setdefault(strong, index)
+
+    data = bytearray()
+    start = 0 #start of the block being looked for, in data
+    literal_start = 0 #start of data not yet sent, in data
+    at_end = False
+    weak = None
+    #[first, count, covered] - blocks found, waiting to be sent together
+    copy = None
+    rolled = 0 #bytes rolled past since a block was last found
+    skipped = 0 #blocks skipped since a block was last rolled through
+    while True:
+        #Keep at least a block ahead of start in data
+        if len(data) - start < block_size and not at_end:
+            del data[:literal_start]
+            start -= literal_start
+            literal_start = 0
+            more = source.read(READ_SIZE)
+            at_end = more == ""
+            data.extend(more)
+            continue
+        end = min(start + block_size, len(data))
+        if start == end:
+            break
+        if weak == None:
+            weak = weakChecksum(buffer(data, start, end - start))
+
+        index = None
+        if weak in blocks:
+            strong = strongChecksum(buffer(data, start, end - start))
+            index = blocks[weak].get(strong)
+        if index != None:
+            #Send the data before the block, then the block
+            if literal_start < start:
+                if copy != None:
+                    yield (COPY, copy[0], copy[1], copy[2])
+                    copy = None
+                yield (LITERAL, str(data[literal_start:start]))
+            if copy != None and copy[0] + copy[1] == index:
+                copy[1] += 1
+                copy[2] += end - start
+            else:
+                if copy != None:
+                    yield (COPY, copy[0], copy[1], copy[2])
+                copy = [index, 1, end - start]
+            start = end
+            literal_start = start
+            weak = None
+            rolled = 0
+            skipped = 0
+            continue
+
+        if end - start < block_size:
+            #Less than a block left, and it doesn't match - send the rest
+            start = len(data)
+            break
+        if rolled >= ROLL_LIMIT and skipped < SKIP_BLOCKS:
+            #Skip to the next block, working its checksum out from scratch
+            start = end
+            weak = None
+            skipped += 1
+        else:
+            if rolled >= ROLL_LIMIT:
+                #Roll through the next block, then skip again
+                rolled -= block_size
+                skipped = 0
+            #Roll the checksum on by a byte
+            if end < len(data):
+                removed = data[start]
+                low = ((weak & 0xffff) - removed + data[end]) % ADLER_MOD
+                high = ((weak >> 16) - block_size * removed + low - 1) % \
+                       ADLER_MOD
+                weak = (high << 16) | low
+            else:
+                #Next byte isn't read yet, work it out from scratch after
+                weak = None
+            start += 1
+            rolled += 1
+        if start - literal_start >= LITERAL_SIZE:
+            if copy != None:
+                yield (COPY, copy[0], copy[1], copy[2])
+                copy = None
+            while start - literal_start >= LITERAL_SIZE:
+                yield (LITERAL, str(data[literal_start:literal_start +
+                                         LITERAL_SIZE]))
+                literal_start += LITERAL_SIZE
+
+    if copy != None:
+        yield (COPY, copy[0], copy[1], copy[2])
+    #Whatever is left can't be found in the basis
+    for position in xrange(literal_start, start, LITERAL_SIZE):
+        yield (LITERAL, str(data[position:min(position + LITERAL_SIZE,
+                                              start)]))
+#end of computeDelta function
+
+
+#copyBlocks function - to copy blocks of the basis into the new file
+def copyBlocks(basis, output, first, count, block_size):
+    """
+    Takes in:
+        basis - file object of the old copy of the file, in "rb" mode.
+        output - file object of the new file being made.
+        first - number of the first block to copy.
+        count - number of blocks to copy.
+        block_size - block size used for the signatures.
+
+    Returns:
+        Number of bytes copied - less than count * block_size if the last
+        block of the basis is copied.
+
+    Exceptions:
+        IOError - If reading or writing fails.
+    """
+    basis.seek(first * block_size)
+    remaining = count * block_size
+    copied = 0
+    while remaining > 0:
+        data = basis.read(min(remaining, READ_SIZE))
+        if data == "":
+            break
+        output.write(data)
+        copied += len(data)
+        remaining -= len(data)
+    return copied
+#end of copyBlocks function
+
+###############################################################################
+# End of finding/applying differences
+###############################################################################
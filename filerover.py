@@ -7,16 +7,131 @@ import multicastcli
 import socket
 import threading
 import time
+import Queue
+import collections
 from Tkinter import *
 
 
 
+PAGE_POLL_TIME = 50 #ms between checks for new pages of the server listing
+TEXT_PAGE_SIZE = 65536 #64kB - text fetched at once by the text viewer
+TEXT_MAX_PAGES = 4 #pages of text the viewer keeps at once
+TEXT_EDGE = 0.25 #fraction of the loaded text from an end at which more loads
+
 keywordDic = ["connect","disconnect","exit","cd","cdserver","mkdir","mkdirserver","serverlist","help"]
 
 
+def localFileRange(filename):
+    """Return a function to read ranges of a file on the client, for a TextWindow"""
+    def fetch(offset, length):
+        f, size = fileviewer.getFile(filename)
+        try:
+            f.seek(offset)
+            return f.read(length), size
+        finally:
+            f.close()
+    return fetch
+
+
+def serverFileRange(filename):
+    """Return a function to read ranges of a file on the server, for a TextWindow"""
+    def fetch(offset, length):
+        return clientio.getFileTextRange(filename, offset, length)
+    return fetch
+
+
+class TextWindow(object):
+    """The few pages of a (maybe huge) text file which the viewer has loaded
+
+    fetch(offset, length) returns (text, file_size). Pages break after a
+    newline where there is one, so lines are never split between pages."""
+
+    def __init__(self, fetch, page_size=TEXT_PAGE_SIZE, max_pages=TEXT_MAX_PAGES):
+        self.fetch = fetch
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = collections.deque() #[offset, text] for each page, in order
+        self.size = 0
+
+    def start(self):
+        """Offset of the first byte loaded"""
+        if self.pages:
+            return self.pages[0][0]
+        return 0
+
+    def end(self):
+        """Offset after the last byte loaded"""
+        if self.pages:
+            return self.pages[-1][0] + len(self.pages[-1][1])
+        return 0
+
+    def jump(self, offset):
+        """Load the page at offset (from the start of its next line) and the
+        one after, dropping the rest. Returns the text loaded."""
+        self.pages.clear()
+        text, self.size = self.fetch(offset, self.page_size)
+        if offset > 0:
+            #start at the next whole line, if there is one
+            cut = text.find("\n")
+            if 0 <= cut < len(text) - 1:
+                offset += cut + 1
+                text = text[cut + 1:]
+        self.pages.append([offset, self.trimEnd(offset, text)])
+        loaded = self.pages[0][1]
+        more = self.next()
+        if more != None:
+            loaded += more[0]
+        return loaded
+
+    def next(self):
+        """Load the page after the loaded text, dropping the first if there
+        are too many. Returns (text_added, text_dropped), or None at the end."""
+        offset = self.end()
+        if self.pages and offset >= self.size:
+            return None
+        text, self.size = self.fetch(offset, self.page_size)
+        if text == "":
+            return None
+        self.pages.append([offset, self.trimEnd(offset, text)])
+        dropped = ""
+        if len(self.pages) > self.max_pages:
+            dropped = self.pages.popleft()[1]
+        return self.pages[-1][1], dropped
+
+    def previous(self):
+        """Load the page before the loaded text, dropping the last if there
+        are too many. Returns (text_added, text_dropped), or None at the start."""
+        end = self.start()
+        if end <= 0:
+            return None
+        offset = max(end - self.page_size, 0)
+        text, self.size = self.fetch(offset, end - offset)
+        if offset > 0:
+            #start at the next whole line, if there is one
+            cut = text.find("\n")
+            if 0 <= cut < len(text) - 1:
+                offset += cut + 1
+                text = text[cut + 1:]
+        self.pages.appendleft([offset, text])
+        dropped = ""
+        if len(self.pages) > self.max_pages:
+            dropped = self.pages.pop()[1]
+        return text, dropped
+
+    def trimEnd(self, offset, text):
+        """Cut text read from offset back to the end of its last whole line,
+        unless it reaches the end of the file"""
+        if offset + len(text) < self.size:
+            cut = text.rfind("\n")
+            if cut >= 0:
+                return text[:cut + 1]
+        return text
+
+
 class Application(Frame):
     connected = False
     lastCommand = ""
+    serverListing = 0 #counts server listings, so old pages can be ignored
 	
     def repaint(self):
         """Updates all text fields etc."""
@@ -30,13 +145,8 @@ class Application(Frame):
 	self.setClientDirEntry(clientDirectory)
 
 	if self.connected:
-                #update the contents of the server's pwd
-		serverList = clientio.listDir()
-		self.setDirList(False,serverList)
-
-                #update the server's pwd path
-		serverDirectory = clientio.getDir()
-		self.setServerDirEntry(serverDirectory)
+                #update the server's pwd path and contents as pages arrive
+		self.listServerDir()
         else:
 		self.serverList.delete(0,END)   
 		self.serverDir.delete(0,END) 
@@ -44,6 +154,59 @@ class Application(Frame):
         #reset the command line
 	self.commandLine.delete(0,END)
 
+    def listServerDir(self):
+        """Starts filling the server list with the server's pwd, a page at a time
+
+        Pages are fetched by a separate thread and shown as they arrive, so big directories don't freeze the GUI"""
+
+        self.serverListing += 1
+        self.serverList.delete(0,END)
+        self.serverPages = Queue.Queue()
+
+        fetcher = threading.Thread(target=self.fetchServerPages, args=(self.serverListing, self.serverPages))
+        fetcher.daemon = True
+        fetcher.start()
+
+        self.after(PAGE_POLL_TIME, self.showServerPages, self.serverListing, self.serverPages)
+
+    def fetchServerPages(self, listing, pages):
+        """Fetches pages of the server listing and queues them to be shown
+
+        Runs in its own thread; stops early if a newer listing has been started"""
+
+        try:
+            for page in clientio.listDirPages():
+                if listing != self.serverListing:
+                    break
+                pages.put(page)
+        except Exception, error:
+            pages.put(str(error))
+
+        #None marks the end of the listing
+        pages.put(None)
+
+    def showServerPages(self, listing, pages):
+        """Adds any pages which have arrived to the server list"""
+
+        #a newer listing has replaced this one
+        if listing != self.serverListing:
+            return
+
+        try:
+            while True:
+                page = pages.get_nowait()
+
+                if page == None:
+                    return
+                elif isinstance(page, str):
+                    self.setCommandHistory(page)
+                else:
+                    path, entries, cursor = page
+                    self.setServerDirEntry(path)
+                    self.addDirList(False,entries)
+        except Queue.Empty:
+            self.after(PAGE_POLL_TIME, self.showServerPages, listing, pages)
+
     def contains(self, item, userStr):
         """Returns the item if the user string is a substring of it, otherwise returns the user string"""
 
@@ -326,29 +489,121 @@ class Application(Frame):
                 self.displayFileText(self.listToString(item[:-1]))
 
     class TextPopup(object):
-        """A popup box for displaying text"""
+        """A popup box for displaying text
+
+        Only a few pages of the file are loaded at once (see TextWindow), and
+        more are fetched as the user scrolls, so big files open straight away.
+        The scrollbar covers the whole file, not just what is loaded."""
 
-        def __init__(self, filename, file_contents):
-            self = Tk()
-            self.title(filename)
+        def __init__(self, filename, fetch):
+            self.window = TextWindow(fetch)
+            self.loading = False
+            #fetch the first pages before making the window, in case it fails
+            text = self.window.jump(0)
 
-            self.scrollbar = Scrollbar(self)
+            self.top = Toplevel()
+            self.top.title(filename)
+
+            self.scrollbar = Scrollbar(self.top)
             self.scrollbar.pack(side=RIGHT, fill=Y)
 
-            self.w = Text(self, yscrollcommand=self.scrollbar.set)
-            self.w.insert(INSERT, file_contents)
-            self.w.configure(state=DISABLED)
+            self.w = Text(self.top, yscrollcommand=self.viewChanged)
+            self.showText(text)
             
-            self.scrollbar.config(command=self.w.yview)
+            self.scrollbar.config(command=self.scroll)
             
             self.w.pack()
 
+        def showText(self, text):
+            """Replace the text shown with text, from the top"""
+            self.w.configure(state=NORMAL)
+            self.w.delete("1.0", END)
+            self.w.insert("1.0", self.decode(text))
+            self.w.configure(state=DISABLED)
+            self.w.yview("1.0")
+
+        def decode(self, text):
+            return text.decode("utf-8", "replace")
+
+        def viewChanged(self, first, last):
+            """Called by the Text widget when the view moves; keeps the
+            scrollbar in step, and loads more text near either end"""
+            first, last = float(first), float(last)
+            start, end = self.window.start(), self.window.end()
+            if self.window.size > 0:
+                self.scrollbar.set((start + first * (end - start)) / self.window.size,
+                                   (start + last * (end - start)) / self.window.size)
+            else:
+                self.scrollbar.set(0, 1)
+            if not self.loading:
+                if last >= 1 - TEXT_EDGE and end < self.window.size:
+                    self.loading = True
+                    self.w.after_idle(self.loadNext)
+                elif first <= TEXT_EDGE and start > 0:
+                    self.loading = True
+                    self.w.after_idle(self.loadPrevious)
+
+        def loadNext(self):
+            """Add the next page at the bottom, dropping one from the top"""
+            try:
+                loaded = self.window.next()
+                if loaded != None:
+                    added, dropped = loaded
+                    top = int(self.w.index("@0,0").split(".")[0])
+                    self.w.configure(state=NORMAL)
+                    self.w.insert(END, self.decode(added))
+                    if dropped != "":
+                        self.w.delete("1.0", "1.0 + %d chars" % len(self.decode(dropped)))
+                        #keep the same line at the top
+                        self.w.yview("%d.0" % max(top - dropped.count("\n"), 1))
+                    self.w.configure(state=DISABLED)
+            except (IOError, OSError, ValueError):
+                self.w.bell()
+            self.loading = False
+
+        def loadPrevious(self):
+            """Add the previous page at the top, dropping one from the bottom"""
+            try:
+                loaded = self.window.previous()
+                if loaded != None:
+                    added, dropped = loaded
+                    top = int(self.w.index("@0,0").split(".")[0])
+                    self.w.configure(state=NORMAL)
+                    self.w.insert("1.0", self.decode(added))
+                    if dropped != "":
+                        #the Text widget always ends with an extra newline
+                        self.w.delete("end - %d chars" % (len(self.decode(dropped)) + 1),
+                                      "end - 1 chars")
+                    #keep the same line at the top
+                    self.w.yview("%d.0" % (top + added.count("\n")))
+                    self.w.configure(state=DISABLED)
+            except (IOError, OSError, ValueError):
+                self.w.bell()
+            self.loading = False
+
+        def scroll(self, *args):
+            """Called by the scrollbar; dragging it somewhere not loaded
+            loads the text there"""
+            if args[0] == "moveto":
+                size = self.window.size
+                start, end = self.window.start(), self.window.end()
+                offset = int(float(args[1]) * size)
+                if start <= offset < end or (offset >= end and end >= size):
+                    if end > start:
+                        self.w.yview_moveto(float(offset - start) / (end - start))
+                else:
+                    try:
+                        self.showText(self.window.jump(max(min(offset, size - TEXT_PAGE_SIZE), 0)))
+                    except (IOError, OSError, ValueError):
+                        self.w.bell()
+            else:
+                self.w.yview(*args)
+
     def displayFileText(self,filename):
         """Make a popup box displaying the text held in the given file on the client"""
 
         try:
-            text = fileviewer.getFileContents(filename)
-            popup = self.TextPopup(filename, text)
+            popup = self.TextPopup(filename, localFileRange(filename))
 
         except Exception, error:
             self.setCommandHistory(str(error))
@@ -374,8 +629,8 @@ class Application(Frame):
             #otherwise try and display the text of the file
             else:
                 try:
-                    text = clientio.getFileText(self.listToString(item[:-1]))
-                    popup = self.TextPopup(self.listToString(item[:-1]), text)
+                    name = self.listToString(item[:-1])
+                    popup = self.TextPopup(name, serverFileRange(name))
 
                 except Exception, error:
                     self.setCommandHistory(str(error))
@@ -388,6 +643,10 @@ class Application(Frame):
 	else:
             self.serverList.delete(0,END)
 
+        self.addDirList(isClient,list)
+
+    def addDirList(self,isClient,list):
+        """Add a list to the end of the client/server listbox"""
 	for x in list:
             if len(x) > 0:
                 s = ""
@@ -403,13 +662,17 @@ class Application(Frame):
 
     class ProgressBarUpdater (threading.Thread):
         """A thread to track transfer progress"""
-        def __init__(self, progress_bar, transfer, message_writer, filename, transfer_type):
+        def __init__(self, progress_bar, transfer, message_writer, filename, transfer_type, on_complete=None):
             threading.Thread.__init__(self)
             self.progress_bar = progress_bar
             self.transfer = transfer
             self.message_writer = message_writer
             self.filename = filename
             self.transfer_type = transfer_type
+            #called once the transfer has completed, if it doesn't fail
+            self.on_complete = on_complete
+            #where a download is being saved, as the pwd may change before it is done
+            self.directory = fileviewer.default_filespace.pwd
             self.start()
 
         def run(self):
@@ -439,6 +702,16 @@ class Application(Frame):
                 if state[3] or state[4]: #transfer_complete or has_failed
                     transferring = False
 
+            if state[3] and self.on_complete != None:
+                try:
+                    self.on_complete()
+                except (IOError, OSError), error:
+                    self.message_writer(str(error))
+
+            if self.transfer_type == 'Downloading':
+                #the file grew without the directory changing, so its cached listing is out of date
+                fileviewer.invalidateListing(self.directory)
+
             self.message_writer('Transfer of ' + self.filename + ' complete')
 
             self.progress_bar.configure(state=NORMAL)
@@ -458,12 +731,20 @@ class Application(Frame):
             clientFile = clientFile.split(" ")
             serverDir = clientio.getDir()
 
-            if len(clientFile) > 1:
+            if len(clientFile) > 1 and clientFile[-1] == "":
+                #a directory - send it and everything in it as one transfer
+                name = self.listToString(clientFile[:-1]).rstrip("/")
+                uploadObj = clientio.TreeTransfer(name,fileviewer.makePwd(name),False)
+
+                updater = self.ProgressBarUpdater(self.progressBar, uploadObj, self.setCommandHistory, name, 'Uploading')
+
+            elif len(clientFile) > 1:
                 name = self.listToString(clientFile[:-1])
                 f = fileviewer.getFile(name)[0] #gets just the file, not the size as well
                 fileSize = int(clientFile[-1])
                 
-                uploadObj = clientio.FileTransfer(name,f,fileSize,False)
+                #if the server already has the file, it is replaced - only sending the changes, if it is big enough for that to be worth it
+                uploadObj = clientio.FileTransfer(name,f,fileSize,False,use_delta=True)
                                 
                 updater = self.ProgressBarUpdater(self.progressBar, uploadObj, self.setCommandHistory, name, 'Uploading')
                     
@@ -481,14 +762,37 @@ class Application(Frame):
             serverFile = serverFile.split(" ")
             clientDir = fileviewer.getPwd()
 
-            if len(serverFile) > 1:
+            if len(serverFile) > 1 and serverFile[-1] == "":
+                #a directory - fetch it and everything in it as one transfer
+                name = self.listToString(serverFile[:-1]).rstrip("/")
+                downloadObj = clientio.TreeTransfer(name,fileviewer.makePwd(name))
+
+                updater = self.ProgressBarUpdater(self.progressBar, downloadObj, self.setCommandHistory, name, 'Downloading')
+
+            elif len(serverFile) > 1:
                 name = self.listToString(serverFile[:-1])
-                f = fileviewer.createFile(name)
-                fileSize = int(serverFile[-1])
-                
-                downloadObj = clientio.FileTransfer(name,f,fileSize,True)
+                try:
+                    #the size and modification time the file has now, so
+                    #only a partial copy of this version of it is carried on
+                    #from, and the server refuses if it changes meanwhile
+                    path, fileSize, atime, mtime = clientio.getFileProperties(name)
+                    validator = [fileSize, mtime]
+                    f, bytesHave, partial = fileviewer.resumeFile(name, fileviewer.makeValidator(fileSize, mtime))
+                except (IOError, OSError, ValueError), error:
+                    self.setCommandHistory(str(error) + ': ' + name)
+                    return
+                if bytesHave > fileSize:
+                    f.close()
+                    self.setCommandHistory('Partial copy is too big: ' + name)
+                    return
+                elif bytesHave > 0:
+                    self.setCommandHistory('Resuming ' + name + ' from ' + str(bytesHave) + ' bytes')
+                #the pwd may change before the download is done
+                finish = lambda target=fileviewer.makePwd(name): fileviewer.finishFile(partial, target)
+
+                downloadObj = clientio.FileTransfer(name,f,fileSize,True,resume=bytesHave > 0,validator=validator)
                                 
-                updater = self.ProgressBarUpdater(self.progressBar, downloadObj, self.setCommandHistory, name, 'Downloading')
+                updater = self.ProgressBarUpdater(self.progressBar, downloadObj, self.setCommandHistory, name, 'Downloading', finish)
         else:
             self.setCommandHistory('Not connected to a server')
 
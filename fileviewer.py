@@ -3,12 +3,30 @@
 Usage:
 Import this module and call the methods to use them
 
-All commands involving changing directory, getting directory contents and getting file contents should be passed to executeCommands. Check it's docstring for usage"""
+All commands involving changing directory, getting directory contents and getting file contents should be passed to executeCommands. Check it's docstring for usage
+
+The state of a filespace (its root and present working directory) is held in a Filespace object. Programs serving many users, such as the server, should create one Filespace per user. The module level functions act on a single default Filespace, for programs with only one user such as the client GUI."""
 
 import os
 import sys
+import stat
 import string
 import re
+import tempfile
+import shutil
+import threading
+import time
+import collections
+import hashlib
+import errno
+import bisect
+
+try:
+    #fcntl is used to clone files on file systems which can share data
+    #between files until one of them is written to
+    import fcntl
+except ImportError:
+    fcntl = None
 
 INVALID_COMMAND = 'invalid'
 REVERT_PWD = 'revert'
@@ -17,41 +35,22 @@ STAY = 'as you were'
 DISPLAY_CONTENTS_CMD = '.'
 GO_UP_CMD = '..'
 UNIX_SLASH = '/'
+FILESPACE_PREFIX = 'filespace:/' #start of paths given by getPwd
 
-pwd = ''
-
-def makeFilestorePath (name):
-    """Returns the path of a directory or file from the filespace root
-
-    For internal use only
-    """
-
-    global pwd
-
-    return getPwd() + UNIX_SLASH + name
-    
-    
-def makePath (name):
-    """
-    Returns a full path for the given file/directory
-
-    Generally for internal use
-    """
-    global pwd
-
-    return pwd + UNIX_SLASH + name
-    
-def makePwd(new_dir):
-    """
-    Returns a full path for the new pwd
+FICLONE = 0x40049409 #ioctl to clone a file, on linux
+COPY_SIZE = 1048576 #1MB - data copied at once when copying a file
+PARTIAL_SUFFIX = '.part' #end of the name of a file still being transferred
+PARTIAL_TAG_SIZE = 12 #characters of the validator's hash in a partial file's name
 
-    Generally for internal use
-    """
+DIR_TYPE = 'dir'
+FILE_TYPE = 'file'
+OTHER_TYPE = 'other'
 
-    global pwd
+LISTING_CACHE_SIZE = 256 #directory listings kept by the listing cache
+RACY_TIME = 2 #seconds a directory must be unchanged for before its listing is cached
+LISTING_MAX_AGE = 10 #seconds a cached listing is used for before the directory is read again
+PAGED_LISTING_ENTRIES = 10000 #most entries in a directory listed a page at a time for its listing to be cached
 
-    return makeInsideDir(pwd, new_dir)
-    
 
 def makeInsideDir(path, new_dir):
     """Returns a full path for a file/directory inside the given directory"""
@@ -62,20 +61,119 @@ def makeInsideDir(path, new_dir):
     else:
         return path + UNIX_SLASH + new_dir
 
-def isInFilespace(path):
-    """Returns whether or not a file is in the filespace
 
-    Generally for internal use"""
+def cloneFile(source, destination):
+    """Makes the destination file share the source file's data, copy on write
 
-    path = replaceBackSlashes(path)
+    Returns False if the file system can't, in which case nothing is done"""
 
-    #if the path starts with the root dir
-    if string.find(path, replaceBackSlashes(root)) is 0:
+    if fcntl == None:
+        return False
+    try:
+        fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
         return True
-    else:
+    except (IOError, OSError):
         return False
 
 
+class ListingCache (object):
+    """A bounded cache of directory listings, the least recently used being dropped first
+
+    Each listing is kept as the names of the directory's entries, sorted, along with the status of each, from which every kind of listing is made. It is kept with the modification time and inode of its directory, and only used while they are unchanged, so a repeat listing costs one stat. Adding, removing or renaming an entry changes the modification time, and the filespace's own writes invalidate the listings they affect
+
+    A file changing size in place does not change the modification time of its directory. So entries modified shortly before the listing was read, which are likely still being written, are looked at again each time the listing is used, and a listing is only used for LISTING_MAX_AGE seconds, which bounds how long a change to any other file can go unseen
+
+    Safe to use from several threads at once"""
+
+    def __init__ (self, size=LISTING_CACHE_SIZE):
+        self.size = size
+        #directory -> ((mtime, inode), time read, names, entries, indexes of recently modified entries)
+        self.listings = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def getListing(self, directory, limit=None):
+        """Returns a tuple of (names, entries) for the directory, from the cache if it is still valid, otherwise read from the directory
+
+        names is a sorted list of the names in the directory, and entries a list of the status of each, formatted as in Filespace.getDirSnapshot, with None for entries which can't be looked at. Neither should be changed
+
+        If the listing isn't cached and the directory has more than limit entries, entries is None, and nothing is looked at but the names
+
+        Throws OSError if the directory can't be looked at"""
+
+        status = os.stat(directory)
+        validator = (status.st_mtime, status.st_ino)
+
+        with self.lock:
+            cached = self.listings.pop(directory, None)
+            if cached != None and cached[0] == validator and time.time() - cached[1] < LISTING_MAX_AGE:
+                self.listings[directory] = cached
+                self.hits += 1
+            else:
+                cached = None
+                self.misses += 1
+
+        if cached != None:
+            names, entries, recent = cached[2:]
+
+            changed = None
+            for x in recent:
+                entry = getEntryStatus(directory, names[x])
+                if entry != entries[x]:
+                    #copied, as the old entries may be in use by another thread
+                    if changed == None:
+                        changed = list(entries)
+                    changed[x] = entry
+
+            if changed != None:
+                entries = changed
+                with self.lock:
+                    #unless it has been dropped or replaced meanwhile
+                    if self.listings.get(directory) is cached:
+                        self.listings[directory] = cached[:3] + (entries, recent)
+
+            return names, entries
+
+        read_time = time.time()
+        names = os.listdir(directory)
+        names.sort()
+
+        if limit != None and len(names) > limit:
+            return names, None
+
+        entries = [getEntryStatus(directory, x) for x in names]
+
+        #a directory changed just now may change again without its modification time moving on, where the file system only keeps it to the second
+        if read_time - status.st_mtime >= RACY_TIME:
+            recent = tuple(x for x, entry in enumerate(entries) if entry != None and read_time - entry[3] < RACY_TIME)
+
+            with self.lock:
+                self.listings[directory] = (validator, read_time, names, entries, recent)
+                while len(self.listings) > self.size:
+                    self.listings.popitem(last=False)
+
+        return names, entries
+
+    def invalidate(self, directory):
+        """Drops the listings of the directory and every directory inside it"""
+
+        directory = replaceBackSlashes(directory).rstrip(UNIX_SLASH)
+        inside = directory + UNIX_SLASH
+
+        with self.lock:
+            for key in self.listings.keys():
+                path = key.rstrip(UNIX_SLASH)
+                if path == directory or path.startswith(inside):
+                    del self.listings[key]
+
+    def getStats(self):
+        """Returns a tuple of (hits, misses, listings cached)"""
+
+        with self.lock:
+            return self.hits, self.misses, len(self.listings)
+
+
 class NavigationException (Exception):
     def __init__ (self, value):
         self.value = value
@@ -83,220 +181,508 @@ class NavigationException (Exception):
     def __str__ (self):
         return self.value
 
-def goUp():
-    """Changes the pwd to the parent of the pwd
+class CommandException (Exception):
+    def __init__ (self, value):
+        self.value = value
 
-    Throws NavigationException if already at the root directory.
+    def __str__ (self):
+        return self.value
 
-    For internal use only; to go up a directory, pass '..' to changePwd()"""
-    
-    global pwd
 
-    #don't allow going back further than root
-    if pwd == root:
-        raise NavigationException("Can't go back further than root directory")
+class Filespace (object):
+    """A filespace with its own root and present working directory
 
-    #go up a directory level
-    else:
-        
-        to_strip = ''
+    Each Filespace is independent, so several users can navigate the same disk at once without affecting each other"""
 
-        #gets a list of all printable characters that aren't slashes
-        for x in string.printable:
-            if x != '/' and x != '\\':
-                to_strip += x
-                
-        #strips the tailing directory name from the pwd
-        pwd = string.rstrip(pwd, to_strip)
+    def __init__ (self, directory=None):
+        """Creates a filespace rooted at the given directory
 
-        #strips the tailing slash from the pwd unless the pwd is now the root
-        if pwd [:len(pwd)] != UNIX_SLASH:
-            pwd = pwd [:len(pwd)-1] 
+        The default root is the directory the program is running in"""
 
+        if directory == None:
+            directory = os.getcwd()
 
-def createFile (filename, path=None):
-    """Returns file created at in the pwd with the specified filename"""
-    global pwd
+        self.setRoot(directory)
 
-    if path == None:
-        path = pwd
-    else:
-        createDir(path)
+    def makeFilestorePath (self, name):
+        """Returns the path of a directory or file from the filespace root
+
+        For internal use only
+        """
+
+        return self.getPwd() + UNIX_SLASH + name
+
+
+    def makePath (self, name):
+        """
+        Returns a full path for the given file/directory
+
+        Generally for internal use
+        """
+
+        return self.pwd + UNIX_SLASH + name
 
-    filename = replaceBackSlashes(filename)
+    def makePwd(self, new_dir):
+        """
+        Returns a full path for the new pwd
 
-    full_filename = makeInsideDir(path, filename)
+        Generally for internal use
+        """
 
-    if isInFilespace(full_filename):
-        if not os.path.exists(full_filename):
-            return open(full_filename, 'wb')
+        return makeInsideDir(self.pwd, new_dir)
+
+    def isInFilespace(self, path):
+        """Returns whether or not a file is in the filespace
+
+        Generally for internal use"""
+
+        path = replaceBackSlashes(path)
+
+        #if the path starts with the root dir
+        if string.find(path, replaceBackSlashes(self.root)) is 0:
+            return True
         else:
+            return False
+
+    def goUp(self):
+        """Changes the pwd to the parent of the pwd
+
+        Throws NavigationException if already at the root directory.
+
+        For internal use only; to go up a directory, pass '..' to changePwd()"""
+
+        #don't allow going back further than root
+        if self.pwd == self.root:
+            raise NavigationException("Can't go back further than root directory")
+
+        #go up a directory level
+        else:
+
+            to_strip = ''
+
+            #gets a list of all printable characters that aren't slashes
+            for x in string.printable:
+                if x != '/' and x != '\\':
+                    to_strip += x
+
+            #strips the tailing directory name from the pwd
+            self.pwd = string.rstrip(self.pwd, to_strip)
+
+            #strips the tailing slash from the pwd unless the pwd is now the root
+            if self.pwd [:len(self.pwd)] != UNIX_SLASH:
+                self.pwd = self.pwd [:len(self.pwd)-1]
+
+
+    def createFile (self, filename, path=None):
+        """Returns file created at in the pwd with the specified filename"""
+
+        if path == None:
+            path = self.pwd
+        else:
+            self.createDir(path)
+
+        filename = replaceBackSlashes(filename)
+
+        full_filename = makeInsideDir(path, filename)
+
+        if self.isInFilespace(full_filename):
+            if not os.path.exists(full_filename):
+                listing_cache.invalidate(os.path.dirname(full_filename))
+                return open(full_filename, 'wb')
+            else:
+                raise OSError('File already exists')
+        else:
+            raise OSError('Path not in filespace')
+
+    def partialPath(self, filename, validator):
+        """Returns the full path of the partial file used to write the specified file in the pwd, whose validator is given (see makeValidator)
+
+        Generally for internal use"""
+
+        filename = replaceBackSlashes(filename)
+        (directory, name) = os.path.split(self.makePwd(filename))
+        tag = hashlib.sha1(validator).hexdigest()[:PARTIAL_TAG_SIZE]
+
+        return os.path.join(directory, '.' + name + '.' + tag + PARTIAL_SUFFIX)
+
+    def resumeFile(self, filename, validator):
+        """Returns a file to carry on writing the specified file in the pwd to, the size of what is already in it, and its full path
+
+        The data goes into a hidden partial file next to the file, which finishFile gives the file's name once it is complete. The partial file is named after the validator of the whole file (see makeValidator), so only a partial file written for the very same file is carried on from - never a different file of the same name, or one which has changed since. Partial files left for other validators are removed
+
+        Raises OSError if the file already exists or the path is not in the filespace"""
+
+        filename = replaceBackSlashes(filename)
+        full_filename = self.makePwd(filename)
+        partial_path = self.partialPath(filename, validator)
+
+        if not self.isInFilespace(full_filename):
+            raise OSError('Path not in filespace')
+        if os.path.exists(full_filename):
             raise OSError('File already exists')
-    else:
-        raise OSError('Path not in filespace')
-      
-def createDir(name):
-    """Creates a with the specified name in the pwd
 
-    Raises OSError if directory already exists or if the path is not in the filespace"""
+        (directory, name) = os.path.split(full_filename)
+        #the partial file's size is about to change
+        listing_cache.invalidate(directory)
+
+        partial_name = re.compile(re.escape('.' + name + '.') + '[0-9a-f]{%d}' % PARTIAL_TAG_SIZE + re.escape(PARTIAL_SUFFIX) + '$')
+        for x in os.listdir(directory):
+            path = os.path.join(directory, x)
+            if partial_name.match(x) and path != partial_path:
+                os.remove(path)
 
-    full_path = makePwd(name)
+        if not os.path.exists(partial_path):
+            return open(partial_path, 'wb'), 0, partial_path
+        file_object = open(partial_path, 'r+b')
+        file_object.seek(0, os.SEEK_END)
+        return file_object, file_object.tell(), partial_path
 
-    if not os.path.exists(full_path):
-        if isInFilespace(full_path):
-            os.makedirs(full_path)  
+    def finishFile(self, partial_path, full_filename):
+        """Gives a complete partial file from resumeFile the name of the file it was for
+
+        The full path is taken, as the pwd may have changed since the file was started
+
+        Raises OSError if the file already exists or either path is not in the filespace"""
+
+        full_filename = replaceBackSlashes(full_filename)
+
+        if not (self.isInFilespace(full_filename) and self.isInFilespace(partial_path)):
+            raise OSError('Path not in filespace')
+
+        try:
+            #a link fails if the file exists, where a rename would replace it
+            os.link(partial_path, full_filename)
+        except (OSError, AttributeError), error:
+            if isinstance(error, OSError) and error.errno == errno.EEXIST:
+                raise OSError('File already exists')
+            #no hard links here
+            if os.path.exists(full_filename):
+                raise OSError('File already exists')
+            os.rename(partial_path, full_filename)
         else:
+            os.remove(partial_path)
+
+        listing_cache.invalidate(os.path.dirname(full_filename))
+
+    def createTempFile(self, filename):
+        """Returns a new, empty file next to the specified file in the pwd, and its path
+
+        Used to build a new copy of a file, which then replaces it using replaceFile
+
+        Raises OSError if the path is not in the filespace"""
+
+        filename = replaceBackSlashes(filename)
+        full_filename = self.makePwd(filename)
+
+        if not self.isInFilespace(full_filename):
             raise OSError('Path not in filespace')
-    else:
-        raise OSError('Directory already exists')
+        (directory, name) = os.path.split(full_filename)
+        (handle, temp_path) = tempfile.mkstemp(prefix='.' + name + '.', dir=directory)
+        return os.fdopen(handle, 'wb'), temp_path
 
-def getFileStatus(filename):
-    """Returns the status of a given file
+    def replaceFile(self, temp_path, full_filename):
+        """Replaces the file at the given full path with a file made by createTempFile, in one step
 
-    Data is held in a tuple in format (full path name, file size, last access time, last modification time)
+        The full path is taken, rather than a name in the pwd, as the pwd may have changed since the new file was started"""
 
-    Throws OSError if file is not valid
+        full_filename = replaceBackSlashes(full_filename)
 
-    For internal use only; pass the filename to executeCommands"""
-    
-    filename = replaceBackSlashes(filename)
+        if not self.isInFilespace(full_filename):
+            raise OSError('Path not in filespace')
+        if os.path.exists(full_filename):
+            #keep the permissions of the file being replaced
+            os.chmod(temp_path, stat.S_IMODE(os.stat(full_filename).st_mode))
+        os.rename(temp_path, full_filename)
+        listing_cache.invalidate(os.path.dirname(full_filename))
 
-    full_path = makePwd(filename)
-    
-    return makeFilestorePath(filename), os.path.getsize(full_path), os.path.getatime(full_path), os.path.getmtime(full_path)
+    def copyFile(self, source_path, filename, replace=False):
+        """Makes a file in the pwd with the same contents as the file at the given full path, without reading it where possible
 
-def getFile(filename):
-    """Returns a file object holding the specified file information and its size
+        A hard link is made if the file is new, otherwise it is replaced by a copy on write clone where the file system allows, or a plain copy
 
-    Throws OSError on bad filename or file outside of the filespace"""
+        Raises OSError if the file already exists (unless replace is True) or if either path is not in the filespace"""
 
-    filename = replaceBackSlashes(filename)
-    full_path = makePwd(filename)
+        filename = replaceBackSlashes(filename)
+        full_filename = self.makePwd(filename)
 
-    if isInFilespace(full_path):
-        return open(full_path, "rb"), os.path.getsize(full_path)
-    else:
-        raise OSError("Invalid file")
+        if not (self.isInFilespace(full_filename) and self.isInFilespace(source_path)):
+            raise OSError('Path not in filespace')
+        if os.path.exists(full_filename):
+            if not replace:
+                raise OSError('File already exists')
+        else:
+            try:
+                os.link(source_path, full_filename)
+                listing_cache.invalidate(os.path.dirname(full_filename))
+                return
+            except (OSError, AttributeError):
+                #e.g. on another device, or no hard links on this system
+                pass
+
+        (file_object, temp_path) = self.createTempFile(filename)
+        try:
+            with open(source_path, 'rb') as source:
+                if not cloneFile(source, file_object):
+                    shutil.copyfileobj(source, file_object, COPY_SIZE)
+            file_object.close()
+            self.replaceFile(temp_path, full_filename)
+        except (OSError, IOError):
+            file_object.close()
+            os.remove(temp_path)
+            raise
+
+    def createDir(self, name):
+        """Creates a with the specified name in the pwd
+
+        Raises OSError if directory already exists or if the path is not in the filespace"""
+
+        full_path = self.makePwd(name)
+
+        if not os.path.exists(full_path):
+            if self.isInFilespace(full_path):
+                os.makedirs(full_path)
+                listing_cache.invalidate(self.pwd)
+            else:
+                raise OSError('Path not in filespace')
+        else:
+            raise OSError('Directory already exists')
 
-def getFileContents(filename):
-    """Returns the contents of a file as one long string
+    def getFileStatus(self, filename):
+        """Returns the status of a given file
 
-    Throws IOError on bad filename
-    Throws OSError if file must be text but isn't"""
-    
-    filename = replaceBackSlashes(filename)
-    full_path = makePwd(filename)
+        Data is held in a tuple in format (full path name, file size, last access time, last modification time)
 
-   
-    if isInFilespace(full_path):
-        with open(full_path) as file:
-            return file.read()
-    else:
-        raise OSError("File is not in filespace")
+        Throws OSError if file is not valid
 
-def setRoot(directory):
-    """Sets the root location of the filestore
+        For internal use only; pass the filename to executeCommands"""
 
-    Absolute paths only"""
-    global root, pwd
+        filename = replaceBackSlashes(filename)
 
-    directory = replaceBackSlashes(directory)
-    
-    root = directory
-    
-    pwd = root
+        full_path = self.makePwd(filename)
 
-def executeCommands(command):
-    """Gets a string of commands and executes them
+        return self.makeFilestorePath(filename), os.path.getsize(full_path), os.path.getatime(full_path), os.path.getmtime(full_path)
 
-    Commands can be:
-    '.' - return contents of directory
-    '..' - go up a directory
-    <directory name> - change to directory (relative)
-    <file name> - return status of file
+    def getFile(self, filename):
+        """Returns a file object holding the specified file information and its size
 
-    These can be joined to create complex commands such as:
-    '../../dir' - change directory to 'dir' where dir is in the parent of the current parent dir
-    'dir1/dir2/file' - return file status of named file
-    """
+        Throws OSError on bad filename or file outside of the filespace"""
 
-    global pwd
+        filename = replaceBackSlashes(filename)
+        full_path = self.makePwd(filename)
 
-    old_pwd = pwd
+        if self.isInFilespace(full_path):
+            return open(full_path, "rb"), os.path.getsize(full_path)
+        else:
+            raise OSError("Invalid file")
+
+    def getFileContents(self, filename):
+        """Returns the contents of a file as one long string
+
+        Throws IOError on bad filename
+        Throws OSError if file must be text but isn't"""
 
-    command = replaceBackSlashes(command)
+        filename = replaceBackSlashes(filename)
+        full_path = self.makePwd(filename)
 
-    commands = string.split(command, UNIX_SLASH)
-    message = ''
-    ret = None
 
-    for x in range(len(commands)):
-        if x == len(commands) - 1:
-            is_last_command = True
+        if self.isInFilespace(full_path):
+            with open(full_path) as file:
+                return file.read()
         else:
-            is_last_command = False
+            raise OSError("File is not in filespace")
 
-        ret, message = singleExecution(commands[x], is_last_command)
+    def setRoot(self, directory):
+        """Sets the root location of the filestore
 
-        if message == INVALID_COMMAND:
-            raise CommandException ("Invalid command")
+        Absolute paths only"""
 
-    if message == REVERT_PWD:
-        pwd = old_pwd
+        directory = replaceBackSlashes(directory)
 
-    if ret != None:
-        return ret
+        self.root = directory
 
-class CommandException (Exception):
-    def __init__ (self, value):
-        self.value = value
+        self.pwd = self.root
 
-    def __str__ (self):
-        return self.value
+    def executeCommands(self, command):
+        """Gets a string of commands and executes them
+
+        Commands can be:
+        '.' - return contents of directory
+        '..' - go up a directory
+        <directory name> - change to directory (relative)
+        <file name> - return status of file
+
+        These can be joined to create complex commands such as:
+        '../../dir' - change directory to 'dir' where dir is in the parent of the current parent dir
+        'dir1/dir2/file' - return file status of named file
+        """
+
+        old_pwd = self.pwd
+
+        command = replaceBackSlashes(command)
+
+        commands = string.split(command, UNIX_SLASH)
+        message = ''
+        ret = None
+
+        for x in range(len(commands)):
+            if x == len(commands) - 1:
+                is_last_command = True
+            else:
+                is_last_command = False
+
+            ret, message = self.singleExecution(commands[x], is_last_command)
+
+            if message == INVALID_COMMAND:
+                raise CommandException ("Invalid command")
+
+        if message == REVERT_PWD:
+            self.pwd = old_pwd
+
+        if ret != None:
+            return ret
+
+    def singleExecution(self, command, is_last_command):
+        """Carries out a single command
+
+        For internal use only; use executeCommands instead"""
+
+        if command == DISPLAY_CONTENTS_CMD and is_last_command:
+            return self.getPwdContents(), REVERT_PWD
+
+        elif os.path.isfile(self.makePath(command)) and is_last_command:
+            return self.getFileStatus(command), REVERT_PWD
+
+        elif command == GO_UP_CMD:
+            self.goUp()
+            return None, STAY
+
+        elif os.path.isdir(self.makePath(command)):
+            self.pwd = string.rstrip(self.makePwd(command), '/')
+            return None, STAY
+
+
+        return None, INVALID_COMMAND
+
+
+    def getPwdContents(self):
+        """Returns the contents of the pwd
+
+        The returned data is held in a tuple, formatted as (name of file/directory, size in bytes)
+
+        Directories are said to have a size of -1
+
+        Throws OSError if there are broken symbolic links"""
+
+        return self.getDirContents(self.pwd)
+
+    def getDirContents(self, directory):
+        """Returns the contents of the specified directory
+
+        Takes absolute paths"""
+
+        directory = replaceBackSlashes(directory)
+
+        names, entries = listing_cache.getListing(directory)
+
+        return tuple([entry[0], entry[1]] for entry in orderSnapshot(entries))
+
+    def getPwdSnapshot(self):
+        """Returns the contents of the pwd along with the status of each entry
+
+        Each entry is held in a tuple, formatted as (name of file/directory, size in bytes, last access time, last modification time, type)
+
+        Type is one of DIR_TYPE, FILE_TYPE or OTHER_TYPE. As with getPwdContents, directories have a slash on the end of their name and a size of -1
+
+        Only one stat is made per entry, so this is cheaper than getPwdContents followed by getFileStatus on each file"""
+
+        return self.getDirSnapshot(self.pwd)
 
-def singleExecution(command, is_last_command):
-    """Carries out a single command
+    def getDirSnapshot(self, directory):
+        """Returns the contents of the specified directory along with the status of each entry
 
-    For internal use only; use executeCommands instead"""
+        Takes absolute paths"""
 
-    global pwd
+        directory = replaceBackSlashes(directory)
 
-    if command == DISPLAY_CONTENTS_CMD and is_last_command:
-        return getPwdContents(), REVERT_PWD
+        names, entries = listing_cache.getListing(directory)
 
-    elif os.path.isfile(makePath(command)) and is_last_command:
-        return getFileStatus(command), REVERT_PWD
+        return orderSnapshot(entries)
 
-    elif command == GO_UP_CMD:
-        goUp()
-        return None, STAY
+    def iterDirSnapshot(self, directory, start=None):
+        """Yields the entries of the specified directory one at a time, in the format used by getDirSnapshot
 
-    elif os.path.isdir(makePath(command)):
-        pwd = string.rstrip(makePwd(command), '/')
-        return None, STAY
-    
-    
-    return None, INVALID_COMMAND
-        
+        Each entry is yielded as a tuple of (name, entry), where name is where to start to carry on listing after this entry
 
-def getPwdContents():
-    """Returns the contents of the pwd
+        Entries come sorted by name, and listing carries on after the name given as start (None for the beginning), so entries added or removed meanwhile are never skipped or given twice
 
-    The returned data is held in a tuple, formatted as (name of file/directory, size in bytes)
+        Directories of up to PAGED_LISTING_ENTRIES entries are listed through the listing cache. For larger ones, unless they are cached already, only the names are held in memory, and each entry is only looked at as it is yielded. Names up to start are skipped without being looked at
 
-    Directories are said to have a size of -1
+        Takes absolute paths"""
 
-    Throws OSError if there are broken symbolic links"""
-    global pwd
+        directory = replaceBackSlashes(directory)
 
-    return getDirContents(pwd)
+        names, entries = listing_cache.getListing(directory, PAGED_LISTING_ENTRIES)
 
-def getDirContents(directory):
-    """Returns the contents of the specified directory
+        first = 0
+        if start != None:
+            first = bisect.bisect_right(names, start)
 
-    Takes absolute paths"""
+        for x in xrange(first, len(names)):
+            if entries == None:
+                entry = getEntryStatus(directory, names[x])
+            else:
+                entry = entries[x]
 
-    directory = replaceBackSlashes(directory)
+            if entry != None:
+                yield names[x], entry
+
+    def getFilteredPwdContents(self):
+        """Returns the contents of the pwd without config files/directories (starting with '.'"""
+
+        data = self.getPwdContents()
+
+        new_data = filter(isNotConfig, data)
+
+        return new_data
+
+    def getPwd(self):
+        """Returns the pwd
+
+        Prefered as opposed to simply accessing the pwd field directly"""
+
+        path = replaceBackSlashes(self.pwd)[len(replaceBackSlashes(self.root)):]
+
+        return FILESPACE_PREFIX + path
+
+    def atPath(self, path):
+        """Returns a new Filespace with the same root, whose pwd is the directory at the given path, as returned by getPwd
+
+        Lets work started in one directory carry on there after the pwd has changed
+
+        Throws NavigationException if the path is not a directory in the filespace"""
+
+        path = replaceBackSlashes(str(path))
+        if not path.startswith(FILESPACE_PREFIX) or GO_UP_CMD in path[len(FILESPACE_PREFIX):].split(UNIX_SLASH):
+            raise NavigationException("Invalid directory")
+
+        filespace = Filespace(self.root)
+        filespace.pwd = replaceBackSlashes(self.root) + path[len(FILESPACE_PREFIX):]
+        if not filespace.isInFilespace(filespace.pwd) or not os.path.isdir(filespace.pwd):
+            raise NavigationException("Invalid directory")
+        return filespace
+
+    def unrestrictFilespace(self):
+        """Unrestricts the filespace, i.e. sets the filespace root to the system root"""
+
+        self.root = platform_root
+
+        self.pwd = self.root
+
+
+def readDirContents(directory):
+    """Reads the contents of the directory, formatted as in Filespace.getDirContents, without using the listing cache
+
+    Generally for internal use"""
 
     contents = os.listdir(directory)
     contents.sort()
@@ -307,25 +693,72 @@ def getDirContents(directory):
 
     for x in contents:
         #add a slash to the end of directories
-        if os.path.isdir(makePath(x)):
+        if os.path.isdir(makeInsideDir(directory, x)):
             x += UNIX_SLASH
             return_data += [x, -1], #dirs always have a size of -1 to help handling on other modules
-        elif os.path.exists(makePath(x)):
+        elif os.path.exists(makeInsideDir(directory, x)):
             files.append(x)
-    
+
     for x in files:
-         return_data += [x, os.path.getsize(makePath(x))],
+         return_data += [x, os.path.getsize(makeInsideDir(directory, x))],
 
     return return_data
 
-def getFilteredPwdContents():
-    """Returns the contents of the pwd without config files/directories (starting with '.'"""
+def readDirSnapshot(directory):
+    """Reads the contents of the directory along with the status of each entry, formatted as in Filespace.getDirSnapshot, without using the listing cache
+
+    Generally for internal use"""
 
-    data = getPwdContents()
+    contents = os.listdir(directory)
+    contents.sort()
 
-    new_data = filter(isNotConfig, data)
+    return orderSnapshot([getEntryStatus(directory, x) for x in contents])
 
-    return new_data
+def orderSnapshot(entries):
+    """Returns a new list of the entries, formatted as in Filespace.getDirSnapshot, with the directories first, from entries sorted by name as given by ListingCache.getListing
+
+    Generally for internal use"""
+
+    dirs = []
+    files = []
+
+    for entry in entries:
+        #broken symbolic links are left out, as in getDirContents
+        if entry == None:
+            continue
+
+        if entry[4] == DIR_TYPE:
+            dirs.append(entry)
+        else:
+            files.append(entry)
+
+    return dirs + files
+
+def makeValidator(size, mtime):
+    """Returns a string which identifies a version of a file, from its size and modification time
+
+    Used to tell if a partial file was written for the same file (see Filespace.resumeFile)"""
+
+    return '%d:%r' % (int(size), float(mtime))
+
+def getEntryStatus(directory, name):
+    """Returns the status of a directory entry, formatted as in Filespace.getDirSnapshot
+
+    Returns None for entries which can't be looked at, such as broken symbolic links
+
+    Generally for internal use"""
+
+    try:
+        status = os.stat(makeInsideDir(directory, name))
+    except OSError:
+        return None
+
+    if stat.S_ISDIR(status.st_mode):
+        return name + UNIX_SLASH, -1, status.st_atime, status.st_mtime, DIR_TYPE
+    elif stat.S_ISREG(status.st_mode):
+        return name, status.st_size, status.st_atime, status.st_mtime, FILE_TYPE
+    else:
+        return name, status.st_size, status.st_atime, status.st_mtime, OTHER_TYPE
 
 def isNotConfig(data):
     """Returns if the file/directory is a non-config file/dir
@@ -338,39 +771,51 @@ def isNotConfig(data):
         else:
             return True
 
-def getPwd():
-    """Returns the pwd
-
-    Prefered as opposed to simply accessing the pwd field directly"""
-
-    path = replaceBackSlashes(pwd)[len(replaceBackSlashes(root)):]
-    
-    return 'filespace:/' + path
-
-def unrestrictFilespace():
-    """Unrestricts the filespace, i.e. sets the filespace root to the system root"""
-    global root, pwd
-
-    root = platform_root
-    
-    pwd = root
-      
 
 def replaceBackSlashes(s):
     """Replaces backslases in a string with slashes"""
 
     return string.replace(s, '\\', '/')
 
-root = os.getcwd() #root directory
-    
-pwd = root #present working directory
-
 platform_root = ''
 
 if sys.platform == 'win32':
-    platform_root = root[:3]
+    platform_root = os.getcwd()[:3]
 else:
     platform_root = '/'
 
-pwd_contents = [] #will hold the contents of the pwd
-
+#listings shared by every filespace, as many users often list the same directories
+listing_cache = ListingCache()
+
+#the filespace used by the module level functions
+default_filespace = Filespace()
+
+makeFilestorePath = default_filespace.makeFilestorePath
+makePath = default_filespace.makePath
+makePwd = default_filespace.makePwd
+isInFilespace = default_filespace.isInFilespace
+goUp = default_filespace.goUp
+createFile = default_filespace.createFile
+partialPath = default_filespace.partialPath
+resumeFile = default_filespace.resumeFile
+finishFile = default_filespace.finishFile
+createTempFile = default_filespace.createTempFile
+replaceFile = default_filespace.replaceFile
+copyFile = default_filespace.copyFile
+createDir = default_filespace.createDir
+getFileStatus = default_filespace.getFileStatus
+getFile = default_filespace.getFile
+getFileContents = default_filespace.getFileContents
+setRoot = default_filespace.setRoot
+executeCommands = default_filespace.executeCommands
+singleExecution = default_filespace.singleExecution
+getPwdContents = default_filespace.getPwdContents
+getDirContents = default_filespace.getDirContents
+getPwdSnapshot = default_filespace.getPwdSnapshot
+getDirSnapshot = default_filespace.getDirSnapshot
+iterDirSnapshot = default_filespace.iterDirSnapshot
+getFilteredPwdContents = default_filespace.getFilteredPwdContents
+getPwd = default_filespace.getPwd
+unrestrictFilespace = default_filespace.unrestrictFilespace
+invalidateListing = listing_cache.invalidate
+getListingCacheStats = listing_cache.getStats
@@ -0,0 +1,248 @@
+"""
+HashIndex module keeps track of the content hash of files on the server, so
+that a file being uploaded which is already somewhere on the server can be
+copied there, rather than sent again.
+
+Usage:
+    Create an index using HashIndex()
+    Add files using add(path)
+        - The file is hashed by the index, so only what is really in the file
+          is ever trusted.
+    Add every file already in a directory tree using scan(directory)
+        - Only the sizes of the files are noted. A file is hashed the first
+          time a file of its size is looked for, so few files are ever
+          hashed.
+    Look for a file with given contents using find(digest, size)
+        - Returns the path of a file, which is checked to be unchanged since
+          it was added, or None.
+    Hash a file on the client using hashFile(file_object)
+
+Exceptions:
+    IOError/OSError - If a file cannot be read.
+"""
+import hashlib
+import os
+import stat
+import threading
+
+
+
+
+###############################################################################
+# Globals
+###############################################################################
+
+HASH_NAME = "sha256" #hash used to identify file contents
+READ_SIZE = 1048576 #1MB - data read at once while hashing
+
+###############################################################################
+# End of globals
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Hashing
+###############################################################################
+
+#hashFile function - to get the content hash of a file
+def hashFile(file_object):
+    """
+    Usage:
+        Hashes file_object from its start. Its position is left as it was.
+
+    Returns:
+        Hex digest of the file's contents.
+    """
+    position = file_object.tell()
+    file_object.seek(0)
+    content_hash = hashlib.new(HASH_NAME)
+    data = file_object.read(READ_SIZE)
+    while data != "":
+        content_hash.update(data)
+        data = file_object.read(READ_SIZE)
+    file_object.seek(position)
+    return content_hash.hexdigest()
+#end of hashFile function
+
+###############################################################################
+# End of hashing
+###############################################################################
+
+
+
+
+
+###############################################################################
+# HashIndex class
+###############################################################################
+
+#HashIndex class - finds files on the server by their contents
+class HashIndex(object):
+    """
+    Usage:
+        See module docstring. Safe to use from several threads at once.
+    """
+
+    #Constructor
+    def __init__(self):
+        #digest -> set of paths
+        self.files = {}
+        #path -> (digest, size, mtime, inode), to tell if it has changed
+        self.paths = {}
+        #size -> set of paths, and path -> size, for files from scan() which
+        #are not hashed yet
+        self.unhashed = {}
+        self.unhashed_sizes = {}
+        self.lock = threading.Lock()
+    #End of Constructor
+
+
+    #add method - to add a file, or update it if it has changed
+    def add(self, path, digest=None):
+        """
+        Usage:
+            Hashes the file at path, and adds it to the index.
+
+        Takes in:
+            path - path of the file.
+            digest - hex digest of the file's contents, only if it is already
+                     known for certain, e.g. the file is a copy of one found
+                     using find(). The file is not hashed if this is given.
+
+        Returns:
+            Hex digest of the file's contents.
+
+        Exceptions:
+            IOError/OSError - If the file cannot be read.
+        """
+        path = os.path.abspath(path)
+        file_stat = os.stat(path)
+        if digest == None:
+            with open(path, "rb") as file_object:
+                digest = hashFile(file_object)
+        with self.lock:
+            self.forget(path)
+            self.forgetUnhashed(path)
+            self.paths[path] = (digest, file_stat.st_size,
+                                file_stat.st_mtime, file_stat.st_ino)
+            self.files.setdefault(digest, set()).add(path)
+        return digest
+    #End of add method
+
+
+    #scan method - to add every file in a directory tree, without hashing
+    def scan(self, directory):
+        """
+        Usage:
+            Goes through every file under directory, noting its size. Links
+            are not followed. Takes a while for a big tree, so is best run in
+            its own thread - files are found by find() as soon as they have
+            been noted.
+        """
+        for (path, dirs, files) in os.walk(directory):
+            for name in files:
+                file_path = os.path.abspath(os.path.join(path, name))
+                try:
+                    file_stat = os.lstat(file_path)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(file_stat.st_mode):
+                    continue
+                with self.lock:
+                    if file_path not in self.paths:
+                        self.forgetUnhashed(file_path)
+                        self.unhashed_sizes[file_path] = file_stat.st_size
+                        self.unhashed.setdefault(file_stat.st_size,
+                                                 set()).add(file_path)
+    #End of scan method
+
+
+    #find method - to find a file with the given contents
+    def find(self, digest, size):
+        """
+        Usage:
+            Files which have changed or gone since they were added are
+            dropped from the index rather than returned. Files from scan()
+            of the same size are hashed first, if they have not been.
+
+        Takes in:
+            digest - hex digest of the contents (see hashFile()).
+            size - size of the contents in bytes.
+
+        Returns:
+            Path of a file with those contents, or None if there is none.
+        """
+        self.hashSize(size)
+        with self.lock:
+            for path in list(self.files.get(digest, ())):
+                try:
+                    file_stat = os.stat(path)
+                except OSError:
+                    self.forget(path)
+                    continue
+                if self.paths[path][1:] != (file_stat.st_size,
+                                            file_stat.st_mtime,
+                                            file_stat.st_ino):
+                    self.forget(path)
+                    continue
+                if file_stat.st_size == size:
+                    return path
+        return None
+    #End of find method
+
+
+    #hashSize method - to hash the files from scan() of the given size
+    def hashSize(self, size):
+        """
+        Usage:
+            For internal use only, by find().
+            Files which have changed since they were noted are hashed as they
+            are now, and those which can't be read are dropped.
+        """
+        with self.lock:
+            waiting = self.unhashed.pop(size, set())
+            for path in waiting:
+                del self.unhashed_sizes[path]
+        for path in waiting:
+            try:
+                self.add(path)
+            except (IOError, OSError):
+                pass
+    #End of hashSize method
+
+
+    #forgetUnhashed method - to drop a file from those not hashed yet
+    def forgetUnhashed(self, path):
+        """
+        Usage:
+            For internal use only, and only with the lock held.
+        """
+        size = self.unhashed_sizes.pop(path, None)
+        if size != None:
+            self.unhashed[size].discard(path)
+            if not self.unhashed[size]:
+                del self.unhashed[size]
+    #End of forgetUnhashed method
+
+
+    #forget method - to drop a file from the index
+    def forget(self, path):
+        """
+        Usage:
+            For internal use only, and only with the lock held.
+        """
+        entry = self.paths.pop(path, None)
+        if entry != None:
+            self.files[entry[0]].discard(path)
+            if not self.files[entry[0]]:
+                del self.files[entry[0]]
+    #End of forget method
+
+#End of HashIndex class
+
+###############################################################################
+# End of HashIndex class
+###############################################################################
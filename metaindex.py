@@ -0,0 +1,460 @@
+"""
+MetaIndex module keeps an index of the name, size and modification time of
+every file in a filespace, in an sqlite database, so files anywhere in the
+tree can be found by name, size or age at once, rather than by walking the
+whole tree each time.
+
+Usage:
+    Create an index using MetaIndex(root, db_path)
+        - The database is kept between runs, so only what has changed needs
+          to be looked at again when the server restarts.
+    Bring the index up to date using refresh()
+        - The tree is walked by a pool of threads. A directory whose
+          modification time is the same as when it was last indexed has not
+          had anything added, removed or renamed in it, so it isn't listed
+          again - only its subdirectories are checked.
+        - Files changed in place (rather than replaced) don't change their
+          directory's modification time, so their size and modification time
+          are only updated by refresh(full=True), or when something else in
+          the directory changes.
+    Keep it up to date in the background using start(interval, full_interval)
+        - Every full_interval seconds, and the first time, the refresh is a
+          full one, so files changed in place are never behind for longer
+          than that.
+    Find files using find(under, name, min_size, max_size, min_mtime,
+    max_mtime, order, limit)
+        - order may be LARGEST or NEWEST, to find the largest or newest files.
+
+Exceptions:
+    ImportError - If MetaIndex is created where python has no sqlite3.
+    IOError - If the database cannot be opened, read or written.
+"""
+import hashlib
+import os
+import Queue
+import stat
+import tempfile
+import threading
+import time
+
+try:
+    #sqlite3 is missing from some python builds, in which case the server
+    #runs without an index
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+
+
+
+###############################################################################
+# Globals
+###############################################################################
+
+WORKERS = 8 #threads listing directories while the index is refreshed
+REFRESH_TIME = 300 #default seconds between refreshes in the background
+FULL_REFRESH_TIME = 3600 #default seconds between full refreshes in the background
+MAX_RESULTS = 1000 #default most files given by find()
+BATCH_SIZE = 64 #directories written to the database in one transaction
+SEPARATOR = "/" #between names in paths in the index
+
+LARGEST = "largest" #find() orders - largest first,
+NEWEST = "newest" #  or most recently modified first
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT,
+                                 mtime REAL);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT, name TEXT,
+                                  size INTEGER, mtime REAL);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE INDEX IF NOT EXISTS files_size ON files (size);
+CREATE INDEX IF NOT EXISTS files_mtime ON files (mtime);
+"""
+
+###############################################################################
+# End of globals
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Paths
+###############################################################################
+
+#defaultDbPath function - to get where the index of a tree is kept
+def defaultDbPath(root):
+    """
+    Usage:
+        The database is kept out of the tree itself, so it is never indexed
+        or listed, with a name made from the root so each tree has its own.
+    """
+    name = hashlib.md5(os.path.abspath(root)).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), "filerover-" + name + ".db")
+#end of defaultDbPath function
+
+
+#joinPath function - to get the path of an entry in an indexed directory
+def joinPath(directory, name):
+    if directory == "":
+        return name
+    return directory + SEPARATOR + name
+#end of joinPath function
+
+
+#escapeLike function - to match a string literally in an sqlite LIKE
+def escapeLike(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+#end of escapeLike function
+
+###############################################################################
+# End of paths
+###############################################################################
+
+
+
+
+
+###############################################################################
+# MetaIndex class
+###############################################################################
+
+#MetaIndex class - an index of the files in a tree
+class MetaIndex(object):
+    """
+    Usage:
+        See module docstring. Safe to use from several threads at once - one
+        refresh runs at a time, and find() may be used while it runs.
+        Paths in the index are relative to the root, with "/" between names.
+        Links are not followed, and only regular files are indexed.
+    """
+
+    #Constructor
+    def __init__(self, root, db_path=None):
+        """
+        Takes in:
+            root - full path of the top of the tree.
+            db_path - where to keep the database, by default a file in the
+                      temporary directory (see defaultDbPath()).
+
+        Exceptions:
+            ImportError - If there is no sqlite3.
+            IOError - If the database cannot be opened.
+        """
+        if sqlite3 == None:
+            raise ImportError("No sqlite3 - the index is not available.")
+        self.root = os.path.abspath(root)
+        if db_path == None:
+            db_path = defaultDbPath(self.root)
+        try:
+            #Only used with the lock held, so may be shared between threads
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            #Names are kept as the bytes the OS gives, whatever they are
+            self.db.text_factory = str
+            self.db.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            raise IOError("Could not open index: " + str(e))
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.updated = None #time the last refresh started, once it is done
+        self.refresher = None
+        self.stopped = threading.Event()
+    #End of Constructor
+
+
+    #start method - to refresh the index in the background from now on
+    def start(self, interval=REFRESH_TIME, full_interval=FULL_REFRESH_TIME):
+        """
+        Usage:
+            Refreshes straight away, then every interval seconds, in a daemon
+            thread, until stop() is called. The first refresh, and the first
+            after every full_interval seconds, is a full one, as files changed
+            in place (perhaps while the server was not running) are otherwise
+            missed.
+        """
+        self.refresher = threading.Thread(target=self.refreshLoop,
+                                          args=(interval, full_interval))
+        self.refresher.daemon = True
+        self.refresher.start()
+    #End of start method
+
+
+    #stop method - to stop refreshing in the background
+    def stop(self):
+        self.stopped.set()
+    #End of stop method
+
+
+    #refreshLoop method - to refresh the index every interval
+    def refreshLoop(self, interval, full_interval):
+        """
+        Usage:
+            For internal use only, run by start() in its own thread.
+        """
+        last_full = None #time the last full refresh started
+        while not self.stopped.is_set():
+            started = time.time()
+            full = last_full == None or started - last_full >= full_interval
+            try:
+                self.refresh(full)
+                if full:
+                    last_full = started
+            except (IOError, OSError) as e:
+                print "Could not refresh index: " + str(e)
+            self.stopped.wait(interval)
+    #End of refreshLoop method
+
+
+    #refresh method - to bring the index up to date with the tree
+    def refresh(self, full=False):
+        """
+        Usage:
+            Directories are listed by a pool of WORKERS threads, while this
+            thread writes what they find to the database, so listing is not
+            held up by writing. See module docstring for what is looked at.
+
+        Takes in:
+            full - True to list every directory and look at every file again,
+                   whether or not its directory has changed.
+
+        Returns:
+            Number of directories which were listed.
+
+        Exceptions:
+            IOError - If the database cannot be read or written.
+        """
+        with self.refresh_lock:
+            started = time.time()
+            #path -> [mtime, subdirectories] as last indexed
+            known = {}
+            try:
+                with self.lock:
+                    for (path, parent, mtime) in self.db.execute(
+                            "SELECT path, parent, mtime FROM dirs"):
+                        known.setdefault(path, [None, []])[0] = mtime
+                        if parent != None:
+                            children = known.setdefault(parent, [None, []])[1]
+                            children.append(path)
+            except sqlite3.Error as e:
+                raise IOError("Could not read index: " + str(e))
+            if full:
+                for entry in known.itervalues():
+                    entry[0] = None
+
+            tasks = Queue.Queue()
+            results = Queue.Queue()
+            workers = [threading.Thread(target=self.listDirs,
+                                        args=(tasks, results, known))
+                       for i in xrange(WORKERS)]
+            for worker in workers:
+                worker.daemon = True
+                worker.start()
+            try:
+                listed = self.walk(tasks, results, known)
+            except sqlite3.Error as e:
+                raise IOError("Could not write index: " + str(e))
+            finally:
+                for worker in workers:
+                    tasks.put(None)
+            self.updated = started
+            return listed
+    #End of refresh method
+
+
+    #walk method - to hand out directories and write what is found
+    def walk(self, tasks, results, known):
+        """
+        Usage:
+            For internal use only, by refresh().
+
+        Returns:
+            Number of directories which were listed.
+        """
+        tasks.put(("", None))
+        pending = 1
+        seen = set()
+        listed = 0
+        batch = []
+        while pending > 0:
+            result = results.get()
+            pending -= 1
+            (path, parent, mtime, subdirs, files) = result
+            if mtime == None:
+                #gone, or not a directory any more
+                continue
+            seen.add(path)
+            for subdir in subdirs:
+                tasks.put((subdir, path))
+                pending += 1
+            if files != None:
+                listed += 1
+                batch.append(result)
+            if len(batch) >= BATCH_SIZE:
+                self.writeDirs(batch)
+                batch = []
+        self.writeDirs(batch)
+
+        #Drop directories which were not reached this time
+        gone = [path for path in known if path not in seen]
+        with self.lock:
+            with self.db:
+                for path in gone:
+                    self.db.execute("DELETE FROM dirs WHERE path = ?", (path,))
+                    self.db.execute("DELETE FROM files WHERE dir = ?", (path,))
+        return listed
+    #End of walk method
+
+
+    #writeDirs method - to write what was found in some directories
+    def writeDirs(self, batch):
+        """
+        Usage:
+            For internal use only, by walk().
+            Each directory's files replace what was indexed for it before.
+        """
+        with self.lock:
+            with self.db:
+                for (path, parent, mtime, subdirs, files) in batch:
+                    self.db.execute("INSERT OR REPLACE INTO dirs "
+                                    "(path, parent, mtime) VALUES (?, ?, ?)",
+                                    (path, parent, mtime))
+                    self.db.execute("DELETE FROM files WHERE dir = ?", (path,))
+                    self.db.executemany("INSERT INTO files "
+                                        "(path, dir, name, size, mtime) "
+                                        "VALUES (?, ?, ?, ?, ?)",
+                                        [(joinPath(path, name), path, name,
+                                          size, file_mtime)
+                                         for (name, size, file_mtime)
+                                         in files])
+    #End of writeDirs method
+
+
+    #listDirs method - to list directories until told to stop
+    def listDirs(self, tasks, results, known):
+        """
+        Usage:
+            For internal use only, run in a thread for each worker.
+            Takes (path, parent) from tasks until it gets None, and puts a
+            (path, parent, mtime, subdirs, files) result for each, where
+            files is None if the directory has not changed since it was
+            indexed, and mtime is None if it is not a directory.
+        """
+        while True:
+            task = tasks.get()
+            if task == None:
+                return
+            (path, parent) = task
+            try:
+                results.put((path, parent) + self.listDir(path, known))
+            except OSError:
+                results.put((path, parent, None, [], None))
+    #End of listDirs method
+
+
+    #listDir method - to list one directory, if it has changed
+    def listDir(self, path, known):
+        """
+        Usage:
+            For internal use only, by listDirs().
+
+        Returns:
+            Tuple of (mtime, subdirs, files) - see listDirs().
+
+        Exceptions:
+            OSError - If the directory cannot be looked at.
+        """
+        full_path = os.path.join(self.root, *path.split(SEPARATOR))
+        dir_stat = os.lstat(full_path)
+        if not stat.S_ISDIR(dir_stat.st_mode):
+            return (None, [], None)
+        entry = known.get(path)
+        if entry != None and entry[0] == dir_stat.st_mtime:
+            return (dir_stat.st_mtime, entry[1], None)
+
+        subdirs = []
+        files = []
+        for name in os.listdir(full_path):
+            try:
+                entry_stat = os.lstat(os.path.join(full_path, name))
+            except OSError:
+                continue
+            if stat.S_ISDIR(entry_stat.st_mode):
+                subdirs.append(joinPath(path, name))
+            elif stat.S_ISREG(entry_stat.st_mode):
+                files.append((name, entry_stat.st_size, entry_stat.st_mtime))
+        return (dir_stat.st_mtime, subdirs, files)
+    #End of listDir method
+
+
+    #find method - to find files in the index
+    def find(self, under="", name=None, min_size=None, max_size=None,
+             min_mtime=None, max_mtime=None, order=None, limit=MAX_RESULTS):
+        """
+        Usage:
+            Every condition given must hold. Answers from the index as it is,
+            which may be behind the tree by up to one refresh.
+
+        Takes in:
+            under - path of a directory in the index, to only find files in
+                    it and its subdirectories, or "" for the whole tree.
+            name - glob which the file name must match, e.g. "*.log".
+                   Case sensitive.
+            min_size/max_size - range of sizes in bytes, inclusive.
+            min_mtime/max_mtime - range of modification times, in seconds
+                                  since the epoch, inclusive.
+            order - None to sort by path, LARGEST for the largest files first,
+                    or NEWEST for the most recently modified first.
+            limit - most files to give.
+
+        Returns:
+            List of (path, size, mtime) tuples, path being relative to under.
+
+        Exceptions:
+            ValueError - If order is not known.
+            IOError - If the database cannot be read.
+        """
+        conditions = []
+        values = []
+        if under != "":
+            conditions.append("path LIKE ? ESCAPE '\\'")
+            values.append(escapeLike(under + SEPARATOR) + "%")
+        for (condition, value) in (("name GLOB ?", name),
+                                   ("size >= ?", min_size),
+                                   ("size <= ?", max_size),
+                                   ("mtime >= ?", min_mtime),
+                                   ("mtime <= ?", max_mtime)):
+            if value != None:
+                conditions.append(condition)
+                values.append(value)
+        query = "SELECT path, size, mtime FROM files"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        if order == None:
+            query += " ORDER BY path"
+        elif order == LARGEST:
+            query += " ORDER BY size DESC, path"
+        elif order == NEWEST:
+            query += " ORDER BY mtime DESC, path"
+        else:
+            raise ValueError("Unknown order: " + str(order))
+        query += " LIMIT ?"
+        values.append(int(limit))
+
+        start = 0
+        if under != "":
+            start = len(under) + len(SEPARATOR)
+        try:
+            with self.lock:
+                return [(path[start:], size, mtime) for (path, size, mtime)
+                        in self.db.execute(query, values)]
+        except sqlite3.Error as e:
+            raise IOError("Could not read index: " + str(e))
+    #End of find method
+
+#End of MetaIndex class
+
+###############################################################################
+# End of MetaIndex class
+###############################################################################
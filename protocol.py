@@ -0,0 +1,226 @@
+"""
+Protocol module contains the framed wire format shared by the client and the
+server for messages on the control connection.
+
+Every message is a list of fields, sent as one frame:
+    - a 4 byte (big endian) length of the rest of the frame, followed by
+    - each field in turn, as a 1 byte type code, a 4 byte length and then the
+      field's data.
+Field data is never parsed for separators, so strings may contain any bytes
+(including "|" and newlines), and messages may be of any size. Decoding is a
+single pass over the frame.
+
+Usage:
+    Send a message using sendFrame(socket, fields)
+    Receive a message using receiveFrame(socket)
+    Fields may be:
+        str (unicode is sent as utf-8), int/long, float, None
+        list/tuple of fields - received as a list
+
+Exceptions:
+    socket.error - If sending or receiving fails, or the connection is closed
+                   part way through a frame.
+    ValueError - If a frame is badly formatted, or a field is of a type which
+                 cannot be sent.
+"""
+import socket
+import struct
+
+
+
+
+###############################################################################
+# Globals
+###############################################################################
+
+HEADER = struct.Struct("!I") #frame length
+FIELD_HEADER = struct.Struct("!cI") #field type, field length
+INT_FIELD = struct.Struct("!q")
+FLOAT_FIELD = struct.Struct("!d")
+
+STRING_TYPE = "s"
+INT_TYPE = "i"
+FLOAT_TYPE = "f"
+NONE_TYPE = "n"
+LIST_TYPE = "l"
+
+RECEIVE_SIZE = 65536 #most to ask the socket for at once
+
+###############################################################################
+# End of globals
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Encoding/decoding
+###############################################################################
+
+#encodeFields function - to turn a list of fields into a string
+def encodeFields(fields):
+    """
+    Usage:
+        For internal use only.
+        Encodes fields, without the frame length header.
+
+    Takes in:
+        fields - list of fields to encode.
+
+    Returns:
+        String of encoded fields.
+
+    Exceptions:
+        ValueError - If a field cannot be encoded.
+    """
+    pieces = []
+    for field in fields:
+        if isinstance(field, unicode):
+            field = field.encode("utf-8")
+        if isinstance(field, str):
+            pieces.append(FIELD_HEADER.pack(STRING_TYPE, len(field)))
+            pieces.append(field)
+        #bool is sent as an int
+        elif isinstance(field, (int, long)):
+            pieces.append(FIELD_HEADER.pack(INT_TYPE, INT_FIELD.size))
+            pieces.append(INT_FIELD.pack(field))
+        elif isinstance(field, float):
+            pieces.append(FIELD_HEADER.pack(FLOAT_TYPE, FLOAT_FIELD.size))
+            pieces.append(FLOAT_FIELD.pack(field))
+        elif field == None:
+            pieces.append(FIELD_HEADER.pack(NONE_TYPE, 0))
+        elif isinstance(field, (list, tuple)):
+            #Length of a list is only known once its contents are encoded
+            nested = encodeFields(field)
+            pieces.append(FIELD_HEADER.pack(LIST_TYPE, len(nested)))
+            pieces.append(nested)
+        else:
+            raise ValueError("Cannot send field of type " + str(type(field)))
+    return "".join(pieces)
+#end of encodeFields function
+
+
+#decodeFields function - to turn a string back into a list of fields
+def decodeFields(data, start=0, end=None):
+    """
+    Usage:
+        For internal use only.
+        Decodes the fields held in data[start:end].
+
+    Returns:
+        List of fields.
+
+    Exceptions:
+        ValueError - If the data is badly formatted.
+    """
+    if end == None:
+        end = len(data)
+    fields = []
+    position = start
+    try:
+        while position < end:
+            (field_type, length) = FIELD_HEADER.unpack_from(data, position)
+            position += FIELD_HEADER.size
+            field_end = position + length
+            if field_end > end:
+                raise ValueError("Field runs past end of frame.")
+            if field_type == STRING_TYPE:
+                fields.append(data[position:field_end])
+            elif field_type == INT_TYPE:
+                if length != INT_FIELD.size:
+                    raise ValueError("Bad int field length.")
+                fields.append(INT_FIELD.unpack_from(data, position)[0])
+            elif field_type == FLOAT_TYPE:
+                if length != FLOAT_FIELD.size:
+                    raise ValueError("Bad float field length.")
+                fields.append(FLOAT_FIELD.unpack_from(data, position)[0])
+            elif field_type == NONE_TYPE:
+                fields.append(None)
+            elif field_type == LIST_TYPE:
+                fields.append(decodeFields(data, position, field_end))
+            else:
+                raise ValueError("Unknown field type.")
+            position = field_end
+    except struct.error:
+        raise ValueError("Badly formatted frame.")
+    return fields
+#end of decodeFields function
+
+###############################################################################
+# End of encoding/decoding
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Sending/receiving frames
+###############################################################################
+
+#sendFrame function - to send a list of fields as one frame
+def sendFrame(sock, fields):
+    """
+    Usage:
+        Sends a message through a socket as one frame.
+
+    Takes in:
+        sock - connected socket to send through.
+        fields - list of fields making up the message.
+
+    Exceptions:
+        socket.error - If sending fails.
+        ValueError - If a field cannot be encoded.
+    """
+    body = encodeFields(fields)
+    sock.sendall(HEADER.pack(len(body)) + body)
+#end of sendFrame function
+
+
+#receiveFrame function - to receive one whole frame from a socket
+def receiveFrame(sock):
+    """
+    Usage:
+        Blocks until a whole frame has been received through the socket.
+
+    Takes in:
+        sock - connected socket to receive from.
+
+    Returns:
+        List of fields making up the message.
+
+    Exceptions:
+        socket.error - If receiving fails or the connection closes.
+        ValueError - If the frame is badly formatted.
+    """
+    (length,) = HEADER.unpack(receiveExactly(sock, HEADER.size))
+    return decodeFields(receiveExactly(sock, length))
+#end of receiveFrame function
+
+
+#receiveExactly function - to receive an exact number of bytes
+def receiveExactly(sock, length):
+    """
+    Usage:
+        For internal use only.
+        Blocks until length bytes have been received through the socket.
+
+    Exceptions:
+        socket.error - If receiving fails or the connection closes first.
+    """
+    pieces = []
+    remaining = length
+    while remaining > 0:
+        data = sock.recv(min(remaining, RECEIVE_SIZE))
+        if data == "":
+            # "" = disconnect/network failure
+            raise socket.error("Connection closed.")
+        pieces.append(data)
+        remaining -= len(data)
+    return "".join(pieces)
+#end of receiveExactly function
+
+###############################################################################
+# End of sending/receiving frames
+###############################################################################
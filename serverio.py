@@ -1,753 +1,2557 @@
-"""
-ServerIO module deals with accepting connections from a client, listening for
-commands/requests from the client, and responding to them.
-
-Usage:
-    Run as main:
-    Command line parameters:
-        first parameter: directory of filespace
-        second parameter: mcast_on to enable multicasting
-    or:
-    Wait for connection using getConnection()
-        - Blocks until recieves connection or encounters error.
-    Listen for/respond to requests using serverLoop()
-        - Blocks until the client disconnects or the connection fails.
-    Force disconnect using disconnect()
-    Do not use functions labelled as "For internal use"
-    No other functions should be called outside of serverLoop()
-        - These are for responding data to client requests, and will likely
-          cause problems on the client side if used incorrectly.
-
-Exceptions:
-    In all functions except getConnection() and serverLoop(), all forseeable
-    exceptions are handled and passed on to the client in the form of a failure
-    message.
-    IOError - may be raised by getConnection() or serverLoop() if a
-    network/connection problem occurs.
-    AttributeError - If serverLoop is started before getConnection() or after
-                     disconnect().
-"""
-__author__ = "Sean O'Kelly <so227@st-andrews.ac.uk>"
-__date__ = "2010-11-13  23:18"
-
-import socket
-import sys
-import threading
-import Queue
-
-import fileviewer
-import multicastsrv
-
-
-
-
-###############################################################################
-# Globals
-###############################################################################
-
-#Constants - same across client and server
-PORT_NUM = 56740 #unique port number based on my unix user id
-TRANSFER_PORT_NUM = 56744 #other group member's port number
-BUFFER_SIZE = 8192 #8kB - enough for anything like directory listing etc.
-TIMEOUT = 30 #30 seconds (client only, included for completeness)
-DIVIDER = "|" #To divide sections of transmissions (e.g. cmd and params)
-LISTDIR_CMD = "LS"
-CHDIR_CMD = "CD"
-GETDIR_CMD = "GETCWD"
-GETINFO_CMD = "INFO"
-MKDIR_CMD = "MKDIR"
-DOWNLOAD_CMD = "DOWN"
-UPLOAD_CMD = "UP"
-GETTEXT_CMD = "GETTEXT"
-CONTINUE_CMD = "CONTINUE"
-CANCEL_CMD = "CANCEL"
-DISCONNECT_CMD = "DISCONNECT"
-FAILURE_MSG = "FAIL" #just kidding
-SUCCESS_MSG = "WIN"
-
-#Variables
-client_socket = None
-multicaster = None
-
-###############################################################################
-# End of globals
-###############################################################################
-
-
-
-
-
-###############################################################################
-# Functions to get/end the connection
-###############################################################################
-
-#getConnection function: waits for connection from a client
-def getConnection():
-    """
-    Usage:
-        Use to initialise the connection to the client before attempting to use
-        this module. This function will block until it recieves a connection or
-        an error occurs.
-
-    Exceptions:
-        IOError - If the function fails to connect or fails to bind the socket.
-    """
-    try:
-        print "Listening for connection..."
-        #AF_INET and SOCK_STREAM - constants defining type of socket
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        #Set up socket so that the address can be reused:
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        #next: bind server_socket to PORT_NUM on current machine
-        server_socket.bind((socket.gethostname(), PORT_NUM))
-        #Allow only first connection
-        server_socket.listen(1)
-        global client_socket
-        (client_socket, address) = server_socket.accept()
-        print "Connected"
-    except socket.error as e:
-        print "Connection failed"
-        print e
-        raise IOError("Connection failed")
-    finally:
-        #Tidy up by closing unused socket
-        server_socket.close()
-#end of getConnection function
-
-
-#disconnect function: used to force disconnect
-def disconnect():
-    """
-    Usage:
-        Mainly for internal use in some exceptional circumstances, and to tidy
-        up at the end.
-        Use to force the server to disconnect. Normally, the server will wait
-        until the client disconnects. The client does not expect the server to
-        disconnect, and does not listen for disconnect commands, so this should
-        only be used to force a disconnect.
-    """
-    global client_socket
-    if client_socket != None:
-        client_socket.close()
-        #Remove reference to old socket object.
-        client_socket = None
-        print "Disconnected"
-#end of disconnect function
-
-###############################################################################
-# End of connection functions
-###############################################################################
-
-
-
-
-
-###############################################################################
-# serverLoop
-###############################################################################
-
-#serverLoop function: awaits commands/requests from the client
-def serverLoop():
-    """
-    Usage:
-        Accepts commands, in a loop, from the client and responds to them.
-        Once a connection has been established, this may be used to listen for
-        and respond to requests from the client.
-        serverLoop() will block until the connection fails or is closed by the
-        client.
-
-    Exceptions:
-        AttributeError - If the function is called before the socket is
-                         connected, or after it has disconnected.
-    """
-    if client_socket == None:
-        raise AttributeError("Socket not initialised")
-    
-    print "Listening for messages..."
-    while True: #Keep listening for messages until disconnect
-        
-        print "\n"
-        
-        try:
-            message = client_socket.recv(BUFFER_SIZE)
-            if message == "":
-                # "" = client disconnect/network failure
-                raise socket.error
-        except socket.error:
-            print "Error getting request, breaking from loop."
-            # if socket.error is raised, the connection is probably dead
-            break
-        
-        
-        print "Recieved: " + message
-        # message = "COMMAND|params"
-        request_and_params = message.split(DIVIDER)
-        request = request_and_params[0]
-        #The string to send back to the client:
-        response = ""
-        
-        
-        #Change directory
-        if request == CHDIR_CMD and len(request_and_params) >= 2:
-            print "Changing directory..."
-            path = request_and_params[1]
-            response = chDir(path)
-        
-        #List directory
-        elif request == LISTDIR_CMD:
-            print "Listing directory..."
-            response = listDir()
-        
-        #Get current directory
-        elif request == GETDIR_CMD:
-            print "Returning current working directory..."
-            response = getCWD()
-        
-        #Get file properties
-        elif request == GETINFO_CMD and len(request_and_params) >= 2:
-            print "Returning file info..."
-            filename = request_and_params[1]
-            response = getFileProperties(filename)
-        
-        #Create a directory
-        elif request == MKDIR_CMD and len(request_and_params) >= 2:
-            print "Creating directory..."
-            dir_name = request_and_params[1]
-            response = makeDir(dir_name)
-        
-        #Transfer text contents of file
-        elif request == GETTEXT_CMD and len(request_and_params) >= 2:
-            print "Sending text data to client..."
-            filename = request_and_params[1]
-            sendTextContents(filename)
-            #All communication handled inside function, skip reply.
-            continue
-        
-        #Send file to client
-        elif request == DOWNLOAD_CMD and len(request_and_params) >= 2:
-            print "Sending file to user..."
-            filename = request_and_params[1]
-            transfer = FileTransfer(filename, receiving=False)
-            #Don't send a response, all communication has been handled within
-            #sendFile function.
-            continue
-        
-        #Receive file from client
-        elif request == UPLOAD_CMD and len(request_and_params) >= 3:
-            print "Getting file from user..."
-            filename = request_and_params[1]
-            filesize = request_and_params[2]
-            transfer = FileTransfer(filename, receiving=True,
-                                    filesize_string=filesize)
-            #Don't send a response, all communication has been handled within
-            #sendFile method.
-            continue
-        
-        #Disconnect command
-        elif request == DISCONNECT_CMD:
-            #break from listening for commands
-            break
-        
-        #Request not recognised
-        else:
-            #Notify client of failure.
-            response = FAILURE_MSG + DIVIDER + "Did not recognise command."
-        
-        #replying...
-        print "Replying:"
-        print response
-        try:
-            client_socket.send(response)
-        except socket.error:
-            print "Error sending response, breaking from loop."
-            # if socket.error is raised, the connection is probably dead
-            break
-        
-        print "\n"
-    
-    #disconnect - to tidy up afterwards
-    disconnect()
-#end of serverLoop function
-    
-###############################################################################
-# End of serverLoop
-###############################################################################
-
-
-
-
-
-###############################################################################
-# Internally used functions to respond to client requests
-###############################################################################
-
-#chDir function - changes directory, is called by client
-def chDir(path):
-    """
-    Usage:
-        For internal use only.
-        Should only be used to respond to client request. i.e. in serverLoop()
-        Changes directory to specified path.
-    
-    Takes in:
-        path - path which client has requested to change to.
-    
-    Returns:
-        - SUCCESS_MSG if the operation is carried out succesfully.
-        - FAILURE_MSG (with parameters) if operation fails.
-    """
-    try:
-        fileviewer.executeCommands(path)
-        response = SUCCESS_MSG
-    except fileviewer.NavigationException as e:
-        response = FAILURE_MSG + DIVIDER + str(e)
-    except (OSError, fileviewer.CommandException):
-        response = FAILURE_MSG + "|Invalid directory change."
-    return response
-#end of chDir function
-
-
-#makeDir function - to create a directory at the client's request
-def makeDir(path):
-    """
-    Usage:
-        For internal use only.
-        Should only be used to respond to client request. i.e. in serverLoop()
-        Creates a new directory within the current directory.
-    
-    Takes in:
-        path - path of new directory.
-    
-    Returns:
-        - SUCCESS_MSG if the operation is carried out succesfully.
-        - FAILURE_MSG (with parameters) if operation fails.
-    """
-    try:
-        fileviewer.createDir(path)
-        response = SUCCESS_MSG
-    except OSError:
-        response = FAILURE_MSG + "|Invalid directory"
-    return response
-#end of makeDir function
-
-
-#listDir function - returns string of files/folders in directory
-def listDir():
-    """
-    Usage:
-        For internal use only.
-        Should only be used to respond to client request. i.e. in serverLoop()
-        Should be called if user requests the directory list.
-        Should never fail under normal circumstances.
-    
-    Returns:
-        - String of directory listing in the form: "|file1|size1\\nfile2|size2"
-          etc. (Generates this from a list of tuples).
-        - FAILURE_MSG with parameter if it could not list the directory for
-          some reason.
-    """
-    try:
-        dir_list = fileviewer.executeCommands(".")
-        #dir_list = [("filename1", size1), ("filename2", size2)] etc.
-    except (OSError, fileviewer.CommandException):
-        response = FAILURE_MSG + "|Failed to retrieve data."
-        return response
-    
-    response = "|"
-    for (name, size) in dir_list:
-        #separate tuple elems with "|", list elems with "\n"
-        response += name + "|" + str(size) + "\n"
-    return response
-#end of listDir function
-
-
-#getCWD function - returns path to current working directory
-def getCWD():
-    """
-    Usage:
-        For internal use only.
-        Should only be used to respond to client request. i.e. in serverLoop()
-        Should be called if user requests the path to the current directory.
-        Should never fail under normal circumstances.
-
-    Returns:
-        - String of the path to the current directory
-        - FAILURE_MSG with parameter if it could not get the current directory
-          for some reason.
-    """
-    try:
-        response = fileviewer.getPwd()
-    except OSError:
-        response = FAILURE_MSG + "|Failed to retrieve path."
-    return response
-#end of listDir function
-
-
-#getFileProperties function - returns properties of a file
-def getFileProperties(filename):
-    """
-    Usage:
-        For internal use only.
-        Should only be used to respond to client request. i.e. in serverLoop()
-        Should be called if user requests details on a file.
-
-    Takes in:
-        filename - File name for file which the client has requested details
-
-    Returns:
-        - String of file properties in the form "data1|data2|data3|data4"
-        - FAILURE_MSG with parameter if the file cannot be accessed
-    """
-    try:
-        (path, size, last_access, last_mod) = \
-                fileviewer.executeCommands(filename)
-        response = path + "|" + str(size) + "|" + str(last_access) + "|" \
-                + str(last_mod)
-    except (OSError, fileviewer.CommandException):
-        response = FAILURE_MSG + "|Could not access file."
-    return response
-#end of getFileProperties function
-
-###############################################################################
-# End of internal functions for client requests
-###############################################################################
-
-
-
-
-###############################################################################
-# Code for file transfer (FileTransfer class)
-###############################################################################
-
-#FileTransfer class - allows concurrent, queued (one at a time) file transfer
-class FileTransfer(threading.Thread):
-    """
-    Usage:
-        For internal use only (in response to client download/upload request)
-        File transfers run concurrently and on a different, so this will not
-        block or disrupt the request/response loop.
-        This should not be created (or any functions called) outside of
-        serveLoop().
-    """
-    
-    #Constructor
-    def __init__(self, filename, receiving=False, filesize_string=None):
-        """
-        Constructor
-
-        Usage:
-            For internal use only.
-            For an upload:
-                my_transfer = Transfer(filename_to_save_as,
-                                       receiving=True,
-                                       filesize_string=string_of_filesize)
-            For a download:
-                my_transfer = Transfer(filename_of_file_to_download,
-                                       file_object_to_write_to)
-        
-        Takes in:
-            filename - If this transfer is an upload, the filename is the name
-                       to save the uploaded file to on the server.
-                       If this is a download, it is the name of the file to
-                       download from server.
-            download - Boolean for whether we are sending or receiving a file.
-                       should be True if this is an upload from the client,
-                       False (default) for a download to the client.
-            filesize_string - If this is an upload from client to server, this
-                              is required, and must be a string (from the
-                              client) of the exact size of the file in bytes.
-                              If this is a download, this is not required and
-                              will be ignored.
-        """
-        threading.Thread.__init__(self)
-        
-        self.receiving = receiving
-        self.filename = filename
-        self.file_object = None
-        
-        self.file_size = filesize_string
-        self.bytes_transferred = 0
-
-        self.has_failed = False
-        
-        try:
-            print "Communicating with client..."
-            if receiving:
-                self.initialiseReceipt()
-            else:
-                self.initialiseSend()
-            print "Communication succesful."
-        except (ValueError, OSError, IOError):
-            #There has been some kind of error, initialise methods will have
-            #attempted to notify client of this. Unless the connection is dead,
-            #we can resume normal operation.
-            print "Communication unsuccesful"
-            return
-        
-        #If there is not already a transfer in progress...
-        if not FileTransfer.transfer_in_progress:
-            #start the transfer
-            print "There are no transfers in progress"
-            print "Starting transfer"
-            FileTransfer.transfer_in_progress = True
-            self.start()
-        else:
-            print "There is a transfer already in progress"
-            print "Adding transfer to queue"
-            #There is a transfer in progress already, so add to the queue...
-            FileTransfer.transfer_queue.put(self)
-            print "Queue length: " + str(FileTransfer.transfer_queue.qsize())
-    #End of Constructor
-    
-    
-    #initialiseSend method - to initialise this to send a file to the client
-    def initialiseSend(self):
-        """
-        Usage:
-            For internal use only, and only if this object is a download.
-        
-        Exceptions:
-            OSError - If the file cannot be accessed
-            IOError - If network communication fails
-        """
-        try:
-            #Access the file to send.
-            (self.file_object, self.file_size) = \
-                    fileviewer.getFile(self.filename)
-        except OSError as e:
-            #Try to send a failure message to the client.
-            message = FAILURE_MSG + "|" + str(e)
-            client_socket.send(message)
-            raise
-                
-        try:
-            #Send file size to client - client will be expecting this.
-            client_socket.send(str(self.file_size))
-            #Client will respond with SUCCESS_MSG or CANCEL_CMD
-            message = client_socket.recv(BUFFER_SIZE)
-        except socket.error:
-            #closing unnecessary file:
-            self.file_object.close()
-            raise IOError("Network IO failed")
-        
-        #Check if the client has succesfully initialised
-        if message != SUCCESS_MSG:
-            raise IOError
-    #End of initialiseSend method
-    
-    
-    
-    #initialiseReceipt method - to initialise for receiving from the client
-    def initialiseReceipt(self):
-        """
-        Usage:
-            For internal use only, and only if this object is an upload.
-        
-        Exceptions:
-            OSError - If the file cannot be accessed
-            ValueError - If the data from the client is bad
-            IOError - If network communication fails
-        """
-        try:
-            self.file_size = int(self.file_size)
-            self.file_object = fileviewer.createFile(self.filename)
-        except (ValueError, OSError) as e:
-            try:
-                #Try to send a failure message to the client.
-                message = FAILURE_MSG + "|" + str(e)
-                client_socket.send(message)
-                raise
-            except socket.error:
-                #If there is a connection problem at the same time
-                raise IOError("Network IO failed.")
-        try:
-            #Client is waiting for continue command
-            client_socket.send(SUCCESS_MSG)
-        except socket.error:
-            #IO with client has failed, connection is probably dead.
-            #closing unnecessary file:
-            self.file_object.close()
-            raise IOError("Network IO failed.")
-    #End of initialiseReceipt method
-    
-    
-    #transfer method - to carry out data transfer/file operations
-    def transfer(self):
-        """
-        Usage:
-            For internal use only.
-            Used to perform the actual transfer/read/write of data.
-        
-        Exceptions:
-            IOError - If network communication fails
-        """
-        try:
-            #Loop until all data is transferred.
-            while self.bytes_transferred < self.file_size:
-                #if it's an upload, receive data.
-                if self.receiving:
-                    #receive data through socket.
-                    data = self.transfer_socket.recv(BUFFER_SIZE)
-                    #if data == "", the transfer has failed.
-                    if data == "" or data == None:
-                        raise socket.error
-                    self.bytes_transferred += len(data)
-                    #write binary data to file
-                    self.file_object.write(data)
-                    self.file_object.flush()
-                #if it's a download, send data.
-                else:
-                    #read data from file, and send it through the socket
-                    data = self.file_object.read(BUFFER_SIZE)
-                    self.transfer_socket.send(data)
-                    self.bytes_transferred += len(data)
-        except (socket.error, socket.timeout):
-            raise IOError("Transfer failed.")
-    #End of transfer method
-    
-    
-    #run method - required by Thread - code here is concurrently executed
-    def run(self):
-        """
-        Usage:
-            For internal use only.
-            Required by thread class, code here is executed concurrently.
-            This performs initialisation of the connection used for file
-            transfer, and will automatically start the next transfer in the
-            queue upon completion.
-        """
-        try:
-            #Create a server socket to accept a connection
-            self.listen_socket = socket.socket(socket.AF_INET,
-                                               socket.SOCK_STREAM)
-            #Set up socket so that the address can be reused:
-            self.listen_socket.setsockopt(socket.SOL_SOCKET,
-                                          socket.SO_REUSEADDR, 1)
-            self.listen_socket.bind((socket.gethostname(), TRANSFER_PORT_NUM))
-            self.listen_socket.listen(1)
-            #transfer_socket is only used for file transfer.
-            (self.transfer_socket, addr) = self.listen_socket.accept()
-            self.listen_socket.close()
-            #begin data transfer
-            self.transfer()
-            self.transfer_socket.close()
-            self.file_object.close()
-        except IOError:
-            #some error has occured in file transfer, stop this transfer and
-            #move on.
-            self.has_failed = True
-        finally:
-            try:
-                #Get the next transfer in the queue
-                next_transfer = FileTransfer.transfer_queue.get_nowait()
-            except Queue.Empty:
-                #queue is empty, so there are no more transfers for now.
-                FileTransfer.transfer_in_progress = False
-            else:
-                #start the next transfer.
-                next_transfer.start()
-            finally:
-                if self.receiving:
-                    message_str = "Upload "
-                else:
-                    message_str = "Download "
-                if self.has_failed:
-                    message_str += "failed: "
-                else:
-                    message_str += "complete: "
-                message_str += self.filename
-                print message_str
-    #End of run method
-    
-#End of FileTransfer class
-
-
-#Static fields for FileTransfer class
-FileTransfer.transfer_queue = Queue.Queue()
-FileTransfer.transfer_in_progress = False
-
-
-#getTextContents function - returns text contents of a file
-def sendTextContents(filename):
-    """
-    Usage:
-        For internal use only.
-        Should only be used to respond to client request. i.e. in serverLoop()
-        Should be called if user requests text contents of a file.
-        All communication of data is handled in this function.
-    
-    Takes in:
-        filename - File name for file which the client has requested details
-    """
-    try:
-        try:
-            print "Getting file contents..."
-            file_text = fileviewer.getFileContents(filename)
-        except OSError as e:
-            print "Failed, notifying client..."
-            client_socket.send(FAILURE_MSG + DIVIDER + str(e))
-            return
-        else:
-            print "Sending filesize..."
-            filesize = len(file_text)
-            client_socket.send(str(filesize))
-            reply = client_socket.recv(BUFFER_SIZE)
-            if reply != CONTINUE_CMD:
-                return
-            data_sent = 0
-            while data_sent < filesize:
-                lower = data_sent
-                upper = data_sent + BUFFER_SIZE
-                if upper > filesize:
-                    upper = filesize
-                data = file_text[lower:upper]
-                client_socket.send(data)
-                data_sent += len(data)
-                print "Sent " + str(data_sent) + " of " + str(filesize) + \
-                      " bytes."
-    except socket.error:
-        print "Socket error."
-        return
-#End of getTextContents function
-
-###############################################################################
-# End of file transfer code
-###############################################################################
-
-
-
-
-###############################################################################
-# Main
-###############################################################################
-
-def main():
-    multicaster = multicastsrv.MulticastThread()
-    try:
-        custom_root = ""
-        if len(sys.argv) >= 2:
-            custom_root = sys.argv[1]
-            print "Setting root to command line parameter: " + custom_root
-        else:
-            print "Using default root."
-        print "Starting multicaster..."
-        multicaster.start()
-        while True:
-            if custom_root != "":
-                fileviewer.setRoot(custom_root)
-            getConnection()
-            print "Stopping multicaster."
-            serverLoop()
-            print "Resetting..."
-            reload(fileviewer)
-    except KeyboardInterrupt:
-        print "\nExiting..."
-    finally:
-        multicaster.stop()
-
-if __name__ == "__main__":
-    main()
-
-###############################################################################
-# End of main
-###############################################################################
+"""
+ServerIO module deals with accepting connections from a client, listening for
+commands/requests from the client, and responding to them.
+
+Usage:
+    Run as main:
+    Command line parameters:
+        first parameter: directory of filespace
+        second parameter: optional cap on the data rate of all transfers
+                          together, in bytes per second (0 for no cap)
+        third parameter: optional number of transfers which may run at once
+                         (MAX_TRANSFERS by default)
+        fourth parameter: optional number of one client's transfers which
+                          may run at once (MAX_SESSION_TRANSFERS by default)
+    or:
+    Create a listening socket using listen()
+    Wait for each connection using getConnection()
+        - Blocks until recieves connection or encounters error.
+        - Returns a Session holding the client's socket and its own filespace.
+    Serve sessions using a SessionPool, or directly using serverLoop(session)
+        - serverLoop blocks until the client disconnects or the connection
+          fails.
+    Force disconnect using disconnect(session)
+    Do not use functions labelled as "For internal use"
+    No other functions should be called outside of serverLoop()
+        - These are for responding data to client requests, and will likely
+          cause problems on the client side if used incorrectly.
+
+Exceptions:
+    In all functions except listen(), getConnection() and serverLoop(), all
+    forseeable exceptions are handled and passed on to the client in the form
+    of a failure message.
+    IOError - may be raised by listen(), getConnection() or serverLoop() if a
+    network/connection problem occurs.
+    AttributeError - If serverLoop is started after disconnect().
+"""
+__author__ = "Sean O'Kelly <so227@st-andrews.ac.uk>"
+__date__ = "2010-11-13  23:18"
+
+import hashlib
+import os
+import socket
+import sys
+import threading
+import Queue
+import zlib
+
+try:
+    #sendfile has the kernel copy file data straight to the socket, rather
+    #than passing every byte through python
+    from sendfile import sendfile
+except ImportError:
+    sendfile = None
+
+import compression
+import contentsearch
+import delta
+import fileviewer
+import hashindex
+import metaindex
+import multicastsrv
+import protocol
+import transferengine
+import transfertuner
+import treestream
+
+
+
+
+###############################################################################
+# Globals
+###############################################################################
+
+#Constants - same across client and server
+PORT_NUM = 56740 #unique port number based on my unix user id
+TIMEOUT = 30 #30 seconds
+LISTDIR_CMD = "LS"
+LISTPAGES_CMD = "LSPAGES"
+CHDIR_CMD = "CD"
+GETDIR_CMD = "GETCWD"
+GETINFO_CMD = "INFO"
+SNAPSHOT_CMD = "SNAPSHOT"
+MKDIR_CMD = "MKDIR"
+DOWNLOAD_CMD = "DOWN"
+UPLOAD_CMD = "UP"
+DOWNTREE_CMD = "DOWNTREE"
+UPTREE_CMD = "UPTREE"
+GETTEXT_CMD = "GETTEXT"
+TEXTRANGE_CMD = "TEXTRANGE"
+READRANGE_CMD = "READRANGE"
+CANCEL_CMD = "CANCEL"
+PAUSE_CMD = "PAUSE"
+RATELIMIT_CMD = "RATELIMIT"
+PRIORITY_CMD = "PRIORITY"
+SEARCH_CMD = "SEARCH"
+FIND_CMD = "FIND"
+DATA_MSG = "DATA"
+WINDOW_MSG = "WINDOW"
+COPY_MSG = "COPY"
+SIGNATURES_MSG = "SIGS"
+DISCONNECT_CMD = "DISCONNECT"
+FAILURE_MSG = "FAIL" #just kidding
+SUCCESS_MSG = "WIN"
+NOT_MODIFIED_MSG = "NOTMODIFIED" #listing is the same as the client already has
+SERVER_SCOPE = "server" #rate limit scopes - all transfers on the server,
+SESSION_SCOPE = "session" #  the client's transfers,
+TRANSFER_SCOPE = "transfer" #  or one transfer
+LARGEST = metaindex.LARGEST #orders of found files - largest first,
+NEWEST = metaindex.NEWEST #  or most recently modified first
+
+MAX_SESSIONS = 16 #Number of clients which may be served at the same time
+LISTEN_BACKLOG = 32 #Connections waiting to be accepted before refusing more
+MAX_PAGE_SIZE = 4096 #Most directory entries sent in one page of a listing
+MAX_SEARCH_HITS = 10000 #Most matching lines sent back for one search
+MAX_SEARCH_TIME = 120 #Most seconds one search may run for
+SEARCH_PAGE_SIZE = 256 #Most matching lines sent in one page of a search
+MAX_FIND_RESULTS = 10000 #Most files sent back for one find
+
+MAX_TRANSFERS = 16 #Number of file transfers which may run at once
+MAX_SESSION_TRANSFERS = 4 #Number of one client's transfers which may run at
+                          #once, so one client can't hold up the rest
+SENDFILE_SIZE = 1048576 #1MB - most data for sendfile to send at once
+RECEIVE_BUFFER_SIZE = 262144 #256kB - data received before writing to file
+STREAM_WINDOW = 262144 #256kB - data sent on a stream before waiting for more
+                       #window from the receiver
+STREAM_CHUNK_SIZE = 32768 #32kB - most data sent in one message on a stream
+COPY_COST = 16 #window used up by a delta copy message
+DELTA_MIN_SIZE = 262144 #256kB - smaller files are sent whole rather than
+                        #as a delta, as it would not save much
+SIGNATURES_PER_MSG = 1024 #delta signatures sent in one message
+
+#Variables
+hash_index = hashindex.HashIndex() #files on the server, by their contents
+meta_index = None #files on the server, by name, size and age, if available
+multicaster = None
+transfer_engine = transferengine.TransferEngine(
+        MAX_TRANSFERS, max_per_group=MAX_SESSION_TRANSFERS)
+
+###############################################################################
+# End of globals
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Session state and pool
+###############################################################################
+
+#Session class - holds the state of a single connected client
+class Session(object):
+    """
+    Usage:
+        Created by getConnection() for each client that connects.
+        Holds the client's socket and address along with its own filespace, so
+        that each client has its own root and current directory, and clients
+        served at the same time do not interfere with each other.
+    """
+
+    #Constructor
+    def __init__(self, client_socket, address, root=None):
+        """
+        Takes in:
+            client_socket - connected socket for communication with the client.
+            address - address of the client, as returned by accept().
+            root - directory of the filespace for this client, the directory
+                   the server is running in by default.
+        """
+        self.client_socket = client_socket
+        self.address = address
+        self.filespace = fileviewer.Filespace(root)
+        #Only one thread may send a message at once
+        self.send_lock = threading.Lock()
+        #request ID -> Queue of the client's messages for that stream
+        self.streams = {}
+        self.streams_lock = threading.Lock()
+        #Cap on the data rate of all of the client's transfers together
+        self.rate_limit = transferengine.TokenBucket()
+        #request ID -> FileTransfer, for transfers not yet finished
+        self.transfers = {}
+        self.transfers_lock = threading.Lock()
+    #End of Constructor
+
+
+    #send method - to send a message to the client
+    def send(self, request_id, fields):
+        """
+        Usage:
+            Sends a list of fields to the client as one frame, tagged with the
+            ID of the request it replies to, so the client can match it up.
+            Safe to call from any thread.
+
+        Exceptions:
+            socket.error - If sending fails.
+        """
+        with self.send_lock:
+            protocol.sendFrame(self.client_socket, [request_id] + fields)
+    #End of send method
+
+
+    #receive method - to wait for a message from the client
+    def receive(self):
+        """
+        Usage:
+            Blocks until a whole message has been received from the client.
+            Only serverLoop() should receive messages.
+
+        Returns:
+            The message, as a list of fields.
+
+        Exceptions:
+            socket.error - If receiving fails or the client disconnects.
+            ValueError - If the client sends a badly formatted message.
+        """
+        return protocol.receiveFrame(self.client_socket)
+    #End of receive method
+
+
+    #openStream method - to receive the client's messages for a stream
+    def openStream(self, request_id):
+        """
+        Usage:
+            Registers a stream - data or window messages from the client
+            tagged with request_id are passed to it instead of being treated
+            as requests. Must be called before the client is told the stream
+            has started, and closeStream() called once it has finished.
+
+        Returns:
+            A Queue which will receive the client's messages for the stream,
+            each as a list of fields starting with the message type.
+        """
+        messages = Queue.Queue()
+        with self.streams_lock:
+            self.streams[request_id] = messages
+        return messages
+    #End of openStream method
+
+
+    #closeStream method - to stop receiving messages for a stream
+    def closeStream(self, request_id):
+        with self.streams_lock:
+            self.streams.pop(request_id, None)
+    #End of closeStream method
+
+
+    #routeMessage method - to pass a client's message on to its stream
+    def routeMessage(self, request_id, message):
+        """
+        Usage:
+            For internal use only, by serverLoop().
+            Messages for streams which have finished are ignored.
+        """
+        with self.streams_lock:
+            messages = self.streams.get(request_id)
+        if messages != None:
+            messages.put(message)
+    #End of routeMessage method
+
+
+    #addTransfer method - to keep track of a transfer for the client
+    def addTransfer(self, transfer):
+        with self.transfers_lock:
+            self.transfers[transfer.request_id] = transfer
+    #End of addTransfer method
+
+
+    #removeTransfer method - to stop keeping track of a finished transfer
+    def removeTransfer(self, transfer):
+        with self.transfers_lock:
+            if self.transfers.get(transfer.request_id) is transfer:
+                del self.transfers[transfer.request_id]
+    #End of removeTransfer method
+
+
+    #getTransfer method - to find a transfer by the ID of its request
+    def getTransfer(self, request_id):
+        """
+        Returns:
+            The FileTransfer, or None if there is none which is not finished.
+        """
+        with self.transfers_lock:
+            return self.transfers.get(request_id)
+    #End of getTransfer method
+
+#End of Session class
+
+
+#SessionPool class - a bounded pool of threads which serve sessions
+class SessionPool(object):
+    """
+    Usage:
+        pool = SessionPool(number_of_workers)
+        pool.addSession(session)
+        Each worker thread runs serverLoop() for one session at a time. Once
+        all workers are busy, new sessions wait in a queue until a worker
+        becomes free, so at most number_of_workers clients are served at once.
+    """
+
+    #Constructor
+    def __init__(self, workers=MAX_SESSIONS):
+        """
+        Takes in:
+            workers - Number of sessions which can be served at the same time.
+        """
+        self.session_queue = Queue.Queue()
+        self.workers = []
+        for i in xrange(workers):
+            worker = threading.Thread(target=self.work)
+            #Don't keep the server running just for idle workers.
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+    #End of Constructor
+
+
+    #addSession method - to queue a session to be served
+    def addSession(self, session):
+        """
+        Usage:
+            Adds a session to be served by the next free worker.
+        """
+        self.session_queue.put(session)
+        print "Sessions waiting for a worker: " + \
+              str(self.session_queue.qsize())
+    #End of addSession method
+
+
+    #work method - run by each worker thread
+    def work(self):
+        """
+        Usage:
+            For internal use only.
+            Serves sessions from the queue, one after another, forever.
+        """
+        while True:
+            session = self.session_queue.get()
+            try:
+                serverLoop(session)
+            except Exception as e:
+                #A failure serving one client must not kill the worker.
+                print "Session with " + str(session.address) + " failed: " + \
+                      str(e)
+                disconnect(session)
+    #End of work method
+
+#End of SessionPool class
+
+###############################################################################
+# End of session state and pool
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Functions to get/end the connection
+###############################################################################
+
+#listen function: creates the socket that clients connect to
+def listen():
+    """
+    Usage:
+        Use to create the listening socket before waiting for connections with
+        getConnection().
+
+    Returns:
+        The listening server socket.
+
+    Exceptions:
+        IOError - If the function fails to bind the socket.
+    """
+    try:
+        #AF_INET and SOCK_STREAM - constants defining type of socket
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        #Set up socket so that the address can be reused:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        #next: bind server_socket to PORT_NUM on current machine
+        server_socket.bind((socket.gethostname(), PORT_NUM))
+        #Allow many clients to be waiting for a connection at once
+        server_socket.listen(LISTEN_BACKLOG)
+    except socket.error as e:
+        print "Failed to listen for connections"
+        print e
+        raise IOError("Failed to listen for connections")
+    return server_socket
+#end of listen function
+
+
+#getConnection function: waits for connection from a client
+def getConnection(server_socket, root=None):
+    """
+    Usage:
+        Use to get the next connection from a client. This function will block
+        until it recieves a connection or an error occurs.
+
+    Takes in:
+        server_socket - listening socket, created using listen().
+        root - directory of the filespace for the new session.
+
+    Returns:
+        A Session for the connected client.
+
+    Exceptions:
+        IOError - If the function fails to connect.
+    """
+    try:
+        print "Listening for connection..."
+        (client_socket, address) = server_socket.accept()
+        transfertuner.tuneControlSocket(client_socket)
+        print "Connected to " + str(address)
+    except socket.error as e:
+        print "Connection failed"
+        print e
+        raise IOError("Connection failed")
+    return Session(client_socket, address, root)
+#end of getConnection function
+
+
+#disconnect function: used to force disconnect
+def disconnect(session):
+    """
+    Usage:
+        Mainly for internal use in some exceptional circumstances, and to tidy
+        up at the end.
+        Use to force the server to disconnect. Normally, the server will wait
+        until the client disconnects. The client does not expect the server to
+        disconnect, and does not listen for disconnect commands, so this should
+        only be used to force a disconnect.
+    """
+    if session.client_socket != None:
+        session.client_socket.close()
+        #Remove reference to old socket object.
+        session.client_socket = None
+        print "Disconnected from " + str(session.address)
+#end of disconnect function
+
+###############################################################################
+# End of connection functions
+###############################################################################
+
+
+
+
+
+###############################################################################
+# serverLoop
+###############################################################################
+
+#serverLoop function: awaits commands/requests from the client
+def serverLoop(session):
+    """
+    Usage:
+        Accepts commands, in a loop, from the client and responds to them.
+        Once a connection has been established, this may be used to listen for
+        and respond to requests from the client.
+        serverLoop() will block until the connection fails or is closed by the
+        client.
+
+    Takes in:
+        session - Session of the client to serve, from getConnection().
+
+    Exceptions:
+        AttributeError - If the function is called after the session has
+                         disconnected.
+    """
+    if session.client_socket == None:
+        raise AttributeError("Socket not initialised")
+    
+    print "Listening for messages..."
+    while True: #Keep listening for messages until disconnect
+        
+        print "\n"
+        
+        try:
+            # message = [request_id, COMMAND, params...]
+            message = session.receive()
+            (request_id, request) = message[0:2]
+            params = message[2:]
+        except (socket.error, ValueError):
+            print "Error getting request, breaking from loop."
+            # if socket.error is raised, the connection is probably dead
+            # if the request is badly formatted, the rest of the stream can't
+            # be trusted either
+            break
+        
+        #Data, window and cancel messages belong to a stream in progress,
+        #rather than being new requests
+        if request in (DATA_MSG, COPY_MSG, WINDOW_MSG, CANCEL_CMD):
+            session.routeMessage(request_id, [request] + params)
+            if request == CANCEL_CMD:
+                #Transfers over their own connection may be waiting for it
+                transfer = session.getTransfer(request_id)
+                if transfer != None:
+                    transfer.cancel()
+            continue
+        
+        #Pausing and unpausing act on a transfer, and are not replied to
+        #  [request_id_of_transfer, PAUSE, paused]
+        if request == PAUSE_CMD:
+            transfer = session.getTransfer(request_id)
+            if transfer != None:
+                transfer.setPaused(len(params) < 1 or bool(params[0]))
+            continue
+        
+        print "Recieved: " + str(request_id) + " " + str(request)
+        #The list of fields to send back to the client:
+        response = []
+        
+        
+        #Change directory
+        if request == CHDIR_CMD and len(params) >= 1:
+            print "Changing directory..."
+            path = params[0]
+            response = chDir(session, path)
+        
+        #List directory
+        elif request == LISTDIR_CMD:
+            print "Listing directory..."
+            #Optional parameter - validator of the listing the client has
+            validator = None
+            if len(params) >= 1:
+                validator = params[0]
+            response = listDir(session, validator)
+            logListingCache()
+        
+        #List directory a page at a time
+        elif request == LISTPAGES_CMD and len(params) >= 2:
+            print "Streaming directory listing..."
+            (cursor, page_size) = params[0:2]
+            #Optional parameter - validator of the listing the client has
+            validator = None
+            if len(params) >= 3:
+                validator = params[2]
+            streamDirPages(session, request_id, cursor, page_size, validator)
+            logListingCache()
+            #Pages are sent in the background, skip reply.
+            continue
+        
+        #Search the contents of the files under the current directory
+        elif request == SEARCH_CMD and len(params) >= 1:
+            print "Searching files..."
+            streamSearch(session, request_id, params)
+            #Hits are sent in the background, skip reply.
+            continue
+        
+        #Find files under the current directory, using the index
+        elif request == FIND_CMD:
+            print "Finding files..."
+            response = findFiles(session, params)
+        
+        #Get current directory
+        elif request == GETDIR_CMD:
+            print "Returning current working directory..."
+            response = getCWD(session)
+        
+        #Get current directory, its listing and status of each entry
+        elif request == SNAPSHOT_CMD:
+            print "Returning directory snapshot..."
+            response = getSnapshot(session)
+            logListingCache()
+        
+        #Get file properties
+        elif request == GETINFO_CMD and len(params) >= 1:
+            print "Returning file info..."
+            filename = params[0]
+            response = getFileProperties(session, filename)
+        
+        #Create a directory
+        elif request == MKDIR_CMD and len(params) >= 1:
+            print "Creating directory..."
+            dir_name = params[0]
+            response = makeDir(session, dir_name)
+        
+        #Change a cap on the data rate of transfers
+        elif request == RATELIMIT_CMD and len(params) >= 2:
+            print "Setting rate limit..."
+            response = setRateLimit(session, params)
+        
+        #Change the priority of a queued transfer
+        elif request == PRIORITY_CMD and len(params) >= 2:
+            print "Setting transfer priority..."
+            response = setPriority(session, params)
+        
+        #Transfer text contents of file
+        elif request == GETTEXT_CMD and len(params) >= 1:
+            print "Sending text data to client..."
+            filename = params[0]
+            #Optional parameter - client can take compressed text
+            compress = len(params) >= 2 and bool(params[1])
+            sendTextContents(session, request_id, filename, compress)
+            #All communication handled inside function, skip reply.
+            continue
+        
+        #Transfer part of the text contents of file, or any range of bytes
+        #of a file - the data is sent as it is in the file either way
+        elif request in (TEXTRANGE_CMD, READRANGE_CMD) and len(params) >= 3:
+            print "Sending part of file to client..."
+            filename = params[0]
+            offset = params[1]
+            length = params[2]
+            #Optional parameter - client can take compressed text
+            compress = len(params) >= 4 and bool(params[3])
+            sendTextContents(session, request_id, filename, compress, offset,
+                             length)
+            #All communication handled inside function, skip reply.
+            continue
+        
+        #Send file to client
+        elif request == DOWNLOAD_CMD and len(params) >= 1:
+            print "Sending file to user..."
+            filename = params[0]
+            #Optional parameter - send over this connection, not a new one
+            multiplexed = len(params) >= 2 and bool(params[1])
+            #Optional parameter - bytes the client already has, to resume
+            offset = 0
+            if len(params) >= 3:
+                offset = params[2]
+            #Optional parameter - only send this many bytes from the offset
+            length = None
+            if len(params) >= 4:
+                length = params[3]
+            #Optional parameter - client can take compressed data
+            compress = len(params) >= 5 and bool(params[4])
+            #Optional parameter - [size, modification time] the file had
+            #when the client got the bytes it already has
+            validator = None
+            if len(params) >= 6 and isinstance(params[5], list) and \
+               len(params[5]) == 2:
+                validator = params[5]
+            #Optional parameters - directory the filename is in, and the
+            #transfer's priority
+            (directory, priority) = readTransferPlace(params, 6)
+            transfer = FileTransfer(session, request_id, filename,
+                                    receiving=False, multiplexed=multiplexed,
+                                    offset=offset, length=length,
+                                    compress=compress, validator=validator,
+                                    directory=directory, priority=priority)
+            #Don't send a response, all communication has been handled within
+            #sendFile function.
+            continue
+        
+        #Receive file from client
+        elif request == UPLOAD_CMD and len(params) >= 2:
+            print "Getting file from user..."
+            filename = params[0]
+            filesize = params[1]
+            #Optional parameter - send over this connection, not a new one
+            multiplexed = len(params) >= 3 and bool(params[2])
+            #Optional parameter - [size, modification time] of the
+            #client's file, to carry on from what we already have of it
+            resume = None
+            if len(params) >= 4 and isinstance(params[3], list) and \
+               len(params[3]) == 2:
+                resume = params[3]
+            #Optional parameter - client is sending compressed data
+            compress = len(params) >= 5 and bool(params[4])
+            #Optional parameter - only send what has changed, if we already
+            #have the file
+            use_delta = len(params) >= 6 and bool(params[5])
+            #Optional parameter - hash of the file, in case we already have
+            #one the same
+            content_hash = None
+            if len(params) >= 7:
+                content_hash = params[6]
+            #Optional parameters - directory the filename is in, and the
+            #transfer's priority
+            (directory, priority) = readTransferPlace(params, 7)
+            transfer = FileTransfer(session, request_id, filename,
+                                    receiving=True, filesize=filesize,
+                                    multiplexed=multiplexed, resume=resume,
+                                    compress=compress, use_delta=use_delta,
+                                    content_hash=content_hash,
+                                    directory=directory, priority=priority)
+            #Don't send a response, all communication has been handled within
+            #sendFile method.
+            continue
+        
+        #Send a directory, and everything in it, to client
+        elif request == DOWNTREE_CMD and len(params) >= 1:
+            print "Sending directory to user..."
+            dirname = params[0]
+            #Optional parameter - send over this connection, not a new one
+            multiplexed = len(params) >= 2 and bool(params[1])
+            #Optional parameter - client can take compressed data
+            compress = len(params) >= 3 and bool(params[2])
+            #Optional parameters - directory dirname is in, and the
+            #transfer's priority
+            (directory, priority) = readTransferPlace(params, 3)
+            transfer = TreeTransfer(session, request_id, dirname,
+                                    receiving=False, multiplexed=multiplexed,
+                                    compress=compress, directory=directory,
+                                    priority=priority)
+            #Communication is handled by the transfer, as for a file.
+            continue
+        
+        #Receive a directory, and everything in it, from client
+        elif request == UPTREE_CMD and len(params) >= 3:
+            print "Getting directory from user..."
+            dirname = params[0]
+            filesize = params[1]
+            manifest = params[2]
+            #Optional parameter - send over this connection, not a new one
+            multiplexed = len(params) >= 4 and bool(params[3])
+            #Optional parameter - client is sending compressed data
+            compress = len(params) >= 5 and bool(params[4])
+            #Optional parameters - directory dirname is in, and the
+            #transfer's priority
+            (directory, priority) = readTransferPlace(params, 5)
+            transfer = TreeTransfer(session, request_id, dirname,
+                                    receiving=True, filesize=filesize,
+                                    manifest=manifest,
+                                    multiplexed=multiplexed,
+                                    compress=compress, directory=directory,
+                                    priority=priority)
+            #Communication is handled by the transfer, as for a file.
+            continue
+        
+        #Disconnect command
+        elif request == DISCONNECT_CMD:
+            #break from listening for commands
+            break
+        
+        #Request not recognised
+        else:
+            #Notify client of failure.
+            response = [FAILURE_MSG, "Did not recognise command."]
+        
+        #replying...
+        print "Replying: " + str(response[0])
+        try:
+            session.send(request_id, response)
+        except socket.error:
+            print "Error sending response, breaking from loop."
+            # if socket.error is raised, the connection is probably dead
+            break
+        
+        print "\n"
+    
+    #disconnect - to tidy up afterwards
+    disconnect(session)
+#end of serverLoop function
+    
+###############################################################################
+# End of serverLoop
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Internally used functions to respond to client requests
+###############################################################################
+
+#chDir function - changes directory, is called by client
+def chDir(session, path):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Changes directory to specified path.
+    
+    Takes in:
+        session - Session of the client making the request.
+        path - path which client has requested to change to.
+    
+    Returns:
+        - [SUCCESS_MSG, path] if the operation is carried out succesfully,
+          where path is the new current directory.
+        - [FAILURE_MSG, reason] if operation fails.
+    """
+    try:
+        session.filespace.executeCommands(path)
+        response = [SUCCESS_MSG, session.filespace.getPwd()]
+    except fileviewer.NavigationException as e:
+        response = [FAILURE_MSG, str(e)]
+    except (OSError, fileviewer.CommandException):
+        response = [FAILURE_MSG, "Invalid directory change."]
+    return response
+#end of chDir function
+
+
+#makeDir function - to create a directory at the client's request
+def makeDir(session, path):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Creates a new directory within the current directory.
+    
+    Takes in:
+        session - Session of the client making the request.
+        path - path of new directory.
+    
+    Returns:
+        - [SUCCESS_MSG] if the operation is carried out succesfully.
+        - [FAILURE_MSG, reason] if operation fails.
+    """
+    try:
+        session.filespace.createDir(path)
+        response = [SUCCESS_MSG]
+    except OSError:
+        response = [FAILURE_MSG, "Invalid directory"]
+    return response
+#end of makeDir function
+
+
+#setRateLimit function - changes a cap on the data rate of transfers
+def setRateLimit(session, params):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Caps apply straight away, including to transfers already running.
+
+    Takes in:
+        session - Session of the client making the request.
+        params - [scope, rate, transfer_request_id] - scope is SERVER_SCOPE,
+                 SESSION_SCOPE or TRANSFER_SCOPE, rate is bytes per second,
+                 or None/0 for no cap. transfer_request_id is the ID of the
+                 request which started the transfer, for TRANSFER_SCOPE only.
+
+    Returns:
+        - [SUCCESS_MSG] if the cap is set.
+        - [FAILURE_MSG, reason] if it is not.
+    """
+    try:
+        scope = params[0]
+        if scope == SERVER_SCOPE:
+            transfer_engine.setRateLimit(params[1])
+        elif scope == SESSION_SCOPE:
+            session.rate_limit.setRate(params[1])
+        elif scope == TRANSFER_SCOPE and len(params) >= 3:
+            transfer = session.getTransfer(params[2])
+            if transfer == None:
+                return [FAILURE_MSG, "No such transfer"]
+            transfer.rate_limit.setRate(params[1])
+        else:
+            return [FAILURE_MSG, "Invalid scope"]
+    except (ValueError, TypeError):
+        return [FAILURE_MSG, "Invalid rate"]
+    return [SUCCESS_MSG]
+#end of setRateLimit function
+
+
+#setPriority function - changes the priority of a queued transfer
+def setPriority(session, params):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Priorities are kept between LOW_PRIORITY and HIGH_PRIORITY, so one
+        client can't put its transfers far ahead of everyone else's.
+
+    Takes in:
+        session - Session of the client making the request.
+        params - [transfer_request_id, priority] - transfer_request_id is the
+                 ID of the request which started the transfer.
+
+    Returns:
+        - [SUCCESS_MSG] if the priority is set, or the transfer has already
+          started, so has no need of it.
+        - [FAILURE_MSG, reason] if there is no such transfer.
+    """
+    transfer = session.getTransfer(params[0])
+    if transfer == None:
+        return [FAILURE_MSG, "No such transfer"]
+    try:
+        priority = readPriority(params[1])
+    except (ValueError, TypeError):
+        return [FAILURE_MSG, "Invalid priority"]
+    transfer_engine.setPriority(transfer, priority)
+    return [SUCCESS_MSG]
+#end of setPriority function
+
+
+#readPriority function - to get a transfer priority sent by the client
+def readPriority(priority):
+    """
+    Usage:
+        For internal use only.
+        Keeps the priority between LOW_PRIORITY and HIGH_PRIORITY (see
+        setPriority()).
+
+    Exceptions:
+        ValueError/TypeError - If priority is not a number.
+    """
+    return max(transferengine.LOW_PRIORITY,
+               min(transferengine.HIGH_PRIORITY, int(priority)))
+#end of readPriority function
+
+
+#readTransferPlace function - to get where a transfer goes in the filespace
+#  and in the queue
+def readTransferPlace(params, index):
+    """
+    Usage:
+        For internal use only, by serverLoop().
+        Reads the optional [directory, priority] parameters of a transfer
+        request, starting at params[index]. The client only asks for a
+        transfer once it starts it, so it gives the directory it was in when
+        the transfer was made, which may not be the current one by then.
+
+    Returns:
+        Tuple of (directory, priority) - directory is a path as given by
+        GETDIR_CMD, or None for the current directory.
+    """
+    directory = None
+    if len(params) > index and isinstance(params[index], str):
+        directory = params[index]
+    priority = transferengine.NORMAL_PRIORITY
+    if len(params) > index + 1:
+        try:
+            priority = readPriority(params[index + 1])
+        except (ValueError, TypeError):
+            pass
+    return (directory, priority)
+#end of readTransferPlace function
+
+
+#listDir function - returns string of files/folders in directory
+def listDir(session, validator=None):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Should be called if user requests the directory list.
+        Should never fail under normal circumstances.
+
+    Takes in:
+        session - Session of the client making the request.
+        validator - validator sent with a listing the client already has, or
+                    None.
+    
+    Returns:
+        - [SUCCESS_MSG, listing, path, validator] where listing is a list of
+          [name, size] lists, one for each file or directory, path is the
+          current directory and validator is to be sent back to check the
+          listing later.
+        - [NOT_MODIFIED_MSG, path, validator] if the listing is the same as
+          the one the client has.
+        - [FAILURE_MSG, reason] if it could not list the directory for some
+          reason.
+    """
+    try:
+        dir_list = session.filespace.executeCommands(".")
+        #dir_list = [("filename1", size1), ("filename2", size2)] etc.
+        path = session.filespace.getPwd()
+    except (OSError, fileviewer.CommandException):
+        response = [FAILURE_MSG, "Failed to retrieve data."]
+        return response
+
+    listing_hash = newListingHash(path)
+    for entry in dir_list:
+        listing_hash.update(protocol.encodeFields(entry))
+    if listing_hash.hexdigest() == validator:
+        return [NOT_MODIFIED_MSG, path, validator]
+    
+    response = [SUCCESS_MSG, dir_list, path, listing_hash.hexdigest()]
+    return response
+#end of listDir function
+
+
+#logListingCache function - to print how well the listing cache is doing
+def logListingCache():
+    """
+    Usage:
+        For internal use only.
+        Prints the hits and misses of the listing cache so far, and the
+        number of listings it keeps (see fileviewer.ListingCache).
+    """
+    print "Listing cache hits/misses/listings: " + \
+          str(fileviewer.getListingCacheStats())
+#end of logListingCache function
+
+
+#newListingHash function - to start the validator of a listing
+def newListingHash(path):
+    """
+    Usage:
+        For internal use only.
+        Each entry of the listing, encoded as it is sent, is added using
+        update(), and hexdigest() gives the validator. The path is included,
+        so a listing of another directory never matches.
+        The whole listing is checked, rather than just the directory's
+        modification time, as files can change size without the time of
+        their directory changing. The listing cache looks again at files
+        changed recently, and reads a directory again once its listing is
+        fileviewer.LISTING_MAX_AGE seconds old, so the entries hashed can be
+        taken from the cache.
+    """
+    return hashlib.sha1(protocol.encodeFields([path]))
+#end of newListingHash function
+
+
+#streamDirPages function - starts sending the directory listing in pages
+def streamDirPages(session, request_id, cursor, page_size, validator=None):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Should be called if user requests the directory list a page at a time.
+        The current directory is worked out straight away, then the pages are
+        sent by a separate thread, so other requests are answered meanwhile.
+        Only one page is held in memory at a time, whatever the size of the
+        directory.
+
+    Takes in:
+        session - Session of the client making the request.
+        request_id - ID of the client's request.
+        cursor - None (or 0) for the start, or the cursor sent with a page to
+                 carry on after that page - the name of its last entry, as
+                 entries are sent sorted by name (see
+                 fileviewer.iterDirSnapshot()), so entries added or removed
+                 in between are neither missed nor sent twice.
+        page_size - Number of entries to send in each page.
+        validator - validator sent with the last page of a whole listing the
+                    client already has, or None. Only used from the start.
+
+    Each page is sent as:
+        [SUCCESS_MSG, path, cursor, entries, done, validator]
+        where entries is a list of [name, size, last_access, last_mod, type]
+        lists, cursor is where to carry on listing after this page, and done
+        is True for the last page. validator is sent with the last page of a
+        listing from the start, to be sent back to check the listing later,
+        and is None otherwise.
+    Or if the listing is the same as the one the client has:
+        [NOT_MODIFIED_MSG, path, validator]
+    Or if the directory cannot be listed:
+        [FAILURE_MSG, reason]
+    """
+    try:
+        if cursor in (None, 0, ""):
+            cursor = None
+        elif not isinstance(cursor, str):
+            raise ValueError("Cursor must be a name.")
+        page_size = min(max(int(page_size), 1), MAX_PAGE_SIZE)
+        directory = session.filespace.pwd
+        path = session.filespace.getPwd()
+    except (ValueError, TypeError, OSError):
+        try:
+            session.send(request_id, [FAILURE_MSG, "Invalid listing request."])
+        except socket.error:
+            pass
+        return
+    sender = threading.Thread(target=sendDirPages,
+                              args=(session, request_id, directory, path,
+                                    cursor, page_size, validator))
+    sender.daemon = True
+    sender.start()
+#end of streamDirPages function
+
+
+#sendDirPages function - sends the directory listing in pages
+def sendDirPages(session, request_id, directory, path, cursor, page_size,
+                 validator=None):
+    """
+    Usage:
+        For internal use only.
+        Run by streamDirPages() in its own thread, see streamDirPages().
+        To check a validator, the directory is read through once without
+        sending anything, then again to send it if it has changed, so still
+        only one page is held in memory at a time.
+    """
+    whole = cursor == None
+    try:
+        try:
+            if whole and validator != None:
+                listing_hash = newListingHash(path)
+                for (name, entry) in \
+                        session.filespace.iterDirSnapshot(directory):
+                    listing_hash.update(protocol.encodeFields(entry))
+                if listing_hash.hexdigest() == validator:
+                    session.send(request_id,
+                                 [NOT_MODIFIED_MSG, path, validator])
+                    return
+            listing_hash = newListingHash(path)
+            page = []
+            for (cursor, entry) in \
+                    session.filespace.iterDirSnapshot(directory, cursor):
+                listing_hash.update(protocol.encodeFields(entry))
+                page.append(entry)
+                if len(page) == page_size:
+                    session.send(request_id,
+                                 [SUCCESS_MSG, path, cursor, page, False,
+                                  None])
+                    page = []
+        except OSError:
+            session.send(request_id, [FAILURE_MSG, "Failed to retrieve data."])
+            return
+        #Only a whole listing can be checked later
+        validator = None
+        if whole:
+            validator = listing_hash.hexdigest()
+        session.send(request_id,
+                     [SUCCESS_MSG, path, cursor, page, True, validator])
+    except socket.error:
+        print "Socket error."
+#end of sendDirPages function
+
+
+#streamSearch function - starts searching the contents of files
+def streamSearch(session, request_id, params):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Should be called if user requests a search of the files under the
+        current directory.
+        Every text file in the tree is searched, by a pool of threads (see
+        contentsearch), and the matching lines are sent in pages as they are
+        found, so the first hits arrive while the search goes on. A CANCEL
+        from the client stops the search.
+
+    Takes in:
+        session - Session of the client making the request.
+        request_id - ID of the client's request.
+        params - [pattern, regex, ignore_case, max_hits, time_limit], where
+                 all but pattern are optional. regex is True if pattern is a
+                 regular expression rather than a literal string - it is
+                 limited in length and in how much of a line it is tried on
+                 at once, but may still use CPU past the time limit (see
+                 contentsearch). max_hits and time_limit are capped at
+                 MAX_SEARCH_HITS and MAX_SEARCH_TIME.
+
+    Each page is sent as:
+        [SUCCESS_MSG, hits, done, truncated]
+        where hits is a list of [path, line_number, text] lists, path being
+        relative to the current directory, done is True for the last page,
+        and truncated is True if the search stopped at a limit before
+        searching every file.
+    Or if the search cannot be started:
+        [FAILURE_MSG, reason]
+    """
+    try:
+        pattern = params[0]
+        regex = len(params) >= 2 and bool(params[1])
+        ignore_case = len(params) >= 3 and bool(params[2])
+        max_hits = MAX_SEARCH_HITS
+        if len(params) >= 4 and params[3] != None:
+            max_hits = min(max(int(params[3]), 1), MAX_SEARCH_HITS)
+        time_limit = MAX_SEARCH_TIME
+        if len(params) >= 5 and params[4] != None:
+            time_limit = min(max(float(params[4]), 0), MAX_SEARCH_TIME)
+        matcher = contentsearch.makeMatcher(pattern, regex, ignore_case)
+        directory = session.filespace.pwd
+    except (ValueError, TypeError) as e:
+        try:
+            session.send(request_id, [FAILURE_MSG, "Invalid search: " + str(e)])
+        except socket.error:
+            pass
+        return
+    line_limit = contentsearch.LINE_LIMIT
+    if regex:
+        line_limit = contentsearch.REGEX_LINE_LIMIT
+    search = contentsearch.ContentSearch(directory, matcher, max_hits,
+                                         time_limit, line_limit=line_limit)
+    #Registered before anything is sent, so a CANCEL isn't missed
+    messages = session.openStream(request_id)
+    sender = threading.Thread(target=sendSearchHits,
+                              args=(session, request_id, search, messages))
+    sender.daemon = True
+    sender.start()
+#end of streamSearch function
+
+
+#sendSearchHits function - sends the hits of a search as they are found
+def sendSearchHits(session, request_id, search, messages):
+    """
+    Usage:
+        For internal use only.
+        Run by streamSearch() in its own thread, see streamSearch().
+        A page is sent once it is full, or once the search has gone a while
+        without finding more, so hits are never held back for long.
+    """
+    results = search.results()
+    try:
+        page = []
+        for hit in results:
+            if not messages.empty() and messages.get()[0] == CANCEL_CMD:
+                return
+            if hit != None:
+                page.append(list(hit))
+            if len(page) == SEARCH_PAGE_SIZE or (hit == None and page):
+                session.send(request_id, [SUCCESS_MSG, page, False, False])
+                page = []
+        session.send(request_id, [SUCCESS_MSG, page, True, search.truncated])
+    except socket.error:
+        print "Socket error."
+    finally:
+        results.close()
+        session.closeStream(request_id)
+#end of sendSearchHits function
+
+
+#findFiles function - finds files under the current directory
+def findFiles(session, params):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Should be called if user requests files by name, size or age.
+        Files are looked up in the index of the whole filespace (see
+        metaindex), rather than by walking the tree, so this is quick however
+        big the tree is, but may miss changes made since the index was last
+        refreshed.
+
+    Takes in:
+        session - Session of the client making the request.
+        params - [name, min_size, max_size, min_mtime, max_mtime, order,
+                 limit], all optional, and None for no condition. name is a
+                 glob, e.g. "*.log". order is None to sort by path, LARGEST or
+                 NEWEST. limit is capped at MAX_FIND_RESULTS.
+
+    Returns:
+        - [SUCCESS_MSG, files, updated] where files is a list of [path, size,
+          last_mod] lists, path being relative to the current directory, and
+          updated is the time the index was last brought up to date, or None
+          if it is still being built.
+        - [FAILURE_MSG, reason] if there is no index, or the request is bad.
+    """
+    if meta_index == None:
+        return [FAILURE_MSG, "No index on this server."]
+    params = list(params[:7]) + [None] * (7 - len(params))
+    (name, min_size, max_size, min_mtime, max_mtime, order, limit) = params
+    under = os.path.relpath(os.path.abspath(session.filespace.pwd),
+                            meta_index.root)
+    if under == os.curdir:
+        under = ""
+    under = under.replace(os.sep, metaindex.SEPARATOR)
+    if under == os.pardir or under.startswith(os.pardir + metaindex.SEPARATOR):
+        return [FAILURE_MSG, "Current directory is not indexed."]
+    try:
+        if name != None:
+            name = str(name)
+        (min_size, max_size, min_mtime, max_mtime) = \
+            [None if value == None else float(value)
+             for value in (min_size, max_size, min_mtime, max_mtime)]
+        if limit == None:
+            limit = metaindex.MAX_RESULTS
+        limit = min(max(int(limit), 1), MAX_FIND_RESULTS)
+        files = meta_index.find(under, name, min_size, max_size, min_mtime,
+                                max_mtime, order, limit)
+    except (ValueError, TypeError) as e:
+        return [FAILURE_MSG, "Invalid find: " + str(e)]
+    except IOError:
+        return [FAILURE_MSG, "Failed to read index."]
+    return [SUCCESS_MSG, [list(entry) for entry in files], meta_index.updated]
+#end of findFiles function
+
+
+#getCWD function - returns path to current working directory
+def getCWD(session):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Should be called if user requests the path to the current directory.
+        Should never fail under normal circumstances.
+
+    Takes in:
+        session - Session of the client making the request.
+
+    Returns:
+        - [SUCCESS_MSG, path] with the path to the current directory
+        - [FAILURE_MSG, reason] if it could not get the current directory for
+          some reason.
+    """
+    try:
+        response = [SUCCESS_MSG, session.filespace.getPwd()]
+    except OSError:
+        response = [FAILURE_MSG, "Failed to retrieve path."]
+    return response
+#end of listDir function
+
+
+#getFileProperties function - returns properties of a file
+def getFileProperties(session, filename):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Should be called if user requests details on a file.
+
+    Takes in:
+        session - Session of the client making the request.
+        filename - File name for file which the client has requested details
+
+    Returns:
+        - [SUCCESS_MSG, path, size, last_access, last_mod]
+        - [FAILURE_MSG, reason] if the file cannot be accessed
+    """
+    try:
+        (path, size, last_access, last_mod) = \
+                session.filespace.executeCommands(filename)
+        response = [SUCCESS_MSG, path, size, last_access, last_mod]
+    except (OSError, fileviewer.CommandException):
+        response = [FAILURE_MSG, "Could not access file."]
+    return response
+#end of getFileProperties function
+
+#getSnapshot function - returns path, listing and status of each entry
+def getSnapshot(session):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Should be called if user requests the current directory along with
+        everything in it. The directory is only scanned once.
+
+    Takes in:
+        session - Session of the client making the request.
+
+    Returns:
+        - [SUCCESS_MSG, path, entries] where entries is a list of
+          [name, size, last_access, last_mod, type] lists.
+        - [FAILURE_MSG, reason] if the directory cannot be read.
+    """
+    try:
+        response = [SUCCESS_MSG, session.filespace.getPwd(),
+                    session.filespace.getPwdSnapshot()]
+    except OSError:
+        response = [FAILURE_MSG, "Failed to retrieve data."]
+    return response
+#end of getSnapshot function
+
+###############################################################################
+# End of internal functions for client requests
+###############################################################################
+
+
+
+
+###############################################################################
+# Code for file transfer (FileTransfer class)
+###############################################################################
+
+#FileTransfer class - allows concurrent, queued file transfer
+class FileTransfer(threading.Thread):
+    """
+    Usage:
+        For internal use only (in response to client download/upload request)
+        File transfers run concurrently and on a different, so this will not
+        block or disrupt the request/response loop.
+        Each transfer has its own data connection, on a port chosen by the
+        OS, or if multiplexed, is sent as a stream of messages over the
+        client's control connection, interleaved with other messages. Up to
+        MAX_TRANSFERS run at once, and up to MAX_SESSION_TRANSFERS for one
+        client (see transfer_engine).
+        The client decides the order its own transfers run in, and only asks
+        for each one as it starts it, so these limits only hold a transfer
+        back while the server is busy with other clients, or if a client
+        runs more than MAX_SESSION_TRANSFERS at once.
+        This should not be created (or any functions called) outside of
+        serveLoop().
+    """
+    
+    #Constructor
+    def __init__(self, session, request_id, filename, receiving=False,
+                 filesize=None, multiplexed=False, offset=0, length=None,
+                 resume=None, compress=False, use_delta=False,
+                 content_hash=None, validator=None, directory=None,
+                 priority=transferengine.NORMAL_PRIORITY):
+        """
+        Constructor
+
+        Usage:
+            For internal use only.
+            For an upload:
+                my_transfer = Transfer(session, request_id,
+                                       filename_to_save_as, receiving=True,
+                                       filesize=size_of_file)
+            For a download:
+                my_transfer = Transfer(session, request_id,
+                                       filename_of_file_to_download)
+        
+        Takes in:
+            session - Session of the client which requested the transfer.
+            request_id - ID of the client's request for the transfer.
+            filename - If this transfer is an upload, the filename is the name
+                       to save the uploaded file to on the server.
+                       If this is a download, it is the name of the file to
+                       download from server.
+            download - Boolean for whether we are sending or receiving a file.
+                       should be True if this is an upload from the client,
+                       False (default) for a download to the client.
+            filesize - If this is an upload from client to server, this is
+                       required, and must be the exact size of the file in
+                       bytes (as sent by the client).
+                       If this is a download, this is not required and will be
+                       ignored.
+            multiplexed - True to send the data over the control connection,
+                          False (default) for a separate data connection.
+            offset - If this is a download, the number of bytes the client
+                     already has, to carry on from. Ignored for an upload.
+            length - If this is a download, the number of bytes to send from
+                     offset, or None (default) for the rest of the file, so
+                     that a download can be split into ranges. Ignored for an
+                     upload.
+            resume - If this is an upload, [size, modification time] of the
+                     client's file, to carry on from the partial file left by
+                     an upload of the same file which was cut short (see
+                     fileviewer.resumeFile()), or None (default) to start
+                     from the beginning. Ignored for a download.
+            compress - If this is a download, True if the client can take
+                       compressed data, in which case it is compressed if it
+                       is worth it. If this is an upload, True if the client
+                       is sending compressed data.
+            use_delta - If this is an upload, True to replace the file if it
+                        exists, by getting only the differences from the
+                        client (see delta module). If either file is smaller
+                        than DELTA_MIN_SIZE, the file is sent whole instead,
+                        and still replaces the old one. Ignored for a
+                        download.
+            content_hash - If this is an upload, the hash of the file (see
+                           hashindex module), or None. If there is already a
+                           file with the same contents on the server, it is
+                           copied, rather than uploaded. Ignored for a
+                           download.
+            validator - If this is a download, [size, modification time]
+                        the file had when the client got the bytes before
+                        offset, or None (default). If the file has changed
+                        since, the download fails, rather than giving the
+                        client a mix of the old and new file. Ignored for an
+                        upload.
+            directory - path of the directory filename is in, as given by
+                        GETDIR_CMD, or None (default) for the session's
+                        current directory.
+            priority - queued transfers with a higher priority start first.
+        """
+        threading.Thread.__init__(self)
+        
+        self.session = session
+        self.request_id = request_id
+        self.receiving = receiving
+        self.multiplexed = multiplexed
+        self.filename = filename
+        #The transfer has its own filespace, as the session may change
+        #directory before the transfer is done
+        self.filespace = session.filespace
+        if directory != None:
+            try:
+                self.filespace = session.filespace.atPath(directory)
+            except fileviewer.NavigationException as e:
+                print "Communication unsuccesful"
+                session.send(request_id, [FAILURE_MSG, str(e)])
+                return
+        self.path = self.filespace.makePwd(
+                fileviewer.replaceBackSlashes(filename))
+        self.file_object = None
+        self.listen_socket = None
+        self.transfer_socket = None
+        self.messages = None
+        self.tuner = None
+        #Cap on this transfer's data rate, which the client may set
+        self.rate_limit = transferengine.TokenBucket()
+        #Stops the transfer between pieces of data if the client cancels it
+        self.control = transferengine.TransferControl(self.keepAlive)
+        #Every cap on the data rate of this transfer
+        self.rate_limits = (self.rate_limit, session.rate_limit,
+                            transfer_engine.rate_limit)
+        #Everything checked for each piece of data
+        self.limits = (self.control,) + self.rate_limits
+        
+        self.file_size = filesize
+        self.offset = offset
+        self.length = length
+        self.resume = resume
+        self.compress = compress
+        self.use_delta = use_delta
+        self.content_hash = content_hash
+        self.validator = validator
+        self.deduplicated = False
+        self.basis = None
+        self.block_size = None
+        self.temp_path = None
+        #Where a resumable upload is written until it is complete
+        self.partial_path = None
+        self.bytes_transferred = 0
+
+        self.has_failed = False
+        
+        #Start the transfer once there is room for it. The file is only
+        #opened, and the client answered, once it starts (see initialise()).
+        session.addTransfer(self)
+        transfer_engine.add(self, priority, group=session)
+        print "Transfers running/queued: " + \
+              str(transfer_engine.getStatus()[0:2])
+    #End of Constructor
+    
+    
+    #cancel method - to stop the transfer, as the client has cancelled it
+    def cancel(self):
+        """
+        Usage:
+            A running transfer fails after the piece of data it is on. One
+            waiting for the client to connect stops waiting (where the OS
+            allows). A queued transfer fails straight away.
+        """
+        self.control.cancel()
+        if transfer_engine.remove(self):
+            self.abandon()
+            return
+        listen_socket = self.listen_socket
+        if listen_socket != None:
+            try:
+                listen_socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+    #End of cancel method
+
+
+    #abandon method - to give up on a transfer which never started
+    def abandon(self):
+        """
+        Usage:
+            For internal use only, by cancel().
+            Nothing has been opened for a transfer until it starts, so only
+            the client needs to be told.
+        """
+        self.has_failed = True
+        self.session.removeTransfer(self)
+        try:
+            #Let the client know not to wait for it
+            self.session.send(self.request_id,
+                              [FAILURE_MSG, "Cancelled by client."])
+        except socket.error:
+            pass
+        print "Cancelled: " + self.filename
+    #End of abandon method
+
+
+    #setPaused method - to pause or unpause the transfer, as the client has
+    def setPaused(self, paused):
+        """
+        Usage:
+            The client owns the order its transfers run in, and pauses them
+            there, so a paused transfer gives up its place here too (see
+            transferengine.TransferEngine.pause()).
+        """
+        if paused:
+            self.control.pause()
+            transfer_engine.pause(self)
+        else:
+            self.control.resume()
+            transfer_engine.resume(self)
+    #End of setPaused method
+
+
+    #keepAlive method - to show the client this transfer is still coming
+    def keepAlive(self):
+        """
+        Usage:
+            For internal use only, called by the TransferControl while the
+            transfer is paused. (While it is queued, the client is still
+            waiting for the reply which starts it, which has no time limit.)
+            The client gives up on a multiplexed transfer which goes quiet for
+            TIMEOUT seconds, so an empty window message is sent meanwhile.
+        """
+        if self.multiplexed and self.messages != None:
+            try:
+                self.session.send(self.request_id, [WINDOW_MSG, 0])
+            except socket.error:
+                pass
+    #End of keepAlive method
+
+
+    #initialise method - to get ready for the transfer, and tell the client
+    def initialise(self):
+        """
+        Usage:
+            For internal use only, by run().
+            Done in the transfer's own thread once it starts, rather than by
+            serverLoop(), as it may take a while (e.g. finding and copying a
+            file with the same contents, or listing a whole tree), and so the
+            client is only given the go ahead (and a port to connect to) once
+            the transfer is running.
+
+        Returns:
+            True if there is data to transfer, False if the transfer failed,
+            or a file was copied rather than uploaded.
+        """
+        try:
+            print "Communicating with client..."
+            if self.receiving:
+                self.initialiseReceipt()
+            else:
+                self.initialiseSend()
+            print "Communication succesful."
+        except (ValueError, OSError, IOError, socket.error):
+            #There has been some kind of error, initialise methods will have
+            #attempted to notify client of this.
+            print "Communication unsuccesful"
+            self.has_failed = True
+            return False
+        if self.deduplicated:
+            print "Copied from a file with the same contents: " + \
+                  self.filename
+            return False
+        return True
+    #End of initialise method
+
+
+    #initialiseSend method - to initialise this to send a file to the client
+    def initialiseSend(self):
+        """
+        Usage:
+            For internal use only, and only if this object is a download.
+        
+        Exceptions:
+            OSError - If the file cannot be accessed
+            IOError - If network communication fails
+        """
+        try:
+            #Access the file to send.
+            (self.file_object, self.file_size) = \
+                    self.filespace.getFile(self.filename)
+            if self.validator != None and \
+               fileviewer.makeValidator(*self.validator) != \
+               fileviewer.makeValidator(
+                       self.file_size,
+                       os.fstat(self.file_object.fileno()).st_mtime):
+                self.file_object.close()
+                raise ValueError("File has changed.")
+            #Skip what the client already has
+            self.offset = int(self.offset)
+            end = self.file_size
+            if self.length != None:
+                end = self.offset + int(self.length)
+            if not 0 <= self.offset <= end <= self.file_size:
+                self.file_object.close()
+                raise ValueError("Range is outside of the file.")
+            self.file_object.seek(self.offset)
+            self.bytes_transferred = self.offset
+            #Only compress if the client can take it, and it is worth it
+            if self.compress:
+                self.compress = compression.worthCompressing(
+                        self.file_object.read(compression.SAMPLE_SIZE))
+                self.file_object.seek(self.offset)
+        except (OSError, IOError, ValueError) as e:
+            #Try to send a failure message to the client.
+            self.session.send(self.request_id, [FAILURE_MSG, str(e)])
+            raise
+                
+        try:
+            port = self.openDataChannel()
+            #Send file size, data port and whether the data is compressed to
+            #client - client will be expecting this. If the client can't go
+            #ahead it simply won't connect, and the transfer will time out.
+            self.session.send(self.request_id,
+                              [SUCCESS_MSG, self.file_size, port,
+                               int(self.compress)])
+            #The client has the whole size, from here on only the range
+            #being sent matters
+            self.file_size = end
+        except socket.error:
+            #closing unnecessary file:
+            self.file_object.close()
+            raise IOError("Network IO failed")
+    #End of initialiseSend method
+    
+    
+    
+    #initialiseReceipt method - to initialise for receiving from the client
+    def initialiseReceipt(self):
+        """
+        Usage:
+            For internal use only, and only if this object is an upload.
+        
+        Exceptions:
+            OSError - If the file cannot be accessed
+            ValueError - If the data from the client is bad
+            IOError - If network communication fails
+        """
+        try:
+            self.file_size = int(self.file_size)
+            if self.content_hash != None and self.copyExisting():
+                return
+            if self.use_delta:
+                try:
+                    #The file being replaced is the basis for the delta
+                    (self.basis, basis_size) = \
+                            self.filespace.getFile(self.filename)
+                except (OSError, IOError):
+                    #Nothing to replace, so it is an ordinary upload
+                    self.basis = None
+            if self.basis != None:
+                if min(basis_size, self.file_size) >= DELTA_MIN_SIZE:
+                    #The client sends the differences over this connection
+                    self.block_size = delta.blockSize(basis_size)
+                    self.multiplexed = True
+                    self.compress = False
+                #Otherwise the client sends the whole file, which still
+                #replaces the old one once it is all here
+                (self.file_object, self.temp_path) = \
+                        self.filespace.createTempFile(self.filename)
+            elif self.resume != None:
+                (self.file_object, self.offset, self.partial_path) = \
+                        self.filespace.resumeFile(
+                                self.filename,
+                                fileviewer.makeValidator(*self.resume))
+                if self.offset > self.file_size:
+                    self.file_object.close()
+                    raise OSError("File already exists")
+                self.bytes_transferred = self.offset
+            else:
+                self.file_object = \
+                        self.filespace.createFile(self.filename)
+        except (ValueError, OSError, IOError) as e:
+            if self.basis != None:
+                self.basis.close()
+            try:
+                #Try to send a failure message to the client.
+                self.session.send(self.request_id, [FAILURE_MSG, str(e)])
+                raise
+            except socket.error:
+                #If there is a connection problem at the same time
+                raise IOError("Network IO failed.")
+        try:
+            port = self.openDataChannel()
+            #Client is waiting for continue command, the data port, how
+            #much of the file we already have and the delta block size
+            self.session.send(self.request_id,
+                              [SUCCESS_MSG, port, self.offset,
+                               self.block_size])
+        except socket.error:
+            #IO with client has failed, connection is probably dead.
+            #closing unnecessary file:
+            self.file_object.close()
+            raise IOError("Network IO failed.")
+    #End of initialiseReceipt method
+    
+    
+    #copyExisting method - to copy a file with the same contents, if any
+    def copyExisting(self):
+        """
+        Usage:
+            For internal use only, by initialiseReceipt(), in the transfer's
+            own thread, as finding the file may mean hashing the files of the
+            same size, and copying it may take a while.
+            If a file in the hash index has the contents the client is about
+            to upload, it is copied (see fileviewer.copyFile()) and the client
+            is told it need not send anything, in reply to its request.
+
+        Returns:
+            True if the file was copied, False if it needs to be uploaded.
+
+        Exceptions:
+            socket.error - If network communication fails.
+        """
+        source = hash_index.find(str(self.content_hash), self.file_size)
+        if source == None:
+            return False
+        try:
+            self.filespace.copyFile(source, self.filename,
+                                            replace=self.use_delta)
+            hash_index.add(self.path, str(self.content_hash))
+        except (OSError, IOError):
+            #Upload as normal, which fails as normal if the file cannot be
+            #created.
+            return False
+        self.deduplicated = True
+        self.bytes_transferred = self.file_size
+        #[SUCCESS_MSG, port, bytes_server_already_has, delta_block_size,
+        # deduplicated]
+        self.session.send(self.request_id,
+                          [SUCCESS_MSG, None, self.file_size, None, 1])
+        return True
+    #End of copyExisting method
+
+
+    #openDataChannel method - to get ready to send/receive the data
+    def openDataChannel(self):
+        """
+        Usage:
+            For internal use only.
+            If multiplexed, opens this transfer's stream on the control
+            connection, otherwise creates a socket to accept this transfer's
+            data connection, on a free port chosen by the OS.
+
+        Returns:
+            The port number to give to the client, or None if multiplexed.
+
+        Exceptions:
+            socket.error - If the socket cannot be created.
+        """
+        if self.multiplexed:
+            self.messages = self.session.openStream(self.request_id)
+            return None
+        #Create a server socket to accept a connection
+        self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        #Port 0 - let the OS choose a free port
+        self.listen_socket.bind((socket.gethostname(), 0))
+        self.listen_socket.listen(1)
+        #Give up if the client never connects. The transfer is running by
+        #now, so the client is told the port, and connects, straight away.
+        self.listen_socket.settimeout(TIMEOUT)
+        return self.listen_socket.getsockname()[1]
+    #End of openDataChannel method
+
+
+    #transfer method - to carry out data transfer/file operations
+    def transfer(self):
+        """
+        Usage:
+            For internal use only.
+            Used to perform the actual transfer/read/write of data.
+        
+        Exceptions:
+            IOError - If network communication fails
+        """
+        try:
+            encoder = compression.Encoder(self.compress)
+            #Chunk and socket buffer sizes follow the speed of the connection
+            self.tuner = transfertuner.TransferTuner(self.transfer_socket,
+                                                     not self.receiving)
+            #Loop until all data is transferred.
+            while self.bytes_transferred < self.file_size:
+                #if it's an upload, receive data.
+                if self.receiving and self.compress:
+                    self.receiveCompressed()
+                elif self.receiving:
+                    self.receiveData()
+                #if it's a download, send data.
+                elif sendfile != None and not self.compress and \
+                     isinstance(self.file_object, file):
+                    self.sendFileData()
+                else:
+                    #read data from file, and send it through the socket
+                    data = self.file_object.read(
+                            min(self.tuner.chunkSize(),
+                                self.file_size - self.bytes_transferred))
+                    if data == "":
+                        raise IOError("File ended early.")
+                    transferengine.throttle(self.limits, len(data))
+                    self.transfer_socket.sendall(encoder.encode(data))
+                    self.bytes_transferred += len(data)
+                    self.tuner.update(len(data))
+            if not self.receiving:
+                self.transfer_socket.sendall(encoder.finish())
+        except (socket.error, socket.timeout, OSError, zlib.error):
+            raise IOError("Transfer failed.")
+    #End of transfer method
+
+
+    #receiveData method - to receive the rest of the file into the file
+    def receiveData(self):
+        """
+        Usage:
+            For internal use only, by transfer().
+            Receives straight into one buffer, which is reused for the whole
+            transfer, and only writes to the file once the buffer is full (or
+            the file is complete), so few large writes are made.
+
+        Exceptions:
+            socket.error - If receiving fails or the connection closes.
+        """
+        buffer = bytearray(RECEIVE_BUFFER_SIZE)
+        view = memoryview(buffer)
+        filled = 0
+        while self.bytes_transferred < self.file_size:
+            wanted = min(RECEIVE_BUFFER_SIZE - filled,
+                         self.file_size - self.bytes_transferred)
+            received = self.transfer_socket.recv_into(view[filled:], wanted)
+            #if nothing is received, the transfer has failed.
+            if received == 0:
+                raise socket.error("Connection closed.")
+            filled += received
+            self.bytes_transferred += received
+            self.tuner.update(received)
+            #Not reading holds the client back, once the socket fills up
+            transferengine.throttle(self.limits, received)
+            if filled == RECEIVE_BUFFER_SIZE or \
+               self.bytes_transferred == self.file_size:
+                #write binary data to file
+                self.file_object.write(view[:filled])
+                filled = 0
+        self.file_object.flush()
+    #End of receiveData method
+
+
+    #receiveCompressed method - to receive the rest of a compressed file
+    def receiveCompressed(self):
+        """
+        Usage:
+            For internal use only, by transfer().
+            Used instead of receiveData() if the client is compressing, as the
+            amount of data to receive is not known - it stops once the file
+            is complete.
+
+        Exceptions:
+            socket.error - If receiving fails or the connection closes.
+            zlib.error - If the data is not valid compressed data.
+        """
+        decoder = compression.Decoder(True)
+        while self.bytes_transferred < self.file_size:
+            data = self.transfer_socket.recv(RECEIVE_BUFFER_SIZE)
+            #if data == "", the transfer has failed.
+            if data == "":
+                raise socket.error("Connection closed.")
+            self.tuner.update(len(data))
+            transferengine.throttle(self.limits, len(data))
+            data = decoder.decode(data)
+            self.file_object.write(data)
+            self.bytes_transferred += len(data)
+        self.file_object.flush()
+    #End of receiveCompressed method
+
+
+    #sendFileData method - to send the file using sendfile
+    def sendFileData(self):
+        """
+        Usage:
+            For internal use only, by transfer(), and only if sendfile is
+            available.
+            Sends the rest of the file straight from the file to the socket,
+            without copying it into python, SENDFILE_SIZE at a time so that
+            progress is kept up to date.
+
+        Exceptions:
+            OSError - If sending fails.
+            IOError - If the file ends before file_size bytes are sent.
+        """
+        while self.bytes_transferred < self.file_size:
+            size = min(SENDFILE_SIZE, self.file_size - self.bytes_transferred)
+            if any(limit.getRate() != None for limit in self.rate_limits):
+                #Smaller pieces, so a capped rate is kept smoothly
+                size = min(size, self.tuner.chunkSize())
+            transferengine.throttle(self.limits, size)
+            sent = sendfile(self.transfer_socket.fileno(),
+                            self.file_object.fileno(), self.bytes_transferred,
+                            size)
+            if sent == 0:
+                raise IOError("File ended early.")
+            self.bytes_transferred += sent
+            self.tuner.update(sent)
+    #End of sendFileData method
+
+
+    #transferMultiplexed method - to transfer data over the control connection
+    def transferMultiplexed(self):
+        """
+        Usage:
+            For internal use only.
+            Used instead of transfer() to send or receive the data as a stream
+            of messages on the control connection.
+            When receiving, window is granted back to the client as the data
+            is written, and a final SUCCESS_MSG is sent once it is all here.
+
+        Exceptions:
+            IOError - If network communication fails, the client cancels, or
+                      the client stops sending/receiving for TIMEOUT seconds.
+        """
+        try:
+            if not self.receiving:
+                sendStream(self.session, self.request_id, self.file_object,
+                           self.file_size - self.offset, self.messages,
+                           self.setProgress, self.compress, self.limits)
+                return
+            decoder = compression.Decoder(self.compress)
+            if self.block_size != None:
+                self.sendSignatures()
+            consumed = 0
+            while self.bytes_transferred < self.file_size:
+                try:
+                    message = self.messages.get(True, TIMEOUT)
+                except Queue.Empty:
+                    raise IOError("Client stopped sending.")
+                if message[0] == CANCEL_CMD:
+                    raise IOError("Cancelled by client.")
+                elif message[0] == COPY_MSG and self.block_size != None and \
+                     len(message) >= 3:
+                    #Blocks of the basis, in place of their data
+                    consumed += COPY_COST
+                    self.bytes_transferred += delta.copyBlocks(
+                            self.basis, self.file_object, int(message[1]),
+                            int(message[2]), self.block_size)
+                    continue
+                elif message[0] != DATA_MSG or len(message) < 2:
+                    continue
+                #window is used up by the data as it was sent
+                consumed += len(message[1])
+                #Holding back window holds the client back
+                transferengine.throttle(self.limits, len(message[1]))
+                data = decoder.decode(message[1])
+                self.file_object.write(data)
+                self.bytes_transferred += len(data)
+                #Let the client send more once half the window is used up
+                if consumed >= STREAM_WINDOW / 2:
+                    self.session.send(self.request_id, [WINDOW_MSG, consumed])
+                    consumed = 0
+            self.file_object.flush()
+            if self.temp_path != None:
+                self.replaceBasis()
+            elif self.partial_path != None:
+                self.finishPartial()
+            self.session.send(self.request_id, [SUCCESS_MSG])
+        except (socket.error, zlib.error, OSError, ValueError):
+            raise IOError("Transfer failed.")
+    #End of transferMultiplexed method
+
+
+    #sendSignatures method - to send the signatures of the basis
+    def sendSignatures(self):
+        """
+        Usage:
+            For internal use only.
+            The client needs the signatures to work out the delta. They are
+            sent SIGNATURES_PER_MSG at a time, as
+                [SIGNATURES_MSG, signatures, done]
+            so no one message is too big, done being True for the last.
+
+        Exceptions:
+            socket.error - If network communication fails.
+            IOError - If the basis cannot be read.
+        """
+        signatures = []
+        for signature in delta.iterSignatures(self.basis, self.block_size):
+            signatures.append(signature)
+            if len(signatures) == SIGNATURES_PER_MSG:
+                self.session.send(self.request_id,
+                                  [SIGNATURES_MSG, signatures, False])
+                signatures = []
+        self.session.send(self.request_id, [SIGNATURES_MSG, signatures, True])
+    #End of sendSignatures method
+
+
+    #replaceBasis method - to replace the file with the one sent in its place
+    def replaceBasis(self):
+        """
+        Usage:
+            For internal use only.
+            Once the new file - made from a delta, or sent whole - is
+            complete, it replaces the old one in one step, so the file is
+            never seen half made.
+
+        Exceptions:
+            IOError - If the new file is not the right size.
+            OSError - If the file cannot be replaced.
+        """
+        self.file_object.close()
+        self.basis.close()
+        if os.path.getsize(self.temp_path) != self.file_size:
+            raise IOError("File made from delta is the wrong size.")
+        self.filespace.replaceFile(self.temp_path, self.path)
+        self.temp_path = None
+    #End of replaceBasis method
+
+
+    #finishPartial method - to give a complete resumable upload its name
+    def finishPartial(self):
+        """
+        Usage:
+            For internal use only.
+            Once all of a resumable upload is here, its partial file becomes
+            the file the client asked for.
+
+        Exceptions:
+            OSError - If the file cannot be renamed, e.g. if a file of the
+                      same name has appeared since.
+        """
+        self.file_object.close()
+        self.filespace.finishFile(self.partial_path, self.path)
+        self.partial_path = None
+    #End of finishPartial method
+
+
+    #indexFile method - to add an uploaded file to hash_index
+    def indexFile(self):
+        """
+        Usage:
+            For internal use only, once all of an upload is here, so the same
+            file need not be uploaded again.
+        """
+        try:
+            hash_index.add(self.path)
+        except (OSError, IOError):
+            pass
+    #End of indexFile method
+
+
+    #setProgress method - to keep track of the bytes sent by sendStream
+    def setProgress(self, bytes_sent):
+        self.bytes_transferred = self.offset + bytes_sent
+    #End of setProgress method
+    
+    
+    #run method - required by Thread - code here is concurrently executed
+    def run(self):
+        """
+        Usage:
+            For internal use only.
+            Required by thread class, code here is executed concurrently.
+            This gets the file ready, accepts the connection used for file
+            transfer, and will automatically let the next transfer in the
+            queue start upon completion.
+        """
+        try:
+            if not self.initialise():
+                return
+            if self.multiplexed:
+                self.transferMultiplexed()
+                self.file_object.close()
+                return
+            #transfer_socket is only used for file transfer.
+            (self.transfer_socket, addr) = self.listen_socket.accept()
+            #Only accept the client which requested this transfer.
+            while addr[0] != self.session.address[0]:
+                self.transfer_socket.close()
+                (self.transfer_socket, addr) = self.listen_socket.accept()
+            self.listen_socket.close()
+            #begin data transfer
+            self.transfer()
+            self.transfer_socket.close()
+            self.file_object.close()
+            if self.temp_path != None:
+                self.replaceBasis()
+            elif self.partial_path != None and \
+               self.bytes_transferred == self.file_size:
+                self.finishPartial()
+        except (IOError, OSError, socket.error, socket.timeout):
+            #some error has occured in file transfer, stop this transfer and
+            #move on.
+            self.has_failed = True
+            if self.listen_socket != None:
+                self.listen_socket.close()
+            if self.transfer_socket != None:
+                #So the client isn't left waiting for more data
+                self.transfer_socket.close()
+            self.file_object.close()
+            if self.basis != None:
+                self.basis.close()
+            if self.temp_path != None:
+                #Leave the old file as it was
+                try:
+                    os.remove(self.temp_path)
+                except OSError:
+                    pass
+            if self.multiplexed:
+                try:
+                    #Let the client know not to wait for more data
+                    self.session.send(self.request_id,
+                                      [FAILURE_MSG, "Transfer failed."])
+                except socket.error:
+                    pass
+        finally:
+            if self.multiplexed:
+                self.session.closeStream(self.request_id)
+            self.session.removeTransfer(self)
+            if self.receiving:
+                #What was written changed sizes without changing the
+                #directory's modification time
+                fileviewer.invalidateListing(os.path.dirname(self.path))
+            if self.receiving and not (self.has_failed or
+                                       self.deduplicated) and \
+               self.bytes_transferred == self.file_size:
+                self.indexFile()
+            #Let the next transfer in the queue start.
+            transfer_engine.finished(self)
+            if self.receiving:
+                message_str = "Upload "
+            else:
+                message_str = "Download "
+            if self.has_failed:
+                message_str += "failed: "
+            else:
+                message_str += "complete: "
+            message_str += self.filename
+            print message_str
+    #End of run method
+    
+#End of FileTransfer class
+
+
+#TreeTransfer class - transfers a directory and everything in it
+class TreeTransfer(FileTransfer):
+    """
+    Usage:
+        For internal use only (in response to client DOWNTREE/UPTREE request)
+        Works as a FileTransfer, but the data is a stream of every file in a
+        directory (see treestream module), so a whole tree goes in one
+        transfer, with no handshake for each file.
+        A manifest of the tree is sent before the data, so that directories
+        and files can be made as the data arrives.
+    """
+
+    #Constructor
+    def __init__(self, session, request_id, dirname, receiving=False,
+                 filesize=None, manifest=None, multiplexed=False,
+                 compress=False, directory=None,
+                 priority=transferengine.NORMAL_PRIORITY):
+        """
+        Takes in:
+            session - Session of the client which requested the transfer.
+            request_id - ID of the client's request for the transfer.
+            dirname - name of the directory to send, or to save the uploaded
+                      tree to.
+            receiving - True for an upload from the client, False (default)
+                        for a download to the client.
+            filesize - If this is an upload, the total size of the files in
+                       the tree, as sent by the client.
+            manifest - If this is an upload, the manifest of the tree, as
+                       sent by the client.
+            multiplexed - True to send the data over the control connection,
+                          False (default) for a separate data connection.
+            compress, directory, priority - as for FileTransfer.
+        """
+        self.manifest = manifest
+        FileTransfer.__init__(self, session, request_id, dirname,
+                              receiving=receiving, filesize=filesize,
+                              multiplexed=multiplexed, compress=compress,
+                              directory=directory, priority=priority)
+    #End of Constructor
+
+
+    #initialiseSend method - to initialise this to send a tree to the client
+    def initialiseSend(self):
+        """
+        Usage:
+            For internal use only, and only if this object is a download.
+
+        Exceptions:
+            OSError - If the directory cannot be accessed
+            IOError - If network communication fails
+        """
+        try:
+            if not self.filespace.isInFilespace(self.path) or \
+               not os.path.isdir(self.path):
+                raise OSError("Invalid directory")
+            self.manifest = treestream.makeManifest(self.path)
+            self.file_object = treestream.TreeReader(self.path, self.manifest)
+            self.file_size = self.file_object.size
+            #Only compress if the client can take it, and it is worth it
+            if self.compress:
+                self.compress = compression.worthCompressing(
+                        self.file_object.read(compression.SAMPLE_SIZE))
+                self.file_object.seek(0)
+        except (OSError, IOError) as e:
+            #Try to send a failure message to the client.
+            self.session.send(self.request_id, [FAILURE_MSG, str(e)])
+            raise
+
+        try:
+            port = self.openDataChannel()
+            #[SUCCESS_MSG, total_size, port, compressed, manifest]
+            self.session.send(self.request_id,
+                              [SUCCESS_MSG, self.file_size, port,
+                               int(self.compress), self.manifest])
+        except socket.error:
+            self.file_object.close()
+            raise IOError("Network IO failed")
+    #End of initialiseSend method
+
+
+    #initialiseReceipt method - to initialise for receiving from the client
+    def initialiseReceipt(self):
+        """
+        Usage:
+            For internal use only, and only if this object is an upload.
+
+        Exceptions:
+            OSError - If the directory cannot be made
+            ValueError - If the data from the client is bad
+            IOError - If network communication fails
+        """
+        try:
+            self.file_size = int(self.file_size)
+            if not self.filespace.isInFilespace(self.path):
+                raise OSError("Path not in filespace")
+            if treestream.checkManifest(self.manifest) != self.file_size:
+                raise ValueError("Manifest does not match size.")
+            self.file_object = treestream.TreeWriter(self.path, self.manifest)
+        except (ValueError, OSError, IOError) as e:
+            try:
+                #Try to send a failure message to the client.
+                self.session.send(self.request_id, [FAILURE_MSG, str(e)])
+                raise
+            except socket.error:
+                #If there is a connection problem at the same time
+                raise IOError("Network IO failed.")
+        try:
+            port = self.openDataChannel()
+            #[SUCCESS_MSG, port, bytes_server_already_has, delta_block_size]
+            self.session.send(self.request_id, [SUCCESS_MSG, port, 0, None])
+        except socket.error:
+            self.file_object.close()
+            raise IOError("Network IO failed.")
+    #End of initialiseReceipt method
+
+
+    #indexFile method - trees are not added to hash_index
+    def indexFile(self):
+        """
+        Usage:
+            For internal use only.
+            The path is a directory, not a file. Hashing every file in the
+            tree would hold up the transfer's slot, so they are only found
+            by hash_index.scan() when the server next starts.
+        """
+        pass
+    #End of indexFile method
+
+#End of TreeTransfer class
+
+
+#sendStream function - sends data to the client as a flow controlled stream
+def sendStream(session, request_id, source, size, messages, progress=None,
+               compress=False, limits=()):
+    """
+    Usage:
+        For internal use only.
+        Sends size bytes, read from source, to the client as DATA_MSG
+        messages on the control connection, tagged with request_id so they
+        can be interleaved with other messages.
+        The client starts with STREAM_WINDOW bytes of window, and grants more
+        with WINDOW_MSG messages as it uses up the data. Sending waits while
+        the window is used up, so a slow reader does not fill the connection.
+
+    Takes in:
+        session - Session of the client receiving the stream.
+        request_id - ID of the client's request for the data.
+        source - file-like object to read the data from.
+        size - number of bytes to send.
+        messages - Queue of the client's messages for this stream, from
+                   Session.openStream().
+        progress - optional function, called with the number of bytes sent so
+                   far after each message.
+        compress - True to compress the data. The window is used up by the
+                   compressed data.
+        limits - TokenBuckets capping the rate the data is sent at.
+
+    Exceptions:
+        IOError - If the client cancels, grants no window for TIMEOUT seconds
+                  or the source ends early.
+        socket.error - If sending fails.
+    """
+    window = STREAM_WINDOW
+    encoder = compression.Encoder(compress)
+    sent = 0
+    while sent < size:
+        #Take any window the client has granted, only waiting if there is
+        #none left.
+        while True:
+            try:
+                message = messages.get(window <= 0, TIMEOUT)
+            except Queue.Empty:
+                if window > 0:
+                    break
+                raise IOError("Client stopped receiving.")
+            if message[0] == WINDOW_MSG and len(message) >= 2:
+                window += int(message[1])
+            elif message[0] == CANCEL_CMD:
+                raise IOError("Cancelled by client.")
+        data = source.read(min(window, STREAM_CHUNK_SIZE, size - sent))
+        if data == "":
+            raise IOError("File ended early.")
+        sent += len(data)
+        data = encoder.encode(data)
+        if sent == size:
+            data += encoder.finish()
+        #The compressor may hold on to small pieces for now
+        if data != "":
+            transferengine.throttle(limits, len(data))
+            session.send(request_id, [DATA_MSG, data])
+            window -= len(data)
+        if progress != None:
+            progress(sent)
+#End of sendStream function
+
+
+#sendTextContents function - sends text contents of a file
+def sendTextContents(session, request_id, filename, compress=False, offset=0,
+                     length=None):
+    """
+    Usage:
+        For internal use only.
+        Should only be used to respond to client request. i.e. in serverLoop()
+        Should be called if user requests text contents of a file.
+        All communication of data is handled in this function. After the
+        filesize, the text is sent as a stream (see sendStream()) by a
+        separate thread, so other requests are answered meanwhile.
+        The text is read from the file a piece at a time as it is sent, so
+        memory used does not grow with the size of the file.
+        Replies [SUCCESS_MSG, bytes_to_send, compressed, file_size].
+    
+    Takes in:
+        session - Session of the client making the request.
+        request_id - ID of the client's request.
+        filename - File name for file which the client has requested details
+        compress - True if the client can take compressed text.
+        offset - where in the file to start the text, 0 (default) for the
+                 start.
+        length - most bytes of text to send, or None (default) for the rest
+                 of the file. The range is cut short at the end of the file.
+    """
+    source = None
+    try:
+        try:
+            print "Opening file..."
+            (source, filesize) = session.filespace.getFile(filename)
+            offset = min(max(int(offset), 0), filesize)
+            size = filesize - offset
+            if length != None:
+                size = min(max(int(length), 0), size)
+            source.seek(offset)
+            if compress:
+                compress = compression.worthCompressing(
+                        source.read(min(compression.SAMPLE_SIZE, size)))
+                source.seek(offset)
+        except (OSError, IOError, ValueError, TypeError) as e:
+            print "Failed, notifying client..."
+            if source != None:
+                source.close()
+                source = None
+            session.send(request_id, [FAILURE_MSG, str(e)])
+            return
+        else:
+            print "Sending filesize..."
+            messages = session.openStream(request_id)
+            #The text follows straight on from the size.
+            session.send(request_id,
+                         [SUCCESS_MSG, size, int(compress), filesize])
+    except socket.error:
+        print "Socket error."
+        session.closeStream(request_id)
+        if source != None:
+            source.close()
+        return
+    sender = threading.Thread(target=sendText,
+                              args=(session, request_id, source, size,
+                                    messages, compress))
+    sender.daemon = True
+    sender.start()
+#End of sendTextContents function
+
+
+#sendText function - streams the text of a file to the client
+def sendText(session, request_id, source, filesize, messages, compress):
+    """
+    Usage:
+        For internal use only.
+        Run by sendTextContents() in its own thread.
+    """
+    try:
+        sendStream(session, request_id, source, filesize, messages,
+                   compress=compress)
+    except (IOError, socket.error) as e:
+        print "Text not sent: " + str(e)
+        try:
+            #e.g. the file got shorter - let the client know not to wait
+            session.send(request_id, [FAILURE_MSG, "Could not read file."])
+        except socket.error:
+            pass
+    finally:
+        session.closeStream(request_id)
+        source.close()
+#End of sendText function
+
+###############################################################################
+# End of file transfer code
+###############################################################################
+
+
+
+
+###############################################################################
+# Main
+###############################################################################
+
+#readNumber function - to read a whole number from the command line
+def readNumber(index, description):
+    """
+    Usage:
+        For internal use only, by main().
+        Exits, saying why, if the parameter is not a whole number of at
+        least 0.
+
+    Takes in:
+        index - position of the parameter in sys.argv.
+        description - what the parameter is, for the message.
+
+    Returns:
+        The number, or None if the parameter is not given.
+    """
+    if len(sys.argv) <= index:
+        return None
+    try:
+        number = int(sys.argv[index])
+    except ValueError:
+        number = -1
+    if number < 0:
+        sys.exit(description + " must be a whole number of at least 0, not " +
+                 repr(sys.argv[index]))
+    return number
+#end of readNumber function
+
+
+def main():
+    global meta_index
+    #Cap on the data rate of all transfers, in bytes per second
+    rate_limit = readNumber(2, "Rate limit")
+    max_transfers = readNumber(3, "Number of transfers")
+    max_session_transfers = readNumber(4, "Number of transfers per client")
+    multicaster = multicastsrv.MulticastThread()
+    try:
+        custom_root = ""
+        if len(sys.argv) >= 2:
+            custom_root = sys.argv[1]
+            print "Setting root to command line parameter: " + custom_root
+        else:
+            print "Using default root."
+        if rate_limit:
+            transfer_engine.setRateLimit(rate_limit)
+            print "Limiting transfers to " + str(rate_limit) + " bytes/s"
+        if max_transfers != None:
+            transfer_engine.setMaxTransfers(max_transfers)
+        if max_session_transfers != None:
+            transfer_engine.setMaxPerGroup(max_session_transfers)
+        print "Running up to " + str(transfer_engine.max_transfers) + \
+              " transfers, " + str(transfer_engine.max_per_group) + \
+              " per client"
+        if custom_root == "":
+            #Sessions use the directory the server is running in.
+            custom_root = None
+        try:
+            print "Starting index..."
+            meta_index = metaindex.MetaIndex(custom_root or os.getcwd())
+            meta_index.start()
+        except (ImportError, IOError) as e:
+            #Everything but finding files works without it
+            print "No index: " + str(e)
+        #Files already there can be copied rather than uploaded again
+        scanner = threading.Thread(target=hash_index.scan,
+                                   args=(custom_root or os.getcwd(),))
+        scanner.daemon = True
+        scanner.start()
+        print "Starting multicaster..."
+        multicaster.start()
+        server_socket = listen()
+        pool = SessionPool()
+        while True:
+            #Each client gets a new session, with its own filespace.
+            session = getConnection(server_socket, custom_root)
+            pool.addSession(session)
+    except KeyboardInterrupt:
+        print "\nExiting..."
+    finally:
+        multicaster.stop()
+
+if __name__ == "__main__":
+    main()
+
+###############################################################################
+# End of main
+###############################################################################
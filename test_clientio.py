@@ -0,0 +1,759 @@
+"""
+Tests for the ClientIO module, against a server run for the tests.
+
+The server is run as its own process, on a filespace in a temporary
+directory, and lets each client run at most SESSION_TRANSFERS transfers at
+once, so that the client's and the server's transfer engines both have to
+queue.
+
+Usage:
+    Run as main, or using python -m unittest test_clientio
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import clientio
+import fileviewer
+
+
+
+
+###############################################################################
+# Globals
+###############################################################################
+
+SESSION_TRANSFERS = 2 #transfers of one client the server runs at once
+START_TIME = 10 #most seconds to wait for the server to start
+FINISH_TIME = 60 #most seconds to wait for transfers to finish
+
+server = None #the server's process
+server_root = None #the server's filespace
+client_root = None #where the client keeps its files
+
+###############################################################################
+# End of globals
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+#setUpModule function - to start the server, and connect to it
+def setUpModule():
+    global server, server_root, client_root
+    server_root = tempfile.mkdtemp()
+    client_root = tempfile.mkdtemp()
+    serverio = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "serverio.py")
+    with open(os.devnull, "w") as output:
+        server = subprocess.Popen([sys.executable, serverio, server_root, "0",
+                                   "16", str(SESSION_TRANSFERS)],
+                                  stdout=output, stderr=output)
+    end = time.time() + START_TIME
+    while True:
+        try:
+            clientio.connect(socket.gethostname())
+            return
+        except IOError:
+            if time.time() > end:
+                tearDownModule()
+                raise
+            time.sleep(0.1)
+#end of setUpModule function
+
+
+#tearDownModule function - to disconnect, and stop the server
+def tearDownModule():
+    clientio.disconnect()
+    server.terminate()
+    server.wait()
+    shutil.rmtree(server_root)
+    shutil.rmtree(client_root)
+#end of tearDownModule function
+
+
+#writeFile function - to make a file of random data
+def writeFile(directory, name, size):
+    data = os.urandom(size)
+    with open(os.path.join(directory, name), "wb") as file_object:
+        file_object.write(data)
+    return data
+#end of writeFile function
+
+
+#readFile function - to read a whole file
+def readFile(directory, name):
+    with open(os.path.join(directory, name), "rb") as file_object:
+        return file_object.read()
+#end of readFile function
+
+
+#waitFor function - to wait until transfers have finished
+def waitFor(transfers, timeout=FINISH_TIME):
+    end = time.time() + timeout
+    while time.time() < end:
+        if all(transfer.getStatus()[3] or transfer.getStatus()[4]
+               for transfer in transfers):
+            return
+        time.sleep(0.02)
+#end of waitFor function
+
+###############################################################################
+# End of helpers
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Tests
+###############################################################################
+
+#SchedulingTest class - tests transfers going through both transfer engines
+class SchedulingTest(unittest.TestCase):
+
+    def tearDown(self):
+        clientio.setMaxTransfers(clientio.MAX_TRANSFERS)
+
+
+    def testMoreTransfersThanEitherEngineRuns(self):
+        clientio.setMaxTransfers(6)
+        transfers = []
+        expected = {}
+        for i in xrange(10):
+            name = "many%d" % i
+            if i % 2 == 0:
+                expected[name] = writeFile(server_root, name, 200000 + i)
+                file_object = open(os.path.join(client_root, name), "wb")
+                transfers.append(clientio.FileTransfer(
+                        name, file_object, multiplexed=(i % 4 == 0),
+                        rate_limit=1000000))
+            else:
+                expected[name] = writeFile(client_root, name, 200000 + i)
+                file_object = open(os.path.join(client_root, name), "rb")
+                transfers.append(clientio.FileTransfer(
+                        name, file_object, len(expected[name]),
+                        download=False, dedupe=False, rate_limit=1000000))
+        waitFor(transfers)
+        self.assertEqual([transfer.getStatus()[4] for transfer in transfers],
+                         [True] * 10)
+        for (name, data) in expected.iteritems():
+            self.assertEqual(readFile(server_root, name), data)
+            self.assertEqual(readFile(client_root, name), data)
+
+
+    def testPausedTransfersGiveUpTheirPlaceOnTheServer(self):
+        clientio.setMaxTransfers(SESSION_TRANSFERS)
+        writeFile(server_root, "slow", 2000000)
+        data = writeFile(server_root, "quick", 1000)
+        slow = [clientio.FileTransfer(
+                        "slow", open(os.path.join(client_root, "slow%d" % i),
+                                     "wb"), rate_limit=100000)
+                for i in xrange(SESSION_TRANSFERS)]
+        time.sleep(0.5)
+        for transfer in slow:
+            transfer.pause()
+        quick = clientio.FileTransfer(
+                "quick", open(os.path.join(client_root, "quick"), "wb"))
+        waitFor([quick], 10)
+        self.assertTrue(quick.getStatus()[4])
+        self.assertEqual(readFile(client_root, "quick"), data)
+        for transfer in slow:
+            transfer.cancel()
+        waitFor(slow)
+
+
+    def testQueuedTransferStartsFirstWhenMovedToFront(self):
+        clientio.setMaxTransfers(1)
+        writeFile(server_root, "order", 500000)
+        transfers = [clientio.FileTransfer(
+                             "order", open(os.path.join(client_root,
+                                                        "order%d" % i),
+                                           "wb"), rate_limit=2000000)
+                     for i in xrange(3)]
+        transfers[2].moveToFront()
+        while not transfers[2].getStatus()[5]:
+            time.sleep(0.01)
+        self.assertFalse(transfers[1].getStatus()[5])
+        waitFor(transfers)
+        self.assertEqual([transfer.getStatus()[4] for transfer in transfers],
+                         [True] * 3)
+
+
+    def testFileIsFoundInDirectoryTransferWasMadeIn(self):
+        os.mkdir(os.path.join(server_root, "inside"))
+        data = writeFile(os.path.join(server_root, "inside"), "file", 1000)
+        writeFile(server_root, "file", 10)
+        clientio.chDir("inside")
+        try:
+            transfer = clientio.FileTransfer(
+                    "file", open(os.path.join(client_root, "inside"), "wb"))
+        finally:
+            clientio.chDir("..")
+        waitFor([transfer])
+        self.assertEqual(readFile(client_root, "inside"), data)
+
+
+    def testMissingFileFailsTransfer(self):
+        transfer = clientio.FileTransfer(
+                "missing", open(os.path.join(client_root, "missing"), "wb"))
+        waitFor([transfer])
+        self.assertTrue(transfer.getStatus()[3])
+
+#End of SchedulingTest class
+
+
+#ListingCacheTest class - tests listings are only sent again when changed
+class ListingCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=server_root)
+        writeFile(self.directory, "a", 10)
+        writeFile(self.directory, "b", 20)
+        self.getValidator = clientio.getValidator
+        clientio.chDir(os.path.basename(self.directory))
+
+
+    def tearDown(self):
+        clientio.getValidator = self.getValidator
+        clientio.chDir("..")
+        shutil.rmtree(self.directory)
+
+
+    #dropListingsOnRequest method - to empty the cache once a request is made
+    def dropListingsOnRequest(self):
+        def getValidator(command):
+            validator = self.getValidator(command)
+            with clientio.listing_lock:
+                clientio.listing_cache.clear()
+                clientio.listing_entries = 0
+            return validator
+        clientio.getValidator = getValidator
+    #End of dropListingsOnRequest method
+
+
+    #listPages method - to get every entry of a paged listing
+    def listPages(self):
+        return [entry[0:2] for (path, entries, cursor)
+                in clientio.listDirPages(page_size=1) for entry in entries]
+    #End of listPages method
+
+
+    def testChangingDirectoryGivesItsPath(self):
+        path = clientio.remote_path
+        self.assertTrue(path.endswith(os.path.basename(self.directory)))
+        clientio.chDir("..")
+        self.assertNotEqual(clientio.remote_path, path)
+        self.assertEqual(clientio.remote_path, clientio.getDir())
+        clientio.chDir(os.path.basename(self.directory))
+        self.assertEqual(clientio.remote_path, path)
+
+
+    def testListingIsKeptAcrossChangesOfDirectory(self):
+        listing = clientio.listDir()
+        clientio.chDir("..")
+        clientio.chDir(os.path.basename(self.directory))
+        self.assertNotEqual(clientio.getValidator(clientio.LISTDIR_CMD), None)
+        self.assertEqual(clientio.listDir(), listing)
+
+
+    def testChangedListingIsSentAgain(self):
+        clientio.listDir()
+        writeFile(self.directory, "c", 30)
+        self.assertEqual(sorted(clientio.listDir()),
+                         [("a", 10), ("b", 20), ("c", 30)])
+
+
+    def testListingDroppedFromCacheIsAskedForAgain(self):
+        listing = clientio.listDir()
+        self.dropListingsOnRequest()
+        self.assertEqual(clientio.listDir(), listing)
+
+
+    def testPagedListingDroppedFromCacheIsAskedForAgain(self):
+        self.assertEqual(self.listPages(), [("a", 10), ("b", 20)])
+        self.assertEqual(self.listPages(), [("a", 10), ("b", 20)])
+        self.dropListingsOnRequest()
+        self.assertEqual(self.listPages(), [("a", 10), ("b", 20)])
+
+#End of ListingCacheTest class
+
+
+#RemoteFileTest class - tests reading parts of a file on the server
+class RemoteFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = writeFile(server_root, "remote", 100000)
+        self.readFileRange = clientio.readFileRange
+        #(offset, length) of each range fetched
+        self.fetched = []
+        def readFileRange(filename, offset, length):
+            self.fetched.append((offset, length))
+            return self.readFileRange(filename, offset, length)
+        clientio.readFileRange = readFileRange
+        self.remote = clientio.RemoteFile("remote", block_size=1000,
+                                          cache_blocks=8, readahead=4)
+
+
+    def tearDown(self):
+        clientio.readFileRange = self.readFileRange
+
+
+    def testReadMoreThanCacheFetchesEachBlockOnce(self):
+        self.remote.seek(500)
+        self.assertEqual(self.remote.read(20000), self.data[500:20500])
+        self.assertEqual(self.fetched, [(0, 21000)])
+        self.assertEqual(self.remote.read(), self.data[20500:])
+        self.assertEqual(self.fetched, [(0, 21000), (21000, 79000)])
+
+
+    def testRepeatReadIsCached(self):
+        self.remote.seek(5000)
+        self.assertEqual(self.remote.read(1500), self.data[5000:6500])
+        self.remote.seek(5000)
+        self.assertEqual(self.remote.read(1500), self.data[5000:6500])
+        self.assertEqual(self.fetched, [(5000, 2000)])
+
+
+    def testReadingStraightThroughReadsFurtherAhead(self):
+        data = []
+        while True:
+            piece = self.remote.read(1000)
+            if piece == "":
+                break
+            data.append(piece)
+        self.assertEqual("".join(data), self.data)
+        self.assertEqual(self.fetched[0:4], [(0, 2000), (2000, 3000),
+                                             (5000, 5000), (10000, 5000)])
+
+
+    def testSeekingAwayStopsReadahead(self):
+        self.remote.read(1000)
+        self.remote.read(1000)
+        self.remote.read(1000)
+        self.remote.seek(50000)
+        self.assertEqual(self.remote.read(10), self.data[50000:50010])
+        self.assertEqual(self.fetched[-1], (50000, 1000))
+
+
+    def testSeek(self):
+        self.remote.seek(-10, os.SEEK_END)
+        self.assertEqual(self.remote.tell(), 99990)
+        self.remote.seek(-20, os.SEEK_CUR)
+        self.assertEqual(self.remote.read(30), self.data[99970:])
+        self.assertEqual(self.remote.read(), "")
+        self.remote.seek(200000)
+        self.assertEqual(self.remote.read(10), "")
+        self.assertRaises(IOError, self.remote.seek, -1)
+
+
+    def testReadinto(self):
+        buffer = bytearray(10)
+        self.remote.seek(99995)
+        self.assertEqual(self.remote.readinto(buffer), 5)
+        self.assertEqual(str(buffer[:5]), self.data[99995:])
+
+
+    def testClosedFile(self):
+        self.remote.close()
+        self.assertRaises(ValueError, self.remote.read)
+        self.assertRaises(ValueError, self.remote.seek, 0)
+
+#End of RemoteFileTest class
+
+
+#DeltaUploadTest class - tests replacing files on the server
+class DeltaUploadTest(unittest.TestCase):
+
+    #replace method - to upload data over a file on the server
+    def replace(self, name, data):
+        with open(os.path.join(client_root, name), "wb") as file_object:
+            file_object.write(data)
+        transfer = clientio.FileTransfer(
+                name, open(os.path.join(client_root, name), "rb"), len(data),
+                download=False, use_delta=True, dedupe=False)
+        waitFor([transfer])
+        self.assertTrue(transfer.getStatus()[4])
+        self.assertEqual(readFile(server_root, name), data)
+        return transfer
+    #End of replace method
+
+
+    def testChangedFileIsReplacedUsingDelta(self):
+        #Enough blocks for the signatures to take several messages
+        basis = writeFile(server_root, "basis", 4 * 1024 * 1024)
+        transfer = self.replace("basis", basis[:1000000] + "inserted" +
+                                         basis[1000100:] + "appended")
+        self.assertEqual(transfer.block_size, 2048)
+
+
+    def testSmallFileIsSentWhole(self):
+        writeFile(server_root, "small", 1000)
+        transfer = self.replace("small", os.urandom(2000))
+        self.assertEqual(transfer.block_size, None)
+
+
+    def testNewFileIsSentWhole(self):
+        transfer = self.replace("new", os.urandom(300000))
+        self.assertEqual(transfer.block_size, None)
+
+#End of DeltaUploadTest class
+
+
+#SegmentedDownloadTest class - tests downloads split into segments
+class SegmentedDownloadTest(unittest.TestCase):
+
+    #download method - to download a file of a size in segments
+    def download(self, name, size, segments=clientio.SEGMENTS):
+        data = writeFile(server_root, name, size)
+        download = clientio.SegmentedDownload(
+                name, open(os.path.join(client_root, name), "wb"), segments)
+        waitFor([download])
+        self.assertEqual(download.getStatus()[0:5:4], (size, True))
+        self.assertEqual(readFile(client_root, name), data)
+        return [transfer.segment for transfer in download.transfers]
+    #End of download method
+
+
+    def testSegmentsAreNoSmallerThanMinimum(self):
+        size = 2 * clientio.SEGMENT_MIN_SIZE + 123
+        half = clientio.SEGMENT_MIN_SIZE + 62
+        self.assertEqual(self.download("segmented", size),
+                         [(0, half), (half, size - half)])
+
+
+    def testSegmentsAreSplitEvenly(self):
+        size = 3 * clientio.SEGMENT_MIN_SIZE + 2
+        third = clientio.SEGMENT_MIN_SIZE + 1
+        self.assertEqual(self.download("thirds", size, 3),
+                         [(0, third), (third, third), (2 * third, third - 1)])
+
+
+    def testSmallFileIsOneSegment(self):
+        self.assertEqual(self.download("unsegmented", 1000), [(0, 1000)])
+
+
+    def testEmptyFile(self):
+        self.assertEqual(self.download("nothing", 0), [(0, 0)])
+
+#End of SegmentedDownloadTest class
+
+
+#ResumeTest class - tests carrying on from transfers which were cut short
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = writeFile(server_root, "resumed", 300000)
+        self.properties = clientio.getFileProperties("resumed")
+
+
+    #resumeDownload method - to download the rest of a partial file
+    def resumeDownload(self, have, validator):
+        with open(os.path.join(client_root, "resumed"), "wb") as file_object:
+            file_object.write(have)
+        transfer = clientio.FileTransfer(
+                "resumed", open(os.path.join(client_root, "resumed"), "ab"),
+                resume=True, validator=validator)
+        waitFor([transfer])
+        return transfer
+    #End of resumeDownload method
+
+
+    #partialUpload method - to leave a partial upload on the server
+    def partialUpload(self, name, data, have):
+        with open(os.path.join(client_root, name), "wb") as file_object:
+            file_object.write(data)
+        validator = fileviewer.makeValidator(
+                len(data), os.stat(os.path.join(client_root, name)).st_mtime)
+        path = fileviewer.Filespace(server_root).partialPath(name, validator)
+        with open(path, "wb") as file_object:
+            file_object.write(have)
+        return path
+    #End of partialUpload method
+
+
+    #upload method - to upload a file written by partialUpload()
+    def upload(self, name, resume=True):
+        file_object = open(os.path.join(client_root, name), "rb")
+        transfer = clientio.FileTransfer(
+                name, file_object, os.fstat(file_object.fileno()).st_size,
+                download=False, resume=resume, dedupe=False)
+        waitFor([transfer])
+        return transfer
+    #End of upload method
+
+
+    def testDownloadCarriesOnAfterWhatIsThere(self):
+        transfer = self.resumeDownload(self.data[:100000],
+                                       list(self.properties[1:4:2]))
+        self.assertTrue(transfer.getStatus()[4])
+        self.assertEqual(readFile(client_root, "resumed"), self.data)
+
+
+    def testDownloadOfChangedFileFails(self):
+        transfer = self.resumeDownload(self.data[:100000],
+                                       [self.properties[1],
+                                        self.properties[3] - 10])
+        self.assertTrue(transfer.getStatus()[3])
+        self.assertEqual(readFile(client_root, "resumed"),
+                         self.data[:100000])
+
+
+    def testDownloadOfWholeFileSendsNothing(self):
+        transfer = self.resumeDownload(self.data,
+                                       list(self.properties[1:4:2]))
+        self.assertTrue(transfer.getStatus()[4])
+        self.assertEqual(readFile(client_root, "resumed"), self.data)
+
+
+    def testUploadCarriesOnFromPartialFile(self):
+        data = os.urandom(200000)
+        #Not what the client has, to show it was kept rather than sent
+        path = self.partialUpload("uploaded", data, "x" * 50000)
+        self.assertTrue(self.upload("uploaded").getStatus()[4])
+        self.assertEqual(readFile(server_root, "uploaded"),
+                         "x" * 50000 + data[50000:])
+        self.assertFalse(os.path.exists(path))
+
+
+    def testUploadOfChangedFileStartsAgain(self):
+        data = os.urandom(200000)
+        path = self.partialUpload("changed", data, "x" * 50000)
+        old = time.time() - 100
+        os.utime(os.path.join(client_root, "changed"), (old, old))
+        self.assertTrue(self.upload("changed").getStatus()[4])
+        self.assertEqual(readFile(server_root, "changed"), data)
+        self.assertFalse(os.path.exists(path))
+
+
+    def testUploadWithoutResumeLeavesNoPartialFile(self):
+        data = os.urandom(1000)
+        with open(os.path.join(client_root, "whole"), "wb") as file_object:
+            file_object.write(data)
+        self.assertTrue(self.upload("whole", False).getStatus()[4])
+        self.assertEqual(readFile(server_root, "whole"), data)
+        self.assertEqual([name for name in os.listdir(server_root)
+                          if name.endswith(fileviewer.PARTIAL_SUFFIX)], [])
+
+#End of ResumeTest class
+
+
+#CompressionTest class - tests data is compressed on the way when worth it
+class CompressionTest(unittest.TestCase):
+
+    TEXT = "".join("line %d of the text\n" % x for x in xrange(50000))
+
+    #download method - to download a file, returning the transfer
+    def download(self, name, data, **options):
+        with open(os.path.join(server_root, name), "wb") as file_object:
+            file_object.write(data)
+        transfer = clientio.FileTransfer(
+                name, open(os.path.join(client_root, name), "wb"), **options)
+        waitFor([transfer])
+        self.assertTrue(transfer.getStatus()[4])
+        self.assertEqual(readFile(client_root, name), data)
+        return transfer
+    #End of download method
+
+
+    #upload method - to upload a file, returning the transfer
+    def upload(self, name, data, **options):
+        with open(os.path.join(client_root, name), "wb") as file_object:
+            file_object.write(data)
+        transfer = clientio.FileTransfer(
+                name, open(os.path.join(client_root, name), "rb"), len(data),
+                download=False, dedupe=False, **options)
+        waitFor([transfer])
+        self.assertTrue(transfer.getStatus()[4])
+        self.assertEqual(readFile(server_root, name), data)
+        return transfer
+    #End of upload method
+
+
+    def testTextIsCompressedOnDownload(self):
+        self.assertTrue(self.download("text.down", self.TEXT).compress)
+
+
+    def testTextIsCompressedOnMultiplexedDownload(self):
+        self.assertTrue(self.download("text.mux", self.TEXT,
+                                      multiplexed=True).compress)
+
+
+    def testRandomDataIsNotCompressed(self):
+        self.assertFalse(self.download("random.down",
+                                       os.urandom(200000)).compress)
+
+
+    def testCompressionCanBeTurnedOff(self):
+        self.assertFalse(self.download("text.off", self.TEXT,
+                                       compress=False).compress)
+
+
+    def testTextIsCompressedOnUpload(self):
+        self.assertTrue(self.upload("text.up", self.TEXT,
+                                    multiplexed=False).compress)
+
+
+    def testTextIsCompressedOnMultiplexedUpload(self):
+        self.assertTrue(self.upload("text.upmux", self.TEXT,
+                                    multiplexed=True).compress)
+
+
+    def testFileText(self):
+        with open(os.path.join(server_root, "text.txt"), "wb") as \
+                file_object:
+            file_object.write(self.TEXT)
+        self.assertEqual(clientio.getFileText("text.txt"), self.TEXT)
+
+#End of CompressionTest class
+
+
+#SearchTest class - tests searching the contents of files on the server
+class SearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=server_root)
+        os.mkdir(os.path.join(self.directory, "sub"))
+        for (name, data) in (("a.txt", "one\nfind me\n"),
+                             ("sub/b.txt", "FIND ME too\nand find me\n"),
+                             ("c.bin", "\x00find me\x00" * 10)):
+            with open(os.path.join(self.directory, name), "wb") as \
+                    file_object:
+                file_object.write(data)
+        clientio.chDir(os.path.basename(self.directory))
+
+
+    def tearDown(self):
+        clientio.chDir("..")
+        shutil.rmtree(self.directory)
+
+
+    #search method - to get every hit of a search, in order of path
+    def search(self, pattern, **options):
+        hits = []
+        truncated = False
+        for (found, truncated) in clientio.searchFiles(pattern, **options):
+            hits.extend(found)
+        return (sorted(hits), truncated)
+    #End of search method
+
+
+    def testHitsAreRelativeToCurrentDirectory(self):
+        self.assertEqual(self.search("find me"),
+                         ([("a.txt", 2, "find me"),
+                           ("sub/b.txt", 2, "and find me")], False))
+
+
+    def testIgnoringCase(self):
+        self.assertEqual(len(self.search("find me", ignore_case=True)[0]), 3)
+
+
+    def testRegex(self):
+        self.assertEqual(self.search("^[a-z]+ find", regex=True),
+                         ([("sub/b.txt", 2, "and find me")], False))
+
+
+    def testInvalidRegex(self):
+        self.assertRaises(OSError, self.search, "a(", regex=True)
+
+
+    def testStopsAtMostHits(self):
+        (hits, truncated) = self.search("find me", ignore_case=True,
+                                        max_hits=1)
+        self.assertEqual(len(hits), 1)
+        self.assertTrue(truncated)
+
+#End of SearchTest class
+
+
+#PagingTest class - tests listing a directory a page at a time
+class PagingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=server_root)
+        os.mkdir(os.path.join(self.directory, "m_dir"))
+        for i in xrange(25):
+            writeFile(self.directory, "f%02d" % i, i)
+        clientio.chDir(os.path.basename(self.directory))
+
+
+    def tearDown(self):
+        clientio.chDir("..")
+        shutil.rmtree(self.directory)
+
+
+    #names method - to get the names in pages of a listing
+    def names(self, pages):
+        return [[entry[0] for entry in entries]
+                for (path, entries, cursor) in pages]
+    #End of names method
+
+
+    def testPagesAreSortedByName(self):
+        pages = list(clientio.listDirPages(page_size=10))
+        names = ["f%02d" % i for i in xrange(25)]
+        self.assertEqual(self.names(pages),
+                         [names[0:10], names[10:20], names[20:25] + ["m_dir/"]])
+        self.assertEqual([cursor for (path, entries, cursor) in pages],
+                         ["f09", "f19", "m_dir"])
+        self.assertEqual(pages[0][1][3][0:2], ("f03", 3))
+        self.assertEqual(pages[2][1][-1][4], "dir")
+
+
+    def testWholeListingIsSentInOnePageWhenSmall(self):
+        self.assertEqual(len(list(clientio.listDirPages())), 1)
+
+
+    def testCarriesOnFromCursor(self):
+        self.assertEqual(self.names(clientio.listDirPages("f20", 3)),
+                         [["f21", "f22", "f23"], ["f24", "m_dir/"]])
+
+
+    def testChangesBetweenPagesAreNotMissedOrRepeated(self):
+        pages = clientio.listDirPages(page_size=10)
+        first = pages.next()
+        pages.close()
+        os.remove(os.path.join(self.directory, "f05"))
+        os.remove(os.path.join(self.directory, "f15"))
+        #Before the cursor, so only seen by listing again from the start
+        writeFile(self.directory, "f05a", 0)
+        writeFile(self.directory, "f15a", 0)
+        names = self.names([first] + list(clientio.listDirPages(first[2],
+                                                                10)))
+        expected = ["f%02d" % i for i in xrange(25) if i != 15]
+        expected.insert(15, "f15a")
+        expected.append("m_dir/")
+        self.assertEqual(sum(names, []), expected)
+
+
+    def testPageSizeIsCapped(self):
+        for i in xrange(25, 4200):
+            writeFile(self.directory, "f%04d" % i, 0)
+        pages = list(clientio.listDirPages(page_size=10000))
+        self.assertEqual([len(entries) for (path, entries, cursor) in pages],
+                         [4096, 4200 - 4096 + 1])
+
+
+    def testBadCursor(self):
+        self.assertRaises(OSError, list, clientio.listDirPages(5))
+
+#End of PagingTest class
+
+###############################################################################
+# End of tests
+###############################################################################
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Tests for the Compression module.
+
+Usage:
+    Run as main, or using python -m unittest test_compression
+"""
+import os
+import unittest
+import zlib
+
+import compression
+
+
+
+
+###############################################################################
+# Tests
+###############################################################################
+
+#WorthCompressingTest class - tests deciding whether to compress
+class WorthCompressingTest(unittest.TestCase):
+
+    def testText(self):
+        self.assertTrue(compression.worthCompressing("some text\n" * 100))
+
+
+    def testRandomData(self):
+        self.assertFalse(compression.worthCompressing(os.urandom(65536)))
+
+
+    def testCompressedData(self):
+        data = zlib.compress("".join("line %d: %d\n" % (x, x * x * 7919)
+                                     for x in xrange(20000)), 9)
+        self.assertFalse(compression.worthCompressing(data))
+
+
+    def testRepetitiveBinaryData(self):
+        self.assertTrue(compression.worthCompressing("\x00\xff\x01" * 20000))
+
+
+    def testEmpty(self):
+        self.assertFalse(compression.worthCompressing(""))
+
+#End of WorthCompressingTest class
+
+
+#EncoderDecoderTest class - tests data survives being sent in pieces
+class EncoderDecoderTest(unittest.TestCase):
+
+    #roundTrip method - to encode and decode data a piece at a time
+    def roundTrip(self, data, compress, piece_size=1000):
+        encoder = compression.Encoder(compress)
+        sent = [encoder.encode(data[start:start + piece_size])
+                for start in xrange(0, len(data), piece_size)]
+        sent.append(encoder.finish())
+        decoder = compression.Decoder(compress)
+        return ("".join(sent),
+                "".join(decoder.decode(piece) for piece in sent))
+    #End of roundTrip method
+
+
+    def testCompressed(self):
+        data = "a line of text\n" * 10000
+        (sent, received) = self.roundTrip(data, True)
+        self.assertEqual(received, data)
+        self.assertTrue(len(sent) < len(data) / 10)
+
+
+    def testPassedThrough(self):
+        data = os.urandom(5000)
+        self.assertEqual(self.roundTrip(data, False), (data, data))
+
+
+    def testEmpty(self):
+        self.assertEqual(self.roundTrip("", True)[1], "")
+
+
+    def testBadData(self):
+        decoder = compression.Decoder(True)
+        self.assertRaises(zlib.error, decoder.decode, "not compressed")
+
+#End of EncoderDecoderTest class
+
+###############################################################################
+# End of tests
+###############################################################################
+
+
+if __name__ == "__main__":
+    unittest.main()
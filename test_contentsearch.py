@@ -0,0 +1,153 @@
+"""
+Tests for the ContentSearch module.
+
+Usage:
+    Run as main, or using python -m unittest test_contentsearch
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import contentsearch
+
+
+
+
+###############################################################################
+# Tests
+###############################################################################
+
+#MatcherTest class - tests matching lines against a pattern
+class MatcherTest(unittest.TestCase):
+
+    def testLiteral(self):
+        matcher = contentsearch.makeMatcher("a.b")
+        self.assertTrue(matcher("xa.by"))
+        self.assertFalse(matcher("axb"))
+        self.assertFalse(matcher("A.B"))
+
+
+    def testLiteralIgnoringCase(self):
+        matcher = contentsearch.makeMatcher("a.b(", ignore_case=True)
+        self.assertTrue(matcher("xA.B(y"))
+        self.assertFalse(matcher("axb("))
+
+
+    def testRegex(self):
+        matcher = contentsearch.makeMatcher("^def [a-z]+\\(", regex=True)
+        self.assertTrue(matcher("def search(self):"))
+        self.assertFalse(matcher("    def search(self):"))
+
+
+    def testRegexIgnoringCase(self):
+        matcher = contentsearch.makeMatcher("err(or)?", True, True)
+        self.assertTrue(matcher("ERROR: failed"))
+
+
+    def testInvalidRegex(self):
+        self.assertRaises(ValueError, contentsearch.makeMatcher, "a(", True)
+
+
+    def testRegexTooLong(self):
+        pattern = "a" * (contentsearch.MAX_PATTERN_LENGTH + 1)
+        self.assertRaises(ValueError, contentsearch.makeMatcher, pattern,
+                          True)
+        #A literal string of any length is fine
+        contentsearch.makeMatcher(pattern)
+
+#End of MatcherTest class
+
+
+#ContentSearchTest class - tests searching a tree of files
+class ContentSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, "sub", "deeper"))
+        self.write("top.txt", "first line\nneedle here\nlast line\n")
+        self.write("sub/a.txt", "needle\n\nno\r\nneedle again\r\n")
+        self.write("sub/deeper/b.txt", "nothing\n" * 100 + "needle")
+        self.write("binary.bin", "\x00\x01needle\x02" * 100)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    #write method - to make a file in the tree
+    def write(self, path, data):
+        with open(os.path.join(self.directory, *path.split("/")), "wb") as \
+                file_object:
+            file_object.write(data)
+    #End of write method
+
+
+    #search method - to get every hit of a search, in order of path
+    def search(self, pattern, **options):
+        search = contentsearch.ContentSearch(
+                self.directory, contentsearch.makeMatcher(pattern), **options)
+        hits = sorted(hit for hit in search.results() if hit != None)
+        return (hits, search.truncated)
+    #End of search method
+
+
+    def testHitsInEveryTextFile(self):
+        self.assertEqual(self.search("needle"),
+                         ([("sub/a.txt", 1, "needle"),
+                           ("sub/a.txt", 4, "needle again"),
+                           ("sub/deeper/b.txt", 101, "needle"),
+                           ("top.txt", 2, "needle here")], False))
+
+
+    def testNoHits(self):
+        self.assertEqual(self.search("haystack"), ([], False))
+
+
+    def testStopsAtMostHits(self):
+        (hits, truncated) = self.search("needle", max_hits=2, workers=1)
+        self.assertEqual(len(hits), 2)
+        self.assertTrue(truncated)
+
+
+    def testStopsAtTimeLimit(self):
+        self.assertEqual(self.search("needle", time_limit=0), ([], True))
+
+
+    def testLongLineIsSearchedInPieces(self):
+        self.write("long.txt", "x" * 10000 + "needle" + "x" * 10000 +
+                               "\nneedle\n")
+        hits = [hit for hit in self.search("needle", line_limit=1000)[0]
+                if hit[0] == "long.txt"]
+        self.assertEqual([(path, number) for (path, number, text) in hits],
+                         [("long.txt", 1), ("long.txt", 2)])
+        #The text is that of the piece the match was in
+        self.assertTrue(hits[0][2].startswith("needle"))
+
+
+    def testTextOfHitIsCut(self):
+        self.write("wide.txt", "needle" + "y" * 1000 + "\n")
+        hits = [hit for hit in self.search("needle")[0]
+                if hit[0] == "wide.txt"]
+        self.assertEqual(len(hits[0][2]), contentsearch.MAX_LINE_LENGTH)
+
+
+    def testAbandonedSearchStops(self):
+        search = contentsearch.ContentSearch(
+                self.directory, contentsearch.makeMatcher("needle"))
+        results = search.results()
+        hit = results.next()
+        while hit == None:
+            hit = results.next()
+        results.close()
+        self.assertTrue(search.stopped.is_set())
+
+#End of ContentSearchTest class
+
+###############################################################################
+# End of tests
+###############################################################################
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+"""
+Tests for the Delta module.
+
+Usage:
+    Run as main, or using python -m unittest test_delta
+"""
+import random
+import StringIO
+import unittest
+
+import delta
+
+
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+#randomData function - to make data which doesn't repeat
+def randomData(size, seed):
+    generator = random.Random(seed)
+    return "".join(chr(generator.randrange(256)) for x in xrange(size))
+#End of randomData function
+
+###############################################################################
+# End of helpers
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Tests
+###############################################################################
+
+#DeltaTest class - tests new files are rebuilt from a delta and their basis
+class DeltaTest(unittest.TestCase):
+
+    BLOCK_SIZE = 2048
+
+    def setUp(self):
+        self.basis = randomData(100000, 1)
+
+
+    #roundTrip method - to rebuild the new file from the basis and the delta
+    def roundTrip(self, basis, new):
+        """
+        Returns:
+            Tuple of (rebuilt file, bytes of literal data sent).
+        """
+        signatures = delta.getSignatures(StringIO.StringIO(basis),
+                                         self.BLOCK_SIZE)
+        output = StringIO.StringIO()
+        literal = 0
+        for operation in delta.computeDelta(StringIO.StringIO(new),
+                                            signatures, self.BLOCK_SIZE):
+            if operation[0] == delta.LITERAL:
+                self.assertTrue(0 < len(operation[1]) <= delta.LITERAL_SIZE)
+                output.write(operation[1])
+                literal += len(operation[1])
+            else:
+                (first, count, covered) = operation[1:]
+                copied = delta.copyBlocks(StringIO.StringIO(basis), output,
+                                          first, count, self.BLOCK_SIZE)
+                self.assertEqual(copied, covered)
+        return (output.getvalue(), literal)
+    #End of roundTrip method
+
+
+    #assertRebuilt method - to check the new file is rebuilt, and how cheaply
+    def assertRebuilt(self, basis, new, most_literal):
+        (rebuilt, literal) = self.roundTrip(basis, new)
+        self.assertEqual(rebuilt, new)
+        self.assertTrue(literal <= most_literal,
+                        "%d bytes of literal data sent" % literal)
+    #End of assertRebuilt method
+
+
+    def testSameFile(self):
+        self.assertRebuilt(self.basis, self.basis, 0)
+
+
+    def testInsertion(self):
+        new = self.basis[:50001] + "inserted" + self.basis[50001:]
+        self.assertRebuilt(self.basis, new, 2 * self.BLOCK_SIZE + 8)
+
+
+    def testDeletion(self):
+        new = self.basis[:30000] + self.basis[30100:]
+        self.assertRebuilt(self.basis, new, 2 * self.BLOCK_SIZE)
+
+
+    def testChangeAtStartAndEnd(self):
+        new = "start" + self.basis[10:-10] + "end"
+        self.assertRebuilt(self.basis, new, 3 * self.BLOCK_SIZE)
+
+
+    def testAppended(self):
+        new = self.basis + "more"
+        self.assertRebuilt(self.basis, new, self.BLOCK_SIZE + 4)
+
+
+    def testMovedBlocks(self):
+        new = self.basis[60000:] + self.basis[:60000]
+        self.assertRebuilt(self.basis, new, 3 * self.BLOCK_SIZE)
+
+
+    def testEmptyBasis(self):
+        self.assertEqual(delta.getSignatures(StringIO.StringIO(""),
+                                             self.BLOCK_SIZE), [])
+        self.assertRebuilt("", self.basis, len(self.basis))
+
+
+    def testEmptyNewFile(self):
+        self.assertRebuilt(self.basis, "", 0)
+
+
+    def testNewFileShorterThanBlock(self):
+        self.assertRebuilt(self.basis, self.basis[:100], 100)
+
+
+    def testUnrelatedFile(self):
+        new = randomData(300000, 2)
+        self.assertRebuilt(self.basis, new, len(new))
+
+
+    def testBlocksFoundAgainAfterLongChangeInMiddle(self):
+        change = randomData(delta.ROLL_LIMIT + 1000, 4)
+        new = self.basis[:40000] + change + self.basis[40000:]
+        self.assertRebuilt(self.basis, new,
+                           len(change) +
+                           (delta.SKIP_BLOCKS + 2) * self.BLOCK_SIZE)
+
+
+    def testBlocksFoundAfterLongChange(self):
+        #Only one block in SKIP_BLOCKS + 1 is rolled through by then, so the
+        #basis after the change may be found a few blocks late
+        change = randomData(delta.ROLL_LIMIT + 1000, 3)
+        self.assertRebuilt(self.basis, change + self.basis,
+                           len(change) +
+                           (delta.SKIP_BLOCKS + 1) * self.BLOCK_SIZE)
+
+
+    def testLastBlockIsShort(self):
+        signatures = delta.getSignatures(StringIO.StringIO(self.basis),
+                                         self.BLOCK_SIZE)
+        self.assertEqual(len(signatures), 49)
+        self.assertEqual(signatures[-1],
+                         [delta.weakChecksum(self.basis[-1696:]),
+                          delta.strongChecksum(self.basis[-1696:])])
+
+
+    def testBlockSize(self):
+        self.assertEqual(delta.blockSize(0), delta.MIN_BLOCK_SIZE)
+        self.assertEqual(delta.blockSize(10 ** 8), 10000)
+        self.assertEqual(delta.blockSize(10 ** 12), delta.MAX_BLOCK_SIZE)
+
+#End of DeltaTest class
+
+###############################################################################
+# End of tests
+###############################################################################
+
+
+if __name__ == "__main__":
+    unittest.main()
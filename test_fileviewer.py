@@ -0,0 +1,140 @@
+"""
+Tests for the FileViewer module's listing cache.
+
+Usage:
+    Run as main, or using python -m unittest test_fileviewer
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import fileviewer
+
+
+
+
+###############################################################################
+# Tests
+###############################################################################
+
+#ListingCacheTest class - tests listings are kept, and read again when stale
+class ListingCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = fileviewer.ListingCache()
+        self.max_age = fileviewer.LISTING_MAX_AGE
+        os.mkdir(os.path.join(self.directory, "sub"))
+        self.write("quiet", "quiet file")
+        self.write("busy", "busy")
+        self.age("quiet")
+        self.age("sub")
+        self.age("")
+
+
+    def tearDown(self):
+        fileviewer.LISTING_MAX_AGE = self.max_age
+        shutil.rmtree(self.directory)
+
+
+    #write method - to add to a file
+    def write(self, name, data):
+        with open(os.path.join(self.directory, name), "ab") as file_object:
+            file_object.write(data)
+    #End of write method
+
+
+    #age method - to make an entry look as if it was changed long ago
+    def age(self, name):
+        old = time.time() - 60
+        os.utime(os.path.join(self.directory, name), (old, old))
+    #End of age method
+
+
+    #sizes method - to get the size of each file in a cached listing
+    def sizes(self):
+        (names, entries) = self.cache.getListing(self.directory)
+        return dict((entry[0], entry[1]) for entry in entries)
+    #End of sizes method
+
+
+    def testNamesAreSorted(self):
+        (names, entries) = self.cache.getListing(self.directory)
+        self.assertEqual(names, ["busy", "quiet", "sub"])
+        self.assertEqual([entry[0] for entry in entries],
+                         ["busy", "quiet", "sub/"])
+
+
+    def testRepeatListingIsAHit(self):
+        first = self.cache.getListing(self.directory)
+        self.assertEqual(self.cache.getListing(self.directory), first)
+        self.assertEqual(self.cache.getStats(), (1, 1, 1))
+
+
+    def testDirectoryChangedJustNowIsNotKept(self):
+        self.write("new", "")
+        self.cache.getListing(self.directory)
+        self.assertEqual(self.cache.getStats(), (0, 1, 0))
+
+
+    def testAddedFileIsSeen(self):
+        self.cache.getListing(self.directory)
+        self.write("new", "new")
+        self.assertEqual(self.sizes()["new"], 3)
+
+
+    def testRecentlyModifiedFileGrowingInPlaceIsSeen(self):
+        self.assertEqual(self.sizes()["busy"], 4)
+        self.write("busy", "more")
+        self.assertEqual(self.sizes()["busy"], 8)
+        self.write("busy", "more")
+        self.assertEqual(self.sizes()["busy"], 12)
+        self.assertEqual(self.cache.getStats()[0:2], (2, 1))
+
+
+    def testQuietFileGrowingInPlaceIsSeenOnceListingIsOld(self):
+        self.assertEqual(self.sizes()["quiet"], 10)
+        self.write("quiet", "more")
+        self.age("quiet")
+        self.assertEqual(self.sizes()["quiet"], 10)
+        fileviewer.LISTING_MAX_AGE = 0
+        self.assertEqual(self.sizes()["quiet"], 14)
+
+
+    def testLargeDirectoryIsOnlyNamed(self):
+        (names, entries) = self.cache.getListing(self.directory, 2)
+        self.assertEqual(names, ["busy", "quiet", "sub"])
+        self.assertEqual(entries, None)
+        self.assertEqual(self.cache.getStats()[2], 0)
+
+
+    def testInvalidateDropsDirectoriesInside(self):
+        self.cache.getListing(self.directory)
+        self.cache.getListing(os.path.join(self.directory, "sub"))
+        self.cache.invalidate(self.directory + "/")
+        self.assertEqual(self.cache.getStats()[2], 0)
+
+
+    def testListingsMadeFromCacheMatchDirectory(self):
+        filespace = fileviewer.Filespace(self.directory)
+        for x in range(2):
+            self.assertEqual(filespace.getDirContents(self.directory),
+                             fileviewer.readDirContents(self.directory))
+            self.assertEqual(filespace.getDirSnapshot(self.directory),
+                             fileviewer.readDirSnapshot(self.directory))
+            self.assertEqual([name for (name, entry) in
+                              filespace.iterDirSnapshot(self.directory,
+                                                        "busy")],
+                             ["quiet", "sub"])
+
+#End of ListingCacheTest class
+
+###############################################################################
+# End of tests
+###############################################################################
+
+
+if __name__ == "__main__":
+    unittest.main()
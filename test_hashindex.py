@@ -0,0 +1,75 @@
+"""
+Tests for the HashIndex module.
+
+Usage:
+    Run as main, or using python -m unittest test_hashindex
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import hashindex
+
+
+
+
+###############################################################################
+# Tests
+###############################################################################
+
+#ScanTest class - tests finding files which were there before the index
+class ScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = hashindex.HashIndex()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    #write method - to make a file in the directory
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as file_object:
+            file_object.write(data)
+        return path
+    #End of write method
+
+
+    def testFindsScannedFile(self):
+        path = self.write("a", "contents")
+        self.index.scan(self.directory)
+        digest = hashlib.new(hashindex.HASH_NAME, "contents").hexdigest()
+        self.assertEqual(self.index.find(digest, len("contents")), path)
+
+
+    def testOnlyHashesFilesOfSizeLookedFor(self):
+        self.write("a", "contents")
+        self.write("b", "longer contents")
+        self.index.scan(self.directory)
+        self.index.find("0" * 64, len("contents"))
+        self.assertEqual(len(self.index.paths), 1)
+
+
+    def testChangedFileIsNotFound(self):
+        path = self.write("a", "contents")
+        self.index.scan(self.directory)
+        digest = hashlib.new(hashindex.HASH_NAME, "contents").hexdigest()
+        self.index.find(digest, len("contents"))
+        self.write("a", "CONTENTS")
+        os.utime(path, (0, 0))
+        self.assertEqual(self.index.find(digest, len("contents")), None)
+
+#End of ScanTest class
+
+###############################################################################
+# End of tests
+###############################################################################
+
+
+if __name__ == "__main__":
+    unittest.main()
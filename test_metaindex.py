@@ -0,0 +1,227 @@
+"""
+Tests for the MetaIndex module.
+
+Usage:
+    Run as main, or using python -m unittest test_metaindex
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import metaindex
+
+
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+#IndexTestCase class - a tree to index, and an index of it
+class IndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.root = os.path.join(self.directory, "root")
+        os.makedirs(os.path.join(self.root, "logs", "old"))
+        os.makedirs(os.path.join(self.root, "docs"))
+        self.write("top.txt", 10, 1000)
+        self.write("logs/a.log", 300, 2000)
+        self.write("logs/b.log", 200, 3000)
+        self.write("logs/old/c.log", 100, 4000)
+        self.write("docs/a_b.txt", 50, 5000)
+        self.write("docs/a%b.txt", 60, 6000)
+        self.index = metaindex.MetaIndex(self.root, os.path.join(
+                self.directory, "index.db"))
+        self.index.refresh()
+
+
+    def tearDown(self):
+        self.index.stop()
+        shutil.rmtree(self.directory)
+
+
+    #write method - to make a file of a size, modified at a time
+    def write(self, path, size, mtime=None):
+        full_path = os.path.join(self.root, *path.split("/"))
+        with open(full_path, "wb") as file_object:
+            file_object.write("x" * size)
+        if mtime != None:
+            os.utime(full_path, (mtime, mtime))
+    #End of write method
+
+
+    #keepDirTime method - to undo the change to a directory's time
+    def keepDirTime(self, path, change):
+        full_path = os.path.join(self.root, *path.split("/"))
+        status = os.stat(full_path)
+        change()
+        os.utime(full_path, (status.st_atime, status.st_mtime))
+    #End of keepDirTime method
+
+
+    #paths method - to get only the paths of found files
+    def paths(self, **conditions):
+        return [path for (path, size, mtime) in self.index.find(**conditions)]
+    #End of paths method
+
+#End of IndexTestCase class
+
+###############################################################################
+# End of helpers
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Tests
+###############################################################################
+
+#FindTest class - tests finding files in the index
+class FindTest(IndexTestCase):
+
+    def testEverythingSortedByPath(self):
+        self.assertEqual(self.paths(),
+                         ["docs/a%b.txt", "docs/a_b.txt", "logs/a.log",
+                          "logs/b.log", "logs/old/c.log", "top.txt"])
+
+
+    def testSizeAndTimeAreGiven(self):
+        self.assertEqual(self.index.find(name="top.txt"),
+                         [("top.txt", 10, 1000.0)])
+
+
+    def testGlob(self):
+        self.assertEqual(self.paths(name="*.log"),
+                         ["logs/a.log", "logs/b.log", "logs/old/c.log"])
+        self.assertEqual(self.paths(name="?.log"),
+                         ["logs/a.log", "logs/b.log", "logs/old/c.log"])
+        self.assertEqual(self.paths(name="[ab].*"),
+                         ["logs/a.log", "logs/b.log"])
+        self.assertEqual(self.paths(name="*.LOG"), [])
+
+
+    def testUnder(self):
+        self.assertEqual(self.paths(under="logs"),
+                         ["a.log", "b.log", "old/c.log"])
+        self.assertEqual(self.paths(under="logs/old"), ["c.log"])
+
+
+    def testUnderIsMatchedLiterally(self):
+        os.makedirs(os.path.join(self.root, "d_cs"))
+        self.write("d_cs/x", 1)
+        os.makedirs(os.path.join(self.root, "lo%s"))
+        self.write("lo%s/y", 1)
+        self.index.refresh()
+        self.assertEqual(self.paths(under="d_cs"), ["x"])
+        self.assertEqual(self.paths(under="lo%s"), ["y"])
+        self.assertEqual(self.paths(under="do"), [])
+
+
+    def testSizeRange(self):
+        self.assertEqual(self.paths(min_size=100, max_size=200),
+                         ["logs/b.log", "logs/old/c.log"])
+        self.assertEqual(self.paths(min_size=300), ["logs/a.log"])
+        self.assertEqual(self.paths(max_size=10), ["top.txt"])
+
+
+    def testTimeRange(self):
+        self.assertEqual(self.paths(min_mtime=2000, max_mtime=3000),
+                         ["logs/a.log", "logs/b.log"])
+        self.assertEqual(self.paths(min_mtime=6000), ["docs/a%b.txt"])
+
+
+    def testConditionsTogether(self):
+        self.assertEqual(self.paths(under="logs", name="*.log",
+                                    min_size=150, max_mtime=2500),
+                         ["a.log"])
+
+
+    def testLargestFirst(self):
+        self.assertEqual(self.paths(order=metaindex.LARGEST, limit=3),
+                         ["logs/a.log", "logs/b.log", "logs/old/c.log"])
+
+
+    def testNewestFirst(self):
+        self.assertEqual(self.paths(order=metaindex.NEWEST, limit=2),
+                         ["docs/a%b.txt", "docs/a_b.txt"])
+
+
+    def testUnknownOrder(self):
+        self.assertRaises(ValueError, self.index.find, order="oldest")
+
+#End of FindTest class
+
+
+#RefreshTest class - tests bringing the index up to date
+class RefreshTest(IndexTestCase):
+
+    def testUnchangedDirectoriesAreNotListed(self):
+        self.assertEqual(self.index.refresh(), 0)
+
+
+    def testAddedFileIsFound(self):
+        self.write("logs/d.log", 5)
+        self.assertEqual(self.index.refresh(), 1)
+        self.assertEqual(self.paths(under="logs", name="d.log"), ["d.log"])
+
+
+    def testRemovedDirectoryIsDropped(self):
+        shutil.rmtree(os.path.join(self.root, "logs", "old"))
+        self.index.refresh()
+        self.assertEqual(self.paths(name="*.log"),
+                         ["logs/a.log", "logs/b.log"])
+
+
+    def testReplacedDirectoryIsListed(self):
+        self.keepDirTime("", lambda: os.rename(
+                os.path.join(self.root, "docs"),
+                os.path.join(self.directory, "docs")))
+        os.makedirs(os.path.join(self.root, "docs"))
+        self.write("docs/new.txt", 1)
+        self.index.refresh()
+        self.assertEqual(self.paths(under="docs"), ["new.txt"])
+
+
+    def testFileChangedInPlaceNeedsFullRefresh(self):
+        self.write("logs/a.log", 5, 9000)
+        self.assertEqual(self.index.refresh(), 0)
+        self.assertEqual(self.index.find(name="a.log"),
+                         [("logs/a.log", 300, 2000.0)])
+        self.assertEqual(self.index.refresh(full=True), 4)
+        self.assertEqual(self.index.find(name="a.log"),
+                         [("logs/a.log", 5, 9000.0)])
+
+
+    def testIndexIsKeptBetweenRuns(self):
+        index = metaindex.MetaIndex(self.root, os.path.join(
+                self.directory, "index.db"))
+        self.assertEqual(len(index.find()), 6)
+        self.assertEqual(index.refresh(), 0)
+
+
+    def testBackgroundRefreshesAreFullEveryFullInterval(self):
+        self.write("logs/a.log", 5, 9000)
+        self.index.start(0.01, 0.05)
+        end = time.time() + 10
+        while self.index.find(name="a.log")[0][1] != 5 and time.time() < end:
+            time.sleep(0.01)
+        self.write("logs/a.log", 7, 9500)
+        while self.index.find(name="a.log")[0][1] != 7 and time.time() < end:
+            time.sleep(0.01)
+        self.assertEqual(self.index.find(name="a.log"),
+                         [("logs/a.log", 7, 9500.0)])
+
+#End of RefreshTest class
+
+###############################################################################
+# End of tests
+###############################################################################
+
+
+if __name__ == "__main__":
+    unittest.main()
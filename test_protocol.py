@@ -0,0 +1,184 @@
+"""
+Tests for the Protocol module.
+
+Usage:
+    Run as main, or using python -m unittest test_protocol
+"""
+import socket
+import unittest
+
+import protocol
+
+
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+#TrickleSocket class - a socket which hands over its data a little at a time
+class TrickleSocket(object):
+
+    def __init__(self, data, piece_size=1):
+        self.data = data
+        self.piece_size = piece_size
+
+
+    def recv(self, size):
+        piece = self.data[:min(size, self.piece_size)]
+        self.data = self.data[len(piece):]
+        return piece
+
+#End of TrickleSocket class
+
+
+#makeFrame function - to encode fields as a whole frame
+def makeFrame(fields):
+    body = protocol.encodeFields(fields)
+    return protocol.HEADER.pack(len(body)) + body
+#End of makeFrame function
+
+###############################################################################
+# End of helpers
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Tests
+###############################################################################
+
+#FieldTest class - tests each type of field survives a round trip
+class FieldTest(unittest.TestCase):
+
+    #roundTrip method - to encode and decode fields
+    def roundTrip(self, fields):
+        return protocol.decodeFields(protocol.encodeFields(fields))
+    #End of roundTrip method
+
+
+    def testString(self):
+        self.assertEqual(self.roundTrip(["", "a|b\nc\x00"]), ["", "a|b\nc\x00"])
+
+
+    def testUnicodeIsSentAsUtf8(self):
+        self.assertEqual(self.roundTrip([u"caf\xe9"]), ["caf\xc3\xa9"])
+
+
+    def testInts(self):
+        fields = [0, -1, 2 ** 62, -(2 ** 63)]
+        self.assertEqual(self.roundTrip(fields), fields)
+
+
+    def testBoolIsSentAsInt(self):
+        self.assertEqual(self.roundTrip([True, False]), [1, 0])
+
+
+    def testFloatIsExact(self):
+        fields = [0.1, 1e300, -2.5]
+        self.assertEqual(self.roundTrip(fields), fields)
+
+
+    def testNone(self):
+        self.assertEqual(self.roundTrip([None]), [None])
+
+
+    def testNestedLists(self):
+        fields = [[], ["a", [1, None]], ("b", 2.0)]
+        self.assertEqual(self.roundTrip(fields),
+                         [[], ["a", [1, None]], ["b", 2.0]])
+
+
+    def testUnsendableType(self):
+        self.assertRaises(ValueError, protocol.encodeFields, [object()])
+
+
+    def testUnknownTypeCode(self):
+        data = protocol.FIELD_HEADER.pack("x", 0)
+        self.assertRaises(ValueError, protocol.decodeFields, data)
+
+#End of FieldTest class
+
+
+#FramingTest class - tests whole frames sent through sockets
+class FramingTest(unittest.TestCase):
+
+    def setUp(self):
+        (self.sender, self.receiver) = socket.socketpair()
+
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+
+    def testFramesArriveWhole(self):
+        protocol.sendFrame(self.sender, ["first", 1])
+        protocol.sendFrame(self.sender, ["second", [2.5]])
+        self.assertEqual(protocol.receiveFrame(self.receiver), ["first", 1])
+        self.assertEqual(protocol.receiveFrame(self.receiver),
+                         ["second", [2.5]])
+
+
+    def testEmptyFrame(self):
+        protocol.sendFrame(self.sender, [])
+        self.assertEqual(protocol.receiveFrame(self.receiver), [])
+
+
+    def testFrameReceivedByteByByte(self):
+        frame = makeFrame(["WIN", 12, None, ["a", 0.5]])
+        self.assertEqual(protocol.receiveFrame(TrickleSocket(frame)),
+                         ["WIN", 12, None, ["a", 0.5]])
+
+
+    def testPartialHeader(self):
+        self.sender.sendall(makeFrame(["a"])[:2])
+        self.sender.close()
+        self.assertRaises(socket.error, protocol.receiveFrame, self.receiver)
+
+
+    def testConnectionClosedMidFrame(self):
+        self.sender.sendall(makeFrame(["abcdef"])[:-2])
+        self.sender.close()
+        self.assertRaises(socket.error, protocol.receiveFrame, self.receiver)
+
+
+    def testFrameLengthLongerThanData(self):
+        body = protocol.encodeFields(["a"])
+        self.sender.sendall(protocol.HEADER.pack(len(body) + 100) + body)
+        self.sender.close()
+        self.assertRaises(socket.error, protocol.receiveFrame, self.receiver)
+
+
+    def testFieldLengthPastEndOfFrame(self):
+        body = protocol.FIELD_HEADER.pack(protocol.STRING_TYPE, 100) + "abc"
+        frame = protocol.HEADER.pack(len(body)) + body
+        self.assertRaises(ValueError, protocol.receiveFrame,
+                          TrickleSocket(frame, len(frame)))
+
+
+    def testPartialFieldHeaderInFrame(self):
+        body = protocol.encodeFields(["a"]) + "s\x00"
+        frame = protocol.HEADER.pack(len(body)) + body
+        self.assertRaises(ValueError, protocol.receiveFrame,
+                          TrickleSocket(frame, len(frame)))
+
+
+    def testIntFieldOfWrongLength(self):
+        body = (protocol.FIELD_HEADER.pack(protocol.INT_TYPE, 2) + "\x00\x01" +
+                protocol.encodeFields(["abc"]))
+        frame = protocol.HEADER.pack(len(body)) + body
+        self.assertRaises(ValueError, protocol.receiveFrame,
+                          TrickleSocket(frame, len(frame)))
+
+#End of FramingTest class
+
+###############################################################################
+# End of tests
+###############################################################################
+
+
+if __name__ == "__main__":
+    unittest.main()
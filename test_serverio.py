@@ -0,0 +1,138 @@
+"""
+Tests for the ServerIO module.
+
+Usage:
+    Run as main, or using python -m unittest test_serverio
+"""
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+import serverio
+import transferengine
+import transfertuner
+
+
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+#fakeSendfile function - stands in for sendfile, where it isn't installed
+def fakeSendfile(out_fd, in_fd, offset, count):
+    os.lseek(in_fd, offset, os.SEEK_SET)
+    data = os.read(in_fd, count)
+    os.write(out_fd, data)
+    return len(data)
+#end of fakeSendfile function
+
+
+#receiveAll function - to receive from a socket until it is closed
+def receiveAll(sock, pieces):
+    data = sock.recv(65536)
+    while data != "":
+        pieces.append(data)
+        data = sock.recv(65536)
+#end of receiveAll function
+
+###############################################################################
+# End of helpers
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Tests
+###############################################################################
+
+#SendfileTest class - tests downloads sent using sendfile
+class SendfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.real_sendfile = serverio.sendfile
+        serverio.sendfile = fakeSendfile
+        self.data = os.urandom(300000)
+        (handle, self.path) = tempfile.mkstemp()
+        os.write(handle, self.data)
+        os.close(handle)
+
+
+    def tearDown(self):
+        serverio.sendfile = self.real_sendfile
+        os.remove(self.path)
+
+
+    #makeTransfer method - to make a download without a client session
+    def makeTransfer(self, sock):
+        transfer = serverio.FileTransfer.__new__(serverio.FileTransfer)
+        transfer.receiving = False
+        transfer.compress = False
+        transfer.file_object = open(self.path, "rb")
+        transfer.file_size = len(self.data)
+        transfer.bytes_transferred = 0
+        transfer.transfer_socket = sock
+        transfer.tuner = transfertuner.TransferTuner(sock, True)
+        transfer.control = transferengine.TransferControl()
+        transfer.rate_limit = transferengine.TokenBucket()
+        transfer.rate_limits = (transfer.rate_limit,
+                                transferengine.TokenBucket(),
+                                transferengine.TokenBucket())
+        transfer.limits = (transfer.control,) + transfer.rate_limits
+        return transfer
+    #End of makeTransfer method
+
+
+    #download method - to send the file through sendFileData
+    def download(self, rate=None):
+        (sender, receiver) = socket.socketpair()
+        pieces = []
+        reader = threading.Thread(target=receiveAll, args=(receiver, pieces))
+        reader.start()
+        transfer = self.makeTransfer(sender)
+        transfer.rate_limit.setRate(rate)
+        try:
+            transfer.sendFileData()
+        finally:
+            sender.close()
+            transfer.file_object.close()
+            reader.join()
+            receiver.close()
+        self.assertEqual(transfer.bytes_transferred, len(self.data))
+        return "".join(pieces)
+    #End of download method
+
+
+    def testSendsWholeFile(self):
+        self.assertEqual(self.download(), self.data)
+
+
+    def testSendsWholeFileWithRateLimit(self):
+        #Only the rate limits are asked for their rate, not the control
+        self.assertEqual(self.download(100000000), self.data)
+
+
+    def testCancelStopsTransfer(self):
+        (sender, receiver) = socket.socketpair()
+        transfer = self.makeTransfer(sender)
+        transfer.control.cancel()
+        try:
+            self.assertRaises(IOError, transfer.sendFileData)
+        finally:
+            transfer.file_object.close()
+            sender.close()
+            receiver.close()
+
+#End of SendfileTest class
+
+###############################################################################
+# End of tests
+###############################################################################
+
+
+if __name__ == "__main__":
+    unittest.main()
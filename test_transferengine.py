@@ -0,0 +1,116 @@
+"""
+Tests for the TransferEngine module.
+
+Usage:
+    Run as main, or using python -m unittest test_transferengine
+"""
+import unittest
+
+import transferengine
+
+
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+#FakeTransfer class - a transfer which only records that it was started
+class FakeTransfer(object):
+
+    def __init__(self):
+        self.started = False
+
+
+    def start(self):
+        self.started = True
+
+#End of FakeTransfer class
+
+###############################################################################
+# End of helpers
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Tests
+###############################################################################
+
+#GroupLimitTest class - tests the limit on the transfers of each group
+class GroupLimitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = transferengine.TransferEngine(3, max_per_group=2)
+
+
+    #add method - to add transfers for a group
+    def add(self, group, count):
+        transfers = [FakeTransfer() for i in xrange(count)]
+        for transfer in transfers:
+            self.engine.add(transfer, group=group)
+        return transfers
+    #End of add method
+
+
+    def testGroupCannotTakeEverySlot(self):
+        busy = self.add("a", 3)
+        other = self.add("b", 1)
+        self.assertEqual([t.started for t in busy], [True, True, False])
+        self.assertTrue(other[0].started)
+
+
+    def testNextOfGroupStartsWhenOneFinishes(self):
+        busy = self.add("a", 3)
+        self.engine.finished(busy[0])
+        self.assertTrue(busy[2].started)
+
+
+    def testPausedTransfersDoNotCount(self):
+        busy = self.add("a", 3)
+        self.engine.pause(busy[0])
+        self.assertTrue(busy[2].started)
+
+
+    def testRaisingLimitStartsQueued(self):
+        busy = self.add("a", 3)
+        self.engine.setMaxPerGroup(None)
+        self.assertTrue(busy[2].started)
+
+
+    def testTransfersWithoutGroupOnlyHaveTotalLimit(self):
+        transfers = [FakeTransfer() for i in xrange(4)]
+        for transfer in transfers:
+            self.engine.add(transfer)
+        self.assertEqual([t.started for t in transfers],
+                         [True, True, True, False])
+
+#End of GroupLimitTest class
+
+
+#PauseLimitTest class - tests the limit on paused transfers giving up places
+class PauseLimitTest(unittest.TestCase):
+
+    def testPausedTransfersOnlyGiveUpPlacesUpToLimit(self):
+        engine = transferengine.TransferEngine(1, max_paused=2)
+        transfers = [FakeTransfer() for i in xrange(4)]
+        for transfer in transfers:
+            engine.add(transfer)
+        for transfer in transfers[:3]:
+            engine.pause(transfer)
+        self.assertEqual([t.started for t in transfers],
+                         [True, True, True, False])
+        engine.finished(transfers[0])
+        self.assertTrue(transfers[3].started)
+
+#End of PauseLimitTest class
+
+###############################################################################
+# End of tests
+###############################################################################
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+"""
+Tests for the TreeStream module.
+
+Usage:
+    Run as main, or using python -m unittest test_treestream
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import treestream
+
+
+
+
+###############################################################################
+# Tests
+###############################################################################
+
+#CheckManifestTest class - tests manifests which would leave the tree
+class CheckManifestTest(unittest.TestCase):
+
+    #assertRejected method - to check a manifest with one path is refused
+    def assertRejected(self, path, size=1):
+        self.assertRaises(ValueError, treestream.checkManifest, [[path, size]])
+    #End of assertRejected method
+
+
+    def testTotalOfFileSizes(self):
+        manifest = [["a", -1], ["a/b", 3], ["a/c", 0], ["d", 4]]
+        self.assertEqual(treestream.checkManifest(manifest), 7)
+
+
+    def testParentDirectory(self):
+        self.assertRejected("..")
+        self.assertRejected("../a")
+        self.assertRejected("a/../../b")
+        self.assertRejected("a/..", -1)
+
+
+    def testAbsolutePath(self):
+        self.assertRejected("/etc/passwd")
+        self.assertRejected("/", -1)
+
+
+    def testEmptyNames(self):
+        self.assertRejected("")
+        self.assertRejected("a//b")
+        self.assertRejected("a/")
+
+
+    def testBackslashes(self):
+        self.assertRejected("..\\a")
+        self.assertRejected("a\\b")
+
+
+    def testBadSize(self):
+        self.assertRejected("a", -2)
+        self.assertRejected("a", "big")
+
+
+    def testBadlyFormatted(self):
+        self.assertRaises(ValueError, treestream.checkManifest, [["a"]])
+        self.assertRaises(ValueError, treestream.checkManifest, [["a", None]])
+        self.assertRaises(ValueError, treestream.checkManifest, 5)
+
+#End of CheckManifestTest class
+
+
+#TreeStreamTest class - tests writing out a tree read as a stream
+class TreeStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "source")
+        self.target = os.path.join(self.directory, "target")
+        os.makedirs(os.path.join(self.source, "sub", "deeper"))
+        self.write(self.source, "top", "top file")
+        self.write(self.source, "empty", "")
+        self.write(os.path.join(self.source, "sub"), "inner", "x" * 5000)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    #write method - to make a file
+    def write(self, directory, name, data):
+        with open(os.path.join(directory, name), "wb") as file_object:
+            file_object.write(data)
+    #End of write method
+
+
+    #read method - to read a file
+    def read(self, *names):
+        with open(os.path.join(*names), "rb") as file_object:
+            return file_object.read()
+    #End of read method
+
+
+    #copyTree method - to send the source tree through a stream to a writer
+    def copyTree(self, writer, piece_size=1000):
+        manifest = treestream.makeManifest(self.source)
+        reader = treestream.TreeReader(self.source, manifest)
+        writer.setManifest(manifest)
+        data = reader.read(piece_size)
+        while data != "":
+            writer.write(data)
+            data = reader.read(piece_size)
+        reader.close()
+        writer.close()
+    #End of copyTree method
+
+
+    def testManifestListsDirectoriesFirst(self):
+        self.assertEqual(treestream.makeManifest(self.source),
+                         [["sub", -1], ["empty", 0], ["top", 8],
+                          ["sub/deeper", -1], ["sub/inner", 5000]])
+
+
+    def testRoundTrip(self):
+        self.copyTree(treestream.TreeWriter(self.target))
+        self.assertEqual(self.read(self.target, "top"), "top file")
+        self.assertEqual(self.read(self.target, "empty"), "")
+        self.assertEqual(self.read(self.target, "sub", "inner"), "x" * 5000)
+        self.assertTrue(os.path.isdir(os.path.join(self.target, "sub",
+                                                   "deeper")))
+
+
+    def testReaderSeeksAcrossFiles(self):
+        manifest = treestream.makeManifest(self.source)
+        reader = treestream.TreeReader(self.source, manifest)
+        reader.seek(-5002, os.SEEK_END)
+        self.assertEqual(reader.read(4), "lexx")
+        reader.close()
+
+
+    def testExistingDirectoryIsAddedTo(self):
+        os.makedirs(os.path.join(self.target, "sub"))
+        self.write(os.path.join(self.target, "sub"), "kept", "kept")
+        self.copyTree(treestream.TreeWriter(self.target))
+        self.assertEqual(self.read(self.target, "sub", "kept"), "kept")
+        self.assertEqual(self.read(self.target, "sub", "inner"), "x" * 5000)
+
+
+    def testExistingFileIsNotOverwritten(self):
+        os.makedirs(os.path.join(self.target, "sub"))
+        self.write(os.path.join(self.target, "sub"), "inner", "mine")
+        self.assertRaises(OSError, self.copyTree,
+                          treestream.TreeWriter(self.target))
+        self.assertEqual(self.read(self.target, "sub", "inner"), "mine")
+
+
+    def testExistingEmptyFileIsNotOverwritten(self):
+        os.makedirs(self.target)
+        self.write(self.target, "empty", "mine")
+        writer = treestream.TreeWriter(self.target)
+        self.assertRaises(OSError, writer.setManifest, [["empty", 0]])
+        self.assertEqual(self.read(self.target, "empty"), "mine")
+
+
+    def testUnsafeManifestWritesNothing(self):
+        writer = treestream.TreeWriter(self.target)
+        self.assertRaises(ValueError, writer.setManifest,
+                          [["a", 1], ["../escaped", 1]])
+        self.assertFalse(os.path.exists(self.target))
+        self.assertFalse(os.path.exists(os.path.join(self.directory,
+                                                     "escaped")))
+
+
+    def testMoreDataThanManifest(self):
+        writer = treestream.TreeWriter(self.target, [["a", 2]])
+        self.assertRaises(IOError, writer.write, "abc")
+        writer.close()
+
+#End of TreeStreamTest class
+
+###############################################################################
+# End of tests
+###############################################################################
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,561 @@
+"""
+TransferEngine module runs file transfers concurrently, up to a limit, on both
+the client and the server.
+
+Usage:
+    Create an engine using TransferEngine(max_transfers, policy, max_per_group)
+    Add transfers using add(transfer, priority, group)
+        - A transfer is a threading.Thread. It is started straight away if
+          fewer than max_transfers are running, and fewer than max_per_group
+          of its group (e.g. the client it is for), otherwise it waits in a
+          queue.
+        - The transfer's run method must call finished(transfer) when it is
+          done, successful or not, so that the next transfer can start.
+        - Transfers with a higher priority start first. Among those of the
+          same priority, the oldest starts first, or with the SHORTEST_FIRST
+          policy, the smallest (so a small file is not stuck behind a huge
+          one).
+    Change the order of queued transfers using setPriority(transfer,
+    priority) or moveToFront(transfer), or take one out using
+    remove(transfer)
+    Pause and resume transfers using pause(transfer)/resume(transfer)
+        - A TransferControl, checked by the transfer for each piece of data,
+          stops it moving data while paused, or stops it when cancelled.
+        - A paused transfer which has started still holds its connection and
+          file, so at most max_paused of them give up their place to
+          another transfer. Pausing any more does not start another.
+    Queued transfers which have a keepAlive() method have it called every
+    KEEPALIVE_TIME while they wait, e.g. to stop the other side timing out.
+    Change the limits at any time using setMaxTransfers(max_transfers) and
+    setMaxPerGroup(max_per_group)
+    Cap the data rate of all transfers in the engine using
+    setRateLimit(rate)
+        - Transfers call throttle(limits, size) for each piece of data they
+          send or receive, with the engine's rate_limit among their limits.
+    Cap anything else (a session, one transfer) using a TokenBucket(rate)
+"""
+import itertools
+import threading
+import time
+
+
+
+
+###############################################################################
+# Globals
+###############################################################################
+
+MAX_TRANSFERS = 4 #Default number of transfers which may run at once
+MAX_PAUSED = 4 #Default number of paused transfers which may give up their
+               #place, beyond those running
+BURST_TIME = 0.1 #seconds of data at the capped rate which may go at once
+MIN_BURST = 16384 #16kB - smallest burst, so slow caps still move data
+MAX_WAIT = 0.1 #most seconds slept at once, so new rates apply quickly
+KEEPALIVE_TIME = 5 #seconds between keepalives while paused or queued
+
+FIFO = "fifo" #policies - oldest first,
+SHORTEST_FIRST = "shortest" #  or smallest first, within each priority
+LOW_PRIORITY = -1
+NORMAL_PRIORITY = 0
+HIGH_PRIORITY = 1
+
+###############################################################################
+# End of globals
+###############################################################################
+
+
+
+
+
+###############################################################################
+# TransferEngine class
+###############################################################################
+
+#TransferEngine class - runs a limited number of transfers at once
+class TransferEngine(object):
+    """
+    Usage:
+        See module docstring.
+    """
+
+    #Constructor
+    def __init__(self, max_transfers=MAX_TRANSFERS, policy=FIFO,
+                 max_per_group=None, max_paused=MAX_PAUSED):
+        """
+        Takes in:
+            max_transfers - Number of transfers which may run at once.
+            policy - FIFO (default) or SHORTEST_FIRST - order in which queued
+                     transfers of the same priority start.
+            max_per_group - Number of transfers of one group which may run
+                            at once, or None (default) for no limit but
+                            max_transfers.
+            max_paused - Number of started transfers which may be paused
+                         without counting towards max_transfers.
+        """
+        self.max_transfers = max_transfers
+        self.policy = policy
+        self.max_per_group = max_per_group
+        self.max_paused = max_paused
+        #transfer -> [priority, order], for queued transfers
+        self.queue = {}
+        #transfer -> group, for queued and running transfers with a group
+        self.groups = {}
+        self.order = itertools.count()
+        #started and not finished, and those of them which are paused
+        self.running = set()
+        self.paused = set()
+        self.lock = threading.Lock()
+        #Cap on the data rate of all of the transfers together
+        self.rate_limit = TokenBucket()
+        #Thread keeping queued transfers alive, while there are any
+        self.keeper = None
+    #End of Constructor
+
+
+    #add method - to run a transfer once there is room for it
+    def add(self, transfer, priority=NORMAL_PRIORITY, group=None):
+        """
+        Usage:
+            Starts the transfer if there is room for it, otherwise queues it
+            to start once a running transfer finishes.
+
+        Takes in:
+            transfer - the transfer to run.
+            priority - queued transfers with a higher priority start first.
+            group - optional thing the transfer belongs to, e.g. the client
+                    it is for, so that no more than max_per_group of them
+                    run at once.
+        """
+        with self.lock:
+            self.queue[transfer] = [priority, next(self.order)]
+            if group != None:
+                self.groups[transfer] = group
+            self.startTransfers()
+            if self.queue and self.keeper == None:
+                self.keeper = threading.Thread(target=self.keepQueuedAlive)
+                self.keeper.daemon = True
+                self.keeper.start()
+    #End of add method
+
+
+    #finished method - to let the engine know that a transfer is done
+    def finished(self, transfer):
+        """
+        Usage:
+            Must be called by each transfer when it is done, so that the next
+            transfer in the queue can start.
+        """
+        with self.lock:
+            self.running.discard(transfer)
+            self.paused.discard(transfer)
+            self.groups.pop(transfer, None)
+            self.startTransfers()
+    #End of finished method
+
+
+    #setPriority method - to change the priority of a queued transfer
+    def setPriority(self, transfer, priority):
+        """
+        Usage:
+            Has no effect once the transfer has started.
+        """
+        with self.lock:
+            if transfer in self.queue:
+                self.queue[transfer][0] = priority
+                self.startTransfers()
+    #End of setPriority method
+
+
+    #moveToFront method - to start a queued transfer before others
+    def moveToFront(self, transfer):
+        """
+        Usage:
+            The transfer starts before every other queued transfer of the
+            same priority, whatever the policy.
+        """
+        with self.lock:
+            if transfer in self.queue:
+                first = min([order for (priority, order)
+                             in self.queue.itervalues()])
+                self.queue[transfer][1] = first - 1
+    #End of moveToFront method
+
+
+    #remove method - to take a transfer out of the queue
+    def remove(self, transfer):
+        """
+        Returns:
+            True if the transfer was queued, and now never will be started.
+            False if it has already started (or was never added).
+        """
+        with self.lock:
+            self.paused.discard(transfer)
+            if self.queue.pop(transfer, None) == None:
+                return False
+            self.groups.pop(transfer, None)
+            return True
+    #End of remove method
+
+
+    #pause method - to stop a transfer taking up a place
+    def pause(self, transfer):
+        """
+        Usage:
+            A paused queued transfer is not started. A paused running
+            transfer doesn't count towards max_transfers, so another may
+            start in its place, unless max_paused started transfers are
+            already paused. The transfer itself must stop moving data
+            (see TransferControl).
+        """
+        with self.lock:
+            if transfer in self.queue or transfer in self.running:
+                self.paused.add(transfer)
+                self.startTransfers()
+    #End of pause method
+
+
+    #resume method - to let a paused transfer carry on
+    def resume(self, transfer):
+        """
+        Usage:
+            A running transfer carries on straight away, even if that means
+            more than max_transfers are running for a while. A queued one
+            waits for its turn again.
+        """
+        with self.lock:
+            self.paused.discard(transfer)
+            self.startTransfers()
+    #End of resume method
+
+
+    #setPolicy method - to change the order queued transfers start in
+    def setPolicy(self, policy):
+        """
+        Takes in:
+            policy - FIFO or SHORTEST_FIRST.
+        """
+        with self.lock:
+            self.policy = policy
+    #End of setPolicy method
+
+
+    #setMaxTransfers method - to change the number of concurrent transfers
+    def setMaxTransfers(self, max_transfers):
+        """
+        Usage:
+            Changes the number of transfers which may run at once. If it is
+            raised, queued transfers start straight away. If it is lowered,
+            running transfers carry on, but no more start until the number
+            running is below the new limit.
+        """
+        with self.lock:
+            self.max_transfers = max(int(max_transfers), 1)
+            self.startTransfers()
+    #End of setMaxTransfers method
+
+
+    #setMaxPerGroup method - to change the number of a group's transfers
+    def setMaxPerGroup(self, max_per_group):
+        """
+        Usage:
+            As for setMaxTransfers(), for the transfers of each group.
+
+        Takes in:
+            max_per_group - number of transfers, or None for no limit.
+        """
+        with self.lock:
+            if max_per_group != None:
+                max_per_group = max(int(max_per_group), 1)
+            self.max_per_group = max_per_group
+            self.startTransfers()
+    #End of setMaxPerGroup method
+
+
+    #setRateLimit method - to cap the data rate of all transfers together
+    def setRateLimit(self, rate):
+        """
+        Takes in:
+            rate - bytes per second, or None/0 for no cap.
+        """
+        self.rate_limit.setRate(rate)
+    #End of setRateLimit method
+
+
+    #getStatus method - to see how busy the engine is
+    def getStatus(self):
+        """
+        Returns:
+            Tuple of (running_transfers, queued_transfers, max_transfers)
+            - paused transfers are not counted as running or queued.
+        """
+        with self.lock:
+            return (len(self.running - self.paused),
+                    len(set(self.queue) - self.paused), self.max_transfers)
+    #End of getStatus method
+
+
+    #startTransfers method - to start queued transfers while there is room
+    def startTransfers(self):
+        """
+        Usage:
+            For internal use only, and only with the lock held.
+        """
+        #Paused transfers still hold their connections and files
+        most = self.max_transfers + self.max_paused
+        while len(self.running - self.paused) < self.max_transfers and \
+              len(self.running) < most:
+            full = self.getFullGroups()
+            waiting = [transfer for transfer in self.queue
+                       if transfer not in self.paused and
+                       self.groups.get(transfer) not in full]
+            if not waiting:
+                break
+            transfer = min(waiting, key=self.queueKey)
+            del self.queue[transfer]
+            self.running.add(transfer)
+            transfer.start()
+    #End of startTransfers method
+
+
+    #getFullGroups method - to find groups which may not start another
+    def getFullGroups(self):
+        """
+        Usage:
+            For internal use only, and only with the lock held.
+
+        Returns:
+            Set of groups with max_per_group transfers running, not counting
+            paused ones.
+        """
+        if self.max_per_group == None:
+            return set()
+        running = {}
+        for transfer in self.running - self.paused:
+            group = self.groups.get(transfer)
+            if group != None:
+                running[group] = running.get(group, 0) + 1
+        return set([group for (group, count) in running.iteritems()
+                    if count >= self.max_per_group])
+    #End of getFullGroups method
+
+
+    #keepQueuedAlive method - to call keepAlive() of each queued transfer
+    def keepQueuedAlive(self):
+        """
+        Usage:
+            For internal use only, run in its own thread.
+            Ends once nothing is queued, and is started again by add().
+        """
+        while True:
+            time.sleep(KEEPALIVE_TIME)
+            with self.lock:
+                if not self.queue:
+                    self.keeper = None
+                    return
+                waiting = list(self.queue)
+            for transfer in waiting:
+                keepalive = getattr(transfer, "keepAlive", None)
+                if keepalive != None:
+                    keepalive()
+    #End of keepQueuedAlive method
+
+
+    #queueKey method - to get what queued transfers are sorted by
+    def queueKey(self, transfer):
+        """
+        Usage:
+            For internal use only, and only with the lock held.
+            The smallest key starts first. Transfers which don't know their
+            size (e.g. downloads not yet started) count as the smallest.
+        """
+        (priority, order) = self.queue[transfer]
+        size = 0
+        if self.policy == SHORTEST_FIRST:
+            size = max(getattr(transfer, "file_size", 0), 0)
+        return (-priority, size, order)
+    #End of queueKey method
+
+#End of TransferEngine class
+
+###############################################################################
+# End of TransferEngine class
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Rate limiting and control
+###############################################################################
+
+#TokenBucket class - caps the rate data is sent/received at
+class TokenBucket(object):
+    """
+    Usage:
+        Tokens (bytes) build up at the capped rate, up to a burst of
+        BURST_TIME worth, and take(size) uses them, waiting if there are not
+        enough. A piece bigger than the burst may be taken - the bucket goes
+        into debt, and the next piece waits until it is paid off - so the
+        rate holds over time whatever size pieces are used.
+        Safe to share between threads - together they get the capped rate.
+        The rate may be changed at any time, even while a thread is waiting.
+    """
+
+    #Constructor
+    def __init__(self, rate=None):
+        """
+        Takes in:
+            rate - bytes per second, or None/0 (default) for no cap.
+        """
+        self.lock = threading.Lock()
+        self.setRate(rate)
+    #End of Constructor
+
+
+    #setRate method - to change the cap
+    def setRate(self, rate):
+        """
+        Takes in:
+            rate - bytes per second, or None/0 for no cap.
+
+        Exceptions:
+            ValueError - If rate is not a number, or is negative.
+        """
+        if rate != None:
+            rate = float(rate)
+            if rate < 0:
+                raise ValueError("Rate must not be negative.")
+        with self.lock:
+            self.rate = rate or None
+            self.burst = 0
+            if self.rate != None:
+                self.burst = max(self.rate * BURST_TIME, MIN_BURST)
+            self.tokens = self.burst
+            self.last = time.time()
+    #End of setRate method
+
+
+    #getRate method - to get the cap
+    def getRate(self):
+        """
+        Returns:
+            bytes per second, or None if there is no cap.
+        """
+        return self.rate
+    #End of getRate method
+
+
+    #take method - to use up size bytes, waiting until they are allowed
+    def take(self, size):
+        with self.lock:
+            self.refill()
+            self.tokens -= size
+        while True:
+            with self.lock:
+                self.refill()
+                if self.rate == None or self.tokens >= 0:
+                    return
+                wait = min(-self.tokens / self.rate, MAX_WAIT)
+            time.sleep(wait)
+    #End of take method
+
+
+    #refill method - to add the tokens built up since last time
+    def refill(self):
+        """
+        Usage:
+            For internal use only, and only with the lock held.
+        """
+        now = time.time()
+        if self.rate == None:
+            self.tokens = 0
+        else:
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.last) * self.rate)
+        self.last = now
+    #End of refill method
+
+#End of TokenBucket class
+
+
+#TransferControl class - pauses or cancels a transfer while it runs
+class TransferControl(object):
+    """
+    Usage:
+        Given to throttle() with a transfer's caps, so it is checked for
+        every piece of data the transfer sends or receives. take() waits
+        while the transfer is paused, and raises IOError once it has been
+        cancelled, which fails the transfer as any other error would.
+    """
+
+    #Constructor
+    def __init__(self, keepalive=None):
+        """
+        Takes in:
+            keepalive - optional function called every KEEPALIVE_TIME while
+                        paused, e.g. to stop the other side timing out.
+        """
+        self.keepalive = keepalive
+        self.running = threading.Event()
+        self.running.set()
+        self.cancelled = False
+    #End of Constructor
+
+
+    #pause method - to stop the transfer at the next piece of data
+    def pause(self):
+        self.running.clear()
+    #End of pause method
+
+
+    #resume method - to let a paused transfer carry on
+    def resume(self):
+        self.running.set()
+    #End of resume method
+
+
+    #cancel method - to stop the transfer for good
+    def cancel(self):
+        self.cancelled = True
+        self.running.set()
+    #End of cancel method
+
+
+    #isPaused method - to check whether the transfer is paused
+    def isPaused(self):
+        return not self.running.is_set()
+    #End of isPaused method
+
+
+    #take method - to wait while paused before size bytes are moved
+    def take(self, size):
+        """
+        Exceptions:
+            IOError - If the transfer has been cancelled.
+        """
+        while not self.running.wait(KEEPALIVE_TIME):
+            if self.keepalive != None:
+                self.keepalive()
+        if self.cancelled:
+            raise IOError("Transfer cancelled.")
+    #End of take method
+
+#End of TransferControl class
+
+
+#throttle function - to wait until size bytes are allowed by every cap
+def throttle(limits, size):
+    """
+    Takes in:
+        limits - TokenBuckets which apply, e.g. the transfer's own, its
+                 session's and its engine's. The slowest sets the pace.
+        size - bytes about to be, or just, sent/received.
+    """
+    for limit in limits:
+        limit.take(size)
+#end of throttle function
+
+###############################################################################
+# End of rate limiting and control
+###############################################################################
@@ -0,0 +1,193 @@
+"""
+TransferTuner module picks the size of the pieces file data is read and sent
+in, and the size of the socket buffers, from the throughput and round trip
+time measured while a transfer runs, so that transfers are quick on both
+fast local networks and slow, distant ones, without any settings.
+
+Usage:
+    Create a TransferTuner(sock, sending) for each data connection
+        - rtt may be given if it has been measured some other way, it is
+          otherwise read from the socket where the OS allows.
+    Read and send (or receive) chunkSize() bytes at a time
+    Call update(size) after each piece is sent or received
+        - Every SAMPLE_TIME the throughput is worked out, the chunk size is
+          moved towards what can be sent in CHUNK_TIME, and the socket buffer
+          is grown to hold what is in flight over one round trip.
+    Set TCP_NODELAY on control connections using tuneControlSocket(sock)
+        - Small requests and replies are then sent straight away, rather
+          than held back to be joined with more data.
+
+Exceptions:
+    None - anything the OS does not allow is left as it is.
+"""
+import socket
+import struct
+import time
+
+
+
+
+###############################################################################
+# Globals
+###############################################################################
+
+MIN_CHUNK_SIZE = 8192 #8kB - smallest piece of data read/sent at once
+MAX_CHUNK_SIZE = 1048576 #1MB - biggest piece of data read/sent at once
+INITIAL_CHUNK_SIZE = 65536 #64kB - piece size until throughput is known
+MAX_SOCKET_BUFFER = 8388608 #8MB - biggest socket buffer asked for
+SAMPLE_TIME = 0.2 #seconds between measurements of throughput
+CHUNK_TIME = 0.005 #seconds of data at the measured rate in each piece
+MAX_STEP = 4 #most the chunk size changes by at one measurement
+
+#Linux only - offset and format of tcpi_rtt (in microseconds) in TCP_INFO
+TCP_INFO_RTT = (68, "I")
+TCP_INFO_SIZE = 104
+
+###############################################################################
+# End of globals
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Socket options
+###############################################################################
+
+#tuneControlSocket function - to set up a control connection
+def tuneControlSocket(sock):
+    """
+    Usage:
+        Turns off Nagle's algorithm, so that requests and replies, which are
+        small, are not delayed waiting for more data to go with them.
+    """
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (socket.error, AttributeError):
+        pass
+#end of tuneControlSocket function
+
+
+#getRtt function - to ask the OS for the round trip time of a connection
+def getRtt(sock):
+    """
+    Returns:
+        Smoothed round trip time in seconds, or None if the OS doesn't say.
+    """
+    if not hasattr(socket, "TCP_INFO"):
+        return None
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO,
+                               TCP_INFO_SIZE)
+        (offset, format) = TCP_INFO_RTT
+        rtt = struct.unpack_from(format, info, offset)[0]
+    except (socket.error, struct.error):
+        return None
+    if rtt == 0:
+        return None
+    return rtt / 1000000.0
+#end of getRtt function
+
+###############################################################################
+# End of socket options
+###############################################################################
+
+
+
+
+
+###############################################################################
+# TransferTuner class
+###############################################################################
+
+#TransferTuner class - tunes one data connection as it is used
+class TransferTuner(object):
+    """
+    Usage:
+        See module docstring.
+        Socket buffers are only ever grown, and only beyond what the OS has
+        already given the socket, so the OS's own tuning is kept where it
+        does better.
+    """
+
+    #Constructor
+    def __init__(self, sock=None, sending=True, rtt=None):
+        """
+        Takes in:
+            sock - the data connection, or None to only tune the chunk size,
+                   e.g. for data multiplexed over the control connection.
+            sending - True if data is sent on sock, False if received.
+            rtt - round trip time in seconds, if known.
+        """
+        self.sock = sock
+        self.option = socket.SO_SNDBUF
+        if not sending:
+            self.option = socket.SO_RCVBUF
+        self.rtt = rtt
+        self.chunk_size = INITIAL_CHUNK_SIZE
+        self.sample_start = time.time()
+        self.sample_bytes = 0
+        self.throughput = None
+    #End of Constructor
+
+
+    #chunkSize method - to get the size of the next piece to read/send
+    def chunkSize(self):
+        return self.chunk_size
+    #End of chunkSize method
+
+
+    #update method - to count data transferred, and retune when it is time
+    def update(self, size):
+        """
+        Takes in:
+            size - bytes just sent or received.
+        """
+        self.sample_bytes += size
+        elapsed = time.time() - self.sample_start
+        if elapsed < SAMPLE_TIME:
+            return
+        self.throughput = self.sample_bytes / elapsed
+        self.sample_start += elapsed
+        self.sample_bytes = 0
+
+        #Aim for pieces which take about CHUNK_TIME to go at this rate
+        target = int(self.throughput * CHUNK_TIME)
+        target = max(self.chunk_size // MAX_STEP,
+                     min(self.chunk_size * MAX_STEP, target))
+        self.chunk_size = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, target))
+        if self.sock != None:
+            self.tuneBuffer()
+    #End of update method
+
+
+    #tuneBuffer method - to make the socket buffer hold a round trip of data
+    def tuneBuffer(self):
+        """
+        Usage:
+            For internal use only.
+            The buffer needs to hold the bandwidth-delay product - the data
+            sent but not yet acknowledged - or the sender stalls each round
+            trip waiting for room. Twice that is asked for, as the OS counts
+            its own overhead in the buffer size.
+        """
+        rtt = getRtt(self.sock)
+        if rtt == None:
+            rtt = self.rtt
+        if rtt == None:
+            return
+        wanted = min(int(2 * self.throughput * rtt), MAX_SOCKET_BUFFER)
+        try:
+            current = self.sock.getsockopt(socket.SOL_SOCKET, self.option)
+            if wanted > current:
+                self.sock.setsockopt(socket.SOL_SOCKET, self.option, wanted)
+        except socket.error:
+            pass
+    #End of tuneBuffer method
+
+#End of TransferTuner class
+
+###############################################################################
+# End of TransferTuner class
+###############################################################################
@@ -0,0 +1,355 @@
+"""
+TreeStream module turns a directory, with everything in it, into a single
+stream of data and back, so a whole tree can be sent as one transfer.
+
+A tree is described by a manifest - a list of [path, size] for each entry,
+where path is relative to the top of the tree, with "/" between names, and
+size is -1 for a directory. Directories come before what is in them. The
+stream is the contents of each file in the manifest, one after the other.
+
+Usage:
+    Make a manifest using makeManifest(directory)
+    Read the stream using TreeReader(directory, manifest)
+        - It is a file-like object, with read(), seek(), tell() and close().
+    Check a manifest which has been received using checkManifest(manifest)
+    Write the stream back out using TreeWriter(directory, manifest)
+        - It is a file-like object, with write(), flush() and close().
+        - Directories and files are made as the stream reaches them.
+
+Exceptions:
+    ValueError - If a manifest is badly formatted, or has a path which is
+                 absolute or goes up out of the tree.
+    IOError/OSError - If a file cannot be read or written, has changed size
+                      since the manifest was made, or already exists.
+"""
+import bisect
+import os
+
+
+
+
+###############################################################################
+# Globals
+###############################################################################
+
+DIR_SIZE = -1 #size given for directories in a manifest
+SEPARATOR = "/" #between names in a manifest path
+
+###############################################################################
+# End of globals
+###############################################################################
+
+
+
+
+
+###############################################################################
+# Manifests
+###############################################################################
+
+#makeManifest function - to list everything in a tree
+def makeManifest(directory):
+    """
+    Usage:
+        Only directories and regular files are included. Links to directories
+        are not followed.
+
+    Takes in:
+        directory - full path of the top of the tree.
+
+    Returns:
+        Manifest of the tree (see module docstring), in a fixed order.
+    """
+    manifest = []
+    for (path, dirs, files) in os.walk(directory):
+        dirs.sort()
+        relative = os.path.relpath(path, directory)
+        if relative == os.curdir:
+            relative = ""
+        else:
+            relative = relative.replace(os.sep, SEPARATOR) + SEPARATOR
+        for name in dirs:
+            if not os.path.islink(os.path.join(path, name)):
+                manifest.append([relative + name, DIR_SIZE])
+        for name in sorted(files):
+            full_path = os.path.join(path, name)
+            if os.path.isfile(full_path):
+                manifest.append([relative + name,
+                                 os.path.getsize(full_path)])
+    return manifest
+#end of makeManifest function
+
+
+#checkManifest function - to check a manifest from somewhere else is safe
+def checkManifest(manifest):
+    """
+    Returns:
+        Total size of the files in the manifest.
+
+    Exceptions:
+        ValueError - If the manifest is badly formatted, or has a path which
+                     would be outside of the tree.
+    """
+    total = 0
+    try:
+        for (path, size) in manifest:
+            path = str(path)
+            size = int(size)
+            names = path.split(SEPARATOR)
+            #"" in names covers empty paths and leading/double separators
+            if "" in names or os.pardir in names or "\\" in path or \
+               (size < 0 and size != DIR_SIZE):
+                raise ValueError("Bad path in manifest: " + path)
+            total += max(size, 0)
+    except TypeError:
+        raise ValueError("Badly formatted manifest.")
+    return total
+#end of checkManifest function
+
+###############################################################################
+# End of manifests
+###############################################################################
+
+
+
+
+
+###############################################################################
+# TreeReader/TreeWriter classes
+###############################################################################
+
+#TreeReader class - to read a tree as one stream
+class TreeReader(object):
+    """
+    Usage:
+        See module docstring.
+    """
+    mode = "rb"
+
+    #Constructor
+    def __init__(self, directory, manifest):
+        """
+        Takes in:
+            directory - full path of the top of the tree.
+            manifest - manifest of the tree, from makeManifest().
+        """
+        self.directory = directory
+        self.files = [path for (path, size) in manifest if size != DIR_SIZE]
+        self.sizes = [size for (path, size) in manifest if size != DIR_SIZE]
+        #where each file starts in the stream
+        self.starts = []
+        self.size = 0
+        for size in self.sizes:
+            self.starts.append(self.size)
+            self.size += size
+        self.index = 0 #file being read
+        self.current = None
+        self.position = 0
+    #End of Constructor
+
+
+    #read method - to read up to size bytes of the stream
+    def read(self, size=-1):
+        """
+        Returns:
+            String of data, shorter than size only at the end of the stream.
+
+        Exceptions:
+            IOError - If a file cannot be read, or has changed size.
+        """
+        if size < 0:
+            size = self.size - self.position
+        pieces = []
+        while size > 0 and self.index < len(self.files):
+            if self.current == None:
+                self.current = open(os.path.join(self.directory,
+                                                 self.files[self.index]),
+                                    "rb")
+                self.current.seek(self.position - self.starts[self.index])
+            end = self.starts[self.index] + self.sizes[self.index]
+            data = self.current.read(min(size, end - self.position))
+            if data == "" and self.position < end:
+                raise IOError("File has changed: " + self.files[self.index])
+            pieces.append(data)
+            self.position += len(data)
+            size -= len(data)
+            if self.position == end:
+                self.nextFile()
+        return "".join(pieces)
+    #End of read method
+
+
+    #seek method - to move to a position in the stream
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            position += self.position
+        elif whence == os.SEEK_END:
+            position += self.size
+        self.closeFile()
+        self.position = max(min(position, self.size), 0)
+        #the last file which starts at or before the position
+        self.index = max(bisect.bisect_right(self.starts, self.position) - 1,
+                         0)
+    #End of seek method
+
+
+    #tell method - to get the position in the stream
+    def tell(self):
+        return self.position
+    #End of tell method
+
+
+    #nextFile method - to move on to the next file
+    def nextFile(self):
+        """
+        Usage:
+            For internal use only.
+        """
+        self.closeFile()
+        self.index += 1
+        #skip empty files
+        while self.index < len(self.files) and self.sizes[self.index] == 0:
+            self.index += 1
+    #End of nextFile method
+
+
+    #closeFile method - to close the file being read
+    def closeFile(self):
+        if self.current != None:
+            self.current.close()
+            self.current = None
+    #End of closeFile method
+
+
+    #close method - to finish reading
+    def close(self):
+        self.closeFile()
+    #End of close method
+
+#End of TreeReader class
+
+
+#TreeWriter class - to write a stream back out as a tree
+class TreeWriter(object):
+    """
+    Usage:
+        See module docstring.
+        Files which already exist are not overwritten. Directories which
+        already exist are added to.
+    """
+    mode = "wb"
+
+    #Constructor
+    def __init__(self, directory, manifest=None):
+        """
+        Takes in:
+            directory - full path of the top of the tree, which is made if it
+                        does not exist.
+            manifest - manifest of the tree. May be given later using
+                       setManifest(), before anything is written.
+
+        Exceptions:
+            ValueError - If the manifest is not safe (see checkManifest()).
+            OSError - If the directory cannot be made.
+        """
+        self.directory = directory
+        self.manifest = []
+        self.size = 0
+        self.index = 0 #entry being written
+        self.current = None
+        self.remaining = 0 #bytes still to write to the current file
+        if manifest != None:
+            self.setManifest(manifest)
+    #End of Constructor
+
+
+    #setManifest method - to give the manifest of the tree being written
+    def setManifest(self, manifest):
+        """
+        Exceptions:
+            ValueError - If the manifest is not safe (see checkManifest()).
+            OSError/IOError - If the tree cannot be started.
+        """
+        self.size = checkManifest(manifest)
+        self.manifest = manifest
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.advance()
+    #End of setManifest method
+
+
+    #write method - to write the next piece of the stream
+    def write(self, data):
+        """
+        Takes in:
+            data - string, or buffer/memoryview.
+
+        Exceptions:
+            IOError - If there is more data than the manifest has room for,
+                      or a file cannot be written.
+        """
+        view = memoryview(data)
+        while len(view) > 0:
+            if self.current == None:
+                raise IOError("More data than in the manifest.")
+            piece = view[:self.remaining]
+            self.current.write(piece)
+            self.remaining -= len(piece)
+            view = view[len(piece):]
+            if self.remaining == 0:
+                self.current.close()
+                self.current = None
+                self.index += 1
+                self.advance()
+    #End of write method
+
+
+    #advance method - to make entries until one needs data
+    def advance(self):
+        """
+        Usage:
+            For internal use only.
+            Makes directories and empty files, and opens the next file with
+            data to come.
+        """
+        while self.current == None and self.index < len(self.manifest):
+            (path, size) = self.manifest[self.index]
+            full_path = os.path.join(self.directory,
+                                     *str(path).split(SEPARATOR))
+            if size == DIR_SIZE:
+                if not os.path.isdir(full_path):
+                    os.mkdir(full_path)
+                self.index += 1
+                continue
+            #Never overwrite a file
+            handle = os.open(full_path,
+                             os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                             getattr(os, "O_BINARY", 0), 0666)
+            self.current = os.fdopen(handle, "wb")
+            self.remaining = int(size)
+            if self.remaining == 0:
+                self.current.close()
+                self.current = None
+                self.index += 1
+    #End of advance method
+
+
+    #flush method - to flush the file being written
+    def flush(self):
+        if self.current != None:
+            self.current.flush()
+    #End of flush method
+
+
+    #close method - to finish writing
+    def close(self):
+        if self.current != None:
+            self.current.close()
+            self.current = None
+    #End of close method
+
+#End of TreeWriter class
+
+###############################################################################
+# End of TreeReader/TreeWriter classes
+###############################################################################